@@ -77,6 +77,12 @@ class Arg:
          rhs = "%s(%s)" % (function.__name__, ", ".join(output_args))
          if function.return_type.__class__.__name__ == "Pixel":
             rhs = "pixel_to_python(%s)" % rhs
+         if function.release_gil:
+            if function.progress_bar or "python" in rhs:
+               raise RuntimeError(
+                  "'%s' uses Python objects and can not release the global interpreter lock." %
+                  function.__name__)
+            return "{\nReleaseGIL release_gil;\n%s%s;\n}\n" % (lhs, rhs)
          return "%s%s;\n" % (lhs, rhs)
 
    def call(self, function, args, output_args, limit_choices=None):
@@ -188,7 +194,8 @@ class ImageType(Arg):
 
    def _get_choices_for_pixel_type(self, pixel_type):
       if pixel_type == ONEBIT:
-         result = ["OneBitImageView", "Cc", "OneBitRleImageView", "RleCc", "MlCc"]
+         result = ["OneBitImageView", "Cc", "OneBitRleImageView", "RleCc", "MlCc",
+                   "OneBitPackedImageView"]
       else:
          result = [util.get_pixel_type_name(pixel_type) + "ImageView"]
       return [(x, pixel_type) for x in result]
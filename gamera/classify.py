@@ -276,17 +276,28 @@ page."""
             if glyph.classification_state in (core.UNCLASSIFIED, core.AUTOMATIC):
                for child in glyph.children_images:
                   removed[child] = None
+         self._generate_features_to_classify(
+            [glyph for glyph in glyphs if not removed.has_key(glyph)])
+         to_classify = []
          for glyph in glyphs:
-            if not removed.has_key(glyph):
-               self.generate_features(glyph)
-               if (glyph.classification_state in
-                   (core.UNCLASSIFIED, core.AUTOMATIC)):
-                  (id, conf) = self._classify_automatic_impl(glyph)
-                  glyph.classify_automatic(id)
-                  glyph.confidence = conf
-                  adds = self._do_splits(self, glyph)
-                  progress.add_length(len(adds))
-                  added.extend(adds)
+            if (not removed.has_key(glyph) and
+                glyph.classification_state in
+                (core.UNCLASSIFIED, core.AUTOMATIC)):
+               to_classify.append(glyph)
+            else:
+               progress.step()
+         # all glyphs are classified at once, so that the classifier
+         # can process them in a single batch
+         if len(to_classify):
+            results = self._classify_automatic_list_impl(to_classify)
+         else:
+            results = []
+         for glyph, (id, conf) in zip(to_classify, results):
+            glyph.classify_automatic(id)
+            glyph.confidence = conf
+            adds = self._do_splits(self, glyph)
+            progress.add_length(len(adds))
+            added.extend(adds)
             progress.step()
          if len(added):
             added_recurse, removed_recurse = self._classify_list_automatic(
@@ -329,6 +340,11 @@ Return type: (*add*, *remove*)
 """
       return self._classify_list_automatic(glyphs, max_recursion, 0, progress)
 
+   def _classify_automatic_list_impl(self, glyphs):
+      # Classifiers that can classify several glyphs at once more
+      # efficiently override this
+      return [self._classify_automatic_impl(glyph) for glyph in glyphs]
+
    def _update_after_classification(self, glyphs, added, removed):
       result = glyphs + added
       for g in removed:
@@ -448,6 +464,13 @@ existing training data."""
             progress.step()
       finally:
          progress.kill()
+
+   def _generate_features_to_classify(self, glyphs):
+      # Generates the features of glyphs that are only classified (and
+      # not added to the database), so classifiers may leave out features
+      # that do not affect the classification.
+      for glyph in glyphs:
+         self.generate_features(glyph)
    
 class NonInteractiveClassifier(_Classifier):
    def __init__(self, database=[], perform_splits=True):
@@ -657,31 +680,63 @@ Creates a new classifier instance.
       glyphs = util.make_sequence(glyphs)
       self.clear_glyphs()
       self.generate_features_on_glyphs(glyphs)
-      self.database.extend(glyphs)
+      self._change_database(self.database.extend, glyphs)
+      self._database_changed(added=glyphs)
 
    def merge_glyphs(self, glyphs):
       glyphs = util.make_sequence(glyphs)
       self.generate_features_on_glyphs(glyphs)
-      self.database.extend(glyphs)
+      self._change_database(self.database.extend, glyphs)
+      self._database_changed(added=glyphs)
 
    def clear_glyphs(self):
-      self.database.clear()
+      removed = list(self.database)
+      self._change_database(self.database.clear)
+      self._database_changed(removed=removed)
+
+   # True while the classifier adds glyphs to or removes glyphs from
+   # its database (see _change_database)
+   _changing_database = False
+
+   def _change_database(self, change, *args):
+      # Changes the database with the given method of the database.
+      # Meanwhile _changing_database is set, so that these changes,
+      # which are reported to _database_changed, can be told apart from
+      # changes of the database from outside (e.g. through get_glyphs()).
+      self._changing_database = True
+      try:
+         change(*args)
+      finally:
+         self._changing_database = False
+
+   def _database_changed(self, added=[], removed=[], changed=[]):
+      # Called after glyphs were added to or removed from the
+      # database, or glyphs in the database were reclassified.
+      # Classifiers that keep their own copy of the training data
+      # update it here.
+      pass
 
    ########################################
    # AUTOMATIC CLASSIFICATION
+   def _classify_with_database(self, glyph):
+      return self.classify_with_images(self.database, glyph)
+
    def _classify_automatic_impl(self, glyph):
       if len(self.database) == 0:
          raise ClassifierError(
             "Cannot classify using an empty production database.")
+      removed = []
       for child in glyph.children_images:
          if child in self.database:
-            self.database.remove(child)
-      return self.classify_with_images(self.database, glyph)
+            self._change_database(self.database.remove, child)
+            removed.append(child)
+      self._database_changed(removed=removed)
+      return self._classify_with_database(glyph)
 
    def guess_glyph_automatic(self, glyph):
       if len(self.database):
          self.generate_features(glyph)
-         return self.classify_with_images(self.database, glyph)
+         return self._classify_with_database(glyph)
       else:
          return ([(0.0, 'unknown')], {})
 
@@ -710,13 +765,20 @@ end user definitively knows the identity of the glyph.
             "to create a group")
 
       removed = {}
+      removed_from_database = []
       for child in glyph.children_images:
          removed[child] = None
          if child in self.database:
-            self.database.remove(child)
+            self._change_database(self.database.remove, child)
+            removed_from_database.append(child)
+      was_in_database = glyph in self.database
       glyph.classify_manual([(1.0, id)])
       self.generate_features(glyph)
-      self.database.append(glyph)
+      self._change_database(self.database.append, glyph)
+      if was_in_database:
+         self._database_changed(removed=removed_from_database, changed=[glyph])
+      else:
+         self._database_changed(added=[glyph], removed=removed_from_database)
       return self._do_splits(self, glyph), removed.keys()
 
    def classify_list_manual(self, glyphs, id):
@@ -746,10 +808,14 @@ connnected components, such as the lower-case *i*.
             parts = id.split('.')
             sub = '.'.join(parts[1:])
             union = image_utilities.union_images(glyphs)
+            changed = []
             for glyph in glyphs:
                if glyph.nrows > 2 and glyph.ncols > 2:
                   glyph.classify_heuristic('_group._part.' + sub)
                   self.generate_features(glyph)
+                  if glyph in self.database:
+                     changed.append(glyph)
+            self._database_changed(changed=changed)
             added, removed = self.classify_glyph_manual(union, sub)
             #added.append(union) # this would lead to doublets
             return added, removed
@@ -764,15 +830,19 @@ connnected components, such as the lower-case *i*.
             removed.add(child)
 
       new_glyphs = []
+      changed = []
       for glyph in glyphs:
          # Don't re-insert removed children glyphs
          if not glyph in removed:
             if not glyph in self.database:
                self.generate_features(glyph)
                new_glyphs.append(glyph)
+            else:
+               changed.append(glyph)
             glyph.classify_manual([(1.0, id)])
             added.extend(self._do_splits(self, glyph))
-      self.database.extend(new_glyphs)
+      self._change_database(self.database.extend, new_glyphs)
+      self._database_changed(added=new_glyphs, changed=changed)
       return added, list(removed)
 
    def classify_and_update_list_manual(self, glyphs, *args, **kwargs):
@@ -798,7 +868,8 @@ to the training data.  Unlike classify_glyph_manual_, no grouping support is per
              not glyph in self.database):
             self.generate_features(glyph)
             new_glyphs.append(glyph)
-      self.database.extend(new_glyphs)
+      self._change_database(self.database.extend, new_glyphs)
+      self._database_changed(added=new_glyphs)
 
    def remove_from_database(self, glyphs):
       """**remove_from_database** (ImageList *glyphs*)
@@ -807,9 +878,12 @@ Removes the given glyphs from the classifier training data.  Ignores silently
 if a given glyph is not in the training data.
 """
       glyphs = util.make_sequence(glyphs)
+      removed = []
       for glyph in glyphs:
          if glyph in self.database:
-            self.database.remove(glyph)
+            self._change_database(self.database.remove, glyph)
+            removed.append(glyph)
+      self._database_changed(removed=removed)
 
    def display(self, current_database=[], context_image=None, symbol_table=[]):
       """**display** (ImageList *current_database* = ``[]``, Image
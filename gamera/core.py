@@ -37,6 +37,7 @@ MlCc - the same as Cc but with multiple labels
 Additionally this module contains the following functions:
 
 load_image - load an image from a file.
+load_images - load a sequence of image files, loading ahead in the background.
 image_info - get information about an image file.
 display_multi - display a list of images in a grid-like window.
 init_gamera - parse the gamera options and load all of the plugins.
@@ -45,6 +46,7 @@ init_gamera - parse the gamera options and load all of the plugins.
 # Python standard library
 from array import array
 from types import *
+import sys
 
 # import the classification states
 try:
@@ -55,7 +57,7 @@ except ImportError:
 from gameracore import ONEBIT, GREYSCALE, GREY16, RGB, FLOAT, COMPLEX
 from enums import ALL, NONIMAGE
 # import the storage types
-from gameracore import DENSE, RLE
+from gameracore import DENSE, RLE, PACKED
 # import some of the basic types
 from gameracore import ImageData, Size, Dim, Point, \
      FloatPoint, Rect, Region, RegionMap, ImageInfo, RGBPixel
@@ -74,8 +76,8 @@ class SegmentationError(Exception):
 
 ######################################################################
 
-def load_image(filename, compression = DENSE):
-   """**load_image** (FileOpen *filename*, Choice *storage_format* = ``DENSE``)
+def load_image(filename, compression = DENSE, mmap_file = None):
+   """**load_image** (FileOpen *filename*, Choice *storage_format* = ``DENSE``, *mmap_file* = None)
 
 Load an image from the given filename.  At present, TIFF and PNG files are
 supported.
@@ -83,7 +85,16 @@ supported.
 *storage_format*
   The type of `storage format`__ to use for the resulting image.
 
-.. __: image_types.html#storage-formats"""
+.. __: image_types.html#storage-formats
+
+*mmap_file*
+  When given, the image data is stored in a `memory-mapped file`__
+  instead of main memory: the name of a cache file, the name of a
+  directory for an anonymous scratch file, or ``True`` for a scratch
+  file in the temporary directory.  Only ``DENSE`` images can be
+  memory-mapped.
+
+.. __: image_types.html#memory-mapped-images"""
    from gamera import plugin
    import os.path
    methods = plugin.methods_flat_category("File")
@@ -96,12 +107,18 @@ supported.
       filename = filename.encode('utf8')
    except Exception:
       pass
+   if mmap_file is None:
+      args = (filename, compression)
+   else:
+      if compression != DENSE:
+         raise ValueError("Only images with storage format DENSE can be memory-mapped.")
+      args = (filename, compression, mmap_file)
    # First, try being smart by loading by extension
    for method in methods:
       for ext in method.exts:
          if os.path.splitext(filename)[1].lower() == ext.lower():
             try:
-               image = method.__call__(filename, compression)
+               image = method.__call__(*args)
             except Exception:
                pass
             else:
@@ -110,7 +127,7 @@ supported.
    # Then just try all options
    for method in methods:
       try:
-         image = method.__call__(filename, compression)
+         image = method.__call__(*args)
       except Exception:
          pass
       else:
@@ -118,6 +135,98 @@ supported.
 
    raise IOError("'%s' could not be loaded." % filename)
 
+def load_images(filenames, compression = DENSE, prefetch = 4, num_threads = 0):
+   """**load_images** (list *filenames*, Choice *storage_format* = ``DENSE``, int *prefetch* = 4, int *num_threads* = 0)
+
+Loads the images from the given filenames and yields them one after
+another in the same order, like ``load_image`` in a loop.  While an
+image is processed, the next images are already loaded by background
+threads, so that loading and processing overlap.
+
+*filenames*
+  A list (or any other iterable) of image filenames.
+
+*storage_format*
+  The type of `storage format`__ to use for the resulting images.
+
+.. __: image_types.html#storage-formats
+
+*prefetch*
+  The number of images that are loaded ahead.  At most *prefetch*
+  images are held in memory in addition to the one that is returned
+  last.
+
+*num_threads*
+  The number of loading threads, at most *prefetch*.  The default
+  ``0`` uses one thread per processor.  TIFF and PNG files are decoded
+  without the global interpreter lock, so that several files are
+  really decoded in parallel.
+
+An image that can not be loaded raises an ``IOError`` when it is its
+turn, after all previous images have been returned."""
+   import threading, Queue
+   from collections import deque
+   if prefetch < 1:
+      raise ValueError("The prefetch depth must be positive.")
+   if num_threads == 0:
+      try:
+         import multiprocessing
+         num_threads = multiprocessing.cpu_count()
+      except (ImportError, NotImplementedError):
+         num_threads = 1
+   num_threads = max(min(num_threads, prefetch), 1)
+
+   # A job is [filename, done, image, exc_info]
+   jobs = Queue.Queue()
+   def work():
+      while True:
+         job = jobs.get()
+         if job is None:
+            return
+         try:
+            job[2] = load_image(job[0], compression)
+         except Exception:
+            job[3] = sys.exc_info()
+         job[1].set()
+
+   threads = [threading.Thread(target=work) for i in range(num_threads)]
+   for thread in threads:
+      thread.setDaemon(True)
+      thread.start()
+   filenames = iter(filenames)
+   pending = deque()
+   try:
+      while True:
+         while len(pending) < prefetch:
+            try:
+               filename = filenames.next()
+            except StopIteration:
+               break
+            job = [filename, threading.Event(), None, None]
+            pending.append(job)
+            jobs.put(job)
+         if not pending:
+            return
+         job = pending.popleft()
+         job[1].wait()
+         if job[3] is not None:
+            type, value, traceback = job[3]
+            raise type, value, traceback
+         image = job[2]
+         del job
+         yield image
+         del image
+   finally:
+      # When the iteration is stopped early, the images that are not
+      # being loaded yet are not loaded at all.
+      try:
+         while True:
+            jobs.get_nowait()
+      except Queue.Empty:
+         pass
+      for thread in threads:
+         jobs.put(None)
+
 def save_image(image, filename):
    """**save_image** (Image(ALL) *image*, String *filename*)
 
@@ -225,7 +334,8 @@ See `pixel types`_ for more information."""
    pixel_type_name = property(pixel_type_name, doc=pixel_type_name.__doc__)
 
    _storage_format_names = {DENSE:  "Dense",
-                            RLE:    "RLE"}
+                            RLE:    "RLE",
+                            PACKED: "Packed"}
    
    def storage_format_name(self):
       """String **storage_format_name** ()
@@ -238,15 +348,62 @@ See `storage formats`_ for more information."""
       return self._storage_format_names[self.data.storage_format]
    storage_format_name = property(storage_format_name, doc=storage_format_name.__doc__)
 
-   def load_image(filename, compression=DENSE):
+   _byte_order = {"little": "<", "big": ">"}[sys.byteorder]
+   # The numpy type of each pixel type, and the number of bytes per pixel
+   _array_typestrs = {ONEBIT:    (_byte_order + "u2", 2),
+                      GREYSCALE: ("|u1", 1),
+                      GREY16:    (_byte_order + "u4", 4),
+                      RGB:       ("|u1", 3),
+                      FLOAT:     (_byte_order + "f8", 8),
+                      COMPLEX:   (_byte_order + "c16", 16)}
+
+   def __array_interface__(self):
+      """dict **__array_interface__**
+
+Describes the pixels of the image in the `array interface`__ of numpy,
+so that ``numpy.asarray(image)`` returns an array that shares the
+memory of the image instead of copying it.  Changing the array changes
+the image and vice versa.  The array has the shape ``(nrows, ncols)``
+(``(nrows, ncols, 3)`` for RGB images) and the same types as
+``to_numpy``; for a subimage it is a view into the rows of the full
+image.  The array keeps the image alive.  Resizing the image after
+creating an array from it invalidates the array.
+
+Only the pixels of DENSE images can be shared.  For RLE and PACKED
+images and for connected components, the array is a read-only copy of
+the pixels.
+
+.. __: https://docs.scipy.org/doc/numpy/reference/arrays.interface.html"""
+      typestr, pixel_size = self._array_typestrs[self.data.pixel_type]
+      if self.data.pixel_type == RGB:
+         shape = (self.nrows, self.ncols, 3)
+      else:
+         shape = (self.nrows, self.ncols)
+      try:
+         address, row_stride = self._pixel_buffer()
+      except TypeError:
+         return {"version": 3, "shape": shape, "typestr": typestr,
+                 "data": self._to_raw_string()}
+      strides = (row_stride, pixel_size, 1)[:len(shape)]
+      return {"version": 3, "shape": shape, "typestr": typestr,
+              "data": (address, False), "strides": strides}
+   __array_interface__ = property(__array_interface__, doc=__array_interface__.__doc__)
+
+   def load_image(filename, compression=DENSE, mmap_file=None):
       """Load an image from the given filename.  At present, TIFF and PNG files are
 supported.
 
 *storage_format*
   The type of `storage format`__ to use for the resulting image.
 
-.. __: image_types.html#storage-formats"""
-      return load_image(filename, compression)
+.. __: image_types.html#storage-formats
+
+*mmap_file*
+  When given, the image data is stored in a `memory-mapped file`__
+  instead of main memory.
+
+.. __: image_types.html#memory-mapped-images"""
+      return load_image(filename, compression, mmap_file)
    load_image = staticmethod(load_image)
 
    def save_image(self, filename):
@@ -737,11 +894,11 @@ if __name__ == "__main__":
    init_gamera()
 
 __all__ = ("init_gamera UNCLASSIFIED AUTOMATIC HEURISTIC MANUAL "
-           "ONEBIT GREYSCALE GREY16 RGB FLOAT COMPLEX ALL DENSE RLE "
+           "ONEBIT GREYSCALE GREY16 RGB FLOAT COMPLEX ALL DENSE RLE PACKED "
            "CONFIDENCE_DEFAULT CONFIDENCE_KNNFRACTION "
            "CONFIDENCE_LINEARWEIGHT CONFIDENCE_INVERSEWEIGHT "
            "CONFIDENCE_NUN CONFIDENCE_NNDISTANCE CONFIDENCE_AVGDISTANCE "
            "ImageData Size Dim Point FloatPoint Rect Region RegionMap "
            "ImageInfo Image SubImage Cc MlCc load_image image_info "
-           "display_multi ImageBase nested_list_to_image RGBPixel "
+           "load_images display_multi ImageBase nested_list_to_image RGBPixel "
            "save_image").split()
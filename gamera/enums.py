@@ -29,4 +29,5 @@ NONIMAGE = -1
 
 DENSE = 0
 RLE = 1
+PACKED = 2
 
@@ -0,0 +1,264 @@
+# -*- mode: python; indent-tabs-mode: nil; tab-width: 3 -*-
+# vim: set tabstop=3 shiftwidth=3 expandtab:
+#
+# Copyright (C) 2026 Gamera developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""A persistent cache for the features of images.
+
+The features are stored in an SQLite database under a hash of the
+image's pixels and the feature functions, so that glyphs loaded again
+from XML or segmented again from the same page do not need their
+features to be recomputed."""
+
+import array, os, time
+import sqlite3
+try:
+   from hashlib import sha1
+except ImportError:
+   from sha import new as sha1
+
+from gamera import __version__
+from gamera.config import config
+
+config.add_option(
+   "", "--feature-cache", action="store", default=None,
+   help="[features] Cache generated features in the given file")
+
+# Changes whenever the stored features would differ for the same key
+FEATURE_CACHE_VERSION = 1
+
+class FeatureCache:
+   def __init__(self, filename, max_size=64 * 1024 * 1024):
+      """**FeatureCache** (FileSave *filename*, int *max_size* = 64 MB)
+
+Opens (or creates) the feature cache in the file *filename*.
+
+*max_size*
+  The maximal size of the cached features and keys in bytes.  When it
+  is exceeded, the least recently used features are removed.
+
+Several processes may use the same cache file at the same time.  The
+cache never makes feature generation fail: when the file cannot be
+read or written, the features are just computed."""
+      self.filename = os.path.abspath(filename)
+      self.max_size = max_size
+      self._connection = None
+      self._pid = None
+
+   def _get_connection(self):
+      # SQLite connections must not be shared with forked processes
+      if self._connection is None or self._pid != os.getpid():
+         connection = sqlite3.connect(self.filename, timeout=60.0,
+                                      isolation_level=None)
+         connection.text_factory = str
+         try:
+            connection.execute("PRAGMA journal_mode=WAL")
+         except sqlite3.DatabaseError:
+            pass
+         self._begin(connection)
+         try:
+            connection.execute(
+               "CREATE TABLE IF NOT EXISTS features "
+               "(key TEXT PRIMARY KEY, features BLOB, used REAL)")
+            connection.execute(
+               "CREATE INDEX IF NOT EXISTS features_used ON features (used)")
+            connection.execute(
+               "CREATE TABLE IF NOT EXISTS size (bytes INTEGER)")
+            if connection.execute("SELECT COUNT(*) FROM size").fetchone()[0] == 0:
+               connection.execute("INSERT INTO size VALUES (0)")
+            connection.execute("COMMIT")
+         except:
+            connection.execute("ROLLBACK")
+            raise
+         self._connection = connection
+         self._pid = os.getpid()
+      return self._connection
+
+   def _begin(self, connection):
+      # takes the write lock at once, so that concurrent writers wait
+      # for each other instead of failing on the upgrade of a read lock
+      connection.execute("BEGIN IMMEDIATE")
+
+   def _feature_key(self, feature_functions):
+      features = feature_functions[0]
+      return "%s %d %s " % (
+         __version__, FEATURE_CACHE_VERSION,
+         " ".join(["%s.%s:%d" % (function.__module__, name,
+                                 function.return_type.length)
+                   for name, function in features]))
+
+   def key(self, image, feature_functions):
+      """**key** (Image *image*, *feature_functions*)
+
+Returns the key of the features of *image* for the *feature_functions*
+(as returned by ``get_feature_functions``).  It only depends on the
+black pixels of the image, its size and scaling, and the feature
+functions."""
+      hash = sha1(self._feature_key(feature_functions))
+      hash.update("%d %d %r " % (image.nrows, image.ncols, image.scaling))
+      hash.update(image.to_rle())
+      return hash.hexdigest()
+
+   def get_features(self, images, feature_functions):
+      """**get_features** (ImageList *images*, *feature_functions*)
+
+Sets the features of all *images* that are in the cache, and returns
+the list of the remaining images together with their keys."""
+      keys = [self.key(image, feature_functions) for image in images]
+      found = {}
+      try:
+         connection = self._get_connection()
+         for start in range(0, len(keys), 256):
+            chunk = keys[start:start + 256]
+            marks = ",".join(["?"] * len(chunk))
+            for key, features in connection.execute(
+               "SELECT key, features FROM features WHERE key IN (%s)" % marks,
+               chunk):
+               found[key] = features
+         if found:
+            self._begin(connection)
+            try:
+               now = time.time()
+               connection.executemany(
+                  "UPDATE features SET used = ? WHERE key = ?",
+                  [(now, key) for key in found])
+               connection.execute("COMMIT")
+            except:
+               connection.execute("ROLLBACK")
+               raise
+      except sqlite3.Error:
+         pass
+      missing = []
+      num_features = feature_functions[1]
+      for image, key in zip(images, keys):
+         features = found.get(key)
+         if features is not None and len(features) == num_features * 8:
+            image.features = array.array('d', str(features))
+            image.feature_functions = feature_functions
+         else:
+            missing.append((image, key))
+      return missing
+
+   def set_features(self, images):
+      """**set_features** (*images*)
+
+Stores the features of the images in the cache.  *images* is a list
+of images together with their keys, as returned by ``get_features``."""
+      if not len(images):
+         return
+      now = time.time()
+      rows = [(key, sqlite3.Binary(image.features.tostring()), now)
+              for image, key in images]
+      try:
+         connection = self._get_connection()
+         self._begin(connection)
+         try:
+            added = 0
+            for row in rows:
+               cursor = connection.execute(
+                  "INSERT OR IGNORE INTO features VALUES (?, ?, ?)", row)
+               if cursor.rowcount > 0:
+                  added += len(row[0]) + len(row[1])
+            connection.execute("UPDATE size SET bytes = bytes + ?", (added,))
+            size = connection.execute("SELECT bytes FROM size").fetchone()[0]
+            if size > self.max_size:
+               self._evict(connection, size)
+            connection.execute("COMMIT")
+         except:
+            connection.execute("ROLLBACK")
+            raise
+      except sqlite3.Error:
+         pass
+
+   def _evict(self, connection, size):
+      # removes the least recently used features until there is room
+      # for some more, so that this does not happen on every insertion
+      target = self.max_size * 0.9
+      removed = []
+      for key, length in connection.execute(
+         "SELECT key, LENGTH(key) + LENGTH(features) FROM features "
+         "ORDER BY used"):
+         if size <= target:
+            break
+         removed.append((key,))
+         size -= length
+      connection.executemany("DELETE FROM features WHERE key = ?", removed)
+      connection.execute("UPDATE size SET bytes = ?", (size,))
+
+   def clear(self):
+      """**clear** ()
+
+Removes all features from the cache."""
+      connection = self._get_connection()
+      self._begin(connection)
+      try:
+         connection.execute("DELETE FROM features")
+         connection.execute("UPDATE size SET bytes = 0")
+         connection.execute("COMMIT")
+      except:
+         connection.execute("ROLLBACK")
+         raise
+
+   def close(self):
+      """**close** ()
+
+Closes the cache file.  It is opened again when the cache is used."""
+      if self._connection is not None and self._pid == os.getpid():
+         self._connection.close()
+      self._connection = None
+
+   def __len__(self):
+      return self._get_connection().execute(
+         "SELECT COUNT(*) FROM features").fetchone()[0]
+
+_feature_cache = None
+_feature_cache_checked = False
+
+def set_feature_cache(cache):
+   """**set_feature_cache** (*cache*)
+
+Sets the feature cache used by ``generate_features`` and
+``generate_features_list``.  *cache* is a FeatureCache, a file name
+or ``None`` to disable the cache.  By default, the file given by the
+``--feature-cache`` option is used."""
+   global _feature_cache, _feature_cache_checked
+   if isinstance(cache, basestring):
+      cache = FeatureCache(cache)
+   if _feature_cache is not None and _feature_cache is not cache:
+      _feature_cache.close()
+   _feature_cache = cache
+   _feature_cache_checked = True
+
+def get_feature_cache():
+   """**get_feature_cache** ()
+
+Returns the current feature cache, or ``None`` when features are not
+cached."""
+   global _feature_cache, _feature_cache_checked
+   if not _feature_cache_checked:
+      _feature_cache_checked = True
+      try:
+         filename = config.get("feature_cache")
+      except AttributeError:
+         # the options were parsed before this module was loaded
+         filename = None
+      if filename:
+         _feature_cache = FeatureCache(filename)
+   return _feature_cache
+
+__all__ = ["FeatureCache", "set_feature_cache", "get_feature_cache"]
@@ -504,7 +504,7 @@ class PluginDocumentationGenerator:
          self.docgen.output_images_path, filename + ".png"))
 
    def write_image(self, s, filename, tag=""):
-      image = _png_support.load_PNG(os.path.join(self.docgen.output_images_path, filename + ".png"), 0)
+      image = _png_support.load_PNG(os.path.join(self.docgen.output_images_path, filename + ".png"), 0, "")
       s.write(".. %s image:: images/%s.png\n   :height: %d\n   :width: %d\n\n" %
               (tag, filename, image.height, image.width))
 
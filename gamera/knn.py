@@ -24,6 +24,7 @@ from gamera import core, util, config, classify
 from gamera.plugins import features as features_module
 import gamera.knncore, gamera.gamera_xml
 import array
+import weakref
 
 from gamera.knncore import CITY_BLOCK
 from gamera.knncore import EUCLIDEAN
@@ -142,6 +143,10 @@ class _kNNBase(gamera.knncore.kNN):
    def __del__(self):
       pass
 
+   def _instantiate_database(self):
+      # create the data for classify, leave_one_out etc. from the database
+      self.instantiate_from_images(self.database, self.normalize)
+
    def distance_from_images(self, images, glyph, max=None):
       """**distance_from_images** (ImageList *glyphs*, Image *glyph*, Float *max* = ``None``)
 
@@ -205,6 +210,68 @@ of (distance, imagea, imageb) so that it easy to sort.
       progress.kill()
       return dists
 
+   def distance_array(self, images, condensed=True, normalize=True, out=None):
+      """**distance_array** (ImageList *images*, Bool *condensed* = ``True``, Bool *normalize* = ``True``, *out* = ``None``)
+
+Compute the distances between all pairs of images in the list into a
+flat array of numbers. For large lists this needs much less memory
+than distance_matrix_ and unique_distances_, and the distances are
+computed in parallel (see the *num_threads* setting).
+
+*condensed*
+  When true, the array holds the ``n*(n-1)/2`` distances of the pairs
+  (*i*, *j*) with *i* < *j* row by row as 32 bit floats, i.e. the
+  distance between the images *i* < *j* is at index
+  ``i*n - i*(i+1)/2 + j - i - 1`` (the layout used by
+  ``scipy.spatial.distance.pdist``). Otherwise the array holds the
+  full symmetric ``n*n`` matrix as 64 bit floats.
+
+*normalize*
+  When true, the features are normalized before performing the distance
+  calculations.
+
+*out*
+  A writable contiguous numpy array or ``array.array`` of the right
+  size into which the distances are written. Its type must be
+  ``float32`` (``'f'``) for the condensed distances and ``float64``
+  (``'d'``) for the full matrix. When not given, a numpy array is returned (of shape
+  ``(n, n)`` for the full matrix), or an ``array.array`` when numpy
+  is not installed."""
+      self.generate_features_on_glyphs(images)
+      l = len(images)
+      if condensed:
+         typecode = 'f'
+         size = l * (l - 1) / 2
+      else:
+         typecode = 'd'
+         size = l * l
+      if out is None:
+         try:
+            import numpy
+         except ImportError:
+            out = array.array(typecode, [0.0]) * size
+         else:
+            out = numpy.empty(size, typecode)
+            if not condensed:
+               out.shape = (l, l)
+      else:
+         # the buffer only knows its size in bytes
+         if hasattr(out, 'typecode'):
+            out_typecode = out.typecode
+         elif hasattr(out, 'dtype'):
+            out_typecode = out.dtype.char
+         else:
+            out_typecode = getattr(out, 'format', None)
+         if out_typecode != typecode:
+            if condensed:
+               raise ValueError("out must hold 32 bit floats ('f') for the condensed distances.")
+            raise ValueError("out must hold 64 bit floats ('d') for the full distance matrix.")
+      progress = util.ProgressFactory("Generating distance array...", l)
+      try:
+         return self._distances_into(images, out, condensed, progress.step, normalize)
+      finally:
+         progress.kill()
+
    def evaluate(self):
       """Float **evaluate** ()
 
@@ -213,10 +280,47 @@ leave-one-out cross-validation. The return value is a
 floating-point number between 0.0 (0% correct) and 1.0 (100%
 correct).
 """
-      self.instantiate_from_images(self.database, self.normalize)
+      self._instantiate_database()
       ans = self.leave_one_out()
       return float(ans[0]) / float(ans[1])
 
+   def evaluate_kfold(self, folds=10):
+      """(Float, dict, dict) **evaluate_kfold** (int *folds* = 10)
+
+Evaluate the performance of the kNN classifier using stratified
+*folds*-fold cross-validation: the glyphs of each class are distributed
+evenly over the folds, and the glyphs of each fold are classified using
+the glyphs of all other folds as training data.  The glyphs are
+classified in parallel with ``num_threads`` threads.
+
+The return value is a tuple ``(accuracy, class_accuracy, confusion)``:
+
+*accuracy*
+  The fraction of correctly classified glyphs (between 0.0 and 1.0).
+
+*class_accuracy*
+  A dictionary mapping each class name to the fraction of the glyphs
+  of this class that were classified correctly.
+
+*confusion*
+  A dictionary mapping pairs ``(class_name, classified_as)`` to the
+  number of glyphs of class *class_name* that were classified as
+  *classified_as*.
+"""
+      self._instantiate_database()
+      confusion = self._stratified_kfold(folds)
+      totals = {}
+      correct = {}
+      for ((id_name, answer), count) in confusion.items():
+         totals[id_name] = totals.get(id_name, 0) + count
+         if id_name == answer:
+            correct[id_name] = correct.get(id_name, 0) + count
+      class_accuracy = {}
+      for (id_name, total) in totals.items():
+         class_accuracy[id_name] = float(correct.get(id_name, 0)) / float(total)
+      accuracy = float(sum(correct.values())) / float(sum(totals.values()))
+      return (accuracy, class_accuracy, confusion)
+
    def knndistance_statistics(self, k=0):
       """**knndistance_statistics** (Int *k* = 0)
 
@@ -235,7 +339,7 @@ to the specific class.
 
 When *k* is zero, the property ``num_k`` of the knn classifier is used.
 """
-      self.instantiate_from_images(self.database, self.normalize)
+      self._instantiate_database()
       progress = util.ProgressFactory("Generating knndistance statistics...", len(self.database))
       stats = self._knndistance_statistics(k, progress.step)
       progress.kill()
@@ -370,7 +474,46 @@ classifer-specific format."""
 
 Generates features for the given glyph.
 """
-      glyph.generate_features(self.feature_functions)
+      glyph.generate_features(self.feature_functions,
+                              required=self._get_required_features())
+
+   def generate_features_on_glyphs(self, glyphs):
+      """Generates features for all the given glyphs."""
+      if self.__class__.generate_features.im_func is not \
+             _kNNBase.generate_features.im_func:
+         # subclasses may override generate_features (see "Overriding
+         # the kNN features" in the documentation)
+         classify._Classifier.generate_features_on_glyphs(self, glyphs)
+      else:
+         # computed in parallel with the classifier's number of threads
+         features_module.generate_features_list(
+            glyphs, self.feature_functions, self.num_threads)
+
+   def _generate_features_to_classify(self, glyphs):
+      if self.__class__.generate_features.im_func is not \
+             _kNNBase.generate_features.im_func:
+         classify._Classifier._generate_features_to_classify(self, glyphs)
+      else:
+         features_module.generate_features_list(
+            glyphs, self.feature_functions, self.num_threads,
+            self._get_required_features())
+
+   def get_required_features(self):
+      """**get_required_features** ()
+
+Returns the names of the feature functions with at least one selected
+component (see get_selections_by_features_).  Only these feature
+functions affect the classification."""
+      selections = self.get_selections_by_features()
+      return [name for name, function in self.feature_functions[0]
+              if max(selections[name]) > 0]
+
+   def _get_required_features(self):
+      # the feature functions to generate for glyphs that are classified
+      # (None for all); all features are generated for the interactive
+      # classifier, since the classified glyphs may be added to its
+      # database
+      return None
 
    def __get_settings_by_features(self, function):
       result = {}
@@ -535,9 +678,21 @@ Set the weighting vector elements for one specific feature.
       weights[feature_name] = values
       self.set_weights_by_features(weights)
 
+def _length_change_callback(classifier):
+   # Marks the rows of the classifier as out of date, unless the
+   # classifier changes the database itself (and reports the change to
+   # _database_changed). Only a weak reference is kept, so that the
+   # classifier and its database do not keep each other alive.
+   ref = weakref.ref(classifier)
+   def callback(length):
+      classifier = ref()
+      if classifier is not None and not classifier._changing_database:
+         classifier._untracked_changes = True
+   return callback
+
 class kNNInteractive(_kNNBase, classify.InteractiveClassifier):
-   def __init__(self, database=[], features='all', perform_splits=1, num_k=1):
-      """**kNNInteractive** (ImageList *database* = ``[]``, *features* = 'all', bool *perform_splits* = ``True``, int *num_k* = ``1``)
+   def __init__(self, database=[], features='all', perform_splits=1, num_k=1, single_precision=False):
+      """**kNNInteractive** (ImageList *database* = ``[]``, *features* = 'all', bool *perform_splits* = ``True``, int *num_k* = ``1``, bool *single_precision* = ``False``)
 
 Creates a new kNN interactive classifier instance.
 
@@ -581,17 +736,82 @@ Creates a new kNN interactive classifier instance.
 
 .. __: writing_plugins.html
 
+*single_precision*
+    Store the feature vectors of the training data as 32 bit floats.
+    See the *single_precision* argument of ``kNNNonInteractive``.
+
       """
       self.features = features
       self.feature_functions = core.ImageBase.get_feature_functions(features)
       num_features = features_module.get_features_length(features)
       _kNNBase.__init__(self, num_features=num_features, num_k=num_k)
+      self.single_precision = single_precision
+      # The row of each glyph of the database in the kNN object, which
+      # is None until the rows are created from the database.
+      self._rows = None
+      self._row_glyphs = []
       classify.InteractiveClassifier.__init__(self, database, perform_splits)
+      # Glyphs can also be added to or removed from the database
+      # directly (e.g. through get_glyphs()), without _database_changed
+      # being called. This is noticed from the change of its length.
+      self._untracked_changes = False
+      self.database.add_callback('length_change', _length_change_callback(self))
 
    def __del__(self):
       _kNNBase.__del__(self)
       classify.InteractiveClassifier.__del__(self)
 
+   def _instantiate_database(self):
+      # The kNN object holds the feature vectors of the database, so
+      # that classification does not need to read the features of every
+      # glyph again. They are created from the whole database only once
+      # (or when the database was changed behind the classifier's back);
+      # afterwards _database_changed updates them incrementally.
+      if self._rows is None or self._untracked_changes:
+         glyphs = list(self.database)
+         self._rows = None
+         self._untracked_changes = False
+         if len(glyphs) == 0:
+            return
+         _kNNBase.instantiate_from_images(self, glyphs, self.normalize)
+         self._row_glyphs = glyphs
+         self._rows = dict([(glyphs[i], i) for i in range(len(glyphs))])
+
+   def instantiate_from_images(self, images, normalize=False):
+      # the data no longer mirrors the database
+      self._rows = None
+      _kNNBase.instantiate_from_images(self, images, normalize)
+
+   def _database_changed(self, added=[], removed=[], changed=[]):
+      if self._rows is None:
+         return
+      for glyph in removed:
+         row = self._rows.pop(glyph, None)
+         if row is not None:
+            # the last row is moved into the gap
+            self.remove_feature_vector(row)
+            last = self._row_glyphs.pop()
+            if row < len(self._row_glyphs):
+               self._row_glyphs[row] = last
+               self._rows[last] = row
+      for glyph in changed:
+         row = self._rows.get(glyph)
+         if row is not None:
+            self.update_from_image(row, glyph)
+      for glyph in list(added) + list(changed):
+         if not glyph in self._rows:
+            self._rows[glyph] = self.insert_from_image(glyph)
+            self._row_glyphs.append(glyph)
+
+   def _classify_with_database(self, glyph):
+      self._instantiate_database()
+      if self._rows is not None:
+         # Glyphs of the database may have been reclassified directly
+         # (e.g. with classify_heuristic), so their class names are read
+         # again.
+         self.update_id_names(self._row_glyphs)
+      return self.classify(glyph)
+
    def noninteractive_copy(self):
       """**noninteractive_copy** ()
 
@@ -616,14 +836,16 @@ Changes the set of features used in the classifier to the given list of feature
       self.features = f
       self.feature_functions = core.ImageBase.get_feature_functions(f)
       self.num_features = features_module.get_features_length(f)
+      self._rows = None
       if len(self.database):
          self.is_dirty = True
          self.generate_features_on_glyphs(self.database)
 
 class kNNNonInteractive(_kNNBase, classify.NonInteractiveClassifier):
-   def __init__(self, database=[], features='all', perform_splits=True, num_k=1, normalize=False):
+   def __init__(self, database=[], features='all', perform_splits=True, num_k=1, normalize=False, use_index=False, single_precision=False):
       """**kNNNonInteractive** (ImageList *database* = ``[]``, *features* = ``'all'``,
-bool *perform_splits* = ``True``, int *num_k* = ``1``, bool *normalize* = ``False``)
+bool *perform_splits* = ``True``, int *num_k* = ``1``, bool *normalize* = ``False``,
+bool *use_index* = ``False``, bool *single_precision* = ``False``)
 
 Creates a new kNN classifier instance.
 
@@ -678,11 +900,30 @@ Creates a new kNN classifier instance.
 *normalize*
     Normalize the feature vectors: x' = (x - mean_x)/stdev_x
 
+*use_index*
+    Build a kd-tree index over the training data, which can speed
+    up the classification of large training sets considerably when
+    only a few features are selected. For many features, the index
+    can be slower than the linear search. The
+    classification result is the same as without an index. The index
+    is rebuilt whenever the training data, the selections or the
+    weights change; the time in seconds for the last build is
+    available as the property ``index_build_time``.
+
+*single_precision*
+    Store the feature vectors of the training data as 32 bit floats
+    instead of 64 bit doubles, which halves their memory and speeds
+    up classification of large training sets, while the distances are
+    still computed in double precision.  See the *single_precision*
+    setting.
+
       """
       self.features = features
       self.feature_functions = core.ImageBase.get_feature_functions(features)
       num_features = features_module.get_features_length(features)
       _kNNBase.__init__(self, num_features=num_features, num_k=num_k, normalize=normalize)
+      self.use_index = use_index
+      self.single_precision = single_precision
       classify.NonInteractiveClassifier.__init__(self, database, perform_splits)
 
    def __del__(self):
@@ -707,6 +948,60 @@ Changes the set of features used in the classifier to the given list of feature
          self.generate_features_on_glyphs(self.database)
          self.instantiate_from_images(self.database, self.normalize)
 
+   def _classify_automatic_list_impl(self, glyphs):
+      return self.classify_many(glyphs)
+
+   def _get_required_features(self):
+      # features with a selection of zero do not affect the classification
+      # (e.g. after a feature selection with the GA optimizer), so they are
+      # not generated for the glyphs to classify
+      if not self.num_features or min(self.get_selections()) > 0:
+         return None
+      return self.get_required_features()
+
+   def save_snapshot(self, filename):
+      """**save_snapshot** (FileSave *filename*)
+
+Saves the classifier-specific settings *and* data as a snapshot, which
+can be opened with *load_snapshot* without reading or parsing the
+data.  Unlike *serialize*, the snapshot is memory mapped when it is
+loaded, so several processes classifying with the same snapshot share
+the feature vectors and class names of a single copy in memory.
+
+.. note::
+   The snapshot can only be loaded on platforms with the same byte order
+   and the same sizes of numbers.  Keep the XML file for portability."""
+      if self.features == 'all':
+         gamera.knncore.kNN.save_snapshot(self, filename, ['all'])
+      else:
+         gamera.knncore.kNN.save_snapshot(self, filename, self.features)
+
+   def load_snapshot(self, filename):
+      """**load_snapshot** (FileOpen *filename*)
+
+Opens a snapshot saved with *save_snapshot*.  The file is memory mapped
+read-only and used in place.  Saving a snapshot again under the same
+name replaces the file instead of rewriting it, so classifiers that
+already use the old snapshot keep it, and only snapshots loaded
+afterwards see the new one.  Changing the selections or weights
+afterwards only affects this classifier."""
+      features = gamera.knncore.kNN.load_snapshot(self, filename)
+      if len(features) == 1 and features[0] == 'all':
+         self.change_feature_set('all')
+      else:
+         self.change_feature_set(features)
+
+   def unserialize(self, filename):
+      """**unserialize** (FileOpen *filename*)
+
+Opens the classifier-specific settings *and* data from an optimized and
+classifer-specific format.  Files written by *save_snapshot* are opened
+with *load_snapshot*."""
+      if gamera.knncore.is_snapshot(filename):
+         self.load_snapshot(filename)
+      else:
+         _kNNBase.unserialize(self, filename)
+
    def set_normalization_state(self, flag):
       """**set_normalization_state** (bool *flag*)
 Set whether normalization is used or not for classification.
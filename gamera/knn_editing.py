@@ -16,21 +16,11 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from random import randint
+from random import shuffle
 from gamera.args import Args, Int, Check
 from gamera.knn import kNNInteractive
 from gamera.util import ProgressFactory
 
-def _randomSetElement(set):
-    """Retrieve a random element from the given set
-
-    *set*
-      The set from which to select a random element"""
-    randPos = randint(0, len(set) - 1);
-    for pos, elem in enumerate(set):
-        if pos == randPos:
-            return elem
-
 def _copyClassifier(original, k = 0):
     """Copy a given kNNClassifer by constructing a new one with identical
 parameters.
@@ -43,19 +33,47 @@ parameters.
       k = 0 means, that the original's k-value will be used"""
     if k == 0:
         k = original.num_k
-    return kNNInteractive(
-                list(original.get_glyphs()), original.features,
-                original._perform_splits,
-                k)
-
-def _getMainId(classificationResult):
-    """Classification results returned from a kNN Classifier are in a list
-containing '(confidence, className)' tuples. So to determine the 'main class',
-the classname with the highest confidence has to be returned.
-"""
-    # classificationResult is a tuple of the form
-    #   ([idname1, idname2, ...], confidences_for_idname1)
-    return classificationResult[0][0][1]
+    return _classifierFromRows(original, list(original.get_glyphs()), k)
+
+def _classifierFromRows(original, glyphs, k, rows = None):
+    """Construct a new kNNInteractive classifier with the same parameters as
+the given one from the given glyphs.
+
+    *rows*
+      If given, only the glyphs at these positions are used"""
+    if rows is not None:
+        glyphs = [glyphs[row] for row in rows]
+    return kNNInteractive(glyphs, original.features, original._perform_splits, k)
+
+def _rowGlyphs(classifier):
+    """Returns the glyphs of the classifier in the order of the rows of its
+feature data, to which the results of the native editing functions refer."""
+    classifier._instantiate_database()
+    if classifier._rows is None:
+        return []
+    return list(classifier._row_glyphs)
+
+def _editMnn(classifier, k, protectRare, rareThreshold):
+    """Returns the rows kept by Wilson's editing"""
+    if not protectRare:
+        rareThreshold = 0
+    progress = ProgressFactory("Generating edited MNN classifier...",
+                               len(classifier.get_glyphs()))
+    try:
+        return classifier._edit_mnn(k, rareThreshold, progress.step)
+    finally:
+        progress.kill()
+
+def _editCnn(classifier, k, rows, randomize):
+    """Returns the rows of the store of Hart's condensing of the given rows"""
+    rows = list(rows)
+    if randomize:
+        shuffle(rows)
+    progress = ProgressFactory("Generating edited CNN classifier...", len(rows))
+    try:
+        return classifier._edit_cnn(k, rows, progress.step)
+    finally:
+        progress.kill()
 
 class AlgoRegistry(object):
     """Registry containing a list of all available editing algorithms. Besides
@@ -157,53 +175,14 @@ Reference: D. Wilson: 'Asymptotic Properties of NN Rules Using Edited Data'.
 
     def __call__(self, classifier, k = 0, protectRare = True,
                  rareThreshold = 3):
-
-        editedClassifier = _copyClassifier(classifier, k)
-        toBeRemoved = set()
-        progress = ProgressFactory("Generating edited MNN classifier...",
-                                      len(classifier.get_glyphs()))
-
-        # classify each glyph with its leave-one-out classifier
-        for i, glyph in enumerate(classifier.get_glyphs()):
-            editedClassifier.get_glyphs().remove(glyph)
-            detectedClass = _getMainId(\
-                                editedClassifier.guess_glyph_automatic(glyph))
-            # check if recognized class complies with the true class
-            if glyph.get_main_id() != detectedClass:
-                toBeRemoved.add(glyph)
-            editedClassifier.get_glyphs().add(glyph)
-            progress.step()
-
-        rareClasses = self._getRareClasses(classifier.get_glyphs(),
-                                           protectRare, rareThreshold)
-        
-        # remove 'bad' glyphs, if they are not in a rare class
-        for glyph in toBeRemoved:
-            if glyph.get_main_id() in rareClasses:
-                continue
-            editedClassifier.get_glyphs().remove(glyph)
-            
-        progress.kill()
-        return editedClassifier
-    
-    def _getRareClasses(self, glyphs, protectRare, rareThreshold):
-        """Produces a set containing the names of all rare classes"""
-        result = set()
-        
-        if not protectRare: 
-            return result
-        
-        # histogram of classNames
-        histo = {}        
-        for g in glyphs:
-            count = histo.get(g.get_main_id(), 0)
-            histo[g.get_main_id()] = count + 1
-        
-            
-        for className in histo:
-            if histo[className] < rareThreshold:
-                result.add(className)        
-        return result
+        if k == 0:
+            k = classifier.num_k
+        glyphs = _rowGlyphs(classifier)
+        # special case of empty classifier
+        if not glyphs:
+            return _copyClassifier(classifier, k)
+        rows = _editMnn(classifier, k, protectRare, rareThreshold)
+        return _classifierFromRows(classifier, glyphs, k, rows)
 
 edit_mnn = EditMnn()    
 
@@ -233,49 +212,14 @@ Reference: P.E. Hart: 'The Condensed Nearest Neighbor rule'. *IEEE Transactions
                  Check("Randomize", default = True)])
 
     def __call__(self, classifier, k = 0, randomize = True):
-        # special case of empty classifier
-        if (not classifier.get_glyphs()):
-            return _copyClassifier(classifier)
-
         if k == 0:
             k = classifier.num_k
-        
-        progress = ProgressFactory("Generating edited CNN classifier...",
-                                      len(classifier.get_glyphs()))
-
-        # initialize Store (a) with a single element
-        if randomize:
-            elem = _randomSetElement(classifier.get_glyphs())
-        else:
-            elem = classifier.get_glyphs().__iter__().next()
-        
-        aGlyphs = [elem]
-        a = kNNInteractive(aGlyphs, classifier.features, 
-                           classifier._perform_splits, k)
-        progress.step()
-        
-        # initialize Grabbag (b) with all other
-        b = classifier.get_glyphs().copy()
-        b.remove(aGlyphs[0]);
-
-        # Classify each glyph in b with a as the classifier
-        # If glyph is misclassified, add it to a, repeat until no elements are 
-        # added to a
-        changed = True
-        while changed == True:
-            changed = False
-            # copy needed because iteration through dict is not possible while 
-            # deleting items from it
-            copyOfB = b.copy()
-            for glyph in copyOfB:
-                if glyph.get_main_id() != _getMainId(a.guess_glyph_automatic(glyph)):
-                    b.remove(glyph)
-                    a.get_glyphs().add(glyph)
-                    progress.step()
-                    changed = True
-        progress.kill()
-        a.num_k = 1
-        return a
+        glyphs = _rowGlyphs(classifier)
+        # special case of empty classifier
+        if not glyphs:
+            return _copyClassifier(classifier)
+        rows = _editCnn(classifier, k, range(len(glyphs)), randomize)
+        return _classifierFromRows(classifier, glyphs, 1, rows)
 
 edit_cnn = EditCnn()
 
@@ -296,7 +240,15 @@ For documentation of the parameters see the independent algorithms"""
 
     def __call__(self, classifier, k = 0, protectRare = True,
                  rareThreshold = 3, randomize = True):
-        return edit_cnn(edit_mnn(classifier, k, protectRare, rareThreshold),
-                   randomize)
+        if k == 0:
+            k = classifier.num_k
+        glyphs = _rowGlyphs(classifier)
+        # special case of empty classifier
+        if not glyphs:
+            return _copyClassifier(classifier)
+        # both steps work on the feature data of the given classifier
+        rows = _editMnn(classifier, k, protectRare, rareThreshold)
+        rows = _editCnn(classifier, k, rows, randomize)
+        return _classifierFromRows(classifier, glyphs, 1, rows)
 
 edit_mnn_cnn = EditMnnCnn()
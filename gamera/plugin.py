@@ -78,6 +78,17 @@ class PluginFunction:
    progress_bar = ""
    author = None
    add_to_image = True
+   # The C++ function is called with the global interpreter lock
+   # released, so that it can run in parallel with other Python threads.
+   # Only for functions that do not use Python objects while computing.
+   release_gil = False
+   # Local filters, whose result at a pixel only depends on the pixels
+   # at most tile_halo pixels away, can be run tile by tile on large
+   # images (see gamera.tiles).  Either the number of pixels, or a
+   # function that computes it from the arguments of the plugin
+   # function (without self).  A value of None (or a function returning
+   # None) means the plugin function can not be run tile by tile.
+   tile_halo = None
 
    def get_formatted_argument_list(cls):
       return "**%s** (%s)" % (cls.__name__, ', '.join(
@@ -64,9 +64,13 @@ class mean_filter(PluginFunction):
     self_type = ImageType([GREYSCALE,GREY16,FLOAT])
     args = Args([Int("region size", default=5)])
     doc_examples = [(GREYSCALE,), (GREY16,), (FLOAT,)]
+    release_gil = True
     def __call__(self, region_size=5):
         return _binarization.mean_filter(self, region_size)
     __call__ = staticmethod(__call__)
+    def tile_halo(region_size=5):
+        return region_size / 2
+    tile_halo = staticmethod(tile_halo)
 
 
 class variance_filter(PluginFunction):
@@ -112,9 +116,16 @@ class wiener_filter(PluginFunction):
     args = Args([Int("region size", default=5),
                  Real("noise variance", default=-1.0)])
     doc_examples = [(GREYSCALE,), (GREY16,), (FLOAT,)]
+    release_gil = True
     def __call__(self, region_size=5, noise_variance=-1):
         return _binarization.wiener_filter(self, region_size, noise_variance)
     __call__ = staticmethod(__call__)
+    def tile_halo(region_size=5, noise_variance=-1):
+        # the estimated noise variance depends on the whole image
+        if noise_variance < 0:
+            return None
+        return region_size / 2
+    tile_halo = staticmethod(tile_halo)
 
 
 class niblack_threshold(PluginFunction):
@@ -146,6 +157,7 @@ class niblack_threshold(PluginFunction):
                  Int("lower bound", range=(0,255), default=20),
                  Int("upper bound", range=(0,255), default=150)])
     doc_examples = [(GREYSCALE,)]
+    release_gil = True
     def __call__(self, 
                  region_size=15, 
                  sensitivity=-0.2,
@@ -157,6 +169,9 @@ class niblack_threshold(PluginFunction):
                                                lower_bound,
                                                upper_bound)
     __call__ = staticmethod(__call__)
+    def tile_halo(region_size=15, *args):
+        return region_size / 2
+    tile_halo = staticmethod(tile_halo)
 
    
 class sauvola_threshold(PluginFunction):
@@ -192,6 +207,7 @@ class sauvola_threshold(PluginFunction):
                  Int("lower bound", range=(0,255), default=20),
                  Int("upper bound", range=(0,255), default=150)])
     doc_examples = [(GREYSCALE,)]
+    release_gil = True
     def __call__(self, 
                  region_size=15, 
                  sensitivity=0.5, 
@@ -205,6 +221,9 @@ class sauvola_threshold(PluginFunction):
                                                lower_bound,
                                                upper_bound)
     __call__ = staticmethod(__call__)
+    def tile_halo(region_size=15, *args):
+        return region_size / 2
+    tile_halo = staticmethod(tile_halo)
 
 class gatos_background(PluginFunction):
     """
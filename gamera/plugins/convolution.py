@@ -27,6 +27,19 @@ import _convolution
 
 CONVOLUTION_TYPES = [GREYSCALE, GREY16, FLOAT, RGB, COMPLEX]
 
+def _kernel_tile_halo(kernels, border_treatment):
+    # The wrap border treatment takes pixels from the opposite border
+    # of the image, so it can not be computed tile by tile
+    if border_treatment == 4:
+        return None
+    halo = 0
+    for kernel in kernels:
+        if type(kernel) == list:
+            halo = max([halo, len(kernel)] + [len(row) for row in kernel])
+        else:
+            halo = max(halo, kernel.nrows, kernel.ncols)
+    return halo
+
 # Note: The convolution exposed here does not allow for the case where the
 # logical center of the kernel is different from the physical center.
 # Saving that for another day... MGD
@@ -90,6 +103,7 @@ class convolve(PluginFunction):
                         ['avoid', 'clip', 'repeat', 'reflect', 'wrap'],
                         default=1)])
     return_type = ImageType(CONVOLUTION_TYPES)
+    release_gil = True
 
     def __call__(self, kernel, border_treatment=3):
         from gamera.gameracore import FLOAT
@@ -98,6 +112,10 @@ class convolve(PluginFunction):
         return _convolution.convolve(self, kernel, border_treatment)
     __call__ = staticmethod(__call__)
 
+    def tile_halo(kernel, border_treatment=3):
+        return _kernel_tile_halo([kernel], border_treatment)
+    tile_halo = staticmethod(tile_halo)
+
 class convolve_xy(PluginFunction):
     u"""
     Convolves an image in both X and Y directions with 1D kernels.
@@ -147,6 +165,12 @@ class convolve_xy(PluginFunction):
         return _convolution.convolve_y(result, kernel_y, border_treatment)
     __call__ = staticmethod(__call__)
 
+    def tile_halo(kernel_x, kernel_y=None, border_treatment=1):
+        if kernel_y is None:
+            kernel_y = kernel_x
+        return _kernel_tile_halo([kernel_x, kernel_y], border_treatment)
+    tile_halo = staticmethod(tile_halo)
+
 class convolve_x(PluginFunction):
     u"""
     Convolves an image in the X directions with a 1D kernel.  This is
@@ -172,6 +196,7 @@ class convolve_x(PluginFunction):
                         ['avoid', 'clip', 'repeat', 'reflect', 'wrap'],
                         default=1)])
     return_type = ImageType(CONVOLUTION_TYPES)
+    release_gil = True
 
     def __call__(self, kernel, border_treatment=1):
         from gamera.gameracore import FLOAT
@@ -180,6 +205,10 @@ class convolve_x(PluginFunction):
         return _convolution.convolve_x(self, kernel, border_treatment)
     __call__ = staticmethod(__call__)
 
+    def tile_halo(kernel, border_treatment=1):
+        return _kernel_tile_halo([kernel], border_treatment)
+    tile_halo = staticmethod(tile_halo)
+
 class convolve_y(PluginFunction):
     u"""
     Convolves an image in the X directions with a 1D kernel.  This is
@@ -204,6 +233,7 @@ class convolve_y(PluginFunction):
                         ['avoid', 'clip', 'repeat', 'reflect', 'wrap'],
                         default=1)])
     return_type = ImageType(CONVOLUTION_TYPES)
+    release_gil = True
 
     def __call__(self, kernel, border_treatment=1):
         from gamera.gameracore import FLOAT
@@ -212,6 +242,10 @@ class convolve_y(PluginFunction):
         return _convolution.convolve_y(self, kernel, border_treatment)
     __call__ = staticmethod(__call__)
 
+    def tile_halo(kernel, border_treatment=1):
+        return _kernel_tile_halo([kernel], border_treatment)
+    tile_halo = staticmethod(tile_halo)
+
 ########################################
 # Convolution kernels
 
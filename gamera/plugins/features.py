@@ -20,6 +20,7 @@
 import array
 from gamera.plugin import *
 import _features
+from gamera import feature_cache
 
 class Feature(PluginFunction):
     self_type = ImageType([ONEBIT])
@@ -264,6 +265,11 @@ class zernike_moments(Feature):
     The moments *A00* and *A11* are not computed because these are constant
     under the used normalization scheme.
 
+    The radial polynomials are evaluated from precomputed coefficient
+    tables, and run-length encoded images only visit their black runs.
+    The results agree with those of the direct evaluation of the
+    polynomials (as in Gamera 3.4) up to a relative error of 1e-9.
+
     +---------------------------+
     | **Invariant to:**         |  
     +-------+----------+--------+
@@ -383,30 +389,73 @@ class generate_features(PluginFunction):
        those that have been already generated for the image, the
        features are *not* recalculated.  If you want to force
        recalculation, pass the optional argument ``force=True``.
+
+    The built-in feature functions that need the same sums over the
+    pixels of the image (e.g. ``black_area``, ``moments``, ``nholes`` and
+    ``volume64regions``) are computed together from a single pass over
+    the image. For run-length encoded images, this pass reads the black
+    runs directly instead of the single pixels.
+
+    When a feature cache is set (see the ``gamera.feature_cache``
+    module), the features are taken from the cache if possible, and
+    newly generated features are stored in it.
+
+    *required*
+      Optional.  The names of the feature functions that are actually
+      needed (e.g. those selected in a classifier, see
+      ``get_required_features``).  The features of the other feature
+      functions are set to zero.  Such partial features are generated
+      again when they are later requested without *required* (or with
+      other required feature functions).
     """
     category = "Utility"
     pure_python = True
     self_type = ImageType([ONEBIT])
-    args = Args([Class('features', list), Check('force')])
+    args = Args([Class('features', list), Check('force'),
+                 Class('required', list)])
     return_type = None
     cache = {}
-    def __call__(self, features=None, force=False):
+    def __call__(self, features=None, force=False, required=None):
       if features is None:
          features = self.get_feature_functions()
-      if self.feature_functions == features and not force:
+      generated = _generated_features(features, required)
+      if not force and self.feature_functions in (features, generated):
          return
-      self.feature_functions = features
-      features, num_features = features
-      if len(self.features) != num_features:
+      cache = feature_cache.get_feature_cache()
+      if cache is not None:
+          if force:
+              missing = [(self, cache.key(self, features))]
+          else:
+              missing = cache.get_features([self], features)
+              if not missing:
+                  return
+      self.feature_functions = generated
+      ff = features
+      features, num_features = ff
+      if len(self.features) != num_features or generated is not ff:
           if not generate_features.cache.has_key(num_features):
               generate_features.cache[num_features] = [0] * num_features
           self.features = array.array('d', generate_features.cache[num_features])
-      offset = 0
-      for name, function in features:
+      native, other = _split_features(features, generated)
+      if native:
+          # the built-in features share one pass over the image
+          _features.compute_features_list([self], native, 1)
+      for function, offset in other:
           function.__call__(self, offset)
-          offset += function.return_type.length
+      # partial features must not be cached
+      if cache is not None and generated is ff:
+          cache.set_features(missing)
     __call__ = staticmethod(__call__)
 
+class compute_features_list(PluginFunction):
+    """Computes the features of the built-in feature functions with the
+    given numbers for all *images* in parallel (see generate_features_list)."""
+    # This is only for plugin generation, it will not be added to the image type
+    # (since self_type == None)
+    category = None
+    self_type = None
+    args = Args([ImageList("images"), IntVector("features"), Int("num_threads")])
+
 class FeaturesModule(PluginModule):
     category = "Features"
     cpp_headers=["features.hpp"]
@@ -415,9 +464,18 @@ class FeaturesModule(PluginModule):
                  aspect_ratio, nrows_feature, ncols_feature, compactness,
                  volume16regions, volume64regions,
                  generate_features, zernike_moments, zernike_moments_plugin,
-                 skeleton_features, top_bottom, diagonal_projection]
+                 skeleton_features, top_bottom, diagonal_projection,
+                 compute_features_list]
     author = "Michael Droettboom and Karl MacMillan"
     url = "http://gamera.sourceforge.net/"
+    try:
+        from gamera.__compiletime_config__ import has_openmp
+    except ImportError:
+        has_openmp = False
+    if has_openmp:
+        extra_compile_args = ["-fopenmp"]
+        extra_link_args = ["-fopenmp"]
+    del has_openmp
 module = FeaturesModule()
 
 def get_features_length(features):
@@ -430,23 +488,164 @@ def get_features_length(features):
     ff = core.ImageBase.get_feature_functions(features)
     return ff[1]
 
-def generate_features_list(list, features='all'):
+# The feature functions computed natively by compute_features_list, in
+# the order of their numbers in features.hpp.
+_native_features = [black_area, moments, nholes, nholes_extended, volume, area,
+                    aspect_ratio, nrows_feature, ncols_feature, compactness,
+                    volume16regions, volume64regions, zernike_moments,
+                    skeleton_features, top_bottom, diagonal_projection]
+
+def _generated_features(ff, required):
+   # The feature_functions of an image whose features are generated only
+   # for the required feature functions. When these are not all feature
+   # functions, a third item lists them, so that the features are not
+   # taken as complete.
+   if required is None:
+      return ff
+   features, num_features = ff
+   required = tuple([name for name, function in features if name in required])
+   if len(required) == len(features):
+      return ff
+   return (features, num_features, required)
+
+def _split_features(features, generated=None):
+   # Splits the feature functions into the numbers and offsets for
+   # compute_features_list, and the other functions with their offsets.
+   # Feature functions that are not required are left out.
+   native = []
+   other = []
+   offset = 0
+   for name, function in features:
+      if (generated is not None and len(generated) > 2 and
+          name not in generated[2]):
+         offset += function.return_type.length
+         continue
+      if function in _native_features:
+         native.extend([_native_features.index(function), offset])
+      else:
+         other.append((function, offset))
+      offset += function.return_type.length
+   return native, other
+
+def generate_features_list(list, features='all', num_threads=0, required=None):
    """
    Generate features on a list of images.
 
    *features*
      Follows the same rules as for generate_features_.
+
+   *num_threads*
+     The built-in feature functions are computed for all images at
+     once, with the global interpreter lock released and in parallel
+     with *num_threads* threads when Gamera was compiled with OpenMP
+     support. The default ``0`` uses all processors. Feature functions
+     from other plugins are still called for one image after another.
+
+   *required*
+     Optional.  Only generates the features of the given feature
+     functions, as in generate_features_.
+
+   Like generate_features_, this uses the feature cache if one is set.
    """
    from gamera import core, util
    ff = core.Image.get_feature_functions(features)
-   progress = util.ProgressFactory("Generating features...", len(list) / 10)
+   features, num_features = ff
+   generated = _generated_features(ff, required)
+   # as in generate_features, up to date features are not recalculated
+   glyphs = [glyph for glyph in list
+             if glyph.feature_functions != ff and
+             glyph.feature_functions != generated]
+   cache = feature_cache.get_feature_cache()
+   if cache is not None:
+      missing = cache.get_features(glyphs, ff)
+      glyphs = [glyph for glyph, key in missing]
+   native, other = _split_features(features, generated)
+   if not generate_features.cache.has_key(num_features):
+      generate_features.cache[num_features] = [0] * num_features
+   for glyph in glyphs:
+      if len(glyph.features) != num_features or generated is not ff:
+         glyph.features = array.array('d', generate_features.cache[num_features])
+   chunk_size = 256
+   progress = util.ProgressFactory("Generating features...",
+                                   (len(glyphs) + chunk_size - 1) / chunk_size)
    try:
-      for i, glyph in enumerate(list):
-         glyph.generate_features(ff)
-         if i % 10 == 0:
-             progress.step()
+      for start in range(0, len(glyphs), chunk_size):
+         chunk = glyphs[start:start + chunk_size]
+         if native:
+            _features.compute_features_list(chunk, native, num_threads)
+         for glyph in chunk:
+            for function, offset in other:
+               function.__call__(glyph, offset)
+            glyph.feature_functions = generated
+         # partial features must not be cached
+         if cache is not None and generated is ff:
+            cache.set_features(missing[start:start + chunk_size])
+         progress.step()
    finally:
-       progress.kill()
+      progress.kill()
+
+def features_to_numpy(list, features='all', num_threads=0, share=False):
+   """
+   Returns the features of a list of images as a contiguous numpy
+   array of shape ``(len(list), num_features)``, with the features of
+   each image in one row.  The features are generated first as in
+   generate_features_list_, if necessary.
+
+   *features*
+     Follows the same rules as for generate_features_.
+
+   *num_threads*
+     As for generate_features_list_.
+
+   *share*
+     When ``True``, the ``features`` of each image are replaced by its
+     row of the returned array, so that all features are stored in one
+     block of memory instead of one small array per image.  Changing
+     the array then changes the features of the images, and vice versa.
+
+   Requires numpy.
+   """
+   import numpy
+   from gamera import core
+   ff = core.Image.get_feature_functions(features)
+   matrix = numpy.empty((len(list), ff[1]), 'd')
+   rows = [None] * len(list)
+   if share:
+      # outdated features are generated directly into the rows
+      for i, glyph in enumerate(list):
+         if glyph.feature_functions != ff:
+            rows[i] = glyph.features = matrix[i]
+   generate_features_list(list, ff, num_threads)
+   for i, glyph in enumerate(list):
+      if glyph.features is not rows[i]:
+         matrix[i] = numpy.frombuffer(glyph.features, 'd')
+         if share:
+            glyph.features = matrix[i]
+   return matrix
+
+def features_from_numpy(list, matrix, features='all'):
+   """
+   Sets the features of a list of images from the rows of a numpy
+   array of shape ``(len(list), num_features)``, the reverse of
+   features_to_numpy_.  The ``features`` of each image become a view
+   of its row, so that the array is not copied when it is already a
+   contiguous array of doubles.
+
+   *features*
+     The feature functions the features were generated with.  Follows
+     the same rules as for generate_features_.
+   """
+   import numpy
+   from gamera import core
+   ff = core.Image.get_feature_functions(features)
+   matrix = numpy.ascontiguousarray(matrix, 'd')
+   if matrix.shape != (len(list), ff[1]):
+      raise ValueError(
+         "The array must have the shape (%d, %d), not %s." %
+         (len(list), ff[1], matrix.shape))
+   for glyph, row in zip(list, matrix):
+      glyph.features = row
+      glyph.feature_functions = ff
 
 generate_features = generate_features()
 
@@ -40,17 +40,56 @@ class image_copy(PluginFunction):
       no compression
     RLE (1)
       run-length encoding compression
+    PACKED (2)
+      one bit per pixel, packed into machine words (ONEBIT images only)
     """
     category = "Utility"
     self_type = ImageType(ALL)
     return_type = ImageType(ALL)
-    args = Args([Choice("storage_format", ["DENSE", "RLE"])])
+    args = Args([Choice("storage_format", ["DENSE", "RLE", "PACKED"])])
     def __call__(image, storage_format = 0):
         if image.nrows <= 0 or image.ncols <= 0:
             return image
         return _image_utilities.image_copy(image, storage_format)
     __call__ = staticmethod(__call__)
 
+class image_copy_at(PluginFunction):
+    """
+    Copies an image like ``image_copy`` (always with storage format
+    DENSE), but the upper left corner of the copy is at *origin*
+    instead of at the position of the image.  This makes it possible to
+    process a part of a large image like a stand-alone image, e.g.
+
+    .. code:: Python
+
+      tile = image.subimage(rect).image_copy_at((0, 0))
+
+    *origin*
+      The position of the upper left corner of the copy.
+    """
+    category = "Utility"
+    self_type = ImageType(ALL)
+    return_type = ImageType(ALL)
+    args = Args([Point("origin")])
+
+class paste_image(PluginFunction):
+    """
+    Copies the pixels of the given image into this image, so that the
+    upper left corner of the given image is at *upper_left* (in page
+    coordinates).  The pasted image must lie within this image and have
+    the same pixel type.
+
+    *image*
+      The image to paste.
+
+    *upper_left*
+      The position of the upper left corner of the pasted image.
+    """
+    category = "Utility"
+    self_type = ImageType(ALL)
+    args = Args([ImageType(ALL, "image"), Point("upper_left")])
+    image_types_must_match = True
+
 class image_save(PluginFunction):
     """
     Saves an image to file with specified name and format.
@@ -400,7 +439,7 @@ the plugin wrapping mechanism of Gamera.
 class UtilModule(PluginModule):
     cpp_headers=["image_utilities.hpp"]
     category = None
-    functions = [image_save, image_copy,
+    functions = [image_save, image_copy, image_copy_at, paste_image,
                  histogram, union_images,
                  fill_white, fill, pad_image, pad_image_default, trim_image,
 		 invert, clip_image, mask,
@@ -49,6 +49,7 @@ class rank(PluginFunction):
   return_type = ImageType([ONEBIT, GREYSCALE, GREY16, FLOAT])
   author = "Christoph Dalitz and David Kolanus"
   doc_examples = [(GREYSCALE, 2), (GREYSCALE, 5), (GREYSCALE, 8)]
+  release_gil = True
   def __call__(self, rank, k=3, border_treatment=1):
     if k%2 == 0:
       raise RuntimeError("rank: window size k must be odd")
@@ -56,6 +57,9 @@ class rank(PluginFunction):
       raise RuntimeError("rank: rank must be between 1 and k*k")
     return _misc_filters.rank(self, rank, k, border_treatment)
   __call__ = staticmethod(__call__)
+  def tile_halo(rank, k=3, border_treatment=1):
+    return k / 2
+  tile_halo = staticmethod(tile_halo)
 
 class mean(PluginFunction):
   """
@@ -72,11 +76,15 @@ class mean(PluginFunction):
   doc_examples = [(GREYSCALE,)]
   return_type = ImageType([ONEBIT, GREYSCALE, GREY16, FLOAT])
   author = "David Kolanus"
+  release_gil = True
   def __call__(self, k=3, border_treatment=1):
     if k%2 == 0:
       raise RuntimeError("mean: window size k must be odd")
     return _misc_filters.mean(self, k, border_treatment)
   __call__ = staticmethod(__call__)
+  def tile_halo(k=3, border_treatment=1):
+    return k / 2
+  tile_halo = staticmethod(tile_halo)
 
 class min_max_filter(PluginFunction):
     """
@@ -107,6 +115,7 @@ class min_max_filter(PluginFunction):
     return_type = ImageType([ONEBIT, GREYSCALE, GREY16, FLOAT])
     author = "David Kolanus"
     doc_examples = [(GREYSCALE,)]
+    release_gil = True
     def __call__(self, k=3, filter=0, k_vertical=0):
         if k%2 == 0:
             raise RuntimeError("min_max_filter: window size k must be odd")
@@ -114,6 +123,9 @@ class min_max_filter(PluginFunction):
             raise RuntimeError("min_max_filter: k_vertical must be zero or odd")
         return _misc_filters.min_max_filter(self, k, filter, k_vertical)
     __call__ = staticmethod(__call__)
+    def tile_halo(k=3, filter=0, k_vertical=0):
+        return max(k, k_vertical) / 2
+    tile_halo = staticmethod(tile_halo)
 
 class create_gabor_filter(PluginFunction):
     """
@@ -168,6 +180,7 @@ class kfill(PluginFunction):
     return_type = ImageType([ONEBIT])
     author = "Oliver Christen"
     args = Args([Int("k", default=3),Int("iterations", default=1)])
+    release_gil = True
     def __call__(self, k=3, iterations=1):
       if k < 3:
         raise RuntimeError("kfill: k must be >= 3")
@@ -175,6 +188,9 @@ class kfill(PluginFunction):
         raise RuntimeError("kfill: number of iterations must be > 0")
       return _misc_filters.kfill(self, k, iterations)
     __call__ = staticmethod(__call__)
+    def tile_halo(k=3, iterations=1):
+      return k * iterations
+    tile_halo = staticmethod(tile_halo)
 
 class kfill_modified(PluginFunction):
     """
@@ -199,11 +215,15 @@ class kfill_modified(PluginFunction):
     return_type = ImageType([ONEBIT])
     author = "Oliver Christen"
     args = Args([Int("k", default=3)])
+    release_gil = True
     def __call__(self, k=3):
     		if k < 3:
     			raise RuntimeError("k < 3")
     		return _misc_filters.kfill_modified(self, k)
     __call__ = staticmethod(__call__)
+    def tile_halo(k=3):
+        return k
+    tile_halo = staticmethod(tile_halo)
 
 
 class MiscFiltersModule(PluginModule):
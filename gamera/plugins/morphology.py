@@ -30,6 +30,7 @@ class erode(PluginFunction):
   doc_examples = [(GREYSCALE,), (ONEBIT,)]
   return_type = ImageType([ONEBIT, GREYSCALE, FLOAT])
   pure_python = True
+  tile_halo = 1
   def __call__(image):
     return _morphology.erode_dilate(image, 1, 1, 0)
   __call__ = staticmethod(__call__)
@@ -49,6 +50,7 @@ class dilate(PluginFunction):
   doc_examples = [(GREYSCALE,), (ONEBIT,)]
   return_type = ImageType([ONEBIT, GREYSCALE, FLOAT])
   pure_python = True
+  tile_halo = 1
   def __call__(image):
     return _morphology.erode_dilate(image, 1, 0, 0)
   __call__ = staticmethod(__call__)
@@ -89,6 +91,10 @@ class erode_dilate(PluginFunction):
                Choice('shape', ['rectangular', 'octagonal'])])
   return_type = ImageType([ONEBIT, GREYSCALE, FLOAT])
   doc_examples = [(GREYSCALE, 10, 0, 1)]
+  release_gil = True
+  def tile_halo(ntimes=1, direction=0, shape=0):
+    return ntimes
+  tile_halo = staticmethod(tile_halo)
 
 class despeckle(PluginFunction):
   """
@@ -134,6 +140,11 @@ class distance_transform(PluginFunction):
   author = u"Ullrich K\u00f6the (wrapped from VIGRA by Michael Droettboom)"
 
 
+def _structure_extent(structuring_element, origin):
+    # the largest distance of the structuring element from its origin
+    return max(origin.x, structuring_element.ncols - 1 - origin.x,
+               origin.y, structuring_element.nrows - 1 - origin.y, 0)
+
 class dilate_with_structure(PluginFunction):
     """
     Performs a binary morphological dilation with the given structuring
@@ -183,12 +194,19 @@ class dilate_with_structure(PluginFunction):
                  Check('only_border', default=False)])
     return_type = ImageType([ONEBIT])
     author = "Christoph Dalitz"
+    release_gil = True
 
     def __call__(self, structuring_element, origin, only_border=False):
         return _morphology.dilate_with_structure(self, structuring_element, origin, only_border)
 
     __call__ = staticmethod(__call__)
 
+    def tile_halo(structuring_element, origin, only_border=False):
+        # the border pixels are found with a 3x3 neighborhood
+        return _structure_extent(structuring_element, origin) + int(bool(only_border))
+
+    tile_halo = staticmethod(tile_halo)
+
 class erode_with_structure(PluginFunction):
     """
     Performs a binary morphological erosion with the given structuring
@@ -216,6 +234,12 @@ class erode_with_structure(PluginFunction):
                  Point('origin')])
     return_type = ImageType([ONEBIT])
     author = "Christoph Dalitz"
+    release_gil = True
+
+    def tile_halo(structuring_element, origin):
+        return _structure_extent(structuring_element, origin)
+
+    tile_halo = staticmethod(tile_halo)
 
 class MorphologyModule(PluginModule):
   cpp_headers = ["morphology.hpp"]
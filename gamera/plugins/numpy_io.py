@@ -71,6 +71,15 @@ else:
 
         Requires two copying operations;  may fail for very large images.
 
+        *offset*
+          The position of the upper left corner of the image.
+
+        *share*
+          When ``True``, the image uses the memory of *array* instead
+          of a copy, so that changing the array changes the image and
+          vice versa.  The array must be writable and C-contiguous.  The
+          image keeps the array alive, and it can not be resized.
+
         To use this function, which is not a method on images, do the
         following:
 
@@ -78,15 +87,26 @@ else:
         
           from gamera.plugins import numpy_io
           image = numpy_io.from_numpy(array)
+
+        The reverse, an array sharing the memory of an image, is
+        ``numpy.asarray(image)``.
         """
         self_type = None
-        args = Args([Class("array")])
+        args = Args([Class("array"), Point("offset", default=(0, 0)),
+                     Check("share", default=False)])
         return_type = ImageType(ALL)
         pure_python = True
-        def __call__(array, offset=(0, 0)):
+        def __call__(array, offset=(0, 0), share=False):
             from gamera.plugins import _string_io
             from gamera.core import Dim
             pixel_type = from_numpy._check_input(array)
+            if share:
+                if not (array.flags.c_contiguous and array.flags.writeable):
+                    raise ValueError('Only writable C-contiguous arrays can be shared.')
+                return _string_io._from_buffer(
+                    offset,
+                    Dim(array.shape[1], array.shape[0]),
+                    pixel_type, array)
             return _string_io._from_raw_string(
                 offset,
                 Dim(array.shape[1], array.shape[0]),
@@ -131,7 +151,10 @@ else:
         | COMPLEX    | complex128      |
         +------------+-----------------+
 
-        Requires *three* copies, and may fail for very large images.
+        Requires one copy (two for RLE and PACKED images).  To access
+        the pixels of a DENSE image without copying them, use
+        ``numpy.asarray(image)``, which returns an array that shares
+        the memory of the image.
 
         This method can be used for utilizing special functions present in
         numpy. If you need to compute the discrete fourier transform of
@@ -149,14 +172,7 @@ else:
         return_type = Class("array")
         pure_python = True
         def __call__(image):
-            from gamera.plugins import _string_io
-            pixel_type = image.data.pixel_type
-            shape = (image.nrows, image.ncols)
-            typecode = _typecodes[pixel_type]
-            if pixel_type == RGB:
-                shape += (3,)
-            array = n.fromstring(_string_io._to_raw_string(image), typecode)
-            return n.resize(array, shape)
+            return n.array(image)
         __call__ = staticmethod(__call__)
 
         def __doc_example1__(images):
@@ -205,9 +205,13 @@ class bbox_merging(PluginFunction):
             return new_bboxes
 
         # the actual plugin
-        from gamera.core import Dim, Rect, Point, Cc
+        from gamera.core import Dim, Rect, Point, Cc, DENSE, PACKED
         from gamera.plugins.listutilities import median
 
+        # bit-packed images cannot hold the labels of the segments
+        if self.data.storage_format == PACKED:
+            self = self.image_copy(DENSE)
+
         page = self.image_copy()
         ccs = page.cc_analysis()
 
@@ -56,14 +56,29 @@ class load_PNG(PluginFunction):
         no compression
       RLE (1)
         run-length encoding compression
+      PACKED (2)
+        one bit per pixel, packed into machine words (ONEBIT images only)
+
+    *mmap_file* (optional)
+      stores the image data in a memory-mapped file instead of main
+      memory (DENSE images only): the name of a cache file, the name
+      of a directory for an anonymous scratch file, or ``True`` for a
+      scratch file in the temporary directory.  See `memory-mapped
+      images`__.
+
+    .. __: image_types.html#memory-mapped-images
     """
     self_type = None
     args = Args([FileOpen("image_file_name", "", "*.png"),
-                 Choice("storage format", ["DENSE", "RLE"])])
+                 Choice("storage format", ["DENSE", "RLE", "PACKED"]),
+                 String("mmap_file", "")])
     return_type = ImageType([ONEBIT, GREYSCALE, GREY16, RGB, FLOAT])
-    def __call__(filename, compression = 0):
+    release_gil = True
+    def __call__(filename, compression = 0, mmap_file = None):
+        from gamera.util import mmap_file_argument
         from gamera.plugins import _png_support
-        return _png_support.load_PNG(filename, compression)
+        return _png_support.load_PNG(filename, compression,
+                                     mmap_file_argument(mmap_file))
     __call__ = staticmethod(__call__)
     exts = ['png']
 
@@ -20,6 +20,7 @@
 
 from gamera.plugin import *
 import _runlength
+import zlib
 
 # New version of functions.  Deprecated versions are below.
 
@@ -124,7 +125,8 @@ class to_rle(PluginFunction):
     white run".  Runs go left-to-right, top-to-bottom.  Runs rollover
     the right hand edge and continue on the left edge of the next run.
 
-    To decode an RLE string, use from_rle_.
+    To decode an RLE string, use from_rle_.  A more compact binary
+    encoding is returned by to_rle_binary_.
     """
     self_type = ImageType([ONEBIT])
     return_type = String("runs")
@@ -142,6 +144,53 @@ class from_rle(PluginFunction):
     self_type = ImageType([ONEBIT])
     args = Args(String("runs"))
 
+class to_rle_binary(PluginFunction):
+    """
+    Encodes the runs of the image like to_rle_, but as a compact binary
+    string instead of decimal numbers.
+
+    Each run length is stored as an unsigned variable-length integer:
+    seven bits per byte, least significant bits first, with the high
+    bit set in all but the last byte of a number.  The runs alternate
+    between white and black, starting with white.
+
+    *compress* (optional)
+      When ``True``, the binary string is compressed with zlib.
+
+    To decode a binary RLE string, use from_rle_binary_.
+    """
+    self_type = ImageType([ONEBIT])
+    return_type = Class("runs")
+    def __call__(image, compress = False):
+        runs = _runlength.to_rle_binary(image)
+        if compress:
+            runs = zlib.compress(runs)
+        return runs
+    __call__ = staticmethod(__call__)
+
+class from_rle_binary(PluginFunction):
+    """
+    Decodes a binary run-length encoded version of the image, as
+    returned by to_rle_binary_.
+
+    *runs*
+      The binary run-length string.
+
+    *compressed* (optional)
+      Must be ``True`` when the string was compressed with zlib
+      (*compress* argument of to_rle_binary_).
+
+    Invalid data, e.g. with more or fewer runs than the image has
+    pixels, raises a ``RuntimeError`` and leaves the image unchanged.
+    """
+    self_type = ImageType([ONEBIT])
+    args = Args(Class("runs"))
+    def __call__(image, runs, compressed = False):
+        if compressed:
+            runs = zlib.decompress(runs)
+        return _runlength.from_rle_binary(image, runs)
+    __call__ = staticmethod(__call__)
+
 class iterate_runs(PluginFunction):
     """
     Returns nested iterators over the runs in the given *color* and
@@ -224,6 +273,7 @@ class RunLengthModule(PluginModule):
                  filter_tall_runs,
                  iterate_runs,
                  to_rle, from_rle,
+                 to_rle_binary, from_rle_binary,
                  runlength_from_point]
 
     author = "Michael Droettboom and Karl MacMillan"
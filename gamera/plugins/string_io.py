@@ -54,14 +54,43 @@ class _from_raw_string(PluginFunction):
                  Class("data_string")])
     return_type = ImageType(ALL)
 
+class _from_buffer(PluginFunction):
+    """
+    Instantiates a DENSE image whose pixels are the memory of *array*,
+    which must support the buffer protocol and be writable and
+    C-contiguous.  The pixels are not copied.  The image keeps a
+    reference to *array*, and can not be resized.
+
+    This function is not intended to be used directly.  Use
+    ``numpy_io.from_numpy(array, share=True)`` instead.
+    """
+    self_type = None
+    args = Args([Point("offset"), Dim("dim"), Int("pixel_type"),
+                 Class("array")])
+    return_type = ImageType(ALL)
+
+class _pixel_buffer(PluginFunction):
+    """
+    Returns the address of the upper left pixel of a DENSE image and
+    the distance between the starts of its rows in bytes.
+
+    This function is not intended to be used directly.  It is used for
+    the ``__array_interface__`` of images.
+    """
+    self_type = ImageType(ALL)
+    return_type = Class("buffer")
+
 class StringIOModule(PluginModule):
     category = "ExternalLibraries"
     cpp_headers=["string_io.hpp"]
     functions = [_to_raw_string,
-                 _from_raw_string]
+                 _from_raw_string,
+                 _from_buffer,
+                 _pixel_buffer]
     author = "Alex Cobb"
     url = ('http://www.oeb.harvard.edu/faculty/holbrook/'
            'people/alex/Website/alex.htm')
 module = StringIOModule()
 
 _from_raw_string = _from_raw_string()
+_from_buffer = _from_buffer()
@@ -44,6 +44,8 @@ class threshold(PluginFunction):
     args = Args([Int("threshold"), Choice("storage format", ['dense', 'rle'])])
     return_type = ImageType([ONEBIT], "output")
     doc_examples = [(GREYSCALE, 128)]
+    release_gil = True
+    tile_halo = 0
     def __call__(image, threshold, storage_format = 0):
         return _threshold.threshold(image, threshold, storage_format)
     __call__ = staticmethod(__call__)
@@ -183,10 +185,15 @@ class bernsen_threshold(PluginFunction):
                  Check("doubt_to_black", default=False)])
     return_type = ImageType([ONEBIT], "output")
     doc_examples = [(GREYSCALE,)]
+    release_gil = True
     def __call__(image, storage_format = 0, region_size = 11,
                  contrast_limit = 80, doubt_to_black = False):
         return _threshold.bernsen_threshold(image, storage_format, region_size, contrast_limit, doubt_to_black)
     __call__ = staticmethod(__call__)
+    def tile_halo(storage_format = 0, region_size = 11,
+                  contrast_limit = 80, doubt_to_black = False):
+        return region_size / 2
+    tile_halo = staticmethod(tile_halo)
 
 class djvu_threshold(PluginFunction):
     """
@@ -25,13 +25,30 @@ import _tiff_support
 
 class tiff_info(PluginFunction):
     """
-    Returns an ``ImageInfo`` object describing a TIFF file.
+    Returns an ``ImageInfo`` object describing a page of a TIFF file.
+
+    *image_file_name*
+      A TIFF image filename
+
+    *page* (optional)
+      The number of the page, counted from 0.  Defaults to the first
+      page."""
+    self_type = None
+    args = Args([String("image_file_name"), Int("page")])
+    return_type = ImageInfo("tiff_info")
+    def __call__(filename, page = 0):
+        return _tiff_support.tiff_info(filename, page)
+    __call__ = staticmethod(__call__)
+
+class tiff_page_count(PluginFunction):
+    """
+    Returns the number of pages of a TIFF file.
 
     *image_file_name*
       A TIFF image filename"""
     self_type = None
     args = Args([String("image_file_name")])
-    return_type = ImageInfo("tiff_info")
+    return_type = Int("page_count")
 
 class load_tiff(PluginFunction):
     """
@@ -47,13 +64,33 @@ class load_tiff(PluginFunction):
         no compression
       RLE (1)
         run-length encoding compression
+      PACKED (2)
+        one bit per pixel, packed into machine words (ONEBIT images only)
+
+    *mmap_file* (optional)
+      stores the image data in a memory-mapped file instead of main
+      memory (DENSE images only): the name of a cache file, the name
+      of a directory for an anonymous scratch file, or ``True`` for a
+      scratch file in the temporary directory.  See `memory-mapped
+      images`__.
+
+    .. __: image_types.html#memory-mapped-images
+
+    *page* (optional)
+      The number of the page of a multi-page TIFF file, counted from 0.
+      Defaults to the first page.  To read all pages, use tiff_pages_.
+
+    .. _tiff_pages: image_types.html#multi-page-tiff-files
     """
     self_type = None
     args = Args([FileOpen("image_file_name", "", "*.tiff;*.tif"),
-                 Choice("storage format", ["DENSE", "RLE"])])
+                 Choice("storage format", ["DENSE", "RLE", "PACKED"]),
+                 String("mmap_file", ""), Int("page")])
     return_type = ImageType([ONEBIT, GREYSCALE, GREY16, RGB, FLOAT])
-    def __call__(filename, compression = 0):
-        return _tiff_support.load_tiff(filename, compression)
+    def __call__(filename, compression = 0, mmap_file = None, page = 0):
+        from gamera.util import mmap_file_argument
+        return _tiff_support.load_tiff(filename, compression,
+                                       mmap_file_argument(mmap_file), page)
     __call__ = staticmethod(__call__)
     exts = ["tiff", "tif"]
 load_tiff_class = load_tiff
@@ -71,6 +108,176 @@ class save_tiff(PluginFunction):
     return_type = None
     exts = ["tiff", "tif"]
 
+class _tiff_open(PluginFunction):
+    """
+    Opens a TIFF file for reading it in bands or page by page.  Use
+    tiff_bands_ or tiff_pages_ instead.
+
+    .. _tiff_bands: image_types.html#reading-tiff-files-in-bands
+    .. _tiff_pages: image_types.html#multi-page-tiff-files
+    """
+    self_type = None
+    args = Args([String("image_file_name")])
+    return_type = Class("reader")
+
+class _tiff_page_count(PluginFunction):
+    """
+    Returns the number of pages of a TIFF file opened with _tiff_open.
+    """
+    self_type = None
+    args = Args([Class("reader")])
+    return_type = Int("page_count")
+
+class _tiff_select_page(PluginFunction):
+    """
+    Selects the page of a TIFF file opened with _tiff_open that
+    _tiff_read_band reads, and returns its ``ImageInfo``.
+    """
+    self_type = None
+    args = Args([Class("reader"), Int("page")])
+    return_type = ImageInfo("page_info")
+
+class _tiff_read_band(PluginFunction):
+    """
+    Reads the rows *first_row* to *first_row* + *nrows* - 1 of the
+    selected page of a TIFF file opened with _tiff_open into an image at (0,
+    *first_row*).  Only the rows from *first_load_row* on are read from
+    the file.  Use tiff_bands_ instead.
+
+    .. _tiff_bands: image_types.html#reading-tiff-files-in-bands
+    """
+    self_type = None
+    args = Args([Class("reader"), Int("first_row"), Int("nrows"),
+                 Int("first_load_row"), Int("storage_format")])
+    return_type = ImageType([ONEBIT, GREYSCALE, GREY16, RGB])
+
+class _tiff_open_writer(PluginFunction):
+    """
+    Creates a TIFF file for writing it page by page.  Use
+    save_tiff_pages_ instead.
+
+    .. _save_tiff_pages: image_types.html#multi-page-tiff-files
+    """
+    self_type = None
+    args = Args([String("image_file_name")])
+    return_type = Class("writer")
+
+class _tiff_write_page(PluginFunction):
+    """
+    Appends the image as a new page to a TIFF file created with
+    _tiff_open_writer.
+    """
+    self_type = ImageType([ONEBIT, GREYSCALE, GREY16, RGB])
+    args = Args([Class("writer")])
+    return_type = None
+
+class _tiff_close_writer(PluginFunction):
+    """
+    Closes a TIFF file created with _tiff_open_writer.
+    """
+    self_type = None
+    args = Args([Class("writer")])
+    return_type = None
+
+def tiff_bands(filename, band_height=512, overlap=0, storage_format=DENSE,
+               page=0):
+    """
+    Reads a TIFF file in horizontal bands of *band_height* rows, so
+    that large files can be processed band by band without loading
+    them as a whole.  Yields the bands in order from top to bottom.
+
+    Each band is an image at the position of its rows in the full page,
+    i.e. the upper left corner of a band starting at row *y* is (0,
+    *y*), so that the coordinates of results (e.g. of connected
+    components) are page coordinates.  The last band can be lower than
+    *band_height*.
+
+    *overlap*
+      The number of rows at the top of each band that are the same as
+      the last rows of the previous band, e.g. so that objects cut by
+      the border between two bands are complete in one of them.  Must
+      be smaller than *band_height*.
+
+    *storage_format*
+      The storage format of the bands, as for load_tiff.
+
+    *page*
+      The page of a multi-page TIFF file, counted from 0.
+
+    The file is read row by row (or row of tiles by row of tiles), so
+    that only one band is held in memory at a time, plus one band while
+    the next one is loaded if the previous is still referenced.  The
+    file stays open until the iteration is finished.
+    """
+    if band_height < 1:
+        raise ValueError("The band height must be positive.")
+    if overlap < 0 or overlap >= band_height:
+        raise ValueError("The overlap must be between 0 and band_height - 1.")
+    from gamera.core import Point
+    reader = _tiff_support._tiff_open(filename)
+    nrows = _tiff_support._tiff_select_page(reader, page).nrows
+    first_row = 0
+    tail = None
+    while True:
+        last_row = min(first_row + band_height, nrows) - 1
+        if tail is None:
+            first_load_row = first_row
+        else:
+            first_load_row = tail.lr_y + 1
+        band = _tiff_support._tiff_read_band(
+            reader, first_row, last_row - first_row + 1, first_load_row,
+            storage_format)
+        if tail is not None:
+            band.paste_image(tail, tail.ul)
+        if last_row == nrows - 1:
+            yield band
+            return
+        first_row = last_row + 1 - overlap
+        # The overlapping rows are kept as a copy, because the band
+        # may be changed before the next band is read.
+        if overlap:
+            tail = band.subimage(Point(0, first_row),
+                                 Point(band.lr_x, last_row)).image_copy(storage_format)
+        yield band
+
+def tiff_pages(filename, storage_format=DENSE):
+    """
+    Reads the pages of a multi-page TIFF file one after another and
+    yields them as images.  The file is opened only once and each page
+    is read when the next image is requested, so that only one page is
+    held in memory at a time if the previous pages are not referenced
+    any more.
+
+    *storage_format*
+      The storage format of the pages, as for load_tiff.
+
+    A single page can be loaded with the *page* argument of load_tiff,
+    and tiff_page_count returns the number of pages.
+    """
+    reader = _tiff_support._tiff_open(filename)
+    for page in range(_tiff_support._tiff_page_count(reader)):
+        nrows = _tiff_support._tiff_select_page(reader, page).nrows
+        yield _tiff_support._tiff_read_band(reader, 0, nrows, 0,
+                                            storage_format)
+
+def save_tiff_pages(images, filename):
+    """
+    Saves the images as the pages of a multi-page TIFF file, in order.
+
+    *images*
+      A list (or any other iterable) of ONEBIT, GREYSCALE, GREY16 and
+      RGB images, which may differ in size and pixel type.  The images
+      are written one after another, so *images* can be a generator
+      that creates each image only when it is written.
+
+    *filename*
+      A TIFF image filename
+    """
+    writer = _tiff_support._tiff_open_writer(filename)
+    for image in images:
+        image._tiff_write_page(writer)
+    _tiff_support._tiff_close_writer(writer)
+
 class TiffSupportModule(PluginModule):
     category = "File"
     cpp_headers = ["tiff_support.hpp"]
@@ -97,7 +304,10 @@ class TiffSupportModule(PluginModule):
 	extra_compile_args = ['-Dunix']
     else:
         extra_libraries = ["tiff"]
-    functions = [tiff_info, load_tiff_class, save_tiff]
+    functions = [tiff_info, tiff_page_count, load_tiff_class, save_tiff,
+                 _tiff_open, _tiff_page_count, _tiff_select_page,
+                 _tiff_read_band, _tiff_open_writer, _tiff_write_page,
+                 _tiff_close_writer]
     cpp_include_dirs = ["src/libtiff"]
     author = "Michael Droettboom and Karl MacMillan"
     url = "http://gamera.sourceforge.net/"
@@ -105,3 +315,4 @@ class TiffSupportModule(PluginModule):
 module = TiffSupportModule()
 
 tiff_info = tiff_info()
+tiff_page_count = tiff_page_count()
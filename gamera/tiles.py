@@ -0,0 +1,226 @@
+# -*- mode: python; indent-tabs-mode: nil; tab-width: 3 -*-
+# vim: set tabstop=3 shiftwidth=3 expandtab:
+#
+# Copyright (C) 2026 Gamera developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""Tile by tile execution of local filters on large images.
+
+A TiledImage divides an image into a grid of fixed-size tiles.  Each
+tile is processed as a small image of its own, together with a border
+(the *halo*) of the neighboring pixels, and only the inner part of the
+result is pasted into the output image.  For local filters, whose
+result at a pixel only depends on the pixels in a bounded neighborhood,
+this gives the same result as applying the filter to the whole image,
+while only a few tiles need to be held in memory at a time."""
+
+import sys, threading
+
+from gamera import plugin
+from gamera.core import Image, Rect, Point, Dim, DENSE
+
+def get_tile_halo(function, pixel_type, args=()):
+   """Returns the halo that the plugin function *function* (given by
+its name) needs when it is applied to images of the given pixel type
+with the arguments *args*, or None when it cannot be applied tile by
+tile (see the *tile_halo* attribute of PluginFunction)."""
+   methods = plugin.plugin_methods.get(pixel_type, {})
+   for name, cls in plugin._methods_flatten(methods):
+      if name == function:
+         halo = cls.tile_halo
+         if callable(halo):
+            halo = halo(*args)
+         return halo
+   raise ValueError("'%s' is not a plugin function for this pixel type." %
+                    function)
+
+class TiledImage:
+   def __init__(self, image, tile_size=512, halo=0):
+      """**TiledImage** (Image *image*, int *tile_size* = 512, int *halo* = 0)
+
+Divides *image* into tiles of *tile_size* times *tile_size* pixels
+(or of *tile_size* = (ncols, nrows) pixels).  The tiles at the right
+and lower border of the image are smaller when the image size is not a
+multiple of the tile size.
+
+*halo*
+  The minimal number of neighboring pixels on each side that every
+  tile is processed with.
+
+The image is only read when the tiles are created, so it may be a
+memory-mapped image that does not fit into main memory."""
+      if isinstance(tile_size, (int, long)):
+         tile_size = Dim(tile_size, tile_size)
+      elif not isinstance(tile_size, Dim):
+         tile_size = Dim(*tile_size)
+      if tile_size.ncols < 1 or tile_size.nrows < 1:
+         raise ValueError("The tile size must be positive.")
+      if halo < 0:
+         raise ValueError("The halo must not be negative.")
+      self.image = image
+      self.tile_size = tile_size
+      self.halo = halo
+
+   def __len__(self):
+      return len(self.tile_rects())
+
+   def tile_rects(self):
+      """Returns the (non-overlapping) rectangles of all tiles, row by
+row, in the coordinates of the image."""
+      image = self.image
+      rects = []
+      for y in range(image.ul_y, image.lr_y + 1, self.tile_size.nrows):
+         for x in range(image.ul_x, image.lr_x + 1, self.tile_size.ncols):
+            rects.append(Rect(Point(x, y), Point(
+               min(x + self.tile_size.ncols - 1, image.lr_x),
+               min(y + self.tile_size.nrows - 1, image.lr_y))))
+      return rects
+
+   def _halo_range(self, start, stop, halo, image_start, image_stop):
+      start = max(start - halo, image_start)
+      stop = min(stop + halo, image_stop)
+      # Very small tiles at the image border are enlarged towards the
+      # inside of the image, because some filters treat images that are
+      # smaller than their neighborhood differently.
+      missing = 2 * halo + 1 - (stop - start + 1)
+      if missing > 0:
+         stop = min(stop + missing, image_stop)
+         start = max(stop - 2 * halo, image_start)
+      return start, stop
+
+   def tile(self, rect, halo=None):
+      """Returns the tile *rect* (one of the tile_rects) together with its
+halo, as a copy with the upper left corner at (0, 0), and the position
+of *rect* in that copy.  The halo is clipped at the image border.
+
+*halo*
+  The number of neighboring pixels on each side.  Defaults to the halo
+  of the tiled image."""
+      if halo is None:
+         halo = self.halo
+      image = self.image
+      left, right = self._halo_range(rect.ul_x, rect.lr_x, halo,
+                                     image.ul_x, image.lr_x)
+      top, bottom = self._halo_range(rect.ul_y, rect.lr_y, halo,
+                                     image.ul_y, image.lr_y)
+      # Copy to the origin, because some filters assume that the image
+      # starts at (0, 0).
+      tile = image.subimage(Point(left, top), Point(right, bottom))
+      tile = tile.image_copy_at(Point(0, 0))
+      inner = Rect(Point(rect.ul_x - left, rect.ul_y - top), rect.dim)
+      return tile, inner
+
+   def apply(self, function, args=(), num_threads=1, mmap_file=None):
+      """Image **apply** (*function*, tuple *args* = (), int *num_threads* = 1, *mmap_file* = None)
+
+Applies *function* to all tiles and returns the stitched result, an
+image of the same size and position as the tiled image.
+
+*function*
+  Either the name of a plugin function, which is called as
+  ``tile.function(*args)``, or any function, which is called as
+  ``function(tile, *args)`` and must return an image of the same size
+  as *tile*.  Plugin functions must be local filters (i.e. they have
+  a *tile_halo*); each tile is processed with the larger of their halo
+  and the halo of the tiled image.  For other functions, the halo of
+  the tiled image must be sufficient.
+
+*num_threads*
+  The number of threads that process the tiles.  The default ``1``
+  processes them one after another, ``0`` uses all processors.  Many
+  local filters release the global interpreter lock, so that the
+  tiles are really processed in parallel.  At most *num_threads* tiles
+  are held in memory at a time.
+
+*mmap_file*
+  Stores the result in a memory-mapped file (see the *mmap_file*
+  argument of Image), if it is a DENSE image."""
+      halo = self.halo
+      if isinstance(function, basestring):
+         plugin_halo = get_tile_halo(function, self.image.data.pixel_type, args)
+         if plugin_halo is None:
+            raise ValueError(
+               "'%s' can not be applied tile by tile with these arguments." %
+               function)
+         halo = max(halo, plugin_halo)
+         name = function
+         function = lambda tile, *args: getattr(tile, name)(*args)
+      if num_threads == 0:
+         try:
+            import multiprocessing
+            num_threads = multiprocessing.cpu_count()
+         except (ImportError, NotImplementedError):
+            num_threads = 1
+
+      rects = iter(self.tile_rects())
+      lock = threading.Lock()
+      errors = []
+      output = []
+
+      def paste(rect, inner, result):
+         if not output:
+            data = result.data
+            if data.storage_format == DENSE:
+               output.append(Image(self.image, data.pixel_type,
+                                   data.storage_format, mmap_file=mmap_file))
+            else:
+               output.append(Image(self.image, data.pixel_type,
+                                   data.storage_format))
+         output[0].paste_image(result.subimage(inner), rect.ul)
+
+      def work():
+         while True:
+            lock.acquire()
+            try:
+               if errors:
+                  return
+               try:
+                  rect = rects.next()
+               except StopIteration:
+                  return
+            finally:
+               lock.release()
+            try:
+               tile, inner = self.tile(rect, halo)
+               result = function(tile, *args)
+               if result.dim != tile.dim:
+                  raise ValueError(
+                     "The function must not change the size of the tiles.")
+               del tile
+               lock.acquire()
+               try:
+                  paste(rect, inner, result)
+               finally:
+                  lock.release()
+            except Exception:
+               lock.acquire()
+               errors.append(sys.exc_info())
+               lock.release()
+               return
+
+      if num_threads <= 1:
+         work()
+      else:
+         threads = [threading.Thread(target=work) for i in range(num_threads)]
+         for thread in threads:
+            thread.start()
+         for thread in threads:
+            thread.join()
+      if errors:
+         type, value, traceback = errors[0]
+         raise type, value, traceback
+      return output[0]
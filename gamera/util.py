@@ -182,6 +182,17 @@ _pixel_type_names = {ONEBIT:     "OneBit",
 def get_pixel_type_name(type_):
    return _pixel_type_names[type_]
 
+def mmap_file_argument(mmap_file):
+   """Converts the *mmap_file* argument of the image loaders (None, True,
+or the name of a cache file or a directory) to the name expected by the
+C++ loaders, where an empty string loads the image into main memory."""
+   if mmap_file is None or mmap_file is False:
+      return ""
+   if mmap_file is True:
+      import tempfile
+      return tempfile.gettempdir()
+   return mmap_file
+
 def group_list(list, group_size):
    """Groups the list into fixed-size chunks."""
    groups = []
@@ -60,6 +60,8 @@
 #include "connected_components.hpp"
 #include "image_data.hpp"
 #include "rle_data.hpp"
+#include "packed_data.hpp"
+#include "mapped_data.hpp"
 #include "image.hpp"
 #include "region.hpp"
 #include "static_image.hpp"
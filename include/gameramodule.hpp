@@ -653,32 +653,50 @@ inline bool is_ImageDataObject(PyObject* x) {
   return PyObject_TypeCheck(x, t);
 }
 
+/*
+  If mmap_file is not NULL, the (DENSE) image data is mapped to a file
+  instead of being allocated on the heap: mmap_file is either the name
+  of a cache file, the name of a directory for an anonymous scratch file
+  or empty for a scratch file in the temporary directory.
+*/
 inline PyObject* create_ImageDataObject(const Dim& dim, const Point& offset,
-                                        int pixel_type, int storage_format) {
+                                        int pixel_type, int storage_format,
+                                        const char* mmap_file = NULL) {
   ImageDataObject* o;
   PyTypeObject* id_type = get_ImageDataType();
   if (id_type == 0)
     return 0;
+  if (mmap_file != NULL && storage_format != DENSE) {
+    PyErr_SetString(PyExc_TypeError,
+                    "Only images with storage format DENSE can be memory-mapped.");
+    return 0;
+  }
   o = (ImageDataObject*)id_type->tp_alloc(id_type, 0);
   o->m_pixel_type = pixel_type;
   o->m_storage_format = storage_format;
   if (storage_format == DENSE) {
-    if (pixel_type == ONEBIT)
-      o->m_x = new ImageData<OneBitPixel>(dim, offset);
-    else if (pixel_type == GREYSCALE)
-      o->m_x = new ImageData<GreyScalePixel>(dim, offset);
-    else if (pixel_type == GREY16)
-      o->m_x = new ImageData<Grey16Pixel>(dim, offset);
-    // We have to explicity declare which FLOAT we want here, since there
-    // is a name clash on Mingw32 with a typedef in windef.h
-    else if (pixel_type == Gamera::FLOAT)
-      o->m_x = new ImageData<FloatPixel>(dim, offset);
-    else if (pixel_type == RGB)
-      o->m_x = new ImageData<RGBPixel>(dim, offset);
-    else if (pixel_type == Gamera::COMPLEX)
-      o->m_x = new ImageData<ComplexPixel>(dim, offset);
-    else {
-      PyErr_Format(PyExc_TypeError, "Unknown pixel type '%d'.", pixel_type);
+    try {
+      if (pixel_type == ONEBIT)
+        o->m_x = create_image_data<OneBitPixel>(dim, offset, mmap_file);
+      else if (pixel_type == GREYSCALE)
+        o->m_x = create_image_data<GreyScalePixel>(dim, offset, mmap_file);
+      else if (pixel_type == GREY16)
+        o->m_x = create_image_data<Grey16Pixel>(dim, offset, mmap_file);
+      // We have to explicity declare which FLOAT we want here, since there
+      // is a name clash on Mingw32 with a typedef in windef.h
+      else if (pixel_type == Gamera::FLOAT)
+        o->m_x = create_image_data<FloatPixel>(dim, offset, mmap_file);
+      else if (pixel_type == RGB)
+        o->m_x = create_image_data<RGBPixel>(dim, offset, mmap_file);
+      else if (pixel_type == Gamera::COMPLEX)
+        o->m_x = create_image_data<ComplexPixel>(dim, offset, mmap_file);
+      else {
+        PyErr_Format(PyExc_TypeError, "Unknown pixel type '%d'.", pixel_type);
+        return 0;
+      }
+    } catch (std::runtime_error& e) {
+      Py_DECREF(o);
+      PyErr_SetString(PyExc_IOError, e.what());
       return 0;
     }
   } else if (storage_format == RLE) {
@@ -689,6 +707,14 @@ inline PyObject* create_ImageDataObject(const Dim& dim, const Point& offset,
                       "Pixel type must be ONEBIT when storage format is RLE.");
       return 0;
     }
+  } else if (storage_format == PACKED) {
+    if (pixel_type == ONEBIT)
+      o->m_x = new PackedImageData<OneBitPixel>(dim, offset);
+    else {
+      PyErr_SetString(PyExc_TypeError,
+                      "Pixel type must be ONEBIT when storage format is PACKED.");
+      return 0;
+    }
   } else {
     PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.");
     return 0;
@@ -905,6 +931,8 @@ inline int get_image_combination(PyObject* image) {
       return -1;
   } else if (storage == Gamera::RLE) {
     return Gamera::ONEBITRLEIMAGEVIEW;
+  } else if (storage == Gamera::PACKED) {
+    return Gamera::ONEBITPACKEDIMAGEVIEW;
   } else if (storage == Gamera::DENSE) {
     return get_pixel_type(image);
   } else {
@@ -1028,6 +1056,9 @@ inline PyObject* create_ImageObject(Image* image) {
     pixel_type = Gamera::ONEBIT;
     storage_type = Gamera::RLE;
     cc = true;
+  } else if (dynamic_cast<OneBitPackedImageView*>(image) != 0) {
+    pixel_type = Gamera::ONEBIT;
+    storage_type = Gamera::PACKED;
   } else {
     PyErr_SetString(PyExc_TypeError, "Unknown Image type returned from plugin.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
     return 0;
@@ -1297,6 +1328,27 @@ inline PyTypeObject* get_IteratorType() {
   return t;
 }
 
+/* RELEASING THE GLOBAL INTERPRETER LOCK */
+
+/*
+  Releases the global interpreter lock for the lifetime of the object,
+  so that other Python threads can run while a plugin function is
+  computing.  The lock is reacquired when the object goes out of scope,
+  also when an exception is thrown.  No Python objects must be used
+  while the lock is released.
+*/
+class ReleaseGIL {
+public:
+  inline ReleaseGIL() {
+    m_thread_state = PyEval_SaveThread();
+  }
+  inline ~ReleaseGIL() {
+    PyEval_RestoreThread(m_thread_state);
+  }
+private:
+  PyThreadState* m_thread_state;
+};
+
 /* PROGRESS BAR TYPE */
 
 class ProgressBar {
@@ -165,6 +165,16 @@ namespace Gamera {
       create_data();
     }
 
+  protected:
+    /*
+      For subclasses that provide their own pixel buffer (see
+      mapped_data.hpp): the data is not allocated here.
+    */
+    ImageData(const Dim& dim, const Point& offset, T* data) :
+      ImageDataBase(dim, offset) {
+      m_data = data;
+    }
+  public:
     /*
       Destructor
     */
@@ -220,7 +230,7 @@ namespace Gamera {
 	m_data = new T[m_size];
       std::fill(m_data, m_data + m_size, pixel_traits<T>::default_value());
     }
-
+  protected:
     T* m_data;
   };
 }
@@ -25,6 +25,8 @@
 #include "image_data.hpp"
 #include "image_view.hpp"
 #include "rle_data.hpp"
+#include "packed_data.hpp"
+#include "mapped_data.hpp"
 #include "connected_components.hpp"
 
 #include <list>
@@ -45,6 +47,7 @@ namespace Gamera {
   typedef ImageData<ComplexPixel> ComplexImageData;
   typedef ImageData<OneBitPixel> OneBitImageData;
   typedef RleImageData<OneBitPixel> OneBitRleImageData;
+  typedef PackedImageData<OneBitPixel> OneBitPackedImageData;
 
   /*
     ImageView
@@ -56,6 +59,7 @@ namespace Gamera {
   typedef ImageView<ComplexImageData> ComplexImageView;
   typedef ImageView<OneBitImageData> OneBitImageView;
   typedef ImageView<OneBitRleImageData> OneBitRleImageView;
+  typedef ImageView<OneBitPackedImageData> OneBitPackedImageView;
 
   /*
     Connected-components
@@ -82,13 +86,15 @@ namespace Gamera {
   
   enum StorageTypes {
     DENSE,
-    RLE
+    RLE,
+    PACKED
   };
   
   /*
     To make the wrapping code a little easier these are all of the
     combinations of pixel and storage types. The order is so that
-    the non-compressed views correspond to the PixelTypes.
+    the non-compressed views correspond to the PixelTypes. New
+    combinations are appended to keep the existing numbers stable.
   */
   enum ImageCombinations {
     ONEBITIMAGEVIEW,
@@ -100,7 +106,8 @@ namespace Gamera {
     ONEBITRLEIMAGEVIEW,
     CC,
     RLECC,
-    MLCC
+    MLCC,
+    ONEBITPACKEDIMAGEVIEW
   };
   
   enum ClassificationStates {
@@ -131,10 +138,12 @@ namespace Gamera {
     typedef typename T::data_type data_type;
     typedef ImageData<typename T::value_type> dense_data_type;
     typedef RleImageData<typename T::value_type> rle_data_type;
+    typedef PackedImageData<typename T::value_type> packed_data_type;
     // view types
     typedef ImageView<data_type> view_type;
     typedef ImageView<dense_data_type> dense_view_type;
     typedef ImageView<rle_data_type> rle_view_type;
+    typedef ImageView<packed_data_type> packed_view_type;
     // cc types
     typedef ConnectedComponent<data_type> cc_type;
     typedef ConnectedComponent<dense_data_type> dense_cc_type;
@@ -172,10 +181,12 @@ namespace Gamera {
     typedef RGBImageView::data_type data_type;
     typedef ImageData<RGBImageView::value_type> dense_data_type;
     typedef ImageData<RGBImageView::value_type> rle_data_type;
+    typedef ImageData<RGBImageView::value_type> packed_data_type;
     // view types
     typedef ImageView<data_type> view_type;
     typedef ImageView<dense_data_type> dense_view_type;
     typedef ImageView<rle_data_type> rle_view_type;
+    typedef ImageView<packed_data_type> packed_view_type;
     // cc types
     typedef ConnectedComponent<data_type> cc_type;
     typedef ConnectedComponent<dense_data_type> dense_cc_type;
@@ -208,10 +219,12 @@ namespace Gamera {
     typedef ComplexImageView::data_type data_type;
     typedef ImageData<ComplexImageView::value_type> dense_data_type;
     typedef ImageData<ComplexImageView::value_type> rle_data_type;
+    typedef ImageData<ComplexImageView::value_type> packed_data_type;
     // view types
     typedef ImageView<data_type> view_type;
     typedef ImageView<dense_data_type> dense_view_type;
     typedef ImageView<rle_data_type> rle_view_type;
+    typedef ImageView<packed_data_type> packed_view_type;
     // cc types
     typedef ConnectedComponent<data_type> cc_type;
     typedef ConnectedComponent<dense_data_type> dense_cc_type;
@@ -256,6 +269,11 @@ namespace Gamera {
       data_type* data = new data_type(dim, origin);
       return new image_type(*data, origin, dim);
     }
+    static image_type* create(const Point& origin, const Dim& dim,
+                              const char* mmap_file) {
+      data_type* data = create_image_data<image_type::value_type>(dim, origin, mmap_file);
+      return new image_type(*data, origin, dim);
+    }
   };
 
   template<>
@@ -268,6 +286,16 @@ namespace Gamera {
     }
   };
 
+  template<>
+  struct TypeIdImageFactory<ONEBIT, PACKED> {
+    typedef OneBitPackedImageData data_type;
+    typedef OneBitPackedImageView image_type;
+    static image_type* create(const Point& origin, const Dim& dim) {
+      data_type* data = new data_type(dim, origin);
+      return new image_type(*data, origin, dim);
+    }
+  };
+
   template<>
   struct TypeIdImageFactory<GREYSCALE, DENSE> {
     typedef GreyScaleImageData data_type;
@@ -276,6 +304,11 @@ namespace Gamera {
       data_type* data = new data_type(dim, origin);
       return new image_type(*data, origin, dim);
     }
+    static image_type* create(const Point& origin, const Dim& dim,
+                              const char* mmap_file) {
+      data_type* data = create_image_data<image_type::value_type>(dim, origin, mmap_file);
+      return new image_type(*data, origin, dim);
+    }
   };
 
   template<>
@@ -286,6 +319,11 @@ namespace Gamera {
       data_type* data = new data_type(dim, origin);
       return new image_type(*data, origin, dim);
     }
+    static image_type* create(const Point& origin, const Dim& dim,
+                              const char* mmap_file) {
+      data_type* data = create_image_data<image_type::value_type>(dim, origin, mmap_file);
+      return new image_type(*data, origin, dim);
+    }
   };
 
   template<>
@@ -296,6 +334,11 @@ namespace Gamera {
       data_type* data = new data_type(dim, origin);
       return new image_type(*data, origin, dim);
     }
+    static image_type* create(const Point& origin, const Dim& dim,
+                              const char* mmap_file) {
+      data_type* data = create_image_data<image_type::value_type>(dim, origin, mmap_file);
+      return new image_type(*data, origin, dim);
+    }
   };
 
 
@@ -307,6 +350,11 @@ namespace Gamera {
       data_type* data = new data_type(dim, origin);
       return new image_type(*data, origin, dim);
     }
+    static image_type* create(const Point& origin, const Dim& dim,
+                              const char* mmap_file) {
+      data_type* data = create_image_data<image_type::value_type>(dim, origin, mmap_file);
+      return new image_type(*data, origin, dim);
+    }
   };
 
   template<>
@@ -317,6 +365,11 @@ namespace Gamera {
       data_type* data = new data_type(dim, origin);
       return new image_type(*data, origin, dim);
     }
+    static image_type* create(const Point& origin, const Dim& dim,
+                              const char* mmap_file) {
+      data_type* data = create_image_data<image_type::value_type>(dim, origin, mmap_file);
+      return new image_type(*data, origin, dim);
+    }
   };
 
 }
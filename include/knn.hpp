@@ -99,6 +99,136 @@ namespace Gamera {
       return distance;
     }
 
+    /*
+      DISTANCE FUNCTIONS for contiguous feature vectors.
+
+      Overloads of the distance functions above for plain arrays, as they
+      are used for the feature data of the kNN classifier. The features
+      are summed up in four independent partial sums, so that the loop
+      is not limited by the latency of a single running sum and can be
+      vectorized by the compiler. Note that this changes the order of the
+      summation, so that the result may differ in the last bits from the
+      generic versions. contiguous_distance also accepts feature vectors
+      of floats (see single_precision in knncoremodule.hpp); the
+      differences and sums are always computed in double precision.
+    */
+    struct city_block_term {
+      double operator()(double diff) const {
+        return std::abs(diff);
+      }
+    };
+
+    struct euclidean_term {
+      double operator()(double diff) const {
+        return std::sqrt(diff * diff);
+      }
+    };
+
+    struct fast_euclidean_term {
+      double operator()(double diff) const {
+        return diff * diff;
+      }
+    };
+
+    /*
+      Stop predicates for contiguous_distance. The predicate is called
+      with the partial sum and the number of features summed up so far,
+      and the summation stops as soon as it returns true.
+    */
+    struct never_stop {
+      bool operator()(double partial, size_t i) const {
+        return false;
+      }
+    };
+
+    struct stop_above {
+      stop_above(double b) : bound(b) {}
+      bool operator()(double partial, size_t i) const {
+        return partial > bound;
+      }
+      double bound;
+    };
+
+    template<class K, class U, class Term, class Stop>
+    inline double contiguous_distance(const K* known, const K* end,
+                                      const U* unknown, const int* selection,
+                                      const double* weight, const Term& term,
+                                      const Stop& stop) {
+      const size_t n = end - known;
+      double sum[4] = {0.0, 0.0, 0.0, 0.0};
+      size_t i = 0;
+      while (i + 4 <= n) {
+        // the stop predicate is only checked every 16 features
+        size_t block_end = std::min(i + 16, n - n % 4);
+        for (; i < block_end; i += 4) {
+          for (size_t j = 0; j < 4; ++j)
+            sum[j] += selection[i + j] *
+              (weight[i + j] * term(double(unknown[i + j]) - known[i + j]));
+        }
+        double partial = (sum[0] + sum[1]) + (sum[2] + sum[3]);
+        if (stop(partial, i))
+          return partial;
+      }
+      for (; i < n; ++i)
+        sum[0] += selection[i] * (weight[i] * term(double(unknown[i]) - known[i]));
+      return (sum[0] + sum[1]) + (sum[2] + sum[3]);
+    }
+
+    inline double city_block_distance(const double* known, const double* end,
+                                      const double* unknown, const int* selection,
+                                      const double* weight) {
+      return contiguous_distance(known, end, unknown, selection, weight,
+                                 city_block_term(), never_stop());
+    }
+
+    inline double euclidean_distance(const double* known, const double* end,
+                                     const double* unknown, const int* selection,
+                                     const double* weight) {
+      return contiguous_distance(known, end, unknown, selection, weight,
+                                 euclidean_term(), never_stop());
+    }
+
+    inline double fast_euclidean_distance(const double* known, const double* end,
+                                          const double* unknown, const int* selection,
+                                          const double* weight) {
+      return contiguous_distance(known, end, unknown, selection, weight,
+                                 fast_euclidean_term(), never_stop());
+    }
+
+    /*
+      BOUNDED DISTANCE FUNCTIONS
+
+      These variants stop adding up features as soon as the partial sum
+      exceeds *bound*. For non-negative selections and weights, all terms
+      are non-negative, so that the partial sum is a lower bound for the
+      distance. A candidate can thus be rejected after a fraction of the
+      features when it is already farther away than the current k-th
+      nearest neighbor (see kNearestNeighbors::worst_distance).
+
+      The return value is greater than *bound* if and only if the distance
+      is; when it is not greater, it is exactly the unbounded distance.
+    */
+    inline double city_block_distance(const double* known, const double* end,
+                                      const double* unknown, const int* selection,
+                                      const double* weight, double bound) {
+      return contiguous_distance(known, end, unknown, selection, weight,
+                                 city_block_term(), stop_above(bound));
+    }
+
+    inline double euclidean_distance(const double* known, const double* end,
+                                     const double* unknown, const int* selection,
+                                     const double* weight, double bound) {
+      return contiguous_distance(known, end, unknown, selection, weight,
+                                 euclidean_term(), stop_above(bound));
+    }
+
+    inline double fast_euclidean_distance(const double* known, const double* end,
+                                          const double* unknown, const int* selection,
+                                          const double* weight, double bound) {
+      return contiguous_distance(known, end, unknown, selection, weight,
+                                 fast_euclidean_term(), stop_above(bound));
+    }
+
     /*
       DISTANCE FUNCTIONS with skip.
       
@@ -176,6 +306,57 @@ namespace Gamera {
       return distance;
     }
 
+    /*
+      Bounded variants of the distance functions with skip, which stop
+      adding up features as soon as the partial sum exceeds *bound* (see
+      BOUNDED DISTANCE FUNCTIONS above). Like contiguous_distance, they
+      compute the differences in double precision.
+    */
+    template<class IterA, class IterB, class IterC, class IterD, class IterE>
+    inline double city_block_distance_skip(IterA known, IterB unknown,
+                                           IterC selection, IterD weight,
+                                           IterE indexes, const IterE end,
+                                           double bound) {
+      double distance = 0;
+      for (size_t i = 1; indexes != end; ++indexes, ++i) {
+        double diff = double(unknown[*indexes]) - known[*indexes];
+        distance += selection[*indexes] * (weight[*indexes] * std::abs(diff));
+        if (i % 8 == 0 && distance > bound)
+          break;
+      }
+      return distance;
+    }
+
+    template<class IterA, class IterB, class IterC, class IterD, class IterE>
+    inline double euclidean_distance_skip(IterA known, IterB unknown,
+                                          IterC selection, IterD weight,
+                                          IterE indexes, const IterE end,
+                                          double bound) {
+      double distance = 0;
+      for (size_t i = 1; indexes != end; ++indexes, ++i) {
+        double diff = double(unknown[*indexes]) - known[*indexes];
+        distance += selection[*indexes] * (weight[*indexes] * std::sqrt(diff * diff));
+        if (i % 8 == 0 && distance > bound)
+          break;
+      }
+      return distance;
+    }
+
+    template<class IterA, class IterB, class IterC, class IterD, class IterE>
+    inline double fast_euclidean_distance_skip(IterA known, IterB unknown,
+                                               IterC selection, IterD weight,
+                                               IterE indexes, const IterE end,
+                                               double bound) {
+      double distance = 0;
+      for (size_t i = 1; indexes != end; ++indexes, ++i) {
+        double diff = double(unknown[*indexes]) - known[*indexes];
+        distance += selection[*indexes] * (weight[*indexes] * (diff * diff));
+        if (i % 8 == 0 && distance > bound)
+          break;
+      }
+      return distance;
+    }
+
     /*
       NORMALIZE
       
@@ -223,25 +404,50 @@ namespace Gamera {
         }
         ++m_num_feature_vectors;
       }
+      /*
+        Remove a feature vector that was added before from the running
+        sums, so that the normalization can be updated incrementally.
+      */
+      template<class T>
+      void remove(T begin, const T end) {
+        assert(m_sum_vector != 0 && m_sum2_vector != 0);
+        if (size_t(end - begin) != m_num_features)
+          throw std::range_error("Normalize: number features did not match.");
+        for (size_t i = 0; begin != end; ++begin, ++i) {
+          m_sum_vector[i] -= *begin;
+          m_sum2_vector[i] -= *begin * *begin;
+        }
+        --m_num_feature_vectors;
+      }
+      /*
+        Compute the mean and standard deviation from the running sums. The
+        sums are kept, so that more feature vectors can be added or removed
+        afterwards.
+      */
       void compute_normalization() {
         assert(m_sum_vector != 0 && m_sum2_vector != 0);
         double mean, var, stdev, sum, sum2;
         for (size_t i = 0; i < m_num_features; ++i) {
           sum = m_sum_vector[i];
           sum2 = m_sum2_vector[i];
-          mean = sum / m_num_feature_vectors;
-          var = (m_num_feature_vectors * sum2 - sum * sum)
-            / (m_num_feature_vectors * (m_num_feature_vectors - 1));
-          stdev = std::sqrt(var);
+          if (m_num_feature_vectors == 0) {
+            mean = 0.0;
+            var = 0.0;
+          } else {
+            mean = sum / m_num_feature_vectors;
+            if (m_num_feature_vectors < 2)
+              var = 0.0;
+            else
+              var = (m_num_feature_vectors * sum2 - sum * sum)
+                / (m_num_feature_vectors * (m_num_feature_vectors - 1));
+          }
+          // the running sums may leave a tiny negative variance
+          stdev = (var > 0.0) ? std::sqrt(var) : 0.0;
           if (stdev < 0.00001)
             stdev = 0.00001;
           m_mean_vector[i] = mean;
           m_stdev_vector[i] = stdev;
         }
-        delete[] m_sum_vector;
-        m_sum_vector = 0;
-        delete[] m_sum2_vector;
-        m_sum2_vector = 0;
       }
       // in-place
       template<class T>
@@ -406,6 +612,44 @@ namespace Gamera {
         if (distance > m_max_distance)
           m_max_distance = distance;
       }
+      /*
+        The distance a candidate must fall below to be added to the k
+        nearest neighbors. Candidates that are farther away do not change
+        the neighbors, but still change the maximum distance and possibly
+        the nearest unlike neighbor (see max_distance and nun_distance).
+      */
+      double worst_distance() const {
+        if (m_nn.size() < m_k)
+          return std::numeric_limits<double>::max();
+        return m_nn.back().distance;
+      }
+      // the largest distance added so far
+      double max_distance() const {
+        return m_max_distance;
+      }
+      /*
+        The distance a candidate must fall below to change the nearest
+        unlike neighbor.
+      */
+      double nun_distance() const {
+        if (m_nun == NULL)
+          return std::numeric_limits<double>::max();
+        return m_nun->distance;
+      }
+      /*
+        Set the maximum distance and the nearest unlike neighbor, which
+        are otherwise collected by add. This is needed when the neighbors
+        have been found with a search index, so that add has not been
+        called for every element in the database. A NULL pointer for
+        *nun* means that there is no unlike neighbor.
+      */
+      void set_statistics(double max_distance, const neighbor_type* nun) {
+        m_max_distance = max_distance;
+        if (m_nun) delete m_nun;
+        m_nun = NULL;
+        if (nun)
+          m_nun = new neighbor_type(nun->id, nun->distance);
+      }
       /*
         Find the id of the majority of the k nearest neighbors. This
         includes tie-breaking if necessary.
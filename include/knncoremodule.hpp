@@ -23,9 +23,16 @@
 
 #include <Python.h>
 #include <vector>
+#include <map>
+#include <time.h>
 #include "gameramodule.hpp"
 #include "knn.hpp"
 #include "knnmodule.hpp"
+#include "knnindex.hpp"
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 namespace Gamera { namespace kNN {
 #if 0
@@ -47,10 +54,56 @@ namespace Gamera { namespace kNN {
 
     /*
       The feature vectors.
-      A vector to double arrays of size num_features is used to store the
-      feature vectors. It is only used for non-interactive classification).
+      All feature vectors are stored in a single memory block (feature_data)
+      in row-major order. Each row is padded to feature_stride doubles, so
+      that every row starts at an aligned address and the distance loops
+      run over contiguous memory. feature_vectors holds a pointer to the
+      start of each row. It is only used for non-interactive classification).
     */
     std::vector<double*> *feature_vectors;
+    double* feature_data;
+    /*
+      When single_precision is set, the rows are stored as floats in
+      single_data instead of feature_data, which halves the memory and
+      the memory traffic of the linear scans. The distances are still
+      computed in double precision. feature_vectors then holds null
+      pointers (its size is still the number of feature vectors).
+    */
+    bool single_precision;
+    float* single_data;
+    // the number of elements (doubles or floats) between two rows
+    size_t feature_stride;
+    // the allocated memory, feature_data or single_data is aligned within this block
+    char* feature_storage;
+    /*
+      The smallest and largest value of each feature in the feature data,
+      used for bounding the distances in classify.
+    */
+    double* feature_min;
+    double* feature_max;
+    /*
+      The read-only memory mapping of a snapshot file (see load_snapshot).
+      When set, feature_data (or single_data), the id_names strings,
+      id_name_histogram, feature_min and feature_max point into the
+      mapping instead of being allocated.
+    */
+    void* mapping;
+    size_t mapping_size;
+    /*
+      Feature vectors can be inserted and removed one at a time (see
+      insert_from_image). The rows are allocated for feature_capacity
+      feature vectors, which grows geometrically. When normalizing,
+      raw_data holds the feature vectors before normalization with the
+      same layout as feature_data, because every change of the data
+      changes the normalization. After such changes stale is set and the
+      normalized rows and the index are brought up to date before they
+      are used next (knn_prepare); stale_histogram is the same for
+      id_name_histogram (knn_prepare_histogram).
+    */
+    size_t feature_capacity;
+    double* raw_data;
+    bool stale;
+    bool stale_histogram;
 
     // The id_names for the feature vectors
     char** id_names;
@@ -77,8 +130,67 @@ namespace Gamera { namespace kNN {
     size_t num_k;
     // the distance type currently being used.
     DistanceType distance_type;
+    /*
+      Optional kd-tree over the feature vectors for faster classification.
+      It is only built when use_index is set and rebuilt whenever the
+      feature vectors, the selections or the weights change.
+    */
+    KdIndex* index;
+    bool use_index;
+    // the time in seconds it took to build the index
+    double index_build_time;
+    // the number of threads used by classify_many (0 = all processors)
+    int num_threads;
   };
 
+  // the alignment in bytes of the rows of the feature data
+  static const size_t feature_alignment = 32;
+
+  /*
+    The number of doubles between the starts of two consecutive feature
+    vectors in the feature data: num_features rounded up to a multiple
+    of the alignment.
+  */
+  inline size_t feature_stride(size_t num_features,
+                               size_t element_size = sizeof(double)) {
+    size_t n = feature_alignment / element_size;
+    return ((num_features + n - 1) / n) * n;
+  }
+
+  /*
+    Copy row i of the feature data into the doubles at dest, or store the
+    doubles at src in row i (rounded when single_precision is set).
+  */
+  inline void knn_get_row(const KnnObject* o, size_t i, double* dest) {
+    if (o->single_precision) {
+      const float* row = o->single_data + i * o->feature_stride;
+      std::copy(row, row + o->num_features, dest);
+    } else {
+      const double* row = o->feature_data + i * o->feature_stride;
+      std::copy(row, row + o->num_features, dest);
+    }
+  }
+
+  inline void knn_put_row(KnnObject* o, size_t i, const double* src) {
+    if (o->single_precision)
+      std::copy(src, src + o->num_features, o->single_data + i * o->feature_stride);
+    else
+      std::copy(src, src + o->num_features, o->feature_data + i * o->feature_stride);
+  }
+
+  /*
+    Whether all features contribute non-negative terms to the distance.
+    Only then is a partial sum a lower bound for the distance, so that the
+    bounded distance functions can be used.
+  */
+  inline bool nonnegative_weights(const int* selections, const double* weights,
+                                  size_t num_features) {
+    for (size_t i = 0; i < num_features; ++i)
+      if (selections[i] * weights[i] < 0.0)
+        return false;
+    return true;
+  }
+
   /*
     String comparison functors used by the kNearestNeighbors object
   */
@@ -93,6 +205,199 @@ namespace Gamera { namespace kNN {
     }
   };
 
+  /*
+    Compute the range of each feature in the feature data. This must be
+    called whenever the feature vectors change.
+  */
+  template<class T>
+  inline void knn_compute_feature_range(KnnObject* o, const T* current) {
+    std::copy(current, current + o->num_features, o->feature_min);
+    std::copy(current, current + o->num_features, o->feature_max);
+    for (size_t i = 1; i < o->feature_vectors->size(); ++i) {
+      current += o->feature_stride;
+      for (size_t j = 0; j < o->num_features; ++j) {
+        if (current[j] < o->feature_min[j])
+          o->feature_min[j] = current[j];
+        else if (current[j] > o->feature_max[j])
+          o->feature_max[j] = current[j];
+      }
+    }
+  }
+
+  inline void knn_compute_feature_range(KnnObject* o) {
+    if (o->single_precision)
+      knn_compute_feature_range(o, o->single_data);
+    else
+      knn_compute_feature_range(o, o->feature_data);
+  }
+
+  /*
+    (Re)build the kd-tree index over the current feature vectors. This must
+    be called whenever the feature vectors, the selections or the weights
+    change. When the index cannot be used with the current weights or
+    the rows are stored in single precision, no index is built and
+    classify falls back to a linear scan.
+  */
+  inline void knn_build_index(KnnObject* o) {
+    if (o->index != 0) {
+      delete o->index;
+      o->index = 0;
+    }
+    o->index_build_time = 0.0;
+    // after incremental changes, knn_prepare builds the index
+    if (!o->use_index || o->feature_vectors == 0 || o->stale ||
+        o->feature_vectors->empty() || o->single_precision)
+      return;
+    clock_t start = clock();
+    std::map<char*, int, ltstr> label_map;
+    std::vector<int> labels(o->feature_vectors->size());
+    for (size_t i = 0; i < labels.size(); ++i) {
+      std::map<char*, int, ltstr>::iterator found = label_map.find(o->id_names[i]);
+      if (found == label_map.end())
+        labels[i] = label_map[o->id_names[i]] = (int)label_map.size();
+      else
+        labels[i] = found->second;
+    }
+    o->index = new KdIndex(o->feature_vectors, o->num_features, labels,
+                           o->selection_vector, o->weight_vector);
+    o->index_build_time = double(clock() - start) / CLOCKS_PER_SEC;
+    if (!o->index->valid()) {
+      delete o->index;
+      o->index = 0;
+    }
+  }
+
+  /*
+    Bring the normalized rows, their feature ranges and the index up to
+    date after feature vectors were inserted or removed. Without
+    normalization and index there is nothing to do; otherwise this takes
+    linear time, but only once for any number of changes.
+  */
+  inline void knn_prepare(KnnObject* o) {
+    if (o->feature_vectors == 0 || !o->stale)
+      return;
+    o->stale = false;
+    size_t size = o->feature_vectors->size();
+    if (o->raw_data != 0) {
+      o->normalize->compute_normalization();
+      std::vector<double> row(o->num_features);
+      for (size_t i = 0; i < size; ++i) {
+        const double* raw = o->raw_data + i * o->feature_stride;
+        o->normalize->apply(raw, raw + o->num_features, row.begin());
+        knn_put_row(o, i, &row[0]);
+      }
+      if (size > 0)
+        knn_compute_feature_range(o);
+    }
+    knn_build_index(o);
+  }
+
+  /*
+    Bring the id_name histogram used by leave_one_out up to date after
+    feature vectors were inserted or removed.
+  */
+  inline void knn_prepare_histogram(KnnObject* o) {
+    if (o->feature_vectors == 0 || !o->stale_histogram)
+      return;
+    o->stale_histogram = false;
+    size_t size = o->feature_vectors->size();
+    std::map<char*, int, ltstr> id_name_histogram;
+    for (size_t i = 0; i < size; ++i)
+      id_name_histogram[o->id_names[i]]++;
+    for (size_t i = 0; i < size; ++i)
+      o->id_name_histogram[i] = id_name_histogram[o->id_names[i]];
+  }
+
+  /*
+    The number of threads used by the parallel loops (classify_many,
+    leave_one_out and stratified_kfold).
+  */
+  inline int knn_num_threads(KnnObject* o) {
+#ifdef _OPENMP
+    return o->num_threads > 0 ? o->num_threads : omp_get_max_threads();
+#else
+    return 1;
+#endif
+  }
+
+  typedef kNearestNeighbors<char*, ltstr, eqstr> knn_row_type;
+
+  // skip the row itself (leave-one-out)
+  struct knn_skip_row {
+    knn_skip_row(size_t r) : row(r) {}
+    bool operator()(size_t j) const { return j == row; }
+    size_t row;
+  };
+
+  // skip all rows in the same fold (k-fold cross validation)
+  struct knn_skip_fold {
+    knn_skip_fold(const std::vector<int>& f, size_t row) : folds(f), fold(f[row]) {}
+    bool operator()(size_t j) const { return folds[j] == fold; }
+    const std::vector<int>& folds;
+    int fold;
+  };
+
+  /*
+    Find the k nearest neighbors of feature vector i among the other
+    feature vectors (except those for which skip is true) and compute the
+    majority. Only the k nearest neighbors are needed for the majority, so
+    when bounded the distance computation is abandoned as soon as a
+    candidate is farther away than the current k-th nearest neighbor.
+    When indexes is given, only these features are used.
+  */
+  template<class T, class Skip>
+  inline void knn_row_majority(KnnObject* o, const T* data, size_t i, int* selections,
+                               double* weights, std::vector<long>* indexes,
+                               bool bounded, const Skip& skip, knn_row_type& knn) {
+    const T* current_known = data;
+    // only the known feature vectors are converted in the distance loops
+    const T* row = data + i * o->feature_stride;
+    std::vector<double> unknown_row(row, row + o->num_features);
+    const double* unknown = &unknown_row[0];
+    for (size_t j = 0; j < o->feature_vectors->size();
+         ++j, current_known += o->feature_stride) {
+      if (skip(j))
+        continue;
+      double distance;
+      double bound = bounded ? knn.worst_distance() : std::numeric_limits<double>::infinity();
+      if (indexes == 0) {
+        compute_distance(o->distance_type, current_known, o->num_features,
+                         unknown, &distance, selections, weights, bound);
+      } else if (o->distance_type == CITY_BLOCK) {
+        distance = city_block_distance_skip(current_known, unknown, selections, weights,
+                                            indexes->begin(), indexes->end(), bound);
+      } else if (o->distance_type == FAST_EUCLIDEAN) {
+        distance = fast_euclidean_distance_skip(current_known, unknown, selections, weights,
+                                                indexes->begin(), indexes->end(), bound);
+      } else {
+        distance = euclidean_distance_skip(current_known, unknown, selections, weights,
+                                           indexes->begin(), indexes->end(), bound);
+      }
+      // farther candidates cannot change the k nearest neighbors
+      if (distance < knn.worst_distance())
+        knn.add(o->id_names[j], distance);
+    }
+    knn.majority();
+  }
+
+  template<class Skip>
+  inline void knn_row_majority(KnnObject* o, size_t i, int* selections,
+                               double* weights, std::vector<long>* indexes,
+                               bool bounded, const Skip& skip, knn_row_type& knn) {
+    if (o->single_precision)
+      knn_row_majority(o, (const float*)o->single_data, i, selections, weights,
+                       indexes, bounded, skip, knn);
+    else
+      knn_row_majority(o, (const double*)o->feature_data, i, selections, weights,
+                       indexes, bounded, skip, knn);
+  }
+
+  /*
+    Leave-one-out cross validation. Returns the number of correctly
+    classified feature vectors and the number of classified feature
+    vectors. The feature vectors are classified in parallel with
+    knn_num_threads threads.
+  */
   static std::pair<int,int> leave_one_out(KnnObject* o, int stop_threshold,
                                           int* selection_vector = 0,
                                           double* weight_vector = 0,
@@ -108,67 +413,52 @@ namespace Gamera { namespace kNN {
     }
 
     assert(o->feature_vectors != 0);
-    kNearestNeighbors<char*, ltstr, eqstr> knn(o->num_k);
+    bool bounded = nonnegative_weights(selections, weights, o->num_features);
+
+    // We don't want to do the calculation if there is no
+    // hope that kNN will return the correct answer (because
+    // there aren't enough examples in the database).
+    std::vector<size_t> queries;
+    for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
+      if (o->id_name_histogram[i] >= int((o->num_k + 0.5) / 2))
+        queries.push_back(i);
+    }
+
+    /*
+      The queries are classified in parallel block by block, but counted
+      in order, so that stopping after stop_threshold errors gives the
+      same result as classifying one query after another. Without a
+      threshold, all queries form a single block.
+    */
+    int num_threads = knn_num_threads(o);
+    size_t block_size = queries.size();
+    if (stop_threshold < std::numeric_limits<int>::max())
+      block_size = 64 * size_t(num_threads);
+    std::vector<char> correct(std::min(block_size, queries.size()));
 
     int total_correct = 0;
     int total_queries = 0;
-    if (indexes == 0) {
-      for (size_t i = 0; i < o->feature_vectors->size(); ++i/*, cur += o->num_features*/) {
-        // We don't want to do the calculation if there is no
-        // hope that kNN will return the correct answer (because
-        // there aren't enough examples in the database).
-        if (o->id_name_histogram[i] < int((o->num_k + 0.5) / 2)) {
-          continue;
-        }
-        double* current_known;
-        double* unknown = (*o->feature_vectors)[i];
-        for (size_t j = 0; j < o->feature_vectors->size(); ++j) {
-          current_known = (*o->feature_vectors)[j];
-          if (i == j)
-            continue;
-          double distance;
-          compute_distance(o->distance_type, current_known, o->num_features,
-                           unknown, &distance, selections, weights);
-          knn.add(o->id_names[j], distance);
-        }
-        knn.majority();
-        if (strcmp(knn.answer[0].first, o->id_names[i]) == 0) {
-          total_correct++;
+    for (size_t start = 0; start < queries.size(); start += block_size) {
+      int count = int(std::min(block_size, queries.size() - start));
+#ifdef _OPENMP
+#pragma omp parallel num_threads(num_threads)
+#endif
+      {
+        knn_row_type knn(o->num_k);
+#ifdef _OPENMP
+#pragma omp for schedule(dynamic, 8)
+#endif
+        for (int q = 0; q < count; ++q) {
+          size_t i = queries[start + q];
+          knn_row_majority(o, i, selections, weights, indexes, bounded,
+                           knn_skip_row(i), knn);
+          correct[q] = (strcmp(knn.answer[0].first, o->id_names[i]) == 0);
+          knn.reset();
         }
-        knn.reset();
-        total_queries++;
-        if (total_queries - total_correct > stop_threshold)
-          return std::make_pair(total_correct, total_queries);
       }
-    } else {
-      for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-        if (o->id_name_histogram[i] < int((o->num_k + 0.5) / 2))
-          continue;
-        double* current_known;
-        double* unknown = (*o->feature_vectors)[i];
-        for (size_t j = 0; j < o->feature_vectors->size(); ++j) {
-          current_known = (*o->feature_vectors)[j];
-          if (i == j)
-            continue;
-          double distance;
-          if (o->distance_type == CITY_BLOCK) {
-            distance = city_block_distance_skip(current_known, unknown, selections, weights,
-                                                indexes->begin(), indexes->end());
-          } else if (o->distance_type == FAST_EUCLIDEAN) {
-            distance = fast_euclidean_distance_skip(current_known, unknown, selections, weights,
-                                                    indexes->begin(), indexes->end());
-          } else {
-            distance = euclidean_distance_skip(current_known, unknown, selections, weights,
-                                               indexes->begin(), indexes->end());
-          }
-
-          knn.add(o->id_names[j], distance);
-        }
-        knn.majority();
-        if (strcmp(knn.answer[0].first, o->id_names[i]) == 0) {
+      for (int q = 0; q < count; ++q) {
+        if (correct[q])
           total_correct++;
-        }
-        knn.reset();
         total_queries++;
         if (total_queries - total_correct > stop_threshold)
           return std::make_pair(total_correct, total_queries);
@@ -177,6 +467,44 @@ namespace Gamera { namespace kNN {
     return std::make_pair(total_correct, total_queries);
   }
 
+  /*
+    Stratified k-fold cross validation: the feature vectors of each class
+    are distributed round-robin over the folds (in the order of the
+    feature vectors), and each fold is classified using the others. The
+    predicted id_name of each feature vector is stored in predicted.
+  */
+  inline void stratified_kfold(KnnObject* o, int num_folds,
+                               std::vector<char*>& predicted) {
+    assert(o->feature_vectors != 0 && num_folds > 1);
+    size_t size = o->feature_vectors->size();
+    std::vector<int> folds(size);
+    std::map<char*, int, ltstr> class_counts;
+    for (size_t i = 0; i < size; ++i)
+      folds[i] = class_counts[o->id_names[i]]++ % num_folds;
+
+    bool bounded = nonnegative_weights(o->selection_vector, o->weight_vector,
+                                       o->num_features);
+    predicted.resize(size);
+    int num_threads = knn_num_threads(o);
+    int count = int(size);
+#ifdef _OPENMP
+#pragma omp parallel num_threads(num_threads)
+#endif
+    {
+      knn_row_type knn(o->num_k);
+#ifdef _OPENMP
+#pragma omp for schedule(dynamic, 8)
+#endif
+      for (int i = 0; i < count; ++i) {
+        knn_row_majority(o, size_t(i), o->selection_vector, o->weight_vector, 0,
+                         bounded, knn_skip_fold(folds, size_t(i)), knn);
+        // a fold may contain all feature vectors (fewer vectors than folds)
+        predicted[i] = knn.answer.empty() ? 0 : knn.answer[0].first;
+        knn.reset();
+      }
+    }
+  }
+
 }} // end of namespaces
 
 #endif
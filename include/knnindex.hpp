@@ -0,0 +1,392 @@
+/*
+ *
+ * Copyright (C) 2026 Gamera developers
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+#ifndef KnnIndex202610
+#define KnnIndex202610
+
+#include <vector>
+#include <queue>
+#include <limits>
+#include <algorithm>
+#include <cmath>
+#include "knnmodule.hpp"
+
+namespace Gamera { namespace kNN {
+
+  /*
+    KD INDEX
+
+    A kd-tree over the feature vectors of a non-interactive kNN classifier.
+    Unlike Gamera::Kdtree::KdTree, the index does not copy the feature
+    vectors, but only stores a permutation of their row numbers and the
+    bounding box of each node.
+
+    Searches are exact for all distance types of the kNN classifier,
+    because the distance of each candidate is computed with the same
+    distance functions as the linear scan in knn_classify. The tree is
+    only used for pruning with the weighted distance between the unknown
+    and the bounding box of a subtree, which is a valid bound because all
+    distance types are sums of per-feature terms.
+
+    Besides the k nearest neighbors, a search also yields the statistics
+    needed for the confidences: the maximum distance to any feature vector
+    (for CONFIDENCE_DEFAULT) and optionally the nearest neighbor of a
+    different class (for CONFIDENCE_NUN). For the latter, each feature
+    vector has an integer label.
+
+    The selections and weights are read when the tree is built (they
+    determine the cutting dimensions and the bounds), so the index must
+    be rebuilt whenever they change. Negative weights would make the
+    bounds invalid; in that case valid() returns false and the caller
+    must fall back to the linear scan.
+
+    The search is const and keeps its state on the stack, so that one
+    index can be searched from several threads at once.
+  */
+  class KdIndex {
+  public:
+    // the maximum number of feature vectors in a leaf
+    static const size_t leaf_size = 16;
+
+    typedef std::pair<double, size_t> neighbor_type;
+
+    /*
+      The result of a search. The neighbors are sorted by distance, ties
+      are broken by the row number. *unlike* is the nearest neighbor with
+      a different label than the nearest neighbor.
+    */
+    struct Result {
+      std::vector<neighbor_type> neighbors;
+      bool has_unlike;
+      neighbor_type unlike;
+      double max_distance;
+    };
+
+    KdIndex(const std::vector<double*>* feature_vectors, size_t num_features,
+            const std::vector<int>& labels,
+            const int* selections, const double* weights)
+      : m_feature_vectors(feature_vectors), m_num_features(num_features),
+        m_selections(selections), m_weights(weights),
+        m_effective_weights(num_features), m_labels(labels), m_valid(true) {
+      for (size_t d = 0; d < m_num_features; ++d) {
+        m_effective_weights[d] = m_selections[d] * m_weights[d];
+        if (m_effective_weights[d] < 0.0)
+          m_valid = false;
+      }
+      if (!m_valid || m_feature_vectors->empty())
+        return;
+      m_order.resize(m_feature_vectors->size());
+      for (size_t i = 0; i < m_order.size(); ++i)
+        m_order[i] = i;
+      m_nodes.reserve(4 * (m_order.size() / leaf_size + 1));
+      build(0, m_order.size());
+    }
+
+    bool valid() const {
+      return m_valid;
+    }
+
+    size_t num_nodes() const {
+      return m_nodes.size();
+    }
+
+    /*
+      Search the k nearest neighbors of *unknown*. As the nearest unlike
+      neighbor can be much farther away than the nearest neighbors, it is
+      only searched when *with_unlike* is set.
+
+      The nearest neighbors are searched first, visiting the subtree
+      closer to the unknown first. The maximum distance is searched in a
+      second traversal, which visits the farther subtree first. When
+      *with_max_distance* is not set, this traversal is skipped and the
+      maximum distance is that of the k-th nearest neighbor.
+    */
+    void search(const double* unknown, DistanceType distance_type, size_t k,
+                bool with_unlike, Result& result,
+                bool with_max_distance = true) const {
+      Search search(unknown, distance_type, k, with_unlike);
+      if (!m_nodes.empty()) {
+        visit_nearest(0, search);
+        // the nearest neighbors give a start value for the maximum
+        if (!search.heap.empty())
+          search.max_distance = search.heap.top().first;
+        if (with_max_distance)
+          visit_farthest(0, search);
+      }
+      result.neighbors.resize(search.heap.size());
+      for (size_t i = result.neighbors.size(); i > 0; --i) {
+        result.neighbors[i - 1] = search.heap.top();
+        search.heap.pop();
+      }
+      result.has_unlike = search.has_unlike;
+      result.unlike = search.unlike;
+      result.max_distance = search.max_distance;
+    }
+
+  private:
+    struct Node {
+      // child node indices, only valid for inner nodes
+      size_t loson, hison;
+      // range in m_order
+      size_t begin, end;
+      bool leaf;
+    };
+
+    struct compare_dimension {
+      compare_dimension(const std::vector<double*>* fv, size_t d)
+        : feature_vectors(fv), dim(d) {}
+      bool operator()(size_t a, size_t b) const {
+        return (*feature_vectors)[a][dim] < (*feature_vectors)[b][dim];
+      }
+      const std::vector<double*>* feature_vectors;
+      size_t dim;
+    };
+
+    typedef std::priority_queue<neighbor_type> heap_type;
+
+    struct Search {
+      Search(const double* u, DistanceType dt, size_t k_, bool unlike_)
+        : unknown(u), distance_type(dt), k(k_), with_unlike(unlike_),
+          has_nearest(false), has_unlike(false), max_distance(0.0) {}
+      const double* unknown;
+      DistanceType distance_type;
+      size_t k;
+      bool with_unlike;
+      heap_type heap;
+      // nearest neighbor and nearest neighbor with a different label
+      bool has_nearest, has_unlike;
+      neighbor_type nearest, unlike;
+      double max_distance;
+    };
+
+    const double* row(size_t i) const {
+      return (*m_feature_vectors)[i];
+    }
+
+    const double* lobound(size_t node) const {
+      return &m_bounds[2 * node * m_num_features];
+    }
+
+    const double* upbound(size_t node) const {
+      return &m_bounds[(2 * node + 1) * m_num_features];
+    }
+
+    size_t build(size_t begin, size_t end) {
+      size_t index = m_nodes.size();
+      m_nodes.push_back(Node());
+      m_nodes[index].leaf = true;
+      m_nodes[index].begin = begin;
+      m_nodes[index].end = end;
+      // bounding box of all feature vectors in the subtree
+      m_bounds.resize(2 * m_nodes.size() * m_num_features);
+      double* lo = &m_bounds[2 * index * m_num_features];
+      double* up = lo + m_num_features;
+      const double* first = row(m_order[begin]);
+      std::copy(first, first + m_num_features, lo);
+      std::copy(first, first + m_num_features, up);
+      for (size_t i = begin + 1; i < end; ++i) {
+        const double* x = row(m_order[i]);
+        for (size_t d = 0; d < m_num_features; ++d) {
+          if (x[d] < lo[d])
+            lo[d] = x[d];
+          else if (x[d] > up[d])
+            up[d] = x[d];
+        }
+      }
+      if (end - begin <= leaf_size)
+        return index;
+      // cut along the dimension with the largest weighted spread
+      size_t cutdim = 0;
+      double max_spread = 0.0;
+      for (size_t d = 0; d < m_num_features; ++d) {
+        double spread = m_effective_weights[d] * (up[d] - lo[d]);
+        if (spread > max_spread) {
+          max_spread = spread;
+          cutdim = d;
+        }
+      }
+      // all feature vectors are equal in the selected dimensions
+      if (max_spread == 0.0)
+        return index;
+      size_t m = (begin + end) / 2;
+      std::nth_element(m_order.begin() + begin, m_order.begin() + m,
+                       m_order.begin() + end,
+                       compare_dimension(m_feature_vectors, cutdim));
+      // lo and up are invalidated here, because m_bounds grows
+      size_t loson = build(begin, m);
+      size_t hison = build(m, end);
+      m_nodes[index].leaf = false;
+      m_nodes[index].loson = loson;
+      m_nodes[index].hison = hison;
+      return index;
+    }
+
+    inline double coordinate_distance(size_t d, double diff,
+                                      DistanceType distance_type) const {
+      if (distance_type == FAST_EUCLIDEAN)
+        return m_effective_weights[d] * (diff * diff);
+      return m_effective_weights[d] * diff;
+    }
+
+    // lower bound for the distance of the unknown from the subtree
+    double min_distance(size_t node, const Search& search) const {
+      const double* lo = lobound(node);
+      const double* up = upbound(node);
+      double distance = 0.0;
+      for (size_t d = 0; d < m_num_features; ++d) {
+        double x = search.unknown[d];
+        if (x < lo[d])
+          distance += coordinate_distance(d, lo[d] - x, search.distance_type);
+        else if (x > up[d])
+          distance += coordinate_distance(d, x - up[d], search.distance_type);
+      }
+      return distance;
+    }
+
+    // upper bound for the distance of the unknown from the subtree
+    double max_distance(size_t node, const Search& search) const {
+      const double* lo = lobound(node);
+      const double* up = upbound(node);
+      double distance = 0.0;
+      for (size_t d = 0; d < m_num_features; ++d) {
+        double x = search.unknown[d];
+        distance += coordinate_distance(
+          d, std::max(std::fabs(x - lo[d]), std::fabs(x - up[d])),
+          search.distance_type);
+      }
+      return distance;
+    }
+
+    /*
+      Pruning test with a little slack, because the bounds are subject
+      to different rounding errors than the distances.
+    */
+    static inline bool is_beyond(double a, double b) {
+      return a * (1.0 - 1e-9) > b;
+    }
+
+    /*
+      The largest distance that can still change the set of nearest
+      neighbors or the nearest unlike neighbor.
+    */
+    static inline double search_radius(const Search& search) {
+      if (search.heap.size() < search.k)
+        return std::numeric_limits<double>::max();
+      if (!search.with_unlike)
+        return search.heap.top().first;
+      if (!search.has_unlike)
+        return std::numeric_limits<double>::max();
+      return std::max(search.heap.top().first, search.unlike.first);
+    }
+
+    void add_candidate(Search& search, const neighbor_type& candidate) const {
+      if (search.heap.size() < search.k) {
+        search.heap.push(candidate);
+      } else if (candidate < search.heap.top()) {
+        search.heap.pop();
+        search.heap.push(candidate);
+      }
+      if (!search.with_unlike)
+        return;
+      if (!search.has_nearest) {
+        search.has_nearest = true;
+        search.nearest = candidate;
+      } else if (m_labels[candidate.second] != m_labels[search.nearest.second]) {
+        if (candidate < search.nearest) {
+          search.has_unlike = true;
+          search.unlike = search.nearest;
+          search.nearest = candidate;
+        } else if (!search.has_unlike || candidate < search.unlike) {
+          search.has_unlike = true;
+          search.unlike = candidate;
+        }
+      } else if (candidate < search.nearest) {
+        search.nearest = candidate;
+      }
+    }
+
+    void visit_nearest(size_t index, Search& search) const {
+      const Node& node = m_nodes[index];
+      if (node.leaf) {
+        for (size_t i = node.begin; i < node.end; ++i) {
+          size_t r = m_order[i];
+          double distance;
+          compute_distance(search.distance_type, row(r), m_num_features,
+                           search.unknown, &distance, m_selections, m_weights);
+          add_candidate(search, neighbor_type(distance, r));
+        }
+        return;
+      }
+      double lo_distance = min_distance(node.loson, search);
+      double hi_distance = min_distance(node.hison, search);
+      size_t near_son = node.loson, far_son = node.hison;
+      double near_distance = lo_distance, far_distance = hi_distance;
+      if (hi_distance < lo_distance) {
+        std::swap(near_son, far_son);
+        std::swap(near_distance, far_distance);
+      }
+      if (!is_beyond(near_distance, search_radius(search)))
+        visit_nearest(near_son, search);
+      if (!is_beyond(far_distance, search_radius(search)))
+        visit_nearest(far_son, search);
+    }
+
+    void visit_farthest(size_t index, Search& search) const {
+      const Node& node = m_nodes[index];
+      if (node.leaf) {
+        for (size_t i = node.begin; i < node.end; ++i) {
+          double distance;
+          compute_distance(search.distance_type, row(m_order[i]),
+                           m_num_features, search.unknown, &distance,
+                           m_selections, m_weights);
+          if (distance > search.max_distance)
+            search.max_distance = distance;
+        }
+        return;
+      }
+      double lo_distance = max_distance(node.loson, search);
+      double hi_distance = max_distance(node.hison, search);
+      size_t far_son = node.loson, near_son = node.hison;
+      double far_distance = lo_distance, near_distance = hi_distance;
+      if (hi_distance > lo_distance) {
+        std::swap(near_son, far_son);
+        std::swap(near_distance, far_distance);
+      }
+      if (!is_beyond(search.max_distance, far_distance))
+        visit_farthest(far_son, search);
+      if (!is_beyond(search.max_distance, near_distance))
+        visit_farthest(near_son, search);
+    }
+
+    const std::vector<double*>* m_feature_vectors;
+    size_t m_num_features;
+    const int* m_selections;
+    const double* m_weights;
+    std::vector<double> m_effective_weights;
+    std::vector<int> m_labels;
+    std::vector<size_t> m_order;
+    std::vector<Node> m_nodes;
+    // bounding boxes of the nodes, lower and upper bound for each node
+    std::vector<double> m_bounds;
+    bool m_valid;
+  };
+
+}} // end of namespaces
+
+#endif
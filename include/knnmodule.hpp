@@ -91,33 +91,64 @@ inline int image_get_id_name(PyObject* image, char** id_name, int* len) {
 }
 
 /*
-  Compute the distance between two feature vectors.
+  Compute the distance between two feature vectors. The feature vectors
+  may be arrays of doubles or of floats (see contiguous_distance in
+  knn.hpp).
 */
-inline void compute_distance(DistanceType distance_type, const double* known_buf,
-                 int known_len, const double* unknown_buf, double* distance, 
+template<class K, class U>
+inline void compute_distance(DistanceType distance_type, const K* known_buf,
+                 int known_len, const U* unknown_buf, double* distance, 
                  const int* selections, const double* weights) {
+  compute_distance(distance_type, known_buf, known_len, unknown_buf, distance,
+                   selections, weights, never_stop());
+}
+
+/*
+  Compute the distance between two feature vectors, but stop as soon as
+  the partial sum passes the predicate *stop* (see contiguous_distance
+  in knn.hpp). The result is then only a lower bound for the distance.
+*/
+template<class K, class U, class Stop>
+inline void compute_distance(DistanceType distance_type, const K* known_buf,
+                 int known_len, const U* unknown_buf, double* distance,
+                 const int* selections, const double* weights, const Stop& stop) {
 
   if (distance_type == CITY_BLOCK) {
-    *distance = city_block_distance(known_buf, known_buf + known_len, unknown_buf,
-				   selections, weights);
+    *distance = contiguous_distance(known_buf, known_buf + known_len, unknown_buf,
+                                    selections, weights, city_block_term(), stop);
   } else if (distance_type == FAST_EUCLIDEAN) {
-    *distance = fast_euclidean_distance(known_buf, known_buf + known_len, unknown_buf,
-				   selections, weights);
+    *distance = contiguous_distance(known_buf, known_buf + known_len, unknown_buf,
+                                    selections, weights, fast_euclidean_term(), stop);
   } else {
-    *distance = euclidean_distance(known_buf, known_buf + known_len, unknown_buf,
-				   selections, weights);
+    *distance = contiguous_distance(known_buf, known_buf + known_len, unknown_buf,
+                                    selections, weights, euclidean_term(), stop);
   }
 }
 
+/*
+  Compute the distance between two feature vectors, but stop as soon as
+  the partial sum exceeds *bound*. Then the result is greater than
+  *bound*, but not the exact distance.
+*/
+template<class K, class U>
+inline void compute_distance(DistanceType distance_type, const K* known_buf,
+                 int known_len, const U* unknown_buf, double* distance,
+                 const int* selections, const double* weights, double bound) {
+  compute_distance(distance_type, known_buf, known_len, unknown_buf, distance,
+                   selections, weights, stop_above(bound));
+}
+
 
 /*
   Compute the distance between a known and an unknown image
   with weights. This version takes an image and a buffer
-  for the unknown image.
+  for the unknown image. When a *bound* is given, the computation
+  is abandoned as soon as the distance is known to exceed it.
 */
 inline int compute_distance(DistanceType distance_type, PyObject* known,
                 double* unknown_buf, double* distance,
-                int* selections, double* weights, Py_ssize_t unknown_len) {
+                int* selections, double* weights, Py_ssize_t unknown_len,
+                double bound = std::numeric_limits<double>::infinity()) {
   double* known_buf;
   Py_ssize_t known_len;
 
@@ -130,7 +161,7 @@ inline int compute_distance(DistanceType distance_type, PyObject* known,
   }
 
   compute_distance(distance_type, known_buf, known_len, unknown_buf, distance,
-                   selections, weights);
+                   selections, weights, bound);
 
   return 0;
 }
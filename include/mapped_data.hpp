@@ -0,0 +1,284 @@
+/*
+ *
+ * Copyright (C) 2026 Gamera developers
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+/*
+  MappedImageData is dense storage whose pixel buffer is a memory-mapped
+  file instead of a heap allocation.  The pixels are stored exactly as
+  in ImageData (row-major, one T per pixel), so MappedImageData<T> is an
+  ImageData<T> and every view and plugin works on it unchanged, while
+  the operating system pages the data in and out of the file on demand.
+
+  The file is either a named cache file, which is created (or
+  truncated) and left on disk, or an anonymous scratch file in a
+  directory, which is removed as soon as it has been opened.
+*/
+
+#ifndef gamera_mapped_data_hpp
+#define gamera_mapped_data_hpp
+
+#include "image_data.hpp"
+#include <string>
+#include <vector>
+#include <stdexcept>
+#include <cstdlib>
+#include <cstring>
+#include <cerrno>
+
+#ifdef _WIN32
+#ifndef WIN32_LEAN_AND_MEAN
+#define WIN32_LEAN_AND_MEAN
+#endif
+#include <windows.h>
+#else
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <sys/mman.h>
+#include <fcntl.h>
+#include <unistd.h>
+#endif
+
+namespace Gamera {
+
+  /*
+    The platform dependent part: a file that can be resized and mapped
+    into memory as a single read-write region.
+  */
+  class MappedFile {
+  public:
+    /*
+      An empty filename or the name of a directory creates a scratch
+      file (in the temporary directory or the given directory,
+      respectively), any other name a cache file of that name.
+    */
+    MappedFile(const std::string& filename) {
+      m_address = 0;
+      m_bytes = 0;
+      open_file(filename);
+    }
+    virtual ~MappedFile() {
+      unmap();
+      close_file();
+    }
+    /*
+      The name of the cache file, or an empty string for scratch files.
+    */
+    const std::string& filename() const { return m_filename; }
+    bool is_scratch() const { return m_filename.empty(); }
+    /*
+      Resizes the file to the given number of bytes and maps it.  The
+      contents of the file are kept, up to the new size; bytes beyond
+      the old size are zero.
+    */
+    void* map(size_t bytes) {
+      unmap();
+      resize_file(bytes);
+      if (bytes > 0)
+        map_file(bytes);
+      return m_address;
+    }
+    void unmap() {
+      if (m_address != 0)
+        unmap_file();
+      m_address = 0;
+      m_bytes = 0;
+    }
+
+  private:
+    static std::string error_message(const char* what, const std::string& filename) {
+      std::string message = std::string("Could not ") + what + " '" + filename + "'";
+#ifndef _WIN32
+      if (errno != 0)
+        message += std::string(": ") + std::strerror(errno);
+#endif
+      return message + ".";
+    }
+
+#ifdef _WIN32
+    static bool is_directory(const std::string& filename) {
+      DWORD attributes = GetFileAttributesA(filename.c_str());
+      return attributes != INVALID_FILE_ATTRIBUTES &&
+        (attributes & FILE_ATTRIBUTE_DIRECTORY);
+    }
+    void open_file(const std::string& filename) {
+      m_mapping = NULL;
+      if (filename.empty() || is_directory(filename)) {
+        std::string directory = filename;
+        if (directory.empty()) {
+          char buffer[MAX_PATH + 1];
+          if (GetTempPathA(MAX_PATH + 1, buffer) == 0)
+            throw std::runtime_error("Could not determine the temporary directory.");
+          directory = buffer;
+        }
+        char path[MAX_PATH + 1];
+        if (GetTempFileNameA(directory.c_str(), "gam", 0, path) == 0)
+          throw std::runtime_error(error_message("create a scratch file in", directory));
+        m_file = CreateFileA(path, GENERIC_READ | GENERIC_WRITE, 0, NULL,
+                             CREATE_ALWAYS,
+                             FILE_ATTRIBUTE_TEMPORARY | FILE_FLAG_DELETE_ON_CLOSE,
+                             NULL);
+        if (m_file == INVALID_HANDLE_VALUE)
+          throw std::runtime_error(error_message("create the scratch file", path));
+      } else {
+        m_file = CreateFileA(filename.c_str(), GENERIC_READ | GENERIC_WRITE,
+                             FILE_SHARE_READ, NULL, CREATE_ALWAYS,
+                             FILE_ATTRIBUTE_NORMAL, NULL);
+        if (m_file == INVALID_HANDLE_VALUE)
+          throw std::runtime_error(error_message("create", filename));
+        m_filename = filename;
+      }
+    }
+    void close_file() {
+      CloseHandle(m_file);
+    }
+    void resize_file(size_t bytes) {
+      LARGE_INTEGER size;
+      size.QuadPart = (LONGLONG)bytes;
+      if (!SetFilePointerEx(m_file, size, NULL, FILE_BEGIN) ||
+          !SetEndOfFile(m_file))
+        throw std::runtime_error(error_message("resize", description()));
+    }
+    void map_file(size_t bytes) {
+      unsigned long long size = (unsigned long long)bytes;
+      m_mapping = CreateFileMappingA(m_file, NULL, PAGE_READWRITE,
+                                     (DWORD)(size >> 32), (DWORD)size, NULL);
+      if (m_mapping == NULL)
+        throw std::runtime_error(error_message("map", description()));
+      m_address = MapViewOfFile(m_mapping, FILE_MAP_WRITE, 0, 0, bytes);
+      if (m_address == NULL) {
+        CloseHandle(m_mapping);
+        m_mapping = NULL;
+        throw std::runtime_error(error_message("map", description()));
+      }
+      m_bytes = bytes;
+    }
+    void unmap_file() {
+      UnmapViewOfFile(m_address);
+      CloseHandle(m_mapping);
+      m_mapping = NULL;
+    }
+    HANDLE m_file;
+    HANDLE m_mapping;
+#else
+    static bool is_directory(const std::string& filename) {
+      struct stat info;
+      return stat(filename.c_str(), &info) == 0 && S_ISDIR(info.st_mode);
+    }
+    void open_file(const std::string& filename) {
+      errno = 0;
+      if (filename.empty() || is_directory(filename)) {
+        std::string directory = filename;
+        if (directory.empty()) {
+          const char* tmpdir = std::getenv("TMPDIR");
+          directory = (tmpdir != 0 && *tmpdir != '\0') ? tmpdir : "/tmp";
+        }
+        std::string pattern = directory + "/gamera-XXXXXX";
+        std::vector<char> path(pattern.begin(), pattern.end());
+        path.push_back('\0');
+        m_fd = mkstemp(&path[0]);
+        if (m_fd < 0)
+          throw std::runtime_error(error_message("create a scratch file in", directory));
+        // The open descriptor keeps the file alive until it is closed.
+        unlink(&path[0]);
+      } else {
+        m_fd = open(filename.c_str(), O_RDWR | O_CREAT | O_TRUNC, 0666);
+        if (m_fd < 0)
+          throw std::runtime_error(error_message("create", filename));
+        m_filename = filename;
+      }
+    }
+    void close_file() {
+      close(m_fd);
+    }
+    void resize_file(size_t bytes) {
+      errno = 0;
+      if (ftruncate(m_fd, (off_t)bytes) != 0)
+        throw std::runtime_error(error_message("resize", description()));
+    }
+    void map_file(size_t bytes) {
+      errno = 0;
+      void* address = mmap(0, bytes, PROT_READ | PROT_WRITE, MAP_SHARED, m_fd, 0);
+      if (address == MAP_FAILED)
+        throw std::runtime_error(error_message("map", description()));
+      m_address = address;
+      m_bytes = bytes;
+    }
+    void unmap_file() {
+      munmap(m_address, m_bytes);
+    }
+    int m_fd;
+#endif
+    std::string description() const {
+      return is_scratch() ? std::string("scratch file") : m_filename;
+    }
+
+    std::string m_filename;
+    void* m_address;
+    size_t m_bytes;
+  };
+
+  template<class T>
+  class MappedImageData : public ImageData<T>, public MappedFile {
+  public:
+    MappedImageData(const Dim& dim, const Point& offset,
+                    const std::string& filename = "") :
+      ImageData<T>(dim, offset, (T*)0), MappedFile(filename) {
+      create_data();
+    }
+    MappedImageData(const Dim& dim, const std::string& filename = "") :
+      ImageData<T>(dim, Point(0, 0), (T*)0), MappedFile(filename) {
+      create_data();
+    }
+    virtual ~MappedImageData() {
+      // The base class must not delete[] the mapped buffer
+      MappedFile::unmap();
+      this->m_data = 0;
+    }
+
+  protected:
+    virtual void do_resize(size_t size) {
+      this->m_data = (T*)MappedFile::map(size * sizeof(T));
+      this->m_size = size;
+    }
+
+  private:
+    void create_data() {
+      this->m_data = (T*)MappedFile::map(this->m_size * sizeof(T));
+      // The new file is all zero bytes, which is already the default
+      // value for most pixel types
+      if (!(pixel_traits<T>::default_value() == T()))
+        std::fill(this->m_data, this->m_data + this->m_size,
+                  pixel_traits<T>::default_value());
+    }
+  };
+
+  /*
+    Creates dense image data on the heap if mmap_file is NULL, or else
+    mapped to the file (or scratch file) mmap_file.
+  */
+  template<class T>
+  ImageData<T>* create_image_data(const Dim& dim, const Point& offset,
+                                  const char* mmap_file) {
+    if (mmap_file == 0)
+      return new ImageData<T>(dim, offset);
+    return new MappedImageData<T>(dim, offset, mmap_file);
+  }
+
+}
+
+#endif
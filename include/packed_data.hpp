@@ -0,0 +1,471 @@
+/*
+ *
+ * Copyright (C) 2026 Gamera developers
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+/*
+  Bit-packed Image Data (one bit per pixel)
+*/
+
+#include "image_data.hpp"
+#include "dimensions.hpp"
+#include "accessor.hpp"
+
+#include <vector>
+#include <cassert>
+#include <iterator>
+#include <algorithm>
+
+#ifndef gamera_packed_data
+#define gamera_packed_data
+
+namespace Gamera {
+
+  namespace PackedDataDetail {
+    /*
+      This file contains a bit-packed vector (not quite a complete
+      interface for std::vector) and an Image Data object based on that
+      vector. It is meant for large onebit images: every pixel takes a
+      single bit, so the data is eight times smaller than the DENSE
+      storage, and whole words of pixels can be processed at once by
+      algorithms that know about the packing (see read_bits and
+      write_bits below).
+
+      Encoding Scheme
+      ---------------
+
+      The pixels are stored in row major order (just like DENSE and
+      RLE data). Pixel number pos is bit (pos % WORD_BITS) of the word
+      m_data[pos / WORD_BITS], i.e. the least significant bit of a
+      word holds the leftmost pixel. Bits of the last word behind the
+      last pixel are always zero.
+
+      Only the values 0 (white) and 1 (black) can be stored; every
+      non-zero value is stored as black. Consequently, connected
+      component labels cannot be stored in a packed image.
+    */
+
+    typedef unsigned long word_type;
+    static const size_t WORD_BITS = sizeof(word_type) * 8;
+
+    inline size_t get_word(size_t pos) {
+      return pos / WORD_BITS;
+    }
+
+    inline size_t get_bit(size_t pos) {
+      return pos % WORD_BITS;
+    }
+
+    inline size_t words_for_bits(size_t bits) {
+      return (bits + WORD_BITS - 1) / WORD_BITS;
+    }
+
+    // a word with the n lowest bits set (0 <= n <= WORD_BITS)
+    inline word_type low_mask(size_t n) {
+      if (n >= WORD_BITS)
+        return ~word_type(0);
+      return (word_type(1) << n) - 1;
+    }
+
+    // number of set bits in a word
+    inline size_t popcount(word_type w) {
+#ifdef __GNUC__
+      return __builtin_popcountl(w);
+#else
+      size_t count = 0;
+      for (; w != 0; w &= w - 1)
+        ++count;
+      return count;
+#endif
+    }
+
+    // index of the lowest set bit of a non-zero word
+    inline size_t lowest_bit(word_type w) {
+#ifdef __GNUC__
+      return __builtin_ctzl(w);
+#else
+      size_t i = 0;
+      for (; (w & 1) == 0; w >>= 1)
+        ++i;
+      return i;
+#endif
+    }
+
+    /*
+      Returns the n bits (0 < n <= WORD_BITS) starting at bit position
+      pos in the lowest bits of a word. The bits may straddle a word
+      boundary.
+    */
+    inline word_type read_bits(const word_type* data, size_t pos, size_t n) {
+      size_t w = get_word(pos);
+      size_t b = get_bit(pos);
+      word_type result = data[w] >> b;
+      if (b != 0 && b + n > WORD_BITS)
+        result |= data[w + 1] << (WORD_BITS - b);
+      return result & low_mask(n);
+    }
+
+    /*
+      Overwrites the n bits (0 < n <= WORD_BITS) starting at bit
+      position pos with the lowest bits of 'bits'.
+    */
+    inline void write_bits(word_type* data, size_t pos, size_t n, word_type bits) {
+      size_t w = get_word(pos);
+      size_t b = get_bit(pos);
+      word_type mask = low_mask(n);
+      bits &= mask;
+      data[w] = (data[w] & ~(mask << b)) | (bits << b);
+      if (b != 0 && b + n > WORD_BITS) {
+        size_t shift = WORD_BITS - b;
+        data[w + 1] = (data[w + 1] & ~(mask >> shift)) | (bits >> shift);
+      }
+    }
+
+    /*
+      PackedProxy
+
+      Single bits are not addressable, so the non-const iterators
+      return this proxy instead of a reference. It converts to the
+      pixel value for reading and sets the bit on assignment (similar
+      to the RLEProxy in rle_data.hpp).
+    */
+    template<class T>
+    // T is the PackedVector type
+    class PackedProxy {
+    public:
+      typedef typename T::value_type value_type;
+
+      PackedProxy(T* vec, size_t pos) : m_vec(vec), m_pos(pos) { }
+      void operator=(value_type v) {
+        m_vec->set(m_pos, v);
+      }
+      // assigning one proxy to another copies the pixel, not the proxy
+      void operator=(const PackedProxy& other) {
+        m_vec->set(m_pos, other.m_vec->get(other.m_pos));
+      }
+      operator value_type() const {
+        return m_vec->get(m_pos);
+      }
+    private:
+      T* m_vec;
+      size_t m_pos;
+    };
+
+    /*
+      PackedVectorIterator and ConstPackedVectorIterator provide STL style
+      random access iterators over the bits. They only store the bit
+      position, so moving them is as cheap as moving a pointer.
+    */
+    template<class V, class Iterator>
+    class PackedVectorIteratorBase {
+    public:
+      typedef typename V::value_type value_type;
+      typedef int difference_type;
+      typedef std::random_access_iterator_tag iterator_tag;
+
+      typedef Iterator self;
+
+      PackedVectorIteratorBase() : m_vec(0), m_pos(0) { }
+      PackedVectorIteratorBase(V* vec, size_t pos) : m_vec(vec), m_pos(pos) { }
+
+      self& operator++() {
+        m_pos++;
+        return (self&)*this;
+      }
+      self operator++(int) {
+        self tmp = (self&)*this;
+        m_pos++;
+        return tmp;
+      }
+      self& operator--() {
+        m_pos--;
+        return (self&)*this;
+      }
+      self operator--(int) {
+        self tmp = (self&)*this;
+        m_pos--;
+        return tmp;
+      }
+      self& operator+=(size_t n) {
+        m_pos += n;
+        return (self&)*this;
+      }
+      self operator+(size_t n) const {
+        self tmp = (const self&)*this;
+        tmp.m_pos += n;
+        return tmp;
+      }
+      self& operator-=(size_t n) {
+        m_pos -= n;
+        return (self&)*this;
+      }
+      self operator-(size_t n) const {
+        self tmp = (const self&)*this;
+        tmp.m_pos -= n;
+        return tmp;
+      }
+      bool operator==(const self& other) const {
+        return m_pos == other.m_pos;
+      }
+      bool operator!=(const self& other) const {
+        return m_pos != other.m_pos;
+      }
+      bool operator<(const self& other) const {
+        return m_pos < other.m_pos;
+      }
+      bool operator<=(const self& other) const {
+        return m_pos <= other.m_pos;
+      }
+      bool operator>(const self& other) const {
+        return m_pos > other.m_pos;
+      }
+      bool operator>=(const self& other) const {
+        return m_pos >= other.m_pos;
+      }
+      difference_type operator-(const self& other) const {
+        return m_pos - other.m_pos;
+      }
+      value_type get() const {
+        return m_vec->get(m_pos);
+      }
+      void set(const value_type& v) {
+        m_vec->set(m_pos, v);
+      }
+      // the bit position within the vector (for word-wise algorithms)
+      size_t position() const {
+        return m_pos;
+      }
+    protected:
+      V* m_vec;
+      size_t m_pos;
+    };
+
+    template<class V>
+    class PackedVectorIterator
+      : public PackedVectorIteratorBase<V, PackedVectorIterator<V> > {
+    public:
+      typedef PackedVectorIterator self;
+      typedef PackedVectorIteratorBase<V, self> base;
+
+      using base::m_vec;
+      using base::m_pos;
+
+      typedef PackedProxy<V> proxy_type;
+      typedef proxy_type reference;
+      typedef proxy_type pointer;
+
+      PackedVectorIterator() : base() { }
+      PackedVectorIterator(V* vec, size_t pos) : base(vec, pos) { }
+
+      proxy_type operator*() const {
+        return proxy_type(m_vec, m_pos);
+      }
+    };
+
+    template<class V>
+    class ConstPackedVectorIterator
+      : public PackedVectorIteratorBase<V, ConstPackedVectorIterator<V> > {
+    public:
+      typedef ConstPackedVectorIterator self;
+      typedef PackedVectorIteratorBase<V, self> base;
+
+      using base::m_vec;
+      using base::m_pos;
+
+      typedef void reference;
+      typedef typename V::value_type* pointer;
+
+      ConstPackedVectorIterator() : base() { }
+      ConstPackedVectorIterator(V* vec, size_t pos) : base(vec, pos) { }
+
+      typename V::value_type operator*() const {
+        return m_vec->get(m_pos);
+      }
+    };
+
+    /*
+      PackedVector is a vector of bits stored in machine words.
+    */
+    template<class Data>
+    class PackedVector {
+    public:
+      // typedefs for convenience
+      typedef PackedProxy<PackedVector> proxy_type;
+      typedef Data value_type;
+      typedef proxy_type reference;
+      typedef proxy_type pointer;
+      typedef int difference_type;
+      typedef PackedVector self;
+
+      // iterators
+      typedef PackedVectorIterator<self> iterator;
+      typedef ConstPackedVectorIterator<const self> const_iterator;
+
+      PackedVector(size_t size = 0)
+        : m_size(size), m_data(words_for_bits(size) + 1, 0) { }
+      /*
+        The word vector always has one extra word, so that read_bits
+        may touch the word behind the last pixel.
+      */
+      void resize(size_t size) {
+        if (size < m_size && size > 0 && get_bit(size) != 0)
+          m_data[get_word(size)] &= low_mask(get_bit(size));
+        m_data.resize(words_for_bits(size) + 1, 0);
+        for (size_t i = words_for_bits(size); i < m_data.size(); ++i)
+          m_data[i] = 0;
+        m_size = size;
+      }
+      size_t size() const { return m_size; }
+
+      /*
+        Return the value at the specified position.
+      */
+      value_type get(size_t pos) const {
+        assert(pos < m_size);
+        return value_type((m_data[get_word(pos)] >> get_bit(pos)) & 1);
+      }
+
+      reference operator[](size_t pos) {
+        return proxy_type(this, pos);
+      }
+
+      /*
+        Set the value at the specified position. Every non-zero value
+        is stored as black (1).
+      */
+      void set(size_t pos, value_type v) {
+        assert(pos < m_size);
+        word_type mask = word_type(1) << get_bit(pos);
+        if (v != 0)
+          m_data[get_word(pos)] |= mask;
+        else
+          m_data[get_word(pos)] &= ~mask;
+      }
+
+      /*
+        Iterator access
+      */
+      iterator begin() {
+        return iterator(this, 0);
+      }
+      iterator end() {
+        return iterator(this, m_size);
+      }
+      const_iterator begin() const {
+        return const_iterator(this, 0);
+      }
+      const_iterator end() const {
+        return const_iterator(this, m_size);
+      }
+
+      /*
+        Raw access to the words for the word-parallel algorithms
+      */
+      word_type* words() {
+        return &m_data[0];
+      }
+      const word_type* words() const {
+        return &m_data[0];
+      }
+    public:
+      size_t m_size;
+      std::vector<word_type> m_data;
+    };
+  } // namespace PackedDataDetail
+
+  /*
+    This is a PackedVector with the additional interface necessary to allow
+    it to be used with a ImageView object.
+  */
+  template<class T>
+  class PackedImageData : public PackedDataDetail::PackedVector<T>,
+                          public ImageDataBase {
+  public:
+    using PackedDataDetail::PackedVector<T>::resize;
+    typedef T value_type;
+    typedef typename PackedDataDetail::PackedVector<T>::reference reference;
+    typedef typename PackedDataDetail::PackedVector<T>::pointer pointer;
+    typedef typename PackedDataDetail::PackedVector<T>::iterator iterator;
+    typedef typename PackedDataDetail::PackedVector<T>::const_iterator const_iterator;
+
+    PackedImageData(const Size& size, const Point& offset)
+      : PackedDataDetail::PackedVector<T>((size.height() + 1) * (size.width() + 1)),
+        ImageDataBase(size, offset) {
+    }
+    PackedImageData(const Size& size)
+      : PackedDataDetail::PackedVector<T>((size.height() + 1) * (size.width() + 1)),
+        ImageDataBase(size) {
+    }
+
+    PackedImageData(const Dim& dim, const Point& offset)
+      : PackedDataDetail::PackedVector<T>(dim.nrows() * dim.ncols()),
+        ImageDataBase(dim, offset) {
+    }
+    PackedImageData(const Dim& dim)
+      : PackedDataDetail::PackedVector<T>(dim.nrows() * dim.ncols()),
+        ImageDataBase(dim) {
+    }
+
+    virtual size_t bytes() const {
+      return this->m_data.size() * sizeof(PackedDataDetail::word_type);
+    }
+    virtual double mbytes() const { return bytes() / 1048576.0; }
+    virtual void dimensions(size_t rows, size_t cols) {
+      m_stride = cols;
+      do_resize(rows * cols);
+    }
+    virtual void dim(const Dim& dim) {
+      m_stride = dim.ncols();
+      do_resize(dim.nrows() * dim.ncols());
+    }
+    virtual Dim dim() const {
+      size_t size = ((PackedDataDetail::PackedVector<T>*)(this))->m_size;
+      return Dim(m_stride, size / m_stride);
+    }
+  protected:
+    virtual void do_resize(size_t size) {
+      resize(size);
+      ImageDataBase::m_size = size;
+    }
+  };
+
+  /*
+    Helpers for the word-parallel algorithms on views of packed data.
+    The pixels of a row of a view are consecutive bits, starting at the
+    bit position returned by packed_row_position.
+  */
+  template<class View>
+  size_t packed_row_position(const View& view, size_t y) {
+    return (view.offset_y() + y - view.data()->page_offset_y()) * view.data()->stride()
+      + view.offset_x() - view.data()->page_offset_x();
+  }
+
+  // the number of black pixels in row y of the view
+  template<class View>
+  size_t packed_row_black(const View& view, size_t y) {
+    using namespace PackedDataDetail;
+    const word_type* words = view.data()->words();
+    size_t first = packed_row_position(view, y);
+    size_t ncols = view.ncols();
+    size_t count = 0;
+    for (size_t x = 0; x < ncols; x += WORD_BITS)
+      count += popcount(read_bits(words, first + x, std::min(WORD_BITS, ncols - x)));
+    return count;
+  }
+}
+
+#endif
@@ -30,7 +30,13 @@
 #include "plugins/projections.hpp"
 #include "plugins/transformation.hpp"
 #include <cmath>
+#include <algorithm>
 #include <vector>
+#include <string>
+#include <stdexcept>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 namespace Gamera {
   //
@@ -123,14 +129,11 @@ namespace Gamera {
     }
   }
 
-  template<class T>
-  void moments(T &m, feature_t* buf) {
-    feature_t m10 = 0, m11 = 0, m20 = 0, m21 = 0, m12 = 0, 
-      m01 = 0, m02 = 0, m30 = 0, m03 = 0, m00 = 0, dummy = 0;
-    moments_1d(m.row_begin(), m.row_end(), m00, m01, m02, m03);
-    moments_1d(m.col_begin(), m.col_end(), dummy, m10, m20, m30);
-    moments_2d(m.col_begin(), m.col_end(), m11, m12, m21);
-
+  inline void normalized_moments(size_t nrows, size_t ncols, feature_t m00,
+                                 feature_t m10, feature_t m01, feature_t m20,
+                                 feature_t m02, feature_t m11, feature_t m30,
+                                 feature_t m12, feature_t m21, feature_t m03,
+                                 feature_t* buf) {
     if (m00 == 0.0) m00 = 1.0; // special case: no black pixels
 
     feature_t x, y, x2, y2, div;
@@ -140,12 +143,12 @@ namespace Gamera {
     y2 = 2 * y * y;
 
     // normalized center of gravity [0,1]
-    if (m.ncols() > 1)
-      *(buf++) = x / (m.ncols()-1);
+    if (ncols > 1)
+      *(buf++) = x / (ncols-1);
     else
       *(buf++) = 0.5; // only one pixel wide
-    if (m.nrows() > 1)
-      *(buf++) = y / (m.nrows()-1);
+    if (nrows > 1)
+      *(buf++) = y / (nrows-1);
     else
       *(buf++) = 0.5; // only one pixel high
   
@@ -160,6 +163,17 @@ namespace Gamera {
     *(buf++) = (m21 - (2 * x * m11) - (y * m20) + (x2 * m01)) / div;    // u21
     *buf = (m03 - (3 * y * m02) + (y2 * m01)) / div;                // u03
   }
+
+  template<class T>
+  void moments(T &m, feature_t* buf) {
+    feature_t m10 = 0, m11 = 0, m20 = 0, m21 = 0, m12 = 0, 
+      m01 = 0, m02 = 0, m30 = 0, m03 = 0, m00 = 0, dummy = 0;
+    moments_1d(m.row_begin(), m.row_end(), m00, m01, m02, m03);
+    moments_1d(m.col_begin(), m.col_end(), dummy, m10, m20, m30);
+    moments_2d(m.col_begin(), m.col_end(), m11, m12, m21);
+    normalized_moments(m.nrows(), m.ncols(), m00, m10, m01, m20, m02, m11,
+                       m30, m12, m21, m03, buf);
+  }
  
   // Number of holes in x and y direction
   
@@ -350,8 +364,9 @@ namespace Gamera {
   // compactness is ratio of the volume of the outline of an image to
   // the volume of the image.
   //
+  // (for the already known volume *vol* of the image)
   template<class T>
-  void compactness(const T& image, feature_t* buf) {
+  void compactness(const T& image, feature_t vol, feature_t* buf) {
     // I've converted this to a more efficient method.  Rather than
     // using (volume(outline) / volume(original)), I just use
     // volume(dilated) - volume(original) / volume(original).  This
@@ -360,7 +375,6 @@ namespace Gamera {
     // since we don't want to change the original.
     // as dilate does not extend beyond the image borders,
     // we must compute the surface of the border pixels separately
-    feature_t vol = volume(image);
     feature_t outer_vol = compactness_border_outer_volume(image);
     feature_t result;
     if (vol == 0)
@@ -376,6 +390,11 @@ namespace Gamera {
     *buf = result;
   }
 
+  template<class T>
+  void compactness(const T& image, feature_t* buf) {
+    compactness(image, volume(image), buf);
+  }
+
   //
   // volume16regions
   //
@@ -499,6 +518,146 @@ namespace Gamera {
     }
   }
 
+  //
+  // ZernikeTables holds the coefficients of the radial polynomials
+  //
+  //   R_nm(r) = sum_s (-1)^s (n-s)! / (s! ((n+m)/2-s)! ((n-m)/2-s)!) r^(n-2s)
+  //
+  // for 2 <= n <= order (in the order of the features), so that they are
+  // evaluated from the powers of r instead of calling zer_pol_R for every
+  // pixel. The results agree with those of zer_pol within a relative
+  // error of 1e-9 (see tests/test_features.py).
+  //
+  struct ZernikeTables {
+    size_t order;
+    // for each polynomial: its m and its range of terms
+    std::vector<size_t> m, begin;
+    std::vector<size_t> power;
+    std::vector<double> coefficient;
+
+    ZernikeTables(size_t order_n) : order(order_n) {
+      std::vector<double> factorial(order + 1, 1.0);
+      for (size_t i = 2; i <= order; ++i)
+        factorial[i] = factorial[i - 1] * i;
+      for (size_t n = 2; n <= order; ++n) {
+        for (size_t mm = n % 2; mm <= n; mm += 2) {
+          m.push_back(mm);
+          begin.push_back(power.size());
+          double sign = 1.0;
+          for (size_t s = 0; s <= (n - mm) / 2; ++s) {
+            power.push_back(n - 2 * s);
+            coefficient.push_back(sign * factorial[n - s] /
+                                  (factorial[s] * factorial[(n + mm) / 2 - s] *
+                                   factorial[(n - mm) / 2 - s]));
+            sign = -sign;
+          }
+        }
+      }
+      begin.push_back(power.size());
+    }
+    size_t size() const { return m.size(); }
+
+    double radial(size_t idx, const double* r_pow) const {
+      double result = 0.0;
+      for (size_t t = begin[idx]; t < begin[idx + 1]; ++t)
+        result += coefficient[t] * r_pow[power[t]];
+      return result;
+    }
+
+    // Adds the values of conj(R_nm(r) exp(i m theta)) at (x, y) to real
+    // and imag, like zer_pol. Points outside the unit circle are ignored.
+    void add(double x, double y, double* real, double* imag) const {
+      double r = sqrt(x * x + y * y);
+      if (r > 1.0 || r == 0.0)
+        return;
+      double buffer[3 * 32];
+      std::vector<double> large;
+      double* rp = buffer;
+      if (order >= 32) {
+        large.resize(3 * (order + 1));
+        rp = &large[0];
+      }
+      double* cm = rp + order + 1;
+      double* sm = cm + order + 1;
+      // exp(i m theta) = ((x + i y) / r)^m
+      double c = x / r, sn = y / r;
+      rp[0] = 1.0;
+      cm[0] = 1.0;
+      sm[0] = 0.0;
+      for (size_t i = 1; i <= order; ++i) {
+        rp[i] = rp[i - 1] * r;
+        cm[i] = cm[i - 1] * c - sm[i - 1] * sn;
+        sm[i] = sm[i - 1] * c + cm[i - 1] * sn;
+      }
+      for (size_t idx = 0; idx < m.size(); ++idx) {
+        double value = radial(idx, rp);
+        real[idx] += value * cm[m[idx]];
+        imag[idx] -= value * sm[m[idx]];
+      }
+    }
+
+    // Adds weight * |R_nm(r)|, the absolute value of zer_pol at (x, y).
+    void add_magnitude(double x, double y, double weight, double* result) const {
+      double r = sqrt(x * x + y * y);
+      if (r > 1.0)
+        return;
+      double buffer[32];
+      std::vector<double> large;
+      double* rp = buffer;
+      if (order >= 32) {
+        large.resize(order + 1);
+        rp = &large[0];
+      }
+      rp[0] = 1.0;
+      for (size_t i = 1; i <= order; ++i)
+        rp[i] = rp[i - 1] * r;
+      for (size_t idx = 0; idx < m.size(); ++idx)
+        result[idx] += weight * fabs(radial(idx, rp));
+    }
+  };
+
+  // center of mass and farthest black pixel for zernike_moments
+  struct ZernikeCentroid {
+    feature_t m00, m10, m01;
+    ZernikeCentroid() : m00(0), m10(0), m01(0) { }
+    void operator()(size_t y, size_t begin, size_t end) {
+      size_t length = end - begin;
+      m00 += length;
+      m01 += y * length;
+      m10 += (begin + end - 1) * length / 2;
+    }
+  };
+
+  struct ZernikeRadius {
+    double centroid_x, centroid_y, radius;
+    ZernikeRadius(double x, double y) : centroid_x(x), centroid_y(y), radius(0) { }
+    void operator()(size_t y, size_t begin, size_t end) {
+      // the farthest pixel of a run is one of its ends
+      double dy = (centroid_y - (double)y) * (centroid_y - (double)y);
+      double dx = std::max((centroid_x - (double)begin) * (centroid_x - (double)begin),
+                           (centroid_x - (double)(end - 1)) * (centroid_x - (double)(end - 1)));
+      if (dx + dy > radius)
+        radius = dx + dy;
+    }
+  };
+
+  struct ZernikeSums {
+    const ZernikeTables& tables;
+    double centroid_x, centroid_y, scale;
+    double *real, *imag;
+    ZernikeSums(const ZernikeTables& t, double x, double y, double s,
+                double* re, double* im)
+      : tables(t), centroid_x(x), centroid_y(y), scale(s), real(re), imag(im) { }
+    void operator()(size_t y, size_t begin, size_t end) {
+      double y_dist = (y - centroid_y) / scale;
+      for (size_t x = begin; x < end; ++x) {
+        double x_dist = (x - centroid_x) / scale;
+        if (std::abs(x_dist) > 0.00001 || std::abs(y_dist) > 0.00001)
+          tables.add(x_dist, y_dist, real, imag);
+      }
+    }
+  };
+
   // we use this wrapper so that it is easy to
   // change the maximum order in the future
   template<class T>
@@ -512,107 +671,56 @@ namespace Gamera {
 
   template<class T>
   void zernike_moments(const T& image, feature_t* buf, size_t order_n) {
-    size_t const max_order_n=order_n; 
-    size_t num_features=0; // evaluated by max_order_n
-    double x_dist, y_dist, real_tmp, imag_tmp;
-    
-    
-    // number of features depends on maximum order
-    for (size_t i=0 ; i<=max_order_n; i++)
-        num_features += i/2 + 1;
-    num_features -= 2; // A00 and A11 are constants
-    
-    size_t m, n, idx;
-    double* tmp_real = new double[num_features];
-    double* tmp_imag = new double[num_features];
-    
-    memset(tmp_real, 0, num_features * sizeof(double));
-    memset(tmp_imag, 0, num_features * sizeof(double));
-    
-    feature_t* begin = buf;
-    for (size_t i = 0; i < num_features; ++i)                       
-      *(buf++) = 0.0;
-    buf = begin;
-    
-    const T* scaled_image = &image; // we do not scale
+    ZernikeTables tables(order_n);
+    size_t num_features = tables.size();
+    std::vector<double> tmp_real(num_features, 0.0), tmp_imag(num_features, 0.0);
 
     //compute center of mass and normalization factor m00
-    feature_t m00=0, m10=0, m01=0, dummy1=0, dummy2=0, dummy3=0;
-    moments_1d(scaled_image->row_begin(), scaled_image->row_end(), m00, m01, dummy1, dummy2);
-    moments_1d(scaled_image->col_begin(), scaled_image->col_end(), dummy1, m10, dummy2, dummy3);
-    
-    double centroid_x = m10/m00;
-    double centroid_y = m01/m00;
+    ZernikeCentroid centroid;
+    black_runs(image, centroid);
+    feature_t m00 = centroid.m00;
+    double centroid_x = centroid.m10/m00;
+    double centroid_y = centroid.m01/m00;
 
     // we use a Zernike circle that includes the entire image
     // beware however that some pixels can fall outside the circle
     // by normalizing ZMs to be translation invariant, e.g. a large
     // bunch of pixels in the upper left corner which draws the
     // center to it, excludes pixels in the lower right corner.
+    ZernikeRadius radius(centroid_x, centroid_y);
+    black_runs(image, radius);
 
-    double unit_circle_scale = 0;
-
-    for(size_t y = 0; y < scaled_image->nrows(); ++y) {
-      for (size_t x = 0; x < scaled_image->ncols(); ++x) {
-        if (is_black(scaled_image->get(Point(x,y)))) {
-          double scale_tmp = (centroid_x - (double)x)*(centroid_x - (double)x) + (centroid_y - (double)y)*(centroid_y - (double)y);
-          if(scale_tmp > unit_circle_scale)
-            unit_circle_scale = scale_tmp;
-        }
-      }
-    }
-    
     // Make sure that the farthest pixel is within our analysis circle
-    unit_circle_scale = 1.01 * sqrt(unit_circle_scale);
+    double unit_circle_scale = 1.01 * sqrt(radius.radius);
     if (unit_circle_scale < 0.00001) unit_circle_scale = 1.0;
-    
-    typename T::const_vec_iterator it = scaled_image->vec_begin();
-    for (size_t y = 0; y < scaled_image->nrows(); ++y) {
-      for (size_t x = 0; x < scaled_image->ncols(); ++x, ++it) {
-        if (is_black(*it)) {
-          x_dist = (x - centroid_x) / unit_circle_scale;
-          y_dist = (y - centroid_y) / unit_circle_scale;
-          if (abs(x_dist) > 0.00001 || abs(y_dist) > 0.00001) {   
-            for (n = 2, idx=0; n <= max_order_n; ++n) {
-              for (m = n%2; m <= n; m+=2) {
-                zer_pol(n, m, x_dist, y_dist, real_tmp, imag_tmp);
-                tmp_real[idx] += real_tmp;
-                tmp_imag[idx++] += imag_tmp;
-              }
-            }
-          }
-        }
-      }
+
+    if (num_features) {
+      ZernikeSums sums(tables, centroid_x, centroid_y, unit_circle_scale,
+                       &tmp_real[0], &tmp_imag[0]);
+      black_runs(image, sums);
     }
-    
-    for(idx = 0; idx<num_features; idx++)
+
+    for(size_t idx = 0; idx<num_features; idx++)
       buf[idx] = sqrt(tmp_real[idx]*tmp_real[idx] + tmp_imag[idx]*tmp_imag[idx]);
-    
+
     // scale normalization by m00
-    for (size_t n = 2, idx=0; n <= max_order_n; ++n) {
+    for (size_t n = 2, idx=0; n <= order_n; ++n) {
       double multiplier = (n + 1) / M_PI;
       if (m00 != 0.0)
         multiplier /= m00;
-      for (m= n%2; m<= n; m+=2)
+      for (size_t m= n%2; m<= n; m+=2)
         buf[idx++] *= multiplier;
     }
-
-    delete [] tmp_real;
-    delete [] tmp_imag;
   }
 
   template<class T>
   FloatVector* zernike_moments_plugin(const T& image, int order_n) {
     size_t const max_order_n=(size_t)order_n;
-    size_t num_features=0; // evaluated by max_order_n
-    double x_dist, y_dist, real_tmp, imag_tmp;
-    size_t m, n, idx;  
-    
-    // number of features depends on maximum order
-    for (size_t i=0 ; i<=max_order_n; i++)
-        num_features += i/2 + 1;
-    num_features -= 2; // A00 and A11 are constants
-        
+    ZernikeTables tables(max_order_n);
+    size_t num_features = tables.size();
+    double x_dist, y_dist;
+    size_t m;
+
     const T* scaled_image = &image; // we do not scale
 
     //compute center of mass and normalization factor m00
@@ -661,15 +769,8 @@ namespace Gamera {
         pixel_factor = invert(*it);
         x_dist = (x - centroid_x) / unit_circle_scale;
         y_dist = (y - centroid_y) / unit_circle_scale;
-        if (abs(x_dist) > 0.00001 || abs(y_dist) > 0.00001) {   
-          for (n = 2, idx=0; n <= max_order_n; ++n) {
-            for (m = n%2; m <= n; m+=2) {
-              zer_pol(n, m, x_dist, y_dist, real_tmp, imag_tmp);
-              result->at(idx) += pixel_factor*sqrt(real_tmp*real_tmp + imag_tmp*imag_tmp);
-              idx++;
-            }
-          }
-        }
+        if (num_features && (abs(x_dist) > 0.00001 || abs(y_dist) > 0.00001))
+          tables.add_magnitude(x_dist, y_dist, pixel_factor, &result->at(0));
       }
     }
   
@@ -856,5 +957,764 @@ namespace Gamera {
     delete proj_y;
     delete rotated_image;
   }
+
+  //
+  // Fused features
+  //
+  // black_area, moments, nholes, nholes_extended, volume, compactness,
+  // volume16regions, volume64regions and top_bottom all walk the pixels of
+  // the image for the same few sums. scan_feature_sums collects these sums
+  // in a single pass, and the features are computed from them with the
+  // same results as the single feature functions above.
+  //
+  struct FeatureSums {
+    size_t nrows, ncols;
+    size_t black;
+    // black pixels in each row and column
+    std::vector<size_t> row_proj, col_proj;
+    // the mixed moments of moments_2d
+    feature_t m11, m12, m21;
+    // the state of nholes_1d at the end of each row and column
+    std::vector<int> row_runs, col_runs;
+    std::vector<char> row_last, col_last;
+    // black pixels above and left of each pixel (summed area table with
+    // an additional first row and column of zeros)
+    std::vector<size_t> area_sums;
+  };
+
+  template<class T>
+  void scan_feature_sums(const T& m, FeatureSums& sums, bool mixed_moments,
+                         bool holes, bool regions) {
+    size_t nrows = sums.nrows = m.nrows();
+    size_t ncols = sums.ncols = m.ncols();
+    sums.black = 0;
+    sums.row_proj.assign(nrows, 0);
+    sums.col_proj.assign(ncols, 0);
+    sums.m11 = sums.m12 = sums.m21 = 0;
+    if (holes) {
+      sums.row_runs.assign(nrows, 0);
+      sums.col_runs.assign(ncols, 0);
+      sums.row_last.assign(nrows, 0);
+      sums.col_last.assign(ncols, 0);
+    }
+    if (regions)
+      sums.area_sums.assign((nrows + 1) * (ncols + 1), 0);
+
+    feature_t tmp;
+    typename T::const_row_iterator r = m.row_begin();
+    for (size_t y = 0; r != m.row_end(); ++r, ++y) {
+      size_t proj = 0;
+      bool last = false;
+      typename T::const_col_iterator c = r.begin();
+      for (size_t x = 0; c != r.end(); ++c, ++x) {
+        if (is_black(*c)) {
+          ++proj;
+          ++sums.col_proj[x];
+          if (mixed_moments) {
+            sums.m11 += (tmp = x * y);
+            sums.m21 += (tmp * x);
+            sums.m12 += (tmp * y);
+          }
+          if (holes) {
+            last = true;
+            sums.col_last[x] = 1;
+          }
+        } else if (holes) {
+          if (last) {
+            last = false;
+            ++sums.row_runs[y];
+          }
+          if (sums.col_last[x]) {
+            sums.col_last[x] = 0;
+            ++sums.col_runs[x];
+          }
+        }
+        if (regions)
+          sums.area_sums[(y + 1) * (ncols + 1) + x + 1] =
+            sums.area_sums[y * (ncols + 1) + x + 1] + proj;
+      }
+      sums.row_proj[y] = proj;
+      sums.black += proj;
+      if (holes)
+        sums.row_last[y] = last;
+    }
+  }
+
+  // The mixed moments are summed up in a different order than in
+  // moments_2d. This gives the same result as long as all partial sums
+  // are exact, which is guaranteed by this bound.
+  inline bool exact_mixed_moments(size_t nrows, size_t ncols) {
+    double n = double(std::max(nrows, ncols));
+    return double(nrows) * double(ncols) * n * n * n < 9007199254740992.0;
+  }
+
+  inline void moments_1d(const std::vector<size_t>& projections, feature_t& m0,
+                         feature_t& m1, feature_t& m2, feature_t& m3) {
+    // the same as moments_1d for the iterators, but with known projections
+    feature_t tmp = 0;
+    for (size_t x = 0; x < projections.size(); x++) {
+      size_t proj = projections[x];
+      m0 += proj;
+      m1 += (tmp = x * proj);
+      m2 += (tmp *= x);
+      m3 += (tmp * x);
+    }
+  }
+
+  inline void fused_moments(const FeatureSums& sums, feature_t* buf) {
+    feature_t m10 = 0, m20 = 0, m01 = 0, m02 = 0, m30 = 0, m03 = 0,
+      m00 = 0, dummy = 0;
+    moments_1d(sums.row_proj, m00, m01, m02, m03);
+    moments_1d(sums.col_proj, dummy, m10, m20, m30);
+    normalized_moments(sums.nrows, sums.ncols, m00, m10, m01, m20, m02,
+                       sums.m11, m30, sums.m12, sums.m21, m03, buf);
+  }
+
+  // nholes_1d on the lines begin to end - 1 from their final states
+  inline int fused_nholes_1d(const std::vector<int>& runs,
+                             const std::vector<size_t>& projections,
+                             const std::vector<char>& last,
+                             size_t begin, size_t end) {
+    int hole_count = 0;
+    for (size_t i = begin; i < end; ++i) {
+      hole_count += runs[i];
+      if (!last[i] && hole_count && projections[i])
+        hole_count--;
+    }
+    return hole_count;
+  }
+
+  inline void fused_nholes(const FeatureSums& sums, feature_t* buf) {
+    int vert = fused_nholes_1d(sums.col_runs, sums.col_proj, sums.col_last,
+                               0, sums.ncols);
+    int horiz = fused_nholes_1d(sums.row_runs, sums.row_proj, sums.row_last,
+                                0, sums.nrows);
+    *(buf++) = (feature_t)vert / sums.ncols;
+    *buf = (feature_t)horiz / sums.nrows;
+  }
+
+  inline void fused_nholes_extended(const FeatureSums& sums, feature_t* buf) {
+    double quarter_cols = sums.ncols / 4.0;
+    double start = 0.0;
+    for (size_t i = 0; i < 4; ++i) {
+      size_t begin = size_t(start);
+      *(buf++) = fused_nholes_1d(sums.col_runs, sums.col_proj, sums.col_last,
+                                 begin, begin + size_t(quarter_cols))
+                 / quarter_cols;
+      start += quarter_cols;
+    }
+    double quarter_rows = sums.nrows / 4.0;
+    start = 0.0;
+    for (size_t i = 0; i < 4; ++i) {
+      size_t begin = size_t(start);
+      *(buf++) = fused_nholes_1d(sums.row_runs, sums.row_proj, sums.row_last,
+                                 begin, begin + size_t(quarter_rows))
+                 / quarter_rows;
+      start += quarter_rows;
+    }
+  }
+
+  inline feature_t fused_volume(const FeatureSums& sums) {
+    unsigned int count = sums.black;
+    return (feature_t(count) / (sums.nrows * sums.ncols));
+  }
+
+  // volume16regions (regions == 4) and volume64regions (regions == 8),
+  // with the same region boundaries
+  inline void fused_volume_regions(const FeatureSums& sums, size_t offset_x,
+                                   size_t offset_y, size_t regions,
+                                   feature_t* buf) {
+    size_t width = sums.ncols + 1;
+    double rows = sums.nrows / double(regions);
+    double cols = sums.ncols / double(regions);
+    size_t rows_int = size_t(rows);
+    size_t cols_int = size_t(cols);
+    Dim size(cols_int, rows_int);
+    if (size.ncols() == 0)
+        size.ncols(1);
+    if (size.nrows() == 0)
+        size.nrows(1);
+    double start_col = double(offset_x);
+    for (size_t i = 0; i < regions; ++i) {
+      double start_row = double(offset_y);
+      for (size_t j = 0; j < regions; ++j) {
+        size_t ul_x = size_t(start_col) - offset_x;
+        size_t ul_y = size_t(start_row) - offset_y;
+        size_t lr_x = ul_x + size.ncols();
+        size_t lr_y = ul_y + size.nrows();
+        unsigned int count = sums.area_sums[lr_y * width + lr_x]
+          - sums.area_sums[ul_y * width + lr_x]
+          - sums.area_sums[lr_y * width + ul_x]
+          + sums.area_sums[ul_y * width + ul_x];
+        *(buf++) = feature_t(count) / (size.nrows() * size.ncols());
+        start_row += rows;
+        size.nrows( size_t(start_row + rows)-size_t(start_row));
+        if (size.nrows() == 0)
+            size.nrows(1);
+      }
+      start_col += cols;
+      size.ncols( size_t(start_col + cols) - size_t(start_col));
+      if (size.ncols() == 0)
+        size.ncols(1);
+    }
+  }
+
+  inline void fused_top_bottom(const FeatureSums& sums, feature_t* buf) {
+    int top = -1;
+    for (size_t i = 0; i < sums.nrows; ++i)
+      if (sums.row_proj[i]) {
+        top = int(i);
+        break;
+      }
+    if (top == -1) {
+      *(buf++) = 1.0;
+      *buf = 0.0;
+      return;
+    }
+    // like top_bottom, the first row is not considered for the bottom
+    int bottom = -1;
+    for (size_t i = sums.nrows - 1; i > 0; --i)
+      if (sums.row_proj[i]) {
+        bottom = int(i);
+        break;
+      }
+    *(buf++) = feature_t(top) / feature_t(sums.nrows);
+    *buf = feature_t(bottom) / feature_t(sums.nrows);
+  }
+
+  //
+  // Run-based features
+  //
+  // run_feature_sums collects the same sums as scan_feature_sums from the
+  // black runs of the image. For run-length encoded images, these are
+  // read from the runs directly, which is much faster than visiting their
+  // pixels through the iterators. The features of run-length encoded
+  // images below are computed from these sums, with the same results as
+  // for dense images.
+  //
+  struct BlackRunList {
+    std::vector<size_t> y, begin, end;
+    void operator()(size_t row, size_t b, size_t e) {
+      y.push_back(row);
+      begin.push_back(b);
+      end.push_back(e);
+    }
+  };
+
+  template<class T>
+  void run_feature_sums(const T& m, FeatureSums& sums, bool mixed_moments,
+                        bool holes, bool regions) {
+    size_t nrows = sums.nrows = m.nrows();
+    size_t ncols = sums.ncols = m.ncols();
+    sums.black = 0;
+    sums.row_proj.assign(nrows, 0);
+    sums.col_proj.assign(ncols, 0);
+    sums.m11 = sums.m12 = sums.m21 = 0;
+    if (holes) {
+      sums.row_runs.assign(nrows, 0);
+      sums.col_runs.assign(ncols, 0);
+      sums.row_last.assign(nrows, 0);
+      sums.col_last.assign(ncols, 0);
+    }
+    if (regions)
+      sums.area_sums.assign((nrows + 1) * (ncols + 1), 0);
+
+    BlackRunList runs;
+    black_runs(m, runs);
+    size_t count = runs.y.size();
+    // the changes of col_proj and col_runs at the ends of the runs
+    std::vector<long> proj_changes(ncols + 1, 0), runs_changes;
+    if (holes)
+      runs_changes.assign(ncols + 1, 0);
+    size_t i = 0, previous = 0;
+    for (size_t y = 0; y < nrows; ++y) {
+      // the runs of this row are first..i-1, those of the row above
+      // are previous..first-1
+      size_t first = i;
+      size_t proj = 0;
+      for (; i < count && runs.y[i] == y; ++i) {
+        size_t b = runs.begin[i], e = runs.end[i];
+        proj += e - b;
+        ++proj_changes[b];
+        --proj_changes[e];
+        if (mixed_moments) {
+          // the sums of x and x^2 over the run are exact (see
+          // exact_mixed_moments), so that they give the same moments as
+          // summing up the pixels
+          feature_t n = feature_t(e - b);
+          feature_t sum_x = n * b + n * (n - 1) / 2;
+          feature_t sum_x2 = n * b * b + n * (n - 1) * b
+            + n * (n - 1) * (2 * n - 1) / 6;
+          sums.m11 += y * sum_x;
+          sums.m21 += y * sum_x2;
+          sums.m12 += feature_t(y * y) * sum_x;
+        }
+      }
+      sums.row_proj[y] = proj;
+      sums.black += proj;
+      if (holes) {
+        if (i > first && runs.end[i - 1] == ncols) {
+          sums.row_runs[y] = int(i - first - 1);
+          sums.row_last[y] = 1;
+        } else
+          sums.row_runs[y] = int(i - first);
+        // a column run ends where the row above is black and this row
+        // is white
+        size_t j = first;
+        for (size_t k = previous; k < first; ++k) {
+          size_t x = runs.begin[k], e = runs.end[k];
+          while (j < i && runs.end[j] <= x)
+            ++j;
+          for (size_t l = j; x < e; ++l) {
+            size_t white_end = (l < i) ? std::min(runs.begin[l], e) : e;
+            if (x < white_end) {
+              ++runs_changes[x];
+              --runs_changes[white_end];
+            }
+            if (l >= i)
+              break;
+            x = std::max(x, runs.end[l]);
+          }
+        }
+      }
+      if (regions) {
+        size_t* above = &sums.area_sums[y * (ncols + 1) + 1];
+        size_t* row = above + ncols + 1;
+        size_t x = 0, sum = 0;
+        for (size_t k = first; k < i; ++k) {
+          for (; x < runs.begin[k]; ++x)
+            row[x] = above[x] + sum;
+          for (; x < runs.end[k]; ++x)
+            row[x] = above[x] + ++sum;
+        }
+        for (; x < ncols; ++x)
+          row[x] = above[x] + sum;
+      }
+      previous = first;
+    }
+    long proj = 0, col_runs = 0;
+    for (size_t x = 0; x < ncols; ++x) {
+      sums.col_proj[x] = (proj += proj_changes[x]);
+      if (holes)
+        sums.col_runs[x] = int(col_runs += runs_changes[x]);
+    }
+    if (holes)
+      for (size_t k = previous; k < count; ++k)
+        std::fill(sums.col_last.begin() + runs.begin[k],
+                  sums.col_last.begin() + runs.end[k], 1);
+  }
+
+  inline void scan_feature_sums(const OneBitRleImageView& m, FeatureSums& sums,
+                                bool mixed_moments, bool holes, bool regions) {
+    run_feature_sums(m, sums, mixed_moments, holes, regions);
+  }
+
+  inline void scan_feature_sums(const RleCc& m, FeatureSums& sums,
+                                bool mixed_moments, bool holes, bool regions) {
+    run_feature_sums(m, sums, mixed_moments, holes, regions);
+  }
+
+  struct BlackRunLength {
+    size_t black;
+    BlackRunLength() : black(0) { }
+    void operator()(size_t y, size_t begin, size_t end) {
+      black += end - begin;
+    }
+  };
+
+  template<class T>
+  feature_t run_black_area(const T& image) {
+    BlackRunLength length;
+    black_runs(image, length);
+    return feature_t(length.black);
+  }
+
+  // moments_2d from the black runs, with the pixels summed up in the same
+  // order (column by column)
+  inline void run_moments_2d(const BlackRunList& runs, size_t nrows,
+                             size_t ncols, feature_t& m11, feature_t& m12,
+                             feature_t& m21) {
+    // the first run of each row that does not end left of the column
+    std::vector<size_t> next(nrows + 1, runs.y.size());
+    for (size_t i = runs.y.size(); i > 0; --i)
+      next[runs.y[i - 1]] = i - 1;
+    feature_t tmp = 0;
+    for (size_t x = 0; x < ncols; x++) {
+      for (size_t y = 0; y < nrows; y++) {
+        size_t& i = next[y];
+        while (i < runs.y.size() && runs.y[i] == y && runs.end[i] <= x)
+          ++i;
+        if (i < runs.y.size() && runs.y[i] == y && runs.begin[i] <= x) {
+          m11 += (tmp = x * y);
+          m21 += (tmp * x);
+          m12 += (tmp * y);
+        }
+      }
+    }
+  }
+
+  template<class T>
+  void run_moments(const T& image, feature_t* buf) {
+    bool exact = exact_mixed_moments(image.nrows(), image.ncols());
+    FeatureSums sums;
+    scan_feature_sums(image, sums, exact, false, false);
+    if (!exact) {
+      BlackRunList runs;
+      black_runs(image, runs);
+      run_moments_2d(runs, image.nrows(), image.ncols(),
+                     sums.m11, sums.m12, sums.m21);
+    }
+    fused_moments(sums, buf);
+  }
+
+  template<class T>
+  void run_nholes(const T& image, feature_t* buf, bool extended) {
+    FeatureSums sums;
+    scan_feature_sums(image, sums, false, true, false);
+    if (extended)
+      fused_nholes_extended(sums, buf);
+    else
+      fused_nholes(sums, buf);
+  }
+
+  template<class T>
+  void run_volume_regions(const T& image, size_t regions, feature_t* buf) {
+    FeatureSums sums;
+    scan_feature_sums(image, sums, false, false, true);
+    fused_volume_regions(sums, image.offset_x(), image.offset_y(), regions, buf);
+  }
+
+  template<class T>
+  bool run_row_is_white(const T& image, size_t y) {
+    T row(image, Point(image.offset_x(), image.offset_y() + y),
+          Dim(image.ncols(), 1));
+    BlackRunLength length;
+    black_runs(row, length);
+    return length.black == 0;
+  }
+
+  template<class T>
+  void run_top_bottom(const T& image, feature_t* buf) {
+    // like top_bottom, the rows are only read up to the first black ones
+    int top = 0;
+    while (top < int(image.nrows()) && run_row_is_white(image, top))
+      ++top;
+    if (top == int(image.nrows())) {
+      *(buf++) = 1.0;
+      *buf = 0.0;
+      return;
+    }
+    // like top_bottom, the first row is not considered for the bottom
+    int bottom = int(image.nrows()) - 1;
+    while (bottom > 0 && run_row_is_white(image, bottom))
+      --bottom;
+    if (bottom == 0)
+      bottom = -1;
+    *(buf++) = feature_t(top) / feature_t(image.nrows());
+    *buf = feature_t(bottom) / feature_t(image.nrows());
+  }
+
+  inline void black_area(const OneBitRleImageView& image, feature_t* buf) {
+    *buf = run_black_area(image);
+  }
+
+  inline void black_area(const RleCc& image, feature_t* buf) {
+    *buf = run_black_area(image);
+  }
+
+  inline feature_t black_area(const OneBitRleImageView& image) {
+    return run_black_area(image);
+  }
+
+  inline feature_t black_area(const RleCc& image) {
+    return run_black_area(image);
+  }
+
+  inline feature_t volume(const OneBitRleImageView& image) {
+    return run_black_area(image) / (image.nrows() * image.ncols());
+  }
+
+  inline feature_t volume(const RleCc& image) {
+    return run_black_area(image) / (image.nrows() * image.ncols());
+  }
+
+  inline void moments(OneBitRleImageView& image, feature_t* buf) {
+    run_moments(image, buf);
+  }
+
+  inline void moments(RleCc& image, feature_t* buf) {
+    run_moments(image, buf);
+  }
+
+  inline void nholes(OneBitRleImageView& image, feature_t* buf) {
+    run_nholes(image, buf, false);
+  }
+
+  inline void nholes(RleCc& image, feature_t* buf) {
+    run_nholes(image, buf, false);
+  }
+
+  inline void nholes_extended(const OneBitRleImageView& image, feature_t* buf) {
+    run_nholes(image, buf, true);
+  }
+
+  inline void nholes_extended(const RleCc& image, feature_t* buf) {
+    run_nholes(image, buf, true);
+  }
+
+  inline void volume16regions(const OneBitRleImageView& image, feature_t* buf) {
+    run_volume_regions(image, 4, buf);
+  }
+
+  inline void volume16regions(const RleCc& image, feature_t* buf) {
+    run_volume_regions(image, 4, buf);
+  }
+
+  inline void volume64regions(const OneBitRleImageView& image, feature_t* buf) {
+    run_volume_regions(image, 8, buf);
+  }
+
+  inline void volume64regions(const RleCc& image, feature_t* buf) {
+    run_volume_regions(image, 8, buf);
+  }
+
+  inline void top_bottom(const OneBitRleImageView& image, feature_t* buf) {
+    run_top_bottom(image, buf);
+  }
+
+  inline void top_bottom(const RleCc& image, feature_t* buf) {
+    run_top_bottom(image, buf);
+  }
+
+  // Bit-packed images: the black runs are found a word at a time (see
+  // black_runs in projections.hpp), and the black pixels are counted
+  // with popcount.
+  inline void scan_feature_sums(const OneBitPackedImageView& m, FeatureSums& sums,
+                                bool mixed_moments, bool holes, bool regions) {
+    run_feature_sums(m, sums, mixed_moments, holes, regions);
+  }
+
+  inline feature_t black_area(const OneBitPackedImageView& image) {
+    size_t black = 0;
+    for (size_t y = 0; y < image.nrows(); ++y)
+      black += packed_row_black(image, y);
+    return feature_t(black);
+  }
+
+  inline void black_area(const OneBitPackedImageView& image, feature_t* buf) {
+    *buf = black_area(image);
+  }
+
+  inline feature_t volume(const OneBitPackedImageView& image) {
+    return black_area(image) / (image.nrows() * image.ncols());
+  }
+
+  inline void moments(OneBitPackedImageView& image, feature_t* buf) {
+    run_moments(image, buf);
+  }
+
+  inline void nholes(OneBitPackedImageView& image, feature_t* buf) {
+    run_nholes(image, buf, false);
+  }
+
+  inline void nholes_extended(const OneBitPackedImageView& image, feature_t* buf) {
+    run_nholes(image, buf, true);
+  }
+
+  inline void volume16regions(const OneBitPackedImageView& image, feature_t* buf) {
+    run_volume_regions(image, 4, buf);
+  }
+
+  inline void volume64regions(const OneBitPackedImageView& image, feature_t* buf) {
+    run_volume_regions(image, 8, buf);
+  }
+
+  inline void top_bottom(const OneBitPackedImageView& image, feature_t* buf) {
+    run_top_bottom(image, buf);
+  }
+
+  //
+  // Features of a list of images
+  //
+  // compute_features_parallel computes features for a list of images at
+  // once. The feature functions are given by numbers, each followed by the
+  // offset of its features in the feature arrays of the images. The
+  // functor compute(image, features) computes these features for one image,
+  // the feature function with number i has lengths[i] features.
+  //
+  template<class Compute>
+  void compute_features(const Compute& compute, std::pair<Image*, int>& image,
+                        const IntVector& features) {
+    switch (image.second) {
+    case ONEBITIMAGEVIEW:
+      compute(*((OneBitImageView*)image.first), features); break;
+    case CC:
+      compute(*((Cc*)image.first), features); break;
+    case ONEBITRLEIMAGEVIEW:
+      compute(*((OneBitRleImageView*)image.first), features); break;
+    case RLECC:
+      compute(*((RleCc*)image.first), features); break;
+    case MLCC:
+      compute(*((MlCc*)image.first), features); break;
+    case ONEBITPACKEDIMAGEVIEW:
+      compute(*((OneBitPackedImageView*)image.first), features); break;
+    }
+  }
+
+  template<class Compute>
+  void compute_features_parallel(ImageVector& images, const IntVector& features,
+                                 const int* lengths, int num_features,
+                                 int num_threads, const Compute& compute) {
+    // everything is checked before the global interpreter lock is released
+    if (features.size() % 2 != 0)
+      throw std::invalid_argument("The features must be pairs of feature numbers and offsets.");
+    for (size_t i = 0; i < images.size(); ++i) {
+      int combination = images[i].second;
+      if (combination != ONEBITIMAGEVIEW && combination != CC &&
+          combination != ONEBITRLEIMAGEVIEW && combination != RLECC &&
+          combination != MLCC && combination != ONEBITPACKEDIMAGEVIEW)
+        throw std::invalid_argument("The images must be ONEBIT images.");
+      for (size_t j = 0; j < features.size(); j += 2) {
+        int feature = features[j];
+        int offset = features[j + 1];
+        if (feature < 0 || feature >= num_features)
+          throw std::invalid_argument("Unknown feature number.");
+        if (offset < 0 || offset + lengths[feature] > images[i].first->features_len)
+          throw std::invalid_argument("The feature array of an image is too small.");
+      }
+    }
+
+    std::string error;
+    int count = int(images.size());
+#ifdef _OPENMP
+    if (num_threads <= 0)
+      num_threads = omp_get_max_threads();
+#endif
+    Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel for schedule(dynamic, 4) num_threads(num_threads)
+#endif
+    for (int i = 0; i < count; ++i) {
+      // exceptions must not leave the parallel loop
+      try {
+        compute_features(compute, images[i], features);
+      } catch (std::exception& e) {
+#ifdef _OPENMP
+#pragma omp critical
+#endif
+        {
+          if (error.empty())
+            error = e.what();
+        }
+      }
+    }
+    Py_END_ALLOW_THREADS
+    if (!error.empty())
+      throw std::runtime_error(error);
+  }
+
+  // The feature functions above, by their numbers in _native_features in
+  // features.py.
+  static const int num_native_features = 16;
+  static const int native_feature_lengths[num_native_features] = {
+    1, 9, 2, 8, 1, 1, 1, 1, 1, 1, 16, 64, 14, 6, 2, 1
+  };
+
+  template<class T>
+  void compute_native_feature(T& image, int feature, feature_t* buf) {
+    switch (feature) {
+    case 0: black_area(image, buf); break;
+    case 1: moments(image, buf); break;
+    case 2: nholes(image, buf); break;
+    case 3: nholes_extended(image, buf); break;
+    case 4: volume(image, buf); break;
+    case 5: area(image, buf); break;
+    case 6: aspect_ratio(image, buf); break;
+    case 7: nrows_feature(image, buf); break;
+    case 8: ncols_feature(image, buf); break;
+    case 9: compactness(image, buf); break;
+    case 10: volume16regions(image, buf); break;
+    case 11: volume64regions(image, buf); break;
+    case 12: zernike_moments(image, buf); break;
+    case 13: skeleton_features(image, buf); break;
+    case 14: top_bottom(image, buf); break;
+    case 15: diagonal_projection(image, buf); break;
+    }
+  }
+
+  // Whether the feature with the given number can be computed from the
+  // FeatureSums.
+  inline bool is_fused_feature(int feature) {
+    switch (feature) {
+    case 0: case 1: case 2: case 3: case 4: case 9: case 10: case 11: case 14:
+      return true;
+    }
+    return false;
+  }
+
+  template<class T>
+  void compute_native_features(T& image, const IntVector& features) {
+    // The fused features are computed from one scan of the image when
+    // there are at least two of them.
+    size_t fused = 0;
+    bool mixed_moments = false, holes = false, regions = false;
+    for (size_t i = 0; i < features.size(); i += 2) {
+      int feature = features[i];
+      if (!is_fused_feature(feature))
+        continue;
+      ++fused;
+      if (feature == 1)
+        mixed_moments = exact_mixed_moments(image.nrows(), image.ncols());
+      else if (feature == 2 || feature == 3)
+        holes = true;
+      else if (feature == 10 || feature == 11)
+        regions = true;
+    }
+    if (fused < 2) {
+      for (size_t i = 0; i < features.size(); i += 2)
+        compute_native_feature(image, features[i], image.features + features[i + 1]);
+      return;
+    }
+
+    FeatureSums sums;
+    scan_feature_sums(image, sums, mixed_moments, holes, regions);
+    for (size_t i = 0; i < features.size(); i += 2) {
+      feature_t* buf = image.features + features[i + 1];
+      switch (features[i]) {
+      case 0: *buf = feature_t(sums.black); break;
+      case 1:
+        if (mixed_moments)
+          fused_moments(sums, buf);
+        else
+          moments(image, buf);
+        break;
+      case 2: fused_nholes(sums, buf); break;
+      case 3: fused_nholes_extended(sums, buf); break;
+      case 4: *buf = fused_volume(sums); break;
+      case 9: compactness(image, fused_volume(sums), buf); break;
+      case 10:
+        fused_volume_regions(sums, image.offset_x(), image.offset_y(), 4, buf);
+        break;
+      case 11:
+        fused_volume_regions(sums, image.offset_x(), image.offset_y(), 8, buf);
+        break;
+      case 14: fused_top_bottom(sums, buf); break;
+      default: compute_native_feature(image, features[i], buf);
+      }
+    }
+  }
+
+  struct native_features {
+    template<class T>
+    void operator()(T& image, const IntVector& features) const {
+      compute_native_features(image, features);
+    }
+  };
+
+  inline void compute_features_list(ImageVector& images, IntVector* features,
+                                    int num_threads) {
+    compute_features_parallel(images, *features, native_feature_lengths,
+                              num_native_features, num_threads, native_features());
+  }
 }
 #endif
@@ -160,6 +160,19 @@ namespace Gamera {
         throw;
       }
       return view;
+    } else if (storage_format == PACKED) {
+      typename ImageFactory<T>::packed_data_type* data =
+        new typename ImageFactory<T>::packed_data_type(a.size(), a.origin());
+      typename ImageFactory<T>::packed_view_type* view =
+        new typename ImageFactory<T>::packed_view_type(*data, a.origin(), a.size());
+      try {
+        image_copy_fill(a, *view);
+      } catch (std::exception e) {
+        delete view;
+        delete data;
+        throw;
+      }
+      return view;
     } else {
       typename ImageFactory<T>::rle_data_type* data =
         new typename ImageFactory<T>::rle_data_type(a.size(), a.origin());
@@ -177,6 +190,47 @@ namespace Gamera {
   }
 
 
+  /*
+    image_copy_at
+
+    Creates a DENSE copy of the image whose upper left corner is at
+    origin instead of at the origin of the image.  Used to cut tiles
+    out of large images (see gamera/tiles.py), so that the tiles can be
+    processed like stand-alone images.
+  */
+  template<class T>
+  Image* image_copy_at(T &a, const Point& origin) {
+    typename ImageFactory<T>::dense_data_type* data =
+      new typename ImageFactory<T>::dense_data_type(a.size(), origin);
+    typename ImageFactory<T>::dense_view_type* view =
+      new typename ImageFactory<T>::dense_view_type(*data, origin, a.size());
+    try {
+      image_copy_fill(a, *view);
+    } catch (std::exception e) {
+      delete view;
+      delete data;
+      throw;
+    }
+    return view;
+  }
+
+  /*
+    paste_image
+
+    Copies the pixels of src into the part of dest whose upper left
+    corner is at upper_left (in page coordinates).
+  */
+  template<class T, class U>
+  void paste_image(T& dest, const U& src, const Point& upper_left) {
+    typedef typename ImageFactory<T>::data_type data_type;
+    typedef typename ImageFactory<T>::view_type view_type;
+    if (!dest.contains_rect(Rect(upper_left, src.dim())))
+      throw std::range_error("paste_image: the pasted image must lie within the image.");
+    view_type target(*((data_type*)dest.data()), upper_left, src.dim());
+    image_copy_fill(src, target);
+  }
+
+
   /*
     union_images
 
@@ -239,6 +293,9 @@ namespace Gamera {
         case RLECC:
           _union_image(*dest, *((RleCc*)image));
           break;
+        case ONEBITPACKEDIMAGEVIEW:
+          _union_image(*dest, *((OneBitPackedImageView*)image));
+          break;
         default:
           throw std::runtime_error
             ("There is an Image in the list that is not a OneBit image.");
@@ -526,6 +583,20 @@ namespace Gamera {
       acc.set(invert(acc(in)), in);
   }
 
+  // bit-packed images are inverted a word of pixels at a time
+  inline void invert(OneBitPackedImageView& image) {
+    using namespace PackedDataDetail;
+    word_type* words = image.data()->words();
+    size_t ncols = image.ncols();
+    for (size_t y = 0; y < image.nrows(); ++y) {
+      size_t first = packed_row_position(image, y);
+      for (size_t x = 0; x < ncols; x += WORD_BITS) {
+        size_t n = std::min(WORD_BITS, ncols - x);
+        write_bits(words, first + x, n, ~read_bits(words, first + x, n));
+      }
+    }
+  }
+
 
   template<class T>
   Image *clip_image(T& m, const Rect* rect) {
@@ -741,6 +812,26 @@ namespace Gamera {
     }
   }
 
+  /*
+    Bit-packed images cannot hold the labels of connected components, so
+    the functions that label the pixels of an image work on a DENSE copy
+    of a bit-packed image instead. The returned Ccs refer to this copy,
+    and the bit-packed image itself is left unchanged.
+  */
+  inline OneBitImageView* dense_label_copy(const OneBitPackedImageView& image) {
+    OneBitImageData* data = new OneBitImageData(image.size(), image.origin());
+    OneBitImageView* copy = new OneBitImageView(*data, image.origin(), image.size());
+    image_copy_fill(image, *copy);
+    return copy;
+  }
+
+  // deletes the copy, but keeps its data when it is referenced by Ccs
+  inline void release_dense_label_copy(OneBitImageView* copy, ImageList* ccs) {
+    if (ccs == NULL || ccs->empty())
+      delete copy->data();
+    delete copy;
+  }
+
   /*
    * compute Cc's from an already labeled image
    * Christoph Dalitz and Hasan Yildiz
@@ -797,6 +888,13 @@ namespace Gamera {
     return return_ccs;
   }
 
+  inline ImageList* ccs_from_labeled_image(OneBitPackedImageView& src) {
+    OneBitImageView* copy = dense_label_copy(src);
+    ImageList* ccs = ccs_from_labeled_image(*copy);
+    release_dense_label_copy(copy, ccs);
+    return ccs;
+  }
+
   /*
    * find minimum and maximum location and value of maximum within mask
    * Only black points in the mask are evaluated in image
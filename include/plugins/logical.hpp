@@ -23,6 +23,7 @@
 #include "gamera.hpp"
 #include <functional>
 #include <exception>
+#include <algorithm>
 
 namespace Gamera {
 
@@ -79,6 +80,44 @@ logical_combine(T& a, const U& b, const FUNCTOR& functor, bool in_place) {
   }
 }
 
+/*
+  Bit-packed images are combined a word of pixels at a time. FUNCTOR
+  combines two words of pixels bitwise.
+*/
+template<class FUNCTOR>
+inline OneBitPackedImageView*
+packed_logical_combine(OneBitPackedImageView& a, const OneBitPackedImageView& b,
+                       const FUNCTOR& functor, bool in_place) {
+  using namespace PackedDataDetail;
+  if (a.nrows() != b.nrows() || a.ncols() != b.ncols())
+    throw std::runtime_error("Images must be the same size.");
+
+  OneBitPackedImageView* dest = &a;
+  if (!in_place) {
+    OneBitPackedImageData* dest_data = new OneBitPackedImageData(a.size(), a.origin());
+    dest = new OneBitPackedImageView(*dest_data);
+  }
+  const word_type* words_a = a.data()->words();
+  const word_type* words_b = b.data()->words();
+  word_type* words_dest = dest->data()->words();
+  size_t ncols = a.ncols();
+  for (size_t y = 0; y < a.nrows(); ++y) {
+    size_t pos_a = packed_row_position(a, y);
+    size_t pos_b = packed_row_position(b, y);
+    size_t pos_dest = packed_row_position(*dest, y);
+    for (size_t x = 0; x < ncols; x += WORD_BITS) {
+      size_t n = std::min(WORD_BITS, ncols - x);
+      write_bits(words_dest, pos_dest + x, n,
+                 functor(read_bits(words_a, pos_a + x, n),
+                         read_bits(words_b, pos_b + x, n)));
+    }
+  }
+  // Returning NULL is converted to None by the wrapper mechanism
+  if (in_place)
+    return NULL;
+  return dest;
+}
+
 template<class T, class U>
 typename ImageFactory<T>::view_type* 
 and_image(T& a, const U& b, bool in_place=true) {
@@ -107,5 +146,20 @@ xor_image(T& a, const U& b, bool in_place=true) {
   return logical_combine(a, b, logical_xor<bool>(), in_place);
 }
 
+inline OneBitPackedImageView*
+and_image(OneBitPackedImageView& a, const OneBitPackedImageView& b, bool in_place=true) {
+  return packed_logical_combine(a, b, std::bit_and<PackedDataDetail::word_type>(), in_place);
+}
+
+inline OneBitPackedImageView*
+or_image(OneBitPackedImageView& a, const OneBitPackedImageView& b, bool in_place=true) {
+  return packed_logical_combine(a, b, std::bit_or<PackedDataDetail::word_type>(), in_place);
+}
+
+inline OneBitPackedImageView*
+xor_image(OneBitPackedImageView& a, const OneBitPackedImageView& b, bool in_place=true) {
+  return packed_logical_combine(a, b, std::bit_xor<PackedDataDetail::word_type>(), in_place);
+}
+
 }
 #endif
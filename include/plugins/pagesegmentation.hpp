@@ -617,6 +617,34 @@ PyObject* sub_cc_analysis(T& image, ImageVector &cclist) {
 }
 
 
+/*
+ * Bit-packed images cannot hold the labels of the Ccs, so the
+ * functions above work on a DENSE copy of them (see dense_label_copy
+ * in image_utilities.hpp).
+ */
+inline ImageList* runlength_smearing(OneBitPackedImageView& image, int Cx, int Cy, int Csm) {
+    OneBitImageView* copy = dense_label_copy(image);
+    ImageList* ccs = runlength_smearing(*copy, Cx, Cy, Csm);
+    release_dense_label_copy(copy, ccs);
+    return ccs;
+}
+
+inline ImageList* projection_cutting(OneBitPackedImageView& image, int Tx, int Ty, int noise, int gap_treatment) {
+    OneBitImageView* copy = dense_label_copy(image);
+    ImageList* ccs = projection_cutting(*copy, Tx, Ty, noise, gap_treatment);
+    release_dense_label_copy(copy, ccs);
+    return ccs;
+}
+
+inline PyObject* sub_cc_analysis(OneBitPackedImageView& image, ImageVector &cclist) {
+    // the returned Ccs refer to a new image, not to the copy
+    OneBitImageView* copy = dense_label_copy(image);
+    PyObject* result = sub_cc_analysis(*copy, cclist);
+    release_dense_label_copy(copy, NULL);
+    return result;
+}
+
+
 //
 // evaluation of segmentation
 //
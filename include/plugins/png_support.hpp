@@ -197,7 +197,12 @@ void load_PNG_onebit(T& image, png_structp& png_ptr) {
   delete[] row;
 }
 
-Image* load_PNG(const char* filename, int storage) {
+Image* load_PNG(const char* filename, int storage, const char* mmap_file) {
+  // An empty mmap_file loads the image into main memory
+  if (*mmap_file == '\0')
+    mmap_file = 0;
+  else if (storage != DENSE)
+    throw std::runtime_error("Only images with storage format DENSE can be memory-mapped.");
   FILE* fp;
   png_structp png_ptr;
   png_infop info_ptr, end_info;
@@ -222,9 +227,9 @@ Image* load_PNG(const char* filename, int storage) {
 
   if (color_type == PNG_COLOR_TYPE_RGB || color_type == PNG_COLOR_TYPE_PALETTE ||
       color_type == PNG_COLOR_TYPE_RGB_ALPHA) {
-    if (storage == RLE) {
+    if (storage != DENSE) {
       PNG_close(fp, png_ptr, info_ptr, end_info);
-      throw std::runtime_error("Pixel type must be OneBit to use RLE data.");
+      throw std::runtime_error("Pixel type must be OneBit to use RLE or PACKED data.");
     }
     if (bit_depth > 8) {
 #if PNG_LIBPNG_VER >= 10504
@@ -240,7 +245,7 @@ Image* load_PNG(const char* filename, int storage) {
       png_set_palette_to_rgb(png_ptr);
     typedef TypeIdImageFactory<RGB, DENSE> fact;
     fact::image_type* image =
-      fact::create(Point(0, 0), Dim(width, height));
+      fact::create(Point(0, 0), Dim(width, height), mmap_file);
     load_PNG_simple(*image, png_ptr);
     //Damon
     image->resolution(reso);
@@ -253,13 +258,21 @@ Image* load_PNG(const char* filename, int storage) {
       if (storage == DENSE) {
         typedef TypeIdImageFactory<ONEBIT, DENSE> fact;
         fact::image_type* image =
-          fact::create(Point(0, 0), Dim(width, height));
+          fact::create(Point(0, 0), Dim(width, height), mmap_file);
         load_PNG_onebit(*image, png_ptr);
         //Damon
         image->resolution(reso);
         //Damon: end    
         PNG_close(fp, png_ptr, info_ptr, end_info);
         return image;
+      } else if (storage == PACKED) {
+        typedef TypeIdImageFactory<ONEBIT, PACKED> fact;
+        fact::image_type* image =
+          fact::create(Point(0, 0), Dim(width, height));
+        load_PNG_onebit(*image, png_ptr);
+        image->resolution(reso);
+        PNG_close(fp, png_ptr, info_ptr, end_info);
+        return image;
       } else {
         typedef TypeIdImageFactory<ONEBIT, RLE> fact;
         fact::image_type* image =
@@ -272,9 +285,9 @@ Image* load_PNG(const char* filename, int storage) {
         return image;
       } 
     } else if (bit_depth <= 8) {
-      if (storage == RLE) {
+      if (storage != DENSE) {
         PNG_close(fp, png_ptr, info_ptr, end_info);
-        throw std::runtime_error("Pixel type must be OneBit to use RLE data.");
+        throw std::runtime_error("Pixel type must be OneBit to use RLE or PACKED data.");
       }
       if (bit_depth < 8) {
 #if PNG_LIBPNG_VER > 10399
@@ -285,7 +298,7 @@ Image* load_PNG(const char* filename, int storage) {
       }
       typedef TypeIdImageFactory<GREYSCALE, DENSE> fact_type;
       fact_type::image_type*
-        image = fact_type::create(Point(0, 0), Dim(width, height));
+        image = fact_type::create(Point(0, 0), Dim(width, height), mmap_file);
       load_PNG_simple(*image, png_ptr);
       //Damon
       image->resolution(reso);
@@ -293,13 +306,13 @@ Image* load_PNG(const char* filename, int storage) {
       PNG_close(fp, png_ptr, info_ptr, end_info);
       return image;
     } else if (bit_depth == 16) {
-      if (storage == RLE) {
+      if (storage != DENSE) {
         PNG_close(fp, png_ptr, info_ptr, end_info);
-        throw std::runtime_error("Pixel type must be OneBit to use RLE data.");
+        throw std::runtime_error("Pixel type must be OneBit to use RLE or PACKED data.");
       }
       typedef TypeIdImageFactory<GREY16, DENSE> fact_type;
       fact_type::image_type*
-        image = fact_type::create(Point(0, 0), Dim(width, height));
+        image = fact_type::create(Point(0, 0), Dim(width, height), mmap_file);
       load_PNG_grey16(*image, png_ptr);
       //Damon
       image->resolution(reso);
@@ -22,6 +22,7 @@
 #define kwm02212003_projections
 
 #include "gamera.hpp"
+#include <algorithm>
 
 namespace Gamera {
 
@@ -54,6 +55,122 @@ namespace Gamera {
     return proj;
   }
 
+  /*
+    black_runs calls f(y, begin, end) for the horizontal runs of black
+    pixels begin <= x < end of the image, row by row. Run-length encoded
+    images are read from their runs, so that white pixels are skipped at
+    once.
+  */
+  template<class T, class F>
+  void black_runs(const T& image, F& f) {
+    typename T::const_row_iterator r = image.row_begin();
+    for (size_t y = 0; r != image.row_end(); ++r, ++y) {
+      typename T::const_col_iterator c = r.begin();
+      size_t begin = 0;
+      bool black = false;
+      for (size_t x = 0; c != r.end(); ++c, ++x) {
+        if (is_black(*c)) {
+          if (!black) {
+            begin = x;
+            black = true;
+          }
+        } else if (black) {
+          f(y, begin, x);
+          black = false;
+        }
+      }
+      if (black)
+        f(y, begin, image.ncols());
+    }
+  }
+
+  // black runs of an RLE image with the given label (0 for all black runs)
+  template<class T, class F>
+  void rle_black_runs(const T& image, OneBitPixel label, F& f) {
+    using namespace RleDataDetail;
+    typedef typename T::data_type data_type;
+    typedef typename data_type::list_type list_type;
+    const data_type* data = image.data();
+    size_t ncols = image.ncols();
+    for (size_t y = 0; y < image.nrows(); ++y) {
+      size_t first = (y + image.offset_y() - data->page_offset_y()) * data->stride()
+        + image.offset_x() - data->page_offset_x();
+      size_t last = first + ncols; // exclusive
+      // runs are split at the chunk boundaries and between different
+      // labels, so adjacent runs are joined before they are passed on
+      size_t black_begin = 0, black_end = 0;
+      for (size_t chunk = get_chunk(first); chunk <= get_chunk(last - 1); ++chunk) {
+        const list_type& runs = data->m_data[chunk];
+        size_t run_begin = chunk << RLE_CHUNK_BITS;
+        for (typename list_type::const_iterator i = runs.begin();
+             i != runs.end(); ++i) {
+          size_t run_end = get_global_pos(i->end, chunk) + 1;
+          if (i->value != 0 && (label == 0 || i->value == label)) {
+            size_t begin = std::max(run_begin, first) - first;
+            size_t end = std::min(run_end, last) - first;
+            if (run_begin < last && run_end > first) {
+              if (begin != black_end || black_begin == black_end) {
+                if (black_begin != black_end)
+                  f(y, black_begin, black_end);
+                black_begin = begin;
+              }
+              black_end = end;
+            }
+          }
+          run_begin = run_end;
+        }
+      }
+      if (black_begin != black_end)
+        f(y, black_begin, black_end);
+    }
+  }
+
+  template<class F>
+  void black_runs(const OneBitRleImageView& image, F& f) {
+    rle_black_runs(image, 0, f);
+  }
+
+  template<class F>
+  void black_runs(const RleCc& image, F& f) {
+    rle_black_runs(image, image.label(), f);
+  }
+
+  /*
+    The black runs of a bit-packed image are read a word at a time, so
+    that words without a change between white and black are skipped
+    at once.
+  */
+  template<class F>
+  void black_runs(const OneBitPackedImageView& image, F& f) {
+    using namespace PackedDataDetail;
+    const word_type* words = image.data()->words();
+    size_t ncols = image.ncols();
+    for (size_t y = 0; y < image.nrows(); ++y) {
+      size_t first = packed_row_position(image, y);
+      size_t begin = 0;
+      bool black = false;
+      for (size_t x = 0; x < ncols; x += WORD_BITS) {
+        size_t n = std::min(WORD_BITS, ncols - x);
+        word_type bits = read_bits(words, first + x, n);
+        size_t i = 0;
+        while (true) {
+          // the pixels from i on that end the current run (or gap)
+          word_type changes = (black ? ~bits : bits) & low_mask(n) & ~low_mask(i);
+          if (changes == 0)
+            break;
+          i = lowest_bit(changes);
+          if (black)
+            f(y, begin, x + i);
+          else
+            begin = x + i;
+          black = !black;
+        }
+      }
+      if (black)
+        f(y, begin, ncols);
+    }
+  }
+
   /*
     Projection along the y axis (rows) of an image.
   */
@@ -98,6 +215,75 @@ namespace Gamera {
     return proj;
   }
 
+  /*
+    The projections of run-length encoded (and bit-packed) images, from
+    their black runs.
+  */
+  struct RunProjections {
+    IntVector* rows;
+    IntVector* cols;
+    RunProjections(IntVector* r, IntVector* c) : rows(r), cols(c) { }
+    void operator()(size_t y, size_t begin, size_t end) {
+      if (rows)
+        (*rows)[y] += int(end - begin);
+      // the changes of the column projection, summed up afterwards
+      if (cols) {
+        (*cols)[begin] += 1;
+        if (end < cols->size())
+          (*cols)[end] -= 1;
+      }
+    }
+  };
+
+  template<class T>
+  IntVector* run_projection_rows(const T& image) {
+    IntVector* proj = new IntVector(image.nrows(), 0);
+    RunProjections f(proj, 0);
+    black_runs(image, f);
+    return proj;
+  }
+
+  template<class T>
+  IntVector* run_projection_cols(const T& image) {
+    IntVector* proj = new IntVector(image.ncols(), 0);
+    RunProjections f(0, proj);
+    black_runs(image, f);
+    for (size_t c = 1; c < proj->size(); ++c)
+      (*proj)[c] += (*proj)[c - 1];
+    return proj;
+  }
+
+  inline IntVector* projection_rows(const OneBitRleImageView& image) {
+    return run_projection_rows(image);
+  }
+
+  inline IntVector* projection_rows(const RleCc& image) {
+    return run_projection_rows(image);
+  }
+
+  inline IntVector* projection_cols(const OneBitRleImageView& image) {
+    return run_projection_cols(image);
+  }
+
+  inline IntVector* projection_cols(const RleCc& image) {
+    return run_projection_cols(image);
+  }
+
+  /*
+    The row projection of bit-packed images counts the black pixels a
+    word at a time.
+  */
+  inline IntVector* projection_rows(const OneBitPackedImageView& image) {
+    IntVector* proj = new IntVector(image.nrows(), 0);
+    for (size_t y = 0; y < image.nrows(); ++y)
+      (*proj)[y] = int(packed_row_black(image, y));
+    return proj;
+  }
+
+  inline IntVector* projection_cols(const OneBitPackedImageView& image) {
+    return run_projection_cols(image);
+  }
+
   /*
     Projection along the y axis (rows) of a portion
     on an image.    
@@ -647,6 +647,88 @@ namespace Gamera {
     }
   }
 
+  /*
+    Binary run-length encoding: the same alternating white and black
+    runs as to_rle, each as an unsigned variable-length integer with
+    seven bits per byte, least significant bits first.  All bytes but
+    the last of a number have the high bit set.
+  */
+  inline void append_varint(std::string& s, size_t number) {
+    while (number >= 0x80) {
+      s += char((number & 0x7f) | 0x80);
+      number >>= 7;
+    }
+    s += char(number);
+  }
+
+  template<class T>
+  PyObject* to_rle_binary(const T& image) {
+    // White first
+    std::string result;
+
+    for (typename T::const_vec_iterator i = image.vec_begin();
+	 i != image.vec_end(); /* deliberately blank */) {
+      typename T::const_vec_iterator start;
+      start = i;
+      run_end(i, image.vec_end(), runs::White());
+      append_varint(result, size_t(i - start));
+      start = i;
+      run_end(i, image.vec_end(), runs::Black());
+      append_varint(result, size_t(i - start));
+    }
+
+    return PyString_FromStringAndSize(result.data(), result.size());
+  }
+
+  inline size_t next_varint(const unsigned char* &p, const unsigned char* end) {
+    size_t number = 0;
+    for (size_t shift = 0; ; shift += 7) {
+      if (p == end)
+	throw std::invalid_argument("Image is too large for run-length data");
+      if (shift >= sizeof(size_t) * 8)
+	throw std::invalid_argument("Invalid number in binary run-length data.");
+      unsigned char byte = *(p++);
+      number |= size_t(byte & 0x7f) << shift;
+      if (!(byte & 0x80))
+	return number;
+    }
+  }
+
+  template<class T>
+  void from_rle_binary(T& image, PyObject* data) {
+    // White first
+    if (!PyString_Check(data))
+      throw std::invalid_argument("The binary run-length data must be a string.");
+    const unsigned char* begin = (const unsigned char*)PyString_AS_STRING(data);
+    const unsigned char* end = begin + PyString_GET_SIZE(data);
+
+    // Check the runs first, so that invalid data leaves the image
+    // unchanged
+    const unsigned char* p = begin;
+    size_t left = size_t(image.vec_end() - image.vec_begin());
+    while (left > 0) {
+      for (size_t color = 0; color < 2; ++color) {
+	size_t run = next_varint(p, end);
+	if (run > left)
+	  throw std::invalid_argument("Image is too small for run-length data");
+	left -= run;
+      }
+    }
+    if (p != end)
+      throw std::invalid_argument("Image is too small for run-length data");
+
+    p = begin;
+    for (typename T::vec_iterator i = image.vec_begin();
+	 i != image.vec_end(); /* deliberately blank */) {
+      size_t run = next_varint(p, end);
+      std::fill(i, i + run, white(image));
+      i = i + run;
+      run = next_varint(p, end);
+      std::fill(i, i + run, black(image));
+      i = i + run;
+    }
+  }
+
 ///////////////////////////////////////////////////////////////////////////
 // Run iterators
   struct make_vertical_run {
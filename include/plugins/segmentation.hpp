@@ -291,6 +291,14 @@ namespace Gamera {
     return ccs;
   }
 
+  // see dense_label_copy in image_utilities.hpp
+  inline ImageList* cc_analysis(OneBitPackedImageView& image) {
+    OneBitImageView* copy = dense_label_copy(image);
+    ImageList* ccs = cc_analysis(*copy);
+    release_dense_label_copy(copy, ccs);
+    return ccs;
+  }
+
   template<class T>
   inline void delete_connected_components(T* ccs) {
     for (typename T::iterator i = ccs->begin(); i != ccs->end(); ++i)
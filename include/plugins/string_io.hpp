@@ -78,6 +78,12 @@ Image* _from_raw_string(Point offset, Dim size,
     image_type* image = factory::create(offset, size);
     if (fill_image_from_string(*image, data_string))
       return image;
+  } else if (pixel_type == ONEBIT && storage_format == PACKED) {
+    typedef TypeIdImageFactory<ONEBIT, PACKED> factory;
+    typedef factory::image_type image_type;
+    image_type* image = factory::create(offset, size);
+    if (fill_image_from_string(*image, data_string))
+      return image;
   } else if (pixel_type == ONEBIT && storage_format == DENSE) {
     typedef TypeIdImageFactory<ONEBIT, DENSE> factory;
     typedef factory::image_type image_type;
@@ -121,5 +127,110 @@ Image* _from_raw_string(Point offset, Dim size,
   return NULL;
 }
 
-#endif
 
+/*
+  Dense image data in the buffer of a Python object (e.g. a numpy
+  array).  The data holds a reference to the object, so the buffer
+  stays valid for as long as the image exists.  It is never resized.
+*/
+template<class T>
+class BufferImageData : public ImageData<T> {
+public:
+  BufferImageData(const Dim& dim, const Point& offset, Py_buffer* buffer) :
+    ImageData<T>(dim, offset, (T*)buffer->buf) {
+    m_buffer = *buffer;
+  }
+  virtual ~BufferImageData() {
+    // The base class must not delete[] the borrowed buffer
+    this->m_data = 0;
+    PyBuffer_Release(&m_buffer);
+  }
+  using ImageData<T>::nrows;
+  using ImageData<T>::ncols;
+  using ImageData<T>::dim;
+  /*
+    The base class sets the stride before do_resize is called, so
+    that a new shape with the same number of pixels would go
+    unnoticed there.
+  */
+  virtual void nrows(size_t nrows) { check_dimensions(nrows, this->ncols()); }
+  virtual void ncols(size_t ncols) { check_dimensions(this->nrows(), ncols); }
+  virtual void dimensions(size_t rows, size_t cols) {
+    check_dimensions(rows, cols);
+  }
+  virtual void dim(const Dim& dim) {
+    check_dimensions(dim.nrows(), dim.ncols());
+  }
+protected:
+  virtual void do_resize(size_t size) {
+    if (size != this->m_size)
+      throw std::runtime_error("Images sharing the memory of a Python object can not be resized.");
+  }
+private:
+  void check_dimensions(size_t rows, size_t cols) {
+    if (rows != this->nrows() || cols != this->ncols())
+      throw std::runtime_error("Images sharing the memory of a Python object can not be resized.");
+  }
+  Py_buffer m_buffer;
+};
+
+template<class T>
+Image* image_from_buffer(Point offset, Dim size, Py_buffer* buffer) {
+  if ((size_t)buffer->len != size.ncols() * size.nrows() * sizeof(T)) {
+    PyBuffer_Release(buffer);
+    PyErr_SetString(PyExc_ValueError,
+		    "The size of the buffer does not match the image size.");
+    return NULL;
+  }
+  BufferImageData<T>* data = new BufferImageData<T>(size, offset, buffer);
+  return new ImageView<ImageData<T> >(*data);
+}
+
+Image* _from_buffer(Point offset, Dim size, int pixel_type,
+		    PyObject* array) {
+  Py_buffer buffer;
+  if (PyObject_GetBuffer(array, &buffer,
+			 PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS) != 0)
+    return NULL;
+  switch (pixel_type) {
+  case ONEBIT:
+    return image_from_buffer<OneBitPixel>(offset, size, &buffer);
+  case GREYSCALE:
+    return image_from_buffer<GreyScalePixel>(offset, size, &buffer);
+  case GREY16:
+    return image_from_buffer<Grey16Pixel>(offset, size, &buffer);
+  case RGB:
+    return image_from_buffer<RGBPixel>(offset, size, &buffer);
+  case FLOAT:
+    return image_from_buffer<FloatPixel>(offset, size, &buffer);
+  case COMPLEX:
+    return image_from_buffer<ComplexPixel>(offset, size, &buffer);
+  }
+  PyBuffer_Release(&buffer);
+  PyErr_SetString(PyExc_ValueError, "Invalid pixel_type");
+  return NULL;
+}
+
+/*
+  The address of the upper left pixel of a DENSE image and the
+  distance between its rows in bytes, for the __array_interface__ of
+  images.
+*/
+template<class T>
+PyObject* _pixel_buffer(const ImageView<ImageData<T> >& image) {
+  const ImageData<T>* data = (const ImageData<T>*)image.data();
+  const T* begin = data->begin()
+    + (image.ul_y() - data->page_offset_y()) * data->stride()
+    + (image.ul_x() - data->page_offset_x());
+  return Py_BuildValue(CHAR_PTR_CAST "(Nn)", PyLong_FromVoidPtr((void*)begin),
+		       (Py_ssize_t)(data->stride() * sizeof(T)));
+}
+
+template<class T>
+PyObject* _pixel_buffer(const T& image) {
+  PyErr_SetString(PyExc_TypeError,
+		  "Only the pixels of DENSE images can be shared, not those of RLE or PACKED images or of connected components.");
+  return NULL;
+}
+
+#endif
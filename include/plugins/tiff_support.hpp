@@ -27,39 +27,58 @@
 #include <exception>
 #include <stdexcept>
 #include <bitset>
+#include <algorithm>
+#include <cstring>
 
 namespace Gamera {
 
 // forward declarations
-ImageInfo* tiff_info(const char* filename);
-Image* load_tiff(const char* filename, int compressed);
+ImageInfo* tiff_info(const char* filename, int page);
+Image* load_tiff(const char* filename, int compressed, const char* mmap_file,
+                 int page);
 template<class T>
 void save_tiff(const T& matrix, const char* filename);
 
-/*
-  Get information about tiff images
+namespace {
 
-  This function gets informtion about tiff images and places it in and
-  ImageInfo object.  See image_info.hpp for more information.
-*/
-ImageInfo* tiff_info(const char* filename) {
-  TIFFErrorHandler saved_handler = TIFFSetErrorHandler(NULL);
-  TIFF* tif = 0;
-  tif = TIFFOpen(filename, "r");
-  if (tif == 0) {
-    TIFFSetErrorHandler(saved_handler);
-    throw std::invalid_argument("Failed to open image header");
-  }
-  // Create this later so it isn't leaked if filename does
-  // not exist or is not a TIFF file.
-  ImageInfo* info = new ImageInfo();
+  /*
+    Switches the libtiff error handler off (errors are reported as
+    exceptions instead) while an object of this class exists.  The
+    handler is global, so the objects are counted: the first switches
+    it off and the last restores it, also when several threads decode
+    files at the same time.  The objects must be created and destroyed
+    while the global interpreter lock is held, which protects the
+    counter.
+  */
+  class TiffErrorsSilenced {
+  public:
+    TiffErrorsSilenced() {
+      if (s_count++ == 0)
+        s_saved_handler = TIFFSetErrorHandler(NULL);
+    }
+    ~TiffErrorsSilenced() {
+      if (--s_count == 0)
+        TIFFSetErrorHandler(s_saved_handler);
+    }
+  private:
+    static int s_count;
+    static TIFFErrorHandler s_saved_handler;
+  };
+  int TiffErrorsSilenced::s_count = 0;
+  TIFFErrorHandler TiffErrorsSilenced::s_saved_handler = 0;
 
   /*
-    The tiff library seems very sensitive to type yet provides only a
-    stupid non-type-checked interface.  The following seems to work well
-    (notice that resolution is floating point).  KWM 6/6/01
-   */
-  try {
+    Reads the information about the current directory of an open TIFF
+    file into a new ImageInfo object.
+  */
+  ImageInfo* tiff_directory_info(TIFF* tif) {
+    ImageInfo* info = new ImageInfo();
+
+    /*
+      The tiff library seems very sensitive to type yet provides only a
+      stupid non-type-checked interface.  The following seems to work well
+      (notice that resolution is floating point).  KWM 6/6/01
+    */
     unsigned short tmp;
     uint32 size;
     TIFFGetFieldDefaulted(tif, TIFFTAG_IMAGEWIDTH, &size);
@@ -77,32 +96,194 @@ ImageInfo* tiff_info(const char* filename) {
     info->ncolors((size_t)tmp);
     TIFFGetFieldDefaulted(tif, TIFFTAG_PHOTOMETRIC, &tmp);
     info->inverted(tmp == PHOTOMETRIC_MINISWHITE);
+    return info;
+  }
+
+  /*
+    Makes the given page (counted from 0) the current directory.
+  */
+  void tiff_set_page(TIFF* tif, int page) {
+    if (page < 0 || !TIFFSetDirectory(tif, (tdir_t)page))
+      throw std::range_error("The TIFF file has no such page.");
+  }
+
+}
 
+/*
+  Get information about tiff images
+
+  This function gets informtion about tiff images and places it in and
+  ImageInfo object.  See image_info.hpp for more information.
+*/
+ImageInfo* tiff_info(const char* filename, int page) {
+  TiffErrorsSilenced silenced;
+  TIFF* tif = 0;
+  tif = TIFFOpen(filename, "r");
+  if (tif == 0)
+    throw std::invalid_argument("Failed to open image header");
+  try {
+    if (page != 0)
+      tiff_set_page(tif, page);
+  } catch (std::exception&) {
     TIFFClose(tif);
-  } catch (std::exception e) {
-    TIFFSetErrorHandler(saved_handler);
-    delete info;
+    throw;
   }
-  TIFFSetErrorHandler(saved_handler);
+  ImageInfo* info = tiff_directory_info(tif);
+  TIFFClose(tif);
   return info;
 }
+
+/*
+  Returns the number of pages (directories) of a TIFF file.
+*/
+int tiff_page_count(const char* filename) {
+  TiffErrorsSilenced silenced;
+  TIFF* tif = TIFFOpen(filename, "r");
+  if (tif == 0)
+    throw std::invalid_argument("Failed to open image header");
+  int count = (int)TIFFNumberOfDirectories(tif);
+  TIFFClose(tif);
+  return count;
+}
+
 namespace {
 
-  template<class T>
-  void tiff_load_onebit(T& matrix, ImageInfo& info, const char* filename) {
-    // open the image
-    TIFF* tif = TIFFOpen(filename, "r");
-    if (!tif) throw std::runtime_error("TIFF Error opening file");
-    tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
-    if (!buf) throw std::runtime_error("TIFF Error allocating scanline");
-    
-    // load the data
-    for (size_t i = 0; i < info.nrows(); i++) {
-      if (TIFFReadScanline(tif, buf, i) < 0) {
-        _TIFFfree(buf); TIFFClose(tif);
-        throw std::runtime_error("TIFF Error reading scanline");
+  /*
+    Reads the rows of a page of a TIFF file one after another, for
+    files that are organized in strips as well as in tiles.  Only one
+    row of tiles is held in memory at a time, so that large files can
+    be read in bands.  The file stays open when another page is
+    selected.
+  */
+  class TiffReader {
+  public:
+    TiffReader(const char* filename, int page = 0) {
+      m_page = -1;
+      m_info = 0;
+      m_row = 0;
+      m_tiles = 0;
+      m_tif = TIFFOpen(filename, "r");
+      if (m_tif == 0)
+        throw std::runtime_error("TIFF Error opening file");
+      m_page_count = (int)TIFFNumberOfDirectories(m_tif);
+      try {
+        set_page(page);
+      } catch (std::exception&) {
+        TIFFClose(m_tif);
+        throw;
       }
-      char* data = (char *)buf;
+    }
+    ~TiffReader() {
+      free_page();
+      TIFFClose(m_tif);
+    }
+    ImageInfo& info() {
+      if (m_info == 0)
+        throw std::runtime_error("No page of the TIFF file is selected.");
+      return *m_info;
+    }
+    int page() const { return m_page; }
+    int page_count() const { return m_page_count; }
+    /*
+      Selects the page whose rows are read.  When the page can not be
+      read, no page is selected until another call succeeds.
+    */
+    void set_page(int page) {
+      // the current page stays selected when the page does not exist
+      if (page < 0 || page >= m_page_count)
+        throw std::range_error("The TIFF file has no such page.");
+      free_page();
+      m_page = -1;
+      if (page != (int)TIFFCurrentDirectory(m_tif))
+        tiff_set_page(m_tif, page);
+      m_info = tiff_directory_info(m_tif);
+      m_row = _TIFFmalloc(TIFFScanlineSize(m_tif));
+      if (m_row == 0) {
+        free_page();
+        throw std::runtime_error("TIFF Error allocating scanline");
+      }
+      if (TIFFIsTiled(m_tif)) {
+        TIFFGetField(m_tif, TIFFTAG_TILEWIDTH, &m_tile_width);
+        TIFFGetField(m_tif, TIFFTAG_TILELENGTH, &m_tile_length);
+        m_ntiles = (m_info->ncols() + m_tile_width - 1) / m_tile_width;
+        m_tiles = _TIFFmalloc(TIFFTileSize(m_tif) * m_ntiles);
+        m_tiles_row = 0;
+        m_have_tiles = false;
+        if (m_tiles == 0) {
+          free_page();
+          throw std::runtime_error("TIFF Error allocating tiles");
+        }
+      }
+      m_page = page;
+    }
+    /*
+      Returns the samples of the given row, as stored in the file.
+    */
+    const unsigned char* read_row(size_t row) {
+      if (m_tiles == 0) {
+        if (TIFFReadScanline(m_tif, m_row, (uint32)row) < 0)
+          throw std::runtime_error("TIFF Error reading scanline");
+        return (unsigned char*)m_row;
+      }
+      // decode the row of tiles that contains the row
+      uint32 tiles_row = (uint32)row - (uint32)row % m_tile_length;
+      tsize_t tile_size = TIFFTileSize(m_tif);
+      if (!m_have_tiles || tiles_row != m_tiles_row) {
+        m_have_tiles = false;
+        for (size_t i = 0; i < m_ntiles; i++)
+          if (TIFFReadTile(m_tif, (char*)m_tiles + i * tile_size,
+                           (uint32)(i * m_tile_width), tiles_row, 0, 0) < 0)
+            throw std::runtime_error("TIFF Error reading tile");
+        m_tiles_row = tiles_row;
+        m_have_tiles = true;
+      }
+      // and put the row together from the tiles
+      tsize_t tile_row_size = TIFFTileRowSize(m_tif);
+      tsize_t row_size = TIFFScanlineSize(m_tif);
+      for (size_t i = 0; i < m_ntiles; i++) {
+        tsize_t offset = i * tile_row_size;
+        memcpy((char*)m_row + offset,
+               (char*)m_tiles + i * tile_size + (row - tiles_row) * tile_row_size,
+               std::min(tile_row_size, row_size - offset));
+      }
+      return (unsigned char*)m_row;
+    }
+
+  private:
+    void free_page() {
+      if (m_tiles != 0)
+        _TIFFfree(m_tiles);
+      if (m_row != 0)
+        _TIFFfree(m_row);
+      delete m_info;
+      m_tiles = 0;
+      m_row = 0;
+      m_info = 0;
+    }
+
+    TIFF* m_tif;
+    int m_page, m_page_count;
+    ImageInfo* m_info;
+    tdata_t m_row;
+    tdata_t m_tiles;
+    uint32 m_tile_width, m_tile_length, m_tiles_row;
+    size_t m_ntiles;
+    bool m_have_tiles;
+  };
+
+  /*
+    Converts a row of samples to the pixels of a row of an image.
+  */
+  template<class Pixel>
+  struct tiff_row_loader {
+
+  };
+
+  template<>
+  struct tiff_row_loader<OneBitPixel> {
+    template<class T>
+    void operator()(T& matrix, size_t row, const unsigned char* data,
+                    ImageInfo& info) {
       std::bitset<8> bits;
       int tmp;
       for (size_t j = 0, k = 7, bit_index = 0; j < info.ncols(); j++, k--) {
@@ -121,113 +302,117 @@ namespace {
           else
             tmp = pixel_traits<OneBitPixel>::black();
         }
-        matrix.set(Point(j, i), tmp);
+        matrix.set(Point(j, row), tmp);
         if (k == 0)
           k = 8;
       }
     }
-    // do the cleanup
-    _TIFFfree(buf);
-    TIFFClose(tif);
-  }
+  };
 
-  template<class T>
-  void tiff_load_greyscale(T& matrix, ImageInfo& info, const char* filename) {
-    // open the image
-    TIFF* tif = TIFFOpen(filename, "r");
-    if (!tif) throw std::runtime_error("TIFF Error opening file");
-    tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
-    if (!buf) throw std::runtime_error("TIFF Error allocating scanline");
-    
-    typename T::row_iterator mi = matrix.row_begin();
-    typename T::col_iterator mj;
-    unsigned char* data;
-    if (info.inverted()) {
-      for (size_t i = 0; i < info.nrows(); i++, mi++) {
-        mj = mi.begin();
-        if (TIFFReadScanline(tif, buf, i) < 0) {
-          _TIFFfree(buf); TIFFClose(tif);
-          throw std::runtime_error("TIFF Error reading scanline");
-        }
-        data = (unsigned char *)buf;
-        for (size_t j = 0; j < info.ncols(); j++, mj++) {
+  template<>
+  struct tiff_row_loader<GreyScalePixel> {
+    template<class T>
+    void operator()(T& matrix, size_t row, const unsigned char* data,
+                    ImageInfo& info) {
+      typename T::col_iterator mj = (matrix.row_begin() + row).begin();
+      if (info.inverted()) {
+        for (size_t j = 0; j < info.ncols(); j++, mj++)
           *mj = 255 - data[j];
-        }
-      }
-    } else {
-      for (size_t i = 0; i < info.nrows(); i++, mi++) {
-        mj = mi.begin();
-        if (TIFFReadScanline(tif, buf, i) < 0) {
-          _TIFFfree(buf); TIFFClose(tif);
-          throw std::runtime_error("TIFF Error reading scanline");
-        }
-        data = (unsigned char *)buf;
-        for (size_t j = 0; j < info.ncols(); j++, mj++) {
+      } else {
+        for (size_t j = 0; j < info.ncols(); j++, mj++)
           *mj = data[j];
-        }
       }
     }
-    
-    // do the cleanup
-    _TIFFfree(buf);
-    TIFFClose(tif);
-  }
+  };
 
-  template<class T>
-  void tiff_load_grey16(T& matrix, ImageInfo& info, const char* filename) {
-    // open the image
-    TIFF* tif = TIFFOpen(filename, "r");
-    if (!tif) throw std::runtime_error("TIFF Error opening file");
-    tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
-    if (!buf) throw std::runtime_error("TIFF Error allocating scanline");
-    
-    typename T::row_iterator mi = matrix.row_begin();
-    typename T::col_iterator mj;
-    unsigned short* data;
-    for (size_t i = 0; i < info.nrows(); i++, mi++) {
-      mj = mi.begin();
-      if (TIFFReadScanline(tif, buf, i) < 0) {
-        _TIFFfree(buf); TIFFClose(tif);
-        throw std::runtime_error("TIFF Error reading scanline");
-      }
-      data = (unsigned short *)buf;
-      for (size_t j = 0; j < info.ncols(); j++, mj++) {
-        *mj = data[j];
-      }
+  template<>
+  struct tiff_row_loader<Grey16Pixel> {
+    template<class T>
+    void operator()(T& matrix, size_t row, const unsigned char* data,
+                    ImageInfo& info) {
+      typename T::col_iterator mj = (matrix.row_begin() + row).begin();
+      const unsigned short* samples = (const unsigned short*)data;
+      for (size_t j = 0; j < info.ncols(); j++, mj++)
+        *mj = samples[j];
     }
-    
-    // do the cleanup
-    _TIFFfree(buf);
-    TIFFClose(tif);
-  }
+  };
 
-  template<class T>
-  void tiff_load_rgb(T& matrix, ImageInfo& info, const char* filename) {
-    // open the image
-    TIFF* tif = TIFFOpen(filename, "r");
-    if (!tif) throw std::runtime_error("TIFF Error opening file");
-    tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
-    if (!buf) throw std::runtime_error("TIFF Error allocating scanline");
-    
-    typename T::row_iterator mi = matrix.row_begin();
-    typename T::col_iterator mj;
-    unsigned char* data;
-    for (size_t i = 0; i < info.nrows(); i++, mi++) {
-      mj = mi.begin();
-      if (TIFFReadScanline(tif, buf, i) < 0) {
-        _TIFFfree(buf); TIFFClose(tif);
-        throw std::runtime_error("TIFF Error reading scanline");
-      }
-      data = (unsigned char *)buf;
+  template<>
+  struct tiff_row_loader<RGBPixel> {
+    template<class T>
+    void operator()(T& matrix, size_t row, const unsigned char* data,
+                    ImageInfo& info) {
+      typename T::col_iterator mj = (matrix.row_begin() + row).begin();
       for (size_t j = 0; j < info.ncols() * 3; j += 3, mj++) {
         (*mj).red(data[j]);
         (*mj).green(data[j + 1]);
         (*mj).blue(data[j + 2]);
       }
     }
-    // do the cleanup
-    _TIFFfree(buf);
-    TIFFClose(tif);
+  };
+
+  /*
+    Loads the rows from first_row to the last row of the image (in page
+    coordinates) from the rows with the same numbers in the file.
+  */
+  template<class T>
+  Image* tiff_load_rows(T* image, TiffReader& reader, size_t first_row) {
+    tiff_row_loader<typename T::value_type> load_row;
+    image->resolution(reader.info().x_resolution());
+    try {
+      for (size_t row = first_row; row <= image->lr_y(); row++)
+        load_row(*image, row - image->ul_y(), reader.read_row(row),
+                 reader.info());
+    } catch (std::exception&) {
+      delete image->data();
+      delete image;
+      throw;
+    }
+    return image;
+  }
+
+  /*
+    Creates an image for the rows first_row to first_row + nrows - 1
+    of the TIFF file and loads the rows from first_load_row on (the
+    rows before are left to the caller).
+  */
+  Image* tiff_load_band(TiffReader& reader, size_t first_row, size_t nrows,
+                        size_t first_load_row, int storage,
+                        const char* mmap_file) {
+    ImageInfo& info = reader.info();
+    Point origin(0, first_row);
+    Dim dim(info.ncols(), nrows);
+    if (info.ncolors() == 1 && info.depth() == 1) {
+      if (storage == DENSE) {
+        typedef TypeIdImageFactory<ONEBIT, DENSE> fact_type;
+        return tiff_load_rows(fact_type::create(origin, dim, mmap_file),
+                              reader, first_load_row);
+      } else if (storage == PACKED) {
+        typedef TypeIdImageFactory<ONEBIT, PACKED> fact_type;
+        return tiff_load_rows(fact_type::create(origin, dim),
+                              reader, first_load_row);
+      } else {
+        typedef TypeIdImageFactory<ONEBIT, RLE> fact_type;
+        return tiff_load_rows(fact_type::create(origin, dim),
+                              reader, first_load_row);
+      }
+    }
+    if (storage != DENSE)
+      throw std::runtime_error("Pixel type must be OneBit to use RLE or PACKED data.");
+    if (info.ncolors() == 3) {
+      typedef TypeIdImageFactory<RGB, DENSE> fact_type;
+      return tiff_load_rows(fact_type::create(origin, dim, mmap_file),
+                            reader, first_load_row);
+    } else if (info.depth() == 8) {
+      typedef TypeIdImageFactory<GREYSCALE, DENSE> fact_type;
+      return tiff_load_rows(fact_type::create(origin, dim, mmap_file),
+                            reader, first_load_row);
+    } else if (info.depth() == 16) {
+      typedef TypeIdImageFactory<GREY16, DENSE> fact_type;
+      return tiff_load_rows(fact_type::create(origin, dim, mmap_file),
+                            reader, first_load_row);
+    }
+    throw std::runtime_error("Unable to load image of this type!");
   }
 
     template<class Pixel>
@@ -309,6 +494,9 @@ namespace {
     template<class T>
     void operator()(const T& matrix, TIFF* tif) {
       TIFFSetField(tif, TIFFTAG_PHOTOMETRIC, PHOTOMETRIC_MINISBLACK);
+      // Grey16 pixels are stored in 32 bit integers, but written as
+      // 16 bit samples
+      TIFFSetField(tif, TIFFTAG_BITSPERSAMPLE, 16);
       tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
       if (!buf)
         throw std::runtime_error("Error allocating scanline");
@@ -349,77 +537,86 @@ namespace {
   };
 }
 
-Image* load_tiff(const char* filename, int storage) {
-  TIFFErrorHandler saved_handler = TIFFSetErrorHandler(NULL);
-  ImageInfo* info = tiff_info(filename);
-  if (info->ncolors() == 1) {
-    if (info->depth() == 1) {
-      if (storage == DENSE) {
-        typedef TypeIdImageFactory<ONEBIT, DENSE> fact_type;
-        fact_type::image_type*
-          image = fact_type::create(Point(0, 0), Dim(info->ncols(), info->nrows()));
-        image->resolution(info->x_resolution());
-        tiff_load_onebit(*image, *info, filename);
-        delete info;
-        TIFFSetErrorHandler(saved_handler);
-        return image;
-      } else {
-        typedef TypeIdImageFactory<ONEBIT, RLE> fact_type;
-        fact_type::image_type*
-          image = fact_type::create(Point(0, 0), Dim(info->ncols(), info->nrows()));
-        image->resolution(info->x_resolution());
-        tiff_load_onebit(*image, *info, filename);
-        delete info;
-        TIFFSetErrorHandler(saved_handler);
-        return image;
-      }
-    }
-  }
-  if (storage == RLE) {
-    delete info;
-    TIFFSetErrorHandler(saved_handler);
-    throw std::runtime_error("Pixel type must be OneBit to use RLE data.");
-  }
-  if (info->ncolors() == 3) {
-    typedef TypeIdImageFactory<RGB, DENSE> fact;
-    fact::image_type* image =
-      fact::create(Point(0, 0), Dim(info->ncols(), info->nrows()));
-    tiff_load_rgb(*image, *info, filename);
-    delete info;
-    TIFFSetErrorHandler(saved_handler);
-    return image;
-  } else if (info->depth() == 8) {
-    typedef TypeIdImageFactory<GREYSCALE, DENSE> fact_type;
-    fact_type::image_type*
-      image = fact_type::create(Point(0, 0), Dim(info->ncols(), info->nrows()));
-    image->resolution(info->x_resolution());
-    tiff_load_greyscale(*image, *info, filename);
-    delete info;
-    TIFFSetErrorHandler(saved_handler);
-    return image;
-  } else if (info->depth() == 16) {
-    typedef TypeIdImageFactory<GREY16, DENSE> fact_type;
-    fact_type::image_type*
-      image = fact_type::create(Point(0, 0), Dim(info->ncols(), info->nrows()));
-    image->resolution(info->x_resolution());
-    tiff_load_greyscale(*image, *info, filename);
-    delete info;
-    TIFFSetErrorHandler(saved_handler);
-    return image;
+Image* load_tiff(const char* filename, int storage, const char* mmap_file,
+                 int page) {
+  // An empty mmap_file loads the image into main memory
+  if (*mmap_file == '\0')
+    mmap_file = 0;
+  else if (storage != DENSE)
+    throw std::runtime_error("Only images with storage format DENSE can be memory-mapped.");
+  TiffErrorsSilenced silenced;
+  // The file is decoded without the global interpreter lock, so that
+  // several files can be loaded in parallel by Python threads.
+  ReleaseGIL release_gil;
+  TiffReader reader(filename, page);
+  return tiff_load_band(reader, 0, reader.info().nrows(), 0,
+                        storage, mmap_file);
+}
+
+/*
+  Reading TIFF files in bands and page by page (see tiff_bands and
+  tiff_pages in tiff_support.py): the open file is passed to Python in
+  a capsule that closes the file when it is deleted.
+*/
+#define TIFF_READER_CAPSULE "gamera.tiff_support.TiffReader"
+
+static void tiff_reader_destructor(PyObject* capsule) {
+  delete (TiffReader*)PyCapsule_GetPointer(capsule, TIFF_READER_CAPSULE);
+}
+
+PyObject* _tiff_open(const char* filename) {
+  TiffErrorsSilenced silenced;
+  TiffReader* reader = new TiffReader(filename);
+  return PyCapsule_New((void*)reader, TIFF_READER_CAPSULE,
+                       tiff_reader_destructor);
+}
+
+int _tiff_page_count(PyObject* capsule) {
+  TiffReader* reader =
+    (TiffReader*)PyCapsule_GetPointer(capsule, TIFF_READER_CAPSULE);
+  if (reader == 0)
+    throw std::invalid_argument("Not an open TIFF file.");
+  return reader->page_count();
+}
+
+/*
+  Selects the page that _tiff_read_band reads, without reopening the
+  file.
+*/
+ImageInfo* _tiff_select_page(PyObject* capsule, int page) {
+  TiffReader* reader =
+    (TiffReader*)PyCapsule_GetPointer(capsule, TIFF_READER_CAPSULE);
+  if (reader == 0)
+    throw std::invalid_argument("Not an open TIFF file.");
+  if (page != reader->page()) {
+    TiffErrorsSilenced silenced;
+    reader->set_page(page);
   }
-  delete info;
-  TIFFSetErrorHandler(saved_handler);
-  throw std::runtime_error("Unable to load image of this type!");
-  return 0;
+  return new ImageInfo(reader->info());
 }
 
-template<class T>
-void save_tiff(const T& matrix, const char* filename) {
-  TIFF* tif = 0;
-  tif = TIFFOpen(filename, "w");
-  if (tif == 0)
-    throw std::invalid_argument("Failed to create image.");
+Image* _tiff_read_band(PyObject* capsule, int first_row, int nrows,
+                       int first_load_row, int storage) {
+  TiffReader* reader =
+    (TiffReader*)PyCapsule_GetPointer(capsule, TIFF_READER_CAPSULE);
+  if (reader == 0)
+    return 0;
+  if (first_row < 0 || nrows < 1 ||
+      (size_t)(first_row + nrows) > reader->info().nrows() ||
+      first_load_row < first_row || first_load_row > first_row + nrows)
+    throw std::range_error("The band must lie within the image.");
+  TiffErrorsSilenced silenced;
+  // see load_tiff
+  ReleaseGIL release_gil;
+  return tiff_load_band(*reader, first_row, nrows, first_load_row,
+                        storage, 0);
+}
 
+/*
+  Writes the image into the current directory of an open TIFF file.
+*/
+template<class T>
+void tiff_write_page(const T& matrix, TIFF* tif) {
   TIFFSetField(tif, TIFFTAG_IMAGEWIDTH, matrix.ncols());
   TIFFSetField(tif, TIFFTAG_IMAGELENGTH, matrix.nrows());
   TIFFSetField(tif, TIFFTAG_BITSPERSAMPLE, matrix.depth());
@@ -431,9 +628,80 @@ void save_tiff(const T& matrix, const char* filename) {
 
   tiff_saver<typename T::value_type> saver;
   saver(matrix, tif);
+}
+
+template<class T>
+void save_tiff(const T& matrix, const char* filename) {
+  TIFF* tif = 0;
+  tif = TIFFOpen(filename, "w");
+  if (tif == 0)
+    throw std::invalid_argument("Failed to create image.");
+
+  tiff_write_page(matrix, tif);
         
   TIFFClose(tif);
 }
 
+/*
+  Writing multi-page TIFF files (see save_tiff_pages in
+  tiff_support.py): every image is written as a page of its own into a
+  file that stays open between the pages.
+*/
+#define TIFF_WRITER_CAPSULE "gamera.tiff_support.TiffWriter"
+
+struct TiffWriter {
+  TIFF* tif;
+  int npages;
+};
+
+static void tiff_writer_destructor(PyObject* capsule) {
+  TiffWriter* writer =
+    (TiffWriter*)PyCapsule_GetPointer(capsule, TIFF_WRITER_CAPSULE);
+  if (writer->tif != 0)
+    TIFFClose(writer->tif);
+  delete writer;
+}
+
+PyObject* _tiff_open_writer(const char* filename) {
+  TiffWriter* writer = new TiffWriter;
+  writer->tif = TIFFOpen(filename, "w");
+  writer->npages = 0;
+  if (writer->tif == 0) {
+    delete writer;
+    throw std::invalid_argument("Failed to create image.");
+  }
+  return PyCapsule_New((void*)writer, TIFF_WRITER_CAPSULE,
+                       tiff_writer_destructor);
+}
+
+static TiffWriter* tiff_get_writer(PyObject* capsule) {
+  TiffWriter* writer =
+    (TiffWriter*)PyCapsule_GetPointer(capsule, TIFF_WRITER_CAPSULE);
+  if (writer == 0) {
+    PyErr_Clear();
+    throw std::invalid_argument("Not a TIFF file opened for writing.");
+  }
+  if (writer->tif == 0)
+    throw std::invalid_argument("The TIFF file is already closed.");
+  return writer;
+}
+
+template<class T>
+void _tiff_write_page(const T& matrix, PyObject* capsule) {
+  TiffWriter* writer = tiff_get_writer(capsule);
+  TIFFSetField(writer->tif, TIFFTAG_SUBFILETYPE, FILETYPE_PAGE);
+  TIFFSetField(writer->tif, TIFFTAG_PAGENUMBER, writer->npages, 0);
+  tiff_write_page(matrix, writer->tif);
+  if (!TIFFWriteDirectory(writer->tif))
+    throw std::runtime_error("TIFF Error writing page.");
+  ++writer->npages;
+}
+
+void _tiff_close_writer(PyObject* capsule) {
+  TiffWriter* writer = tiff_get_writer(capsule);
+  TIFFClose(writer->tif);
+  writer->tif = 0;
+}
+
 }
 #endif
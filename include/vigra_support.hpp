@@ -751,6 +751,26 @@ namespace Gamera {
     }
   };
 
+  template<>
+  struct choose_accessor<OneBitPackedImageView> {
+    typedef OneBitAccessor accessor;
+    static accessor make_accessor(const OneBitPackedImageView& mat) {
+      return accessor();
+    }
+    typedef RawOneBitAccessor raw_accessor;
+    static raw_accessor make_raw_accessor(const OneBitPackedImageView& mat) {
+      return raw_accessor();
+    }
+    typedef accessor real_accessor;
+    static real_accessor make_real_accessor(const OneBitPackedImageView& mat) {
+      return real_accessor();
+    }
+    typedef BilinearInterpolatingAccessor<raw_accessor, OneBitPixel> interp_accessor;
+    static interp_accessor make_interp_accessor(const OneBitPackedImageView& mat) {
+      return interp_accessor(make_raw_accessor(mat));
+    }
+  };
+
   template<>
   struct choose_accessor<StaticImage<OneBitPixel> > {
     typedef OneBitAccessor accessor;
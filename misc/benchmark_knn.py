@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+#
+# Copyright (C) 2026 Gamera developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+# Micro-benchmark for the non-interactive kNN classifier: measures the
+# classification throughput on a synthetic database of random feature
+# vectors. Run it against two builds to compare them, e.g.
+#
+#    python misc/benchmark_knn.py --vectors 100000 --features 100
+
+import sys
+import time
+import random
+import array
+from optparse import OptionParser
+
+from gamera.core import init_gamera, Image
+from gamera import knncore
+
+def make_glyphs(n, num_features, num_classes):
+   glyphs = []
+   for i in range(n):
+      glyph = Image((0, 0), (1, 1))
+      glyph.features = array.array(
+         'd', [random.random() for j in range(num_features)])
+      glyph.classify_manual("class%d" % random.randrange(num_classes))
+      glyphs.append(glyph)
+   return glyphs
+
+def main():
+   parser = OptionParser()
+   parser.add_option("--vectors", type="int", default=100000,
+                     help="number of feature vectors in the database")
+   parser.add_option("--features", type="int", default=100,
+                     help="number of features per feature vector")
+   parser.add_option("--queries", type="int", default=200,
+                     help="number of glyphs to classify")
+   parser.add_option("--classes", type="int", default=50,
+                     help="number of classes in the database")
+   parser.add_option("-k", type="int", default=3, dest="num_k",
+                     help="number of neighbors")
+   parser.add_option("--repeat", type="int", default=3,
+                     help="number of timing runs (the best run is reported)")
+   (options, args) = parser.parse_args()
+
+   init_gamera()
+   random.seed(42)
+   database = make_glyphs(options.vectors, options.features, options.classes)
+   queries = make_glyphs(options.queries, options.features, options.classes)
+
+   classifier = knncore.kNN()
+   classifier.num_features = options.features
+   classifier.num_k = options.num_k
+   start = time.time()
+   classifier.instantiate_from_images(database, False)
+   print "database: %d x %d, loaded in %.3fs" % \
+         (options.vectors, options.features, time.time() - start)
+
+   best = None
+   for i in range(options.repeat):
+      start = time.time()
+      for glyph in queries:
+         classifier.classify(glyph)
+      elapsed = time.time() - start
+      if best is None or elapsed < best:
+         best = elapsed
+   print "classify: %d glyphs in %.3fs (%.1f glyphs/s, %.1f M distances/s)" % \
+         (options.queries, best, options.queries / best,
+          options.queries * options.vectors / best / 1e6)
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+#
+# Copyright (C) 2026 Gamera developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+# Benchmark for loading images ahead: binarizes a list of image files
+# after loading them one after another with load_image and with
+# load_images with an increasing number of threads, e.g.
+#
+#    python misc/benchmark_load_images.py --prefetch 4 pages/*.tif
+
+import time
+from optparse import OptionParser
+
+from gamera.core import init_gamera, load_image, load_images, ONEBIT, DENSE
+
+def process(image):
+   if image.data.pixel_type != ONEBIT:
+      image = image.to_greyscale().otsu_threshold()
+   image.cc_analysis()
+
+def run(images):
+   start = time.time()
+   for image in images:
+      process(image)
+   return time.time() - start
+
+def main():
+   parser = OptionParser(usage="%prog [options] image...")
+   parser.add_option("--prefetch", type="int", default=4,
+                     help="number of images that are loaded ahead")
+   parser.add_option("--threads", type="int", default=4,
+                     help="maximal number of threads")
+   (options, filenames) = parser.parse_args()
+   if not filenames:
+      parser.error("at least one image is required")
+
+   init_gamera()
+   print "%d files" % len(filenames)
+   print "%18s %10.1f" % ("load_image [ms]", run(
+      load_image(filename) for filename in filenames) * 1000.0)
+   threads = 1
+   while threads <= options.threads:
+      print "%18s %10.1f" % ("%d thr [ms]" % threads, run(
+         load_images(filenames, DENSE, options.prefetch, threads)) * 1000.0)
+      threads *= 2
+
+if __name__ == "__main__":
+   main()
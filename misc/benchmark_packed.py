@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+#
+# Copyright (C) 2026 Gamera developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+# Micro-benchmark for the bit-packed storage format: measures the logical
+# operations, invert, black_area and the projections of a onebit image
+# for the DENSE and the PACKED storage format, e.g.
+#
+#    python misc/benchmark_packed.py tests/data/testline.png --repeat 5
+
+import time
+from optparse import OptionParser
+
+from gamera.core import init_gamera, load_image, DENSE, PACKED
+
+OPERATIONS = [
+   ("and_image", lambda a, b: a.and_image(b, True)),
+   ("or_image", lambda a, b: a.or_image(b, True)),
+   ("xor_image", lambda a, b: a.xor_image(b, True)),
+   ("invert", lambda a, b: a.invert()),
+   ("black_area", lambda a, b: a.black_area()),
+   ("projection_rows", lambda a, b: a.projection_rows()),
+   ("projection_cols", lambda a, b: a.projection_cols())]
+
+def best_time(function, repeat):
+   best = None
+   for i in range(repeat):
+      start = time.time()
+      function()
+      elapsed = time.time() - start
+      if best is None or elapsed < best:
+         best = elapsed
+   return best
+
+def main():
+   parser = OptionParser(usage="%prog [options] onebit_image")
+   parser.add_option("--repeat", type="int", default=3,
+                     help="number of timing runs (the best run is reported)")
+   (options, args) = parser.parse_args()
+   if len(args) != 1:
+      parser.error("a onebit image is required")
+
+   init_gamera()
+   image = load_image(args[0])
+   print "%d x %d pixels" % (image.ncols, image.nrows)
+   print "%16s %12s %12s" % ("operation", "dense [ms]", "packed [ms]")
+   for name, operation in OPERATIONS:
+      times = []
+      for storage in (DENSE, PACKED):
+         a = image.image_copy(storage)
+         b = image.image_copy(storage)
+         times.append(best_time(lambda: operation(a, b), options.repeat))
+      print "%16s %12.3f %12.3f" % (name, times[0] * 1000.0, times[1] * 1000.0)
+
+if __name__ == "__main__":
+   main()
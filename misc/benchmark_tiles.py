@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+#
+# Copyright (C) 2026 Gamera developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+# Benchmark for tiled processing: applies some local filters to a
+# greyscale image as a whole and tile by tile with an increasing number
+# of threads, e.g.
+#
+#    python misc/benchmark_tiles.py page.png --tile-size 512 --threads 4
+
+import time
+from optparse import OptionParser
+
+from gamera.core import init_gamera, load_image
+from gamera.tiles import TiledImage
+
+FILTERS = [
+   ("mean_filter", (9,)),
+   ("sauvola_threshold", (31,)),
+   ("bernsen_threshold", (0, 11)),
+   ("rank", (13, 5)),
+   ("min_max_filter", (9,))]
+
+def best_time(function, repeat):
+   best = None
+   for i in range(repeat):
+      start = time.time()
+      function()
+      elapsed = time.time() - start
+      if best is None or elapsed < best:
+         best = elapsed
+   return best
+
+def main():
+   parser = OptionParser(usage="%prog [options] image")
+   parser.add_option("--tile-size", type="int", default=512,
+                     help="width and height of the tiles")
+   parser.add_option("--threads", type="int", default=4,
+                     help="maximal number of threads")
+   parser.add_option("--repeat", type="int", default=3,
+                     help="number of timing runs (the best run is reported)")
+   (options, args) = parser.parse_args()
+   if len(args) != 1:
+      parser.error("an image is required")
+
+   init_gamera()
+   image = load_image(args[0]).to_greyscale()
+   tiled = TiledImage(image, options.tile_size)
+   threads = [1]
+   while threads[-1] * 2 <= options.threads:
+      threads.append(threads[-1] * 2)
+   print "%d x %d pixels, %d tiles" % (image.ncols, image.nrows, len(tiled))
+   print "%18s %12s" % ("filter", "whole [ms]") + \
+       "".join(["%9s [ms]" % ("%d thr" % n) for n in threads])
+   for name, filter_args in FILTERS:
+      times = [best_time(lambda: getattr(image, name)(*filter_args),
+                         options.repeat)]
+      for n in threads:
+         times.append(best_time(lambda: tiled.apply(name, filter_args, n),
+                                options.repeat))
+      print "%18s" % name + "".join(["%14.1f" % (t * 1000.0) for t in times])
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+#
+# Copyright (C) 2026 Gamera developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+# Micro-benchmark for the zernike_moments feature: measures the time per
+# glyph for random glyphs of several sizes, both for dense and for
+# run-length encoded images. Run it against two builds to compare them, e.g.
+#
+#    python misc/benchmark_zernike.py --sizes 16,32,64,128
+
+import time
+import random
+from optparse import OptionParser
+
+from gamera.core import init_gamera, Image, Dim, ONEBIT, RLE
+
+def make_glyph(size, density):
+   # a filled disc with random holes, to resemble a glyph
+   glyph = Image((0, 0), Dim(size, size), ONEBIT)
+   center = (size - 1) / 2.0
+   for y in range(size):
+      for x in range(size):
+         if ((x - center) ** 2 + (y - center) ** 2 <= center ** 2 and
+             random.random() < density):
+            glyph.set((x, y), 1)
+   return glyph
+
+def main():
+   parser = OptionParser()
+   parser.add_option("--sizes", default="8,16,32,64,128,256",
+                     help="comma separated glyph sizes (width and height)")
+   parser.add_option("--glyphs", type="int", default=20,
+                     help="number of glyphs per size")
+   parser.add_option("--density", type="float", default=0.8,
+                     help="fraction of black pixels within the glyph")
+   parser.add_option("--repeat", type="int", default=3,
+                     help="number of timing runs (the best run is reported)")
+   (options, args) = parser.parse_args()
+
+   init_gamera()
+   random.seed(42)
+   print "%8s %14s %14s" % ("size", "dense [ms]", "RLE [ms]")
+   for size in [int(x) for x in options.sizes.split(",")]:
+      dense = [make_glyph(size, options.density)
+               for i in range(options.glyphs)]
+      rle = [glyph.image_copy(RLE) for glyph in dense]
+      times = []
+      for glyphs in (dense, rle):
+         best = None
+         for i in range(options.repeat):
+            start = time.time()
+            for glyph in glyphs:
+               glyph.zernike_moments()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+               best = elapsed
+         times.append(best * 1000.0 / len(glyphs))
+      print "%8d %14.3f %14.3f" % (size, times[0], times[1])
+
+if __name__ == "__main__":
+   main()
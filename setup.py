@@ -86,10 +86,10 @@ f = open("gamera/__compiletime_config__.py", "w")
 f.write("# automatically generated configuration at compile time\n")
 if has_openmp:
     f.write("has_openmp = True\n")
-    print "Compiling genetic algorithms with parallelization (OpenMP)"
+    print "Compiling genetic algorithms and kNN classification with parallelization (OpenMP)"
 else:
     f.write("has_openmp = False\n")
-    print "Compiling genetic algorithms without parallelization (OpenMP)"
+    print "Compiling genetic algorithms and kNN classification without parallelization (OpenMP)"
 f.close()
 
 from distutils.core import setup, Extension
@@ -192,6 +192,12 @@ else:
                       libraries=galibraries,
                       extra_compile_args=["-Wall"]
                       )
+knncore_extras = dict(gamera_setup.extras)
+if has_openmp:
+    knncore_extras['extra_compile_args'] = \
+        knncore_extras.get('extra_compile_args', []) + ["-fopenmp"]
+    knncore_extras['extra_link_args'] = \
+        knncore_extras.get('extra_link_args', []) + ["-fopenmp"]
 
 
 extensions = [Extension("gamera.gameracore",
@@ -215,7 +221,7 @@ extensions = [Extension("gamera.gameracore",
               Extension("gamera.knncore", 
                         ["src/knncoremodule.cpp"],
                         include_dirs=["include", "src"],
-                        **gamera_setup.extras
+                        **knncore_extras
                         ),
               ExtGA,
               Extension("gamera.graph", graph_files,
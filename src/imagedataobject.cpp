@@ -37,6 +37,7 @@ extern "C" {
   static PyObject* imagedata_get_mbytes(PyObject* self);
   static PyObject* imagedata_get_pixel_type(PyObject* self);
   static PyObject* imagedata_get_storage_format(PyObject* self);
+  static PyObject* imagedata_get_mmap_file(PyObject* self);
   static int imagedata_set_page_offset_x(PyObject* self, PyObject* v);
   static int imagedata_set_page_offset_y(PyObject* self, PyObject* v);
   static int imagedata_set_nrows(PyObject* self, PyObject* v);
@@ -73,6 +74,8 @@ static PyGetSetDef imagedata_getset[] = {
     (char *)"(int property get/set)\n\nThe type of the pixels.  See `pixel types`__ for more info.\n\n.. __: image_types.html#pixel-types", 0 },
   { (char *)"storage_format", (getter)imagedata_get_storage_format, 0,
     (char *)"(int property get/set)\n\nThe format of the storage.  See `storage formats`__ for more info.\n\n.. __: image_types.html#storage-formats", 0 },
+  { (char *)"mmap_file", (getter)imagedata_get_mmap_file, 0,
+    (char *)"(string property get)\n\nThe name of the file the data is memory-mapped to, an empty string for a scratch file, or None if the data is in main memory.  See `memory-mapped images`__ for more info.\n\n.. __: image_types.html#memory-mapped-images", 0 },
   { NULL }
 };
 
@@ -134,7 +137,12 @@ static void imagedata_dealloc(PyObject* self) {
 
 #define CREATE_SET_FUNC(name) static int imagedata_set_##name(PyObject* self, PyObject* value) {\
   ImageDataBase* x = ((ImageDataObject*)self)->m_x; \
-  x->name((size_t)PyInt_AS_LONG(value)); \
+  try { \
+    x->name((size_t)PyInt_AS_LONG(value)); \
+  } catch (std::exception& e) { \
+    PyErr_SetString(PyExc_RuntimeError, e.what()); \
+    return -1; \
+  } \
   return 0; \
 }
 
@@ -164,6 +172,15 @@ static PyObject* imagedata_get_storage_format(PyObject* self) {
   return Py_BuildValue(CHAR_PTR_CAST "i", ((ImageDataObject*)self)->m_storage_format);
 }
 
+static PyObject* imagedata_get_mmap_file(PyObject* self) {
+  MappedFile* x = dynamic_cast<MappedFile*>(((ImageDataObject*)self)->m_x);
+  if (x == 0) {
+    Py_INCREF(Py_None);
+    return Py_None;
+  }
+  return PyString_FromStringAndSize(x->filename().data(), x->filename().size());
+}
+
 static PyObject* imagedata_dimensions(PyObject* self, PyObject* args) {
   ImageDataBase* x = ((ImageDataObject*)self)->m_x;
   int num_args = PyTuple_GET_SIZE(args);
@@ -171,7 +188,12 @@ static PyObject* imagedata_dimensions(PyObject* self, PyObject* args) {
     PyObject* py_dim;
     if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &py_dim)) {
       if (is_DimObject(py_dim)) {
-	x->dim(*(((DimObject*)py_dim)->m_x));
+	try {
+	  x->dim(*(((DimObject*)py_dim)->m_x));
+	} catch (std::exception& e) {
+	  PyErr_SetString(PyExc_RuntimeError, e.what());
+	  return 0;
+	}
 	Py_INCREF(Py_None);
 	return Py_None;
       }
@@ -226,6 +248,8 @@ void init_ImageDataType(PyObject* module_dict) {
 		       Py_BuildValue(CHAR_PTR_CAST "i", DENSE));
   PyDict_SetItemString(module_dict, "RLE",
 		       Py_BuildValue(CHAR_PTR_CAST "i", RLE));
+  PyDict_SetItemString(module_dict, "PACKED",
+		       Py_BuildValue(CHAR_PTR_CAST "i", PACKED));
 }
 
 
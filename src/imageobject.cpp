@@ -217,7 +217,7 @@ static PyMethodDef image_methods[] = {
 };
 
 static PyObject* _image_new(PyTypeObject* pytype, const Point& offset, const Dim& dim,
-                            int pixel, int format) {
+                            int pixel, int format, const char* mmap_file = NULL) {
   /*
     This is looks really awful, but it is not. We are simply creating a
     matrix view and some matrix data based on the pixel type and storage
@@ -232,34 +232,33 @@ static PyObject* _image_new(PyTypeObject* pytype, const Point& offset, const Dim
   Rect* image = NULL;
   try {
     if (format == DENSE) {
+      // A memory-mapped MappedImageData is still an ImageData
+      py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format, mmap_file);
+      if (py_data == NULL)
+        return NULL;
       if (pixel == ONEBIT) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
         ImageData<OneBitPixel>* data = (ImageData<OneBitPixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<OneBitPixel> >(*data, offset, dim);
       } else if (pixel == GREYSCALE) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
         ImageData<GreyScalePixel>* data = (ImageData<GreyScalePixel>*)(py_data->m_x);
         image = (Rect *)new ImageView<ImageData<GreyScalePixel> >(*data, offset, dim);
       } else if (pixel == GREY16) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
         ImageData<Grey16Pixel>* data = (ImageData<Grey16Pixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<Grey16Pixel> >(*data, offset, dim);
       } else if (pixel == Gamera::FLOAT) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
         ImageData<FloatPixel>* data = (ImageData<FloatPixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<FloatPixel> >(*data, offset, dim);
       } else if (pixel == RGB) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
         ImageData<RGBPixel>* data = (ImageData<RGBPixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<RGBPixel> >(*data, offset, dim);
       } else if (pixel == Gamera::COMPLEX) {
-        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
         ImageData<ComplexPixel>* data = (ImageData<ComplexPixel>*)(py_data->m_x);
         image = (Rect*)new ImageView<ImageData<ComplexPixel> >(*data, offset, dim);
-      } else {
-        PyErr_Format(PyExc_TypeError, "Unknown pixel type '%d'.", pixel);
-        return NULL;
       }
+    } else if (mmap_file != NULL) {
+      PyErr_SetString(PyExc_TypeError,
+                      "Only images with storage format DENSE can be memory-mapped.");
+      return NULL;
     } else if (format == RLE) {
       if (pixel == ONEBIT) {
         py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
@@ -270,6 +269,16 @@ static PyObject* _image_new(PyTypeObject* pytype, const Point& offset, const Dim
                         "Pixel type must be ONEBIT if storage format is RLE.");
         return NULL;
       }
+    } else if (format == PACKED) {
+      if (pixel == ONEBIT) {
+        py_data = (ImageDataObject*)create_ImageDataObject(dim, offset, pixel, format);
+        PackedImageData<OneBitPixel>* data = (PackedImageData<OneBitPixel>*)(py_data->m_x);
+        image = (Rect*)new ImageView<PackedImageData<OneBitPixel> >(*data, offset, dim);
+      } else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT if storage format is PACKED.");
+        return NULL;
+      }
     } else {
       PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.");
       return NULL;
@@ -293,17 +302,43 @@ static PyObject* _image_new(PyTypeObject* pytype, const Point& offset, const Dim
   return o2;
 }
 
+/*
+  Converts the mmap_file argument of the Image constructor to the
+  argument of create_ImageDataObject: None and False keep the image data
+  on the heap (NULL), True maps it to a scratch file in the temporary
+  directory ("") and a string is the name of a cache file or of a
+  directory for the scratch file.
+*/
+static bool coerce_mmap_file(PyObject* py_mmap_file, const char** mmap_file) {
+  if (py_mmap_file == NULL || py_mmap_file == Py_None || py_mmap_file == Py_False)
+    *mmap_file = NULL;
+  else if (py_mmap_file == Py_True)
+    *mmap_file = "";
+  else if (PyString_Check(py_mmap_file))
+    *mmap_file = PyString_AsString(py_mmap_file);
+  else {
+    PyErr_SetString(PyExc_TypeError,
+                    "mmap_file must be a filename, a directory name, True or None.");
+    return false;
+  }
+  return true;
+}
+
 static PyObject* image_new(PyTypeObject* pytype, PyObject* args,
                            PyObject* kwds) {
   int num_args = PyTuple_GET_SIZE(args);
+  const char* mmap_file = NULL;
 
   if (num_args >= 2 && num_args <= 4) {
     PyObject* a = NULL;
     PyObject* b = NULL;
     int pixel = 0;
     int format = 0;
-    static const char *kwlist[] = {"a", "b", "pixel_type", "storage_format", NULL};
-    if (PyArg_ParseTupleAndKeywords(args, kwds, (char *)"OO|ii", (char **)kwlist, &a, &b, &pixel, &format)) {
+    PyObject* py_mmap_file = NULL;
+    static const char *kwlist[] = {"a", "b", "pixel_type", "storage_format", "mmap_file", NULL};
+    if (PyArg_ParseTupleAndKeywords(args, kwds, (char *)"OO|iiO", (char **)kwlist, &a, &b, &pixel, &format, &py_mmap_file)) {
+      if (!coerce_mmap_file(py_mmap_file, &mmap_file))
+        return 0;
       Point point_a;
       try {
         point_a = coerce_Point(a);
@@ -315,17 +350,17 @@ static PyObject* image_new(PyTypeObject* pytype, PyObject* args,
         Point point_b = coerce_Point(b);
         int ncols = point_b.x() - point_a.x() + 1;
         int nrows = point_b.y() - point_a.y() + 1;
-        return _image_new(pytype, point_a, Dim(ncols, nrows), pixel, format);
+        return _image_new(pytype, point_a, Dim(ncols, nrows), pixel, format, mmap_file);
       } catch (std::invalid_argument e) {
         PyErr_Clear();
         if (is_SizeObject(b)) {
           Size* size_b = ((SizeObject*)b)->m_x;
           int nrows = size_b->height() + 1;
           int ncols = size_b->width() + 1;
-          return _image_new(pytype, point_a, Dim(ncols, nrows), pixel, format);
+          return _image_new(pytype, point_a, Dim(ncols, nrows), pixel, format, mmap_file);
         } else if (is_DimObject(b)) {
           Dim* dim_b = ((DimObject*)b)->m_x;
-          return _image_new(pytype, point_a, *dim_b, pixel, format);
+          return _image_new(pytype, point_a, *dim_b, pixel, format, mmap_file);
         }
 #ifdef GAMERA_DEPRECATED
           else if (is_DimensionsObject(b)) {
@@ -354,9 +389,12 @@ static PyObject* image_new(PyTypeObject* pytype, PyObject* args,
     PyObject* src = NULL;
     int pixel = -1;
     int format = -1;
-    static const char *kwlist[] = {"image", "pixel_type", "storage_format", NULL};
-    if (PyArg_ParseTupleAndKeywords(args, kwds, (char *)"O|ii", (char **)kwlist,
-                                    &src, &pixel, &format)) {
+    PyObject* py_mmap_file = NULL;
+    static const char *kwlist[] = {"image", "pixel_type", "storage_format", "mmap_file", NULL};
+    if (PyArg_ParseTupleAndKeywords(args, kwds, (char *)"O|iiO", (char **)kwlist,
+                                    &src, &pixel, &format, &py_mmap_file)) {
+      if (!coerce_mmap_file(py_mmap_file, &mmap_file))
+        return 0;
       if (is_RectObject(src)) {
         Rect* rect = ((RectObject*)src)->m_x;
         if (is_ImageObject(src)) {
@@ -373,7 +411,7 @@ static PyObject* image_new(PyTypeObject* pytype, PyObject* args,
           if (format == -1)
             format = 0;
         }
-        return _image_new(pytype, rect->origin(), rect->dim(), pixel, format);
+        return _image_new(pytype, rect->origin(), rect->dim(), pixel, format, mmap_file);
       }
     }
   }
@@ -460,6 +498,16 @@ static PyObject* _sub_image_new(PyTypeObject* pytype, PyObject* py_src, const Po
                         "Pixel type must be ONEBIT if storage format is RLE.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
         return NULL;
       }
+    } else if (format == PACKED) {
+      if (pixel == ONEBIT) {
+        PackedImageData<OneBitPixel>* data =
+          ((PackedImageData<OneBitPixel>*)((ImageDataObject*)src->m_data)->m_x);
+        subimage = (Rect *)new ImageView<PackedImageData<OneBitPixel> >(*data, offset, dim);
+      } else {
+        PyErr_SetString(PyExc_TypeError,
+                        "Pixel type must be ONEBIT if storage format is PACKED.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
+        return NULL;
+      }
     } else {
       PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.  Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
       return NULL;
@@ -590,6 +638,9 @@ static PyObject* _cc_new(PyTypeObject* pytype, PyObject* py_src, int label,
       RleImageData<OneBitPixel>* data =
         ((RleImageData<OneBitPixel>*)((ImageDataObject*)src->m_data)->m_x);
       cc = (Rect*)new ConnectedComponent<RleImageData<OneBitPixel> >(*data, label, offset, dim);
+    } else if (format == PACKED) {
+      PyErr_SetString(PyExc_TypeError, "Cc objects cannot be created from PACKED images, since they cannot store labels.");
+      return NULL;
     } else {
       PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination.   Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
       return NULL;
@@ -769,6 +820,8 @@ static PyObject* image_get(PyObject* self, const Point& point) {
     return PyInt_FromLong(((MlCc*)o->m_x)->get(point));
   } else if (od->m_storage_format == RLE) {
     return PyInt_FromLong(((OneBitRleImageView*)o->m_x)->get(point));
+  } else if (od->m_storage_format == PACKED) {
+    return PyInt_FromLong(((OneBitPackedImageView*)o->m_x)->get(point));
   } else {
     switch (od->m_pixel_type) {
     case Gamera::FLOAT:
@@ -833,6 +886,13 @@ static PyObject* image_set(PyObject* self, const Point& point, PyObject* value)
     }
     ((OneBitRleImageView*)o->m_x)->set(point,
                                        (OneBitPixel)PyInt_AS_LONG(value));
+  } else if (od->m_storage_format == PACKED) {
+    if (!PyInt_Check(value)) {
+      PyErr_SetString(PyExc_TypeError, "Pixel value for OneBit objects must be an int.");
+      return 0;
+    }
+    ((OneBitPackedImageView*)o->m_x)->set(point,
+                                          (OneBitPixel)PyInt_AS_LONG(value));
   } else if (od->m_pixel_type == RGB) {
     if (!is_RGBPixelObject((PyObject*)value)) {
       PyErr_SetString(PyExc_TypeError, "Pixel value for RGB objects must be an RGBPixel");
@@ -1644,6 +1704,9 @@ static PyObject* _mlcc_new(PyTypeObject* pytype, PyObject* py_src, int label, co
     } else if (format == RLE) {
       PyErr_SetString(PyExc_TypeError, "MultiLabelCCs cannot be used with runline length encoding.");
       return NULL;
+    } else if (format == PACKED) {
+      PyErr_SetString(PyExc_TypeError, "MultiLabelCCs cannot be used with bit-packed storage.");
+      return NULL;
     } else {
       PyErr_SetString(PyExc_TypeError, "Unknown pixel type/storage format combination. Receiving this error indicates an internal inconsistency or memory corruption.  Please report it on the Gamera mailing list.");
       return NULL;
@@ -1903,7 +1966,14 @@ void init_ImageType(PyObject* module_dict) {
 "*storage_format*\n"
 "  An integer value specifying the method used to store the image data.\n"
 "  See `storage formats`__ for more information.\n\n"
-".. __: image_types.html#storage-formats\n";
+".. __: image_types.html#storage-formats\n\n"
+"*mmap_file* (keyword only)\n"
+"  If given, the image data (which must be ``DENSE``) is stored in a\n"
+"  memory-mapped file instead of main memory: either the name of a\n"
+"  cache file, the name of a directory for an anonymous scratch file,\n"
+"  or ``True`` for a scratch file in the temporary directory.\n"
+"  See `memory-mapped images`__ for more information.\n\n"
+".. __: image_types.html#memory-mapped-images\n";
   PyType_Ready(&ImageType);
   PyDict_SetItemString(module_dict, "Image", (PyObject*)&ImageType);
 
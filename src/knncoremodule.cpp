@@ -33,6 +33,7 @@
 #include <algorithm>
 #include <vector>
 #include <map>
+#include <string>
 #include <string.h>
 #include <assert.h>
 #include <stdio.h>
@@ -42,6 +43,21 @@
 // exception handling
 #include <stdexcept>
 
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+// memory mapping of snapshot files
+#ifdef _WIN32
+#define NOMINMAX
+#include <windows.h>
+#else
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#endif
+
 using namespace Gamera;
 using namespace Gamera::kNN;
 
@@ -61,16 +77,25 @@ extern "C" {
                            PyObject* kwds);
   static void knn_dealloc(PyObject* self);
   static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args);
+  static PyObject* knn_insert_from_image(PyObject* self, PyObject* args);
+  static PyObject* knn_update_from_image(PyObject* self, PyObject* args);
+  static PyObject* knn_remove_feature_vector(PyObject* self, PyObject* args);
+  static PyObject* knn_update_id_names(PyObject* self, PyObject* args);
   // classification
   static PyObject* knn_classify(PyObject* self, PyObject* args);
+  static PyObject* knn_classify_many(PyObject* self, PyObject* args);
   static PyObject* knn_classify_with_images(PyObject* self, PyObject* args);
   static PyObject* knn_leave_one_out(PyObject* self, PyObject* args);
+  static PyObject* knn_stratified_kfold(PyObject* self, PyObject* args);
+  static PyObject* knn_edit_mnn(PyObject* self, PyObject* args);
+  static PyObject* knn_edit_cnn(PyObject* self, PyObject* args);
   // distance
   static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args);
   static PyObject* knn_distance_from_images(PyObject* self, PyObject* args);
   static PyObject* knn_distance_between_images(PyObject* self, PyObject* args);
   static PyObject* knn_distance_matrix(PyObject* self, PyObject* args);
   static PyObject* knn_unique_distances(PyObject* self, PyObject* args);
+  static PyObject* knn_distances_into(PyObject* self, PyObject* args);
   // settings
   static PyObject* knn_get_num_k(PyObject* self);
   static int knn_set_num_k(PyObject* self, PyObject* v);
@@ -84,9 +109,19 @@ extern "C" {
   static PyObject* knn_set_weights(PyObject* self, PyObject* args);
   static PyObject* knn_get_num_features(PyObject* self);
   static int knn_set_num_features(PyObject* self, PyObject* v);
+  static PyObject* knn_get_use_index(PyObject* self);
+  static int knn_set_use_index(PyObject* self, PyObject* v);
+  static PyObject* knn_get_index_build_time(PyObject* self);
+  static PyObject* knn_get_single_precision(PyObject* self);
+  static int knn_set_single_precision(PyObject* self, PyObject* v);
+  static PyObject* knn_get_num_threads(PyObject* self);
+  static int knn_set_num_threads(PyObject* self, PyObject* v);
   // saving/loading
   static PyObject* knn_serialize(PyObject* self, PyObject* args);
   static PyObject* knn_unserialize(PyObject* self, PyObject* args);
+  static PyObject* knn_save_snapshot(PyObject* self, PyObject* args);
+  static PyObject* knn_load_snapshot(PyObject* self, PyObject* args);
+  static PyObject* knn_is_snapshot(PyObject* self, PyObject* args);
 }
 
 PyMethodDef knn_methods[] = {
@@ -103,10 +138,28 @@ PyMethodDef knn_methods[] = {
   },
   { (char *)"instantiate_from_images", knn_instantiate_from_images, METH_VARARGS,
     (char *)"Use the list of images for non-interactive classification." },
+  { (char *)"insert_from_image", knn_insert_from_image, METH_VARARGS,
+    (char *)"int **insert_from_image** (Image *glyph*)\n\n"
+    "Adds the feature vector and class name of *glyph* to the data created by\n"
+    "instantiate_from_images and returns its row. This takes amortized constant\n"
+    "time; the normalization is updated from running sums." },
+  { (char *)"update_from_image", knn_update_from_image, METH_VARARGS,
+    (char *)"**update_from_image** (int *row*, Image *glyph*)\n\n"
+    "Replaces the feature vector and class name in *row* with those of *glyph*." },
+  { (char *)"remove_feature_vector", knn_remove_feature_vector, METH_VARARGS,
+    (char *)"**remove_feature_vector** (int *row*)\n\n"
+    "Removes the feature vector in *row*. The last feature vector is moved\n"
+    "into its place, so that this takes constant time." },
+  { (char *)"update_id_names", knn_update_id_names, METH_VARARGS,
+    (char *)"int **update_id_names** (ImageList *glyphs*)\n\n"
+    "Reads the class names of *glyphs*, the glyph of every row in order, again\n"
+    "and replaces those that have changed since the rows were created. Returns\n"
+    "the number of replaced class names." },
   { (char *)"_distance_from_images", knn_distance_from_images, METH_VARARGS, (char *)"" },
   { (char *)"_distance_between_images", knn_distance_between_images, METH_VARARGS, (char *)"" },
   { (char *)"_distance_matrix", knn_distance_matrix, METH_VARARGS, (char *)"" },
   { (char *)"_unique_distances", knn_unique_distances, METH_VARARGS, (char *)"" },
+  { (char *)"_distances_into", knn_distances_into, METH_VARARGS, (char *)"" },
   { (char *)"set_selections", knn_set_selections, METH_VARARGS,
     (char *)"Set the feature selection used for classification."},
   { (char *)"get_selections", knn_get_selections, METH_VARARGS,
@@ -117,11 +170,27 @@ PyMethodDef knn_methods[] = {
     (char *)"Get the weights used for classification." },
   { (char *)"classify", knn_classify, METH_VARARGS,
     (char *)"" },
+  { (char *)"classify_many", knn_classify_many, METH_VARARGS,
+    (char *) "[(id_name, confidencemap), ...] **classify_many** (ImageList *glyphs*)\n"
+    "\nClassifies all *glyphs* using the data created by instantiate_from_images.\n"
+    "The glyphs are classified without setting their classification, and the\n"
+    "return value is a list with a tuple ``(id_name,confidencemap)`` for each\n"
+    "glyph, which is the same as the result of ``classify``. The features of\n"
+    "the glyphs must already have been generated.\n\n"
+    "The distance computations are done with the global interpreter lock\n"
+    "released, and split over *num_threads* threads when Gamera was compiled\n"
+    "with OpenMP support."
+  },
   { (char *)"leave_one_out", knn_leave_one_out, METH_VARARGS, (char *)"" },
+  { (char *)"_stratified_kfold", knn_stratified_kfold, METH_VARARGS, (char *)"" },
+  { (char *)"_edit_mnn", knn_edit_mnn, METH_VARARGS, (char *)"" },
+  { (char *)"_edit_cnn", knn_edit_cnn, METH_VARARGS, (char *)"" },
   { (char *)"_knndistance_statistics", knn_knndistance_statistics, METH_VARARGS,
     (char *)"" },
   { (char *)"serialize", knn_serialize, METH_VARARGS, (char *)"" },
   { (char *)"unserialize", knn_unserialize, METH_VARARGS, (char *)"" },
+  { (char *)"save_snapshot", knn_save_snapshot, METH_VARARGS, (char *)"" },
+  { (char *)"load_snapshot", knn_load_snapshot, METH_VARARGS, (char *)"" },
   { NULL }
 };
 
@@ -134,6 +203,15 @@ PyGetSetDef knn_getset[] = {
     (char *)"The types of confidences computed during classification.", 0 },
   { (char *)"num_features", (getter)knn_get_num_features, (setter)knn_set_num_features,
     (char *)"The current number of features.", 0 },
+  { (char *)"use_index", (getter)knn_get_use_index, (setter)knn_set_use_index,
+    (char *)"Whether a kd-tree index is used for non-interactive classification.", 0 },
+  { (char *)"index_build_time", (getter)knn_get_index_build_time, 0,
+    (char *)"The time in seconds it took to build the kd-tree index.", 0 },
+  { (char *)"single_precision", (getter)knn_get_single_precision,
+    (setter)knn_set_single_precision,
+    (char *)"Whether the feature vectors for non-interactive classification are stored as floats.", 0 },
+  { (char *)"num_threads", (getter)knn_get_num_threads, (setter)knn_set_num_threads,
+    (char *)"The number of threads used by classify_many, leave_one_out and stratified k-fold cross validation (0 means all processors).", 0 },
   { NULL }
 };
 
@@ -143,24 +221,45 @@ static PyObject* array_init;
   Convenience function to delete all of the dynamic data used for
   classification.
 */
+static void knn_unmap_file(void* address, size_t size);
+
 static void knn_delete_feature_data(KnnObject* o) {
   size_t num_feature_vectors;
+  // parts of the data are not allocated, but belong to a mapped snapshot
+  bool mapped = (o->mapping != 0);
+
+  if (o->index != 0) {
+    delete o->index;
+    o->index = 0;
+  }
 
   if (o->feature_vectors == NULL ) {
     num_feature_vectors = 0;
   } else {
     num_feature_vectors = o->feature_vectors->size();
 
-    std::vector<double*>::iterator fv_it;
-    for (fv_it = o->feature_vectors->begin(); fv_it != o->feature_vectors->end(); ++fv_it ) {
-      delete[] *fv_it;
-    }
     delete o->feature_vectors;
     o->feature_vectors = 0;
+    delete[] o->feature_storage;
+    o->feature_storage = 0;
+    o->feature_data = 0;
+    o->single_data = 0;
+    if (o->raw_data != 0)
+      delete[] o->raw_data;
+    o->raw_data = 0;
+    o->feature_capacity = 0;
+    o->stale = false;
+    o->stale_histogram = false;
+    if (!mapped) {
+      delete[] o->feature_min;
+      delete[] o->feature_max;
+    }
+    o->feature_min = 0;
+    o->feature_max = 0;
   }
 
   if (o->id_names != 0) {
-    for (size_t i = 0; i < num_feature_vectors; ++i) {
+    for (size_t i = 0; i < num_feature_vectors && !mapped; ++i) {
       if (o->id_names[i] != 0)
         delete[] o->id_names[i];
     }
@@ -168,9 +267,15 @@ static void knn_delete_feature_data(KnnObject* o) {
     o->id_names = 0;
   }
   if (o->id_name_histogram != 0) {
-    delete[] o->id_name_histogram;
+    if (!mapped)
+      delete[] o->id_name_histogram;
     o->id_name_histogram = 0;
   }
+  if (mapped) {
+    knn_unmap_file(o->mapping, o->mapping_size);
+    o->mapping = 0;
+    o->mapping_size = 0;
+  }
 }
 
 static void set_num_features(KnnObject* o, size_t num_features) {
@@ -210,6 +315,19 @@ static PyObject* knn_new(PyTypeObject* pytype, PyObject* args,
   */
   o->num_features = 0;
   o->feature_vectors = 0;
+  o->feature_data = 0;
+  o->single_precision = false;
+  o->single_data = 0;
+  o->feature_stride = 0;
+  o->feature_storage = 0;
+  o->feature_min = 0;
+  o->feature_max = 0;
+  o->mapping = 0;
+  o->mapping_size = 0;
+  o->feature_capacity = 0;
+  o->raw_data = 0;
+  o->stale = false;
+  o->stale_histogram = false;
   o->id_names = 0;
   o->id_name_histogram = 0;
   o->selection_vector = 0;
@@ -220,28 +338,63 @@ static PyObject* knn_new(PyTypeObject* pytype, PyObject* args,
   o->distance_type = CITY_BLOCK;
   o->confidence_types = new std::vector<int>();
   o->confidence_types->push_back(CONFIDENCE_DEFAULT);
+  o->index = 0;
+  o->use_index = false;
+  o->index_build_time = 0.0;
+  o->num_threads = 0;
 
   Py_INCREF(Py_None);
   return (PyObject*)o;
 }
 
+/*
+  Allocate the rows for capacity feature vectors of type T in one block.
+  The block is over-allocated by the alignment, so that the first row
+  (and with the padded stride every row) starts at an aligned address.
+  Returns the block; data is set to the first row.
+*/
+template<class T>
+static char* knn_allocate_rows(size_t capacity, size_t stride, T** data) {
+  char* storage = new char[capacity * stride * sizeof(T) + feature_alignment];
+  size_t offset = (size_t)storage % feature_alignment;
+  *data = (T*)(offset == 0 ? storage : storage + feature_alignment - offset);
+  // the padding is never read, but should not be left uninitialized
+  std::fill(*data, *data + capacity * stride, T(0));
+  return storage;
+}
+
+// point the entries of feature_vectors to the rows (see KnnObject)
+static void knn_set_row_pointers(KnnObject* o) {
+  for (size_t i = 0; i < o->feature_vectors->size(); ++i)
+    (*o->feature_vectors)[i] = (o->feature_data == 0) ? 0 :
+      o->feature_data + i * o->feature_stride;
+}
+
 /*
   Create and initialize all of the classification data with the given
-  number of features and number of feature vectors. Throughout this
-  object it is assumed that the number of feature vectors is fixed. This
-  is reasonable because if you need to classify using a changing set of
-  known images classify_with_images is a much easier choice. Because
-  we can assume a fixed number of feature vectors it makes allocation
-  easier and also allows certain features (like normalization) to become
-  a lot easier.
+  number of features and number of feature vectors. The number of
+  feature vectors only changes with insert_from_image and
+  remove_feature_vector, which reallocate the data with knn_reserve.
 */
 static int knn_create_feature_data(KnnObject* o, size_t num_feature_vectors) {
   try {
     assert(num_feature_vectors > 0);
 
+    // all feature vectors are allocated in one block
+    o->feature_capacity = num_feature_vectors;
+    if (o->single_precision) {
+      o->feature_stride = feature_stride(o->num_features, sizeof(float));
+      o->feature_storage = knn_allocate_rows(num_feature_vectors, o->feature_stride,
+                                             &o->single_data);
+    } else {
+      o->feature_stride = feature_stride(o->num_features);
+      o->feature_storage = knn_allocate_rows(num_feature_vectors, o->feature_stride,
+                                             &o->feature_data);
+    }
     o->feature_vectors = new std::vector<double*>(num_feature_vectors);
-    for (size_t i = 0; i < num_feature_vectors; ++i)
-      (*o->feature_vectors)[i] = new double[o->num_features];
+    knn_set_row_pointers(o);
+    o->feature_min = new double[o->num_features];
+    o->feature_max = new double[o->num_features];
 
     o->id_names = new char*[num_feature_vectors];
     for (size_t i = 0; i < num_feature_vectors; ++i)
@@ -254,6 +407,127 @@ static int knn_create_feature_data(KnnObject* o, size_t num_feature_vectors) {
   return 1;
 }
 
+/*
+  Make room for at least num_feature_vectors feature vectors. The
+  capacity grows geometrically, so that inserting feature vectors one at
+  a time takes amortized constant time.
+*/
+static void knn_reserve(KnnObject* o, size_t num_feature_vectors) {
+  if (num_feature_vectors <= o->feature_capacity)
+    return;
+  size_t capacity = std::max(num_feature_vectors,
+                             std::max(2 * o->feature_capacity, size_t(16)));
+  size_t size = o->feature_vectors->size();
+  char* storage;
+  if (o->single_precision) {
+    float* data;
+    storage = knn_allocate_rows(capacity, o->feature_stride, &data);
+    std::copy(o->single_data, o->single_data + size * o->feature_stride, data);
+    o->single_data = data;
+  } else {
+    double* data;
+    storage = knn_allocate_rows(capacity, o->feature_stride, &data);
+    std::copy(o->feature_data, o->feature_data + size * o->feature_stride, data);
+    o->feature_data = data;
+  }
+  delete[] o->feature_storage;
+  o->feature_storage = storage;
+  knn_set_row_pointers(o);
+
+  if (o->raw_data != 0) {
+    double* raw_data = new double[capacity * o->feature_stride];
+    std::copy(o->raw_data, o->raw_data + size * o->feature_stride, raw_data);
+    delete[] o->raw_data;
+    o->raw_data = raw_data;
+  }
+  char** id_names = new char*[capacity];
+  std::copy(o->id_names, o->id_names + size, id_names);
+  std::fill(id_names + size, id_names + capacity, (char*)0);
+  delete[] o->id_names;
+  o->id_names = id_names;
+  // the histogram is recomputed by knn_prepare_histogram
+  delete[] o->id_name_histogram;
+  o->id_name_histogram = new int[capacity];
+  o->feature_capacity = capacity;
+}
+
+/*
+  Before the first incremental change of normalized data, recover the
+  feature vectors before normalization and restart the running sums of
+  the normalization from them (after unserialize the sums are unknown).
+*/
+static void knn_create_raw_data(KnnObject* o) {
+  assert(o->normalize != 0 && o->raw_data == 0);
+  size_t size = o->feature_vectors->size();
+  o->raw_data = new double[o->feature_capacity * o->feature_stride];
+  std::fill(o->raw_data, o->raw_data + o->feature_capacity * o->feature_stride, 0.0);
+  const double* mean = o->normalize->get_mean_vector();
+  const double* stdev = o->normalize->get_stdev_vector();
+  Normalize* normalize = new Normalize(o->num_features);
+  std::vector<double> row(o->num_features);
+  for (size_t i = 0; i < size; ++i) {
+    knn_get_row(o, i, &row[0]);
+    double* raw = o->raw_data + i * o->feature_stride;
+    for (size_t j = 0; j < o->num_features; ++j)
+      raw[j] = row[j] * stdev[j] + mean[j];
+    normalize->add(raw, raw + o->num_features);
+  }
+  delete o->normalize;
+  o->normalize = normalize;
+  o->normalize->compute_normalization();
+}
+
+/*
+  Store the feature vector and the id_name in the given row, which must
+  not hold a feature vector.
+*/
+static void knn_set_row(KnnObject* o, size_t i, const double* fv,
+                        const char* id_name, int len) {
+  if (o->raw_data != 0) {
+    double* raw = o->raw_data + i * o->feature_stride;
+    std::copy(fv, fv + o->num_features, raw);
+    o->normalize->add(raw, raw + o->num_features);
+  }
+  // when normalizing, knn_prepare overwrites this
+  knn_put_row(o, i, fv);
+  if (o->raw_data == 0) {
+    // the range of the stored (possibly rounded) values
+    std::vector<double> row(o->num_features);
+    knn_get_row(o, i, &row[0]);
+    /*
+      Widen the feature ranges. After removals the ranges may be wider
+      than necessary, which only makes the bounds in classify less tight.
+    */
+    if (o->feature_vectors->size() == 1) {
+      std::copy(row.begin(), row.end(), o->feature_min);
+      std::copy(row.begin(), row.end(), o->feature_max);
+    } else {
+      for (size_t j = 0; j < o->num_features; ++j) {
+        o->feature_min[j] = std::min(o->feature_min[j], row[j]);
+        o->feature_max[j] = std::max(o->feature_max[j], row[j]);
+      }
+    }
+  }
+  o->id_names[i] = new char[len + 1];
+  strncpy(o->id_names[i], id_name, len + 1);
+  o->stale = true;
+  o->stale_histogram = true;
+}
+
+/*
+  Remove the feature vector and the id_name from the given row.
+*/
+static void knn_clear_row(KnnObject* o, size_t i) {
+  if (o->raw_data != 0) {
+    double* raw = o->raw_data + i * o->feature_stride;
+    o->normalize->remove(raw, raw + o->num_features);
+  }
+  delete[] o->id_names[i];
+  o->id_names[i] = 0;
+  o->stale = true;
+  o->stale_histogram = true;
+}
+
 // destructor for Python
 static void knn_dealloc(PyObject* self) {
   KnnObject* o = (KnnObject*)self;
@@ -334,10 +608,7 @@ static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args) {
   Py_ssize_t tmp_fv_len;
 
   std::map<char*, int, ltstr> id_name_histogram;
-  double *current_features;
   for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    current_features = (*o->feature_vectors)[i];
-
     PyObject* cur_image = PySequence_Fast_GET_ITEM(images_seq, i);
 
     if (image_get_fv(cur_image, &tmp_fv, &tmp_fv_len) < 0) {
@@ -350,7 +621,7 @@ static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args) {
       PyErr_SetString(PyExc_ValueError, "knn: feature vector lengths don't match");
       goto error;
     }
-    std::copy(tmp_fv, tmp_fv + o->num_features, current_features);
+    knn_put_row(o, i, tmp_fv);
     if (o->normalize != 0) {
       o->normalize->add(tmp_fv, tmp_fv + o->num_features);
     }
@@ -373,17 +644,24 @@ static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args) {
   if (o->normalize != 0) {
     o->normalize->compute_normalization();
 
+    /*
+      The features are normalized from the images again, so that they
+      are only rounded once when stored in single precision.
+    */
+    std::vector<double> current_features(o->num_features);
     for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-      current_features = (*o->feature_vectors)[i];
-      o->normalize->apply(current_features, current_features + o->num_features);
+      image_get_fv(PySequence_Fast_GET_ITEM(images_seq, i), &tmp_fv, &tmp_fv_len);
+      o->normalize->apply(tmp_fv, tmp_fv + o->num_features, current_features.begin());
+      knn_put_row(o, i, &current_features[0]);
       o->id_name_histogram[i] = id_name_histogram[o->id_names[i]];
     }
   } else {
     for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-      current_features = (*o->feature_vectors)[i];
       o->id_name_histogram[i] = id_name_histogram[o->id_names[i]];
     }
   }
+  knn_compute_feature_range(o);
+  knn_build_index(o);
 
   Py_DECREF(images_seq);
   Py_INCREF(Py_None);
@@ -394,63 +672,319 @@ static PyObject* knn_instantiate_from_images(PyObject* self, PyObject* args) {
 }
 
 /*
-  non-interactive classification using the data created by
-  instantiate from images.
+  Check that the data of instantiate_from_images exists and may be
+  changed, and get the feature vector and id_name of the image.
 */
-static PyObject* knn_classify(PyObject* self, PyObject* args) {
-  KnnObject* o = (KnnObject*)self;
-
+static int knn_get_row_data(KnnObject* o, PyObject* image, double** fv,
+                            char** id_name, int* len) {
   if (o->feature_vectors == 0) {
-      PyErr_SetString(PyExc_RuntimeError,
-                      "knn: classify called before instantiate from images");
-      return 0;
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: feature vectors changed before instantiate from images");
+    return -1;
   }
-  PyObject* unknown;
-  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &unknown) <= 0) {
-    return 0;
+  if (o->mapping != 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: the feature vectors of a snapshot cannot be changed");
+    return -1;
+  }
+  if (!is_ImageObject(image)) {
+    PyErr_SetString(PyExc_TypeError, "knn: glyph must be an image");
+    return -1;
+  }
+  Py_ssize_t fv_len;
+  if (image_get_fv(image, fv, &fv_len) < 0) {
+    PyErr_SetString(PyExc_ValueError, "knn: could not get features from image");
+    return -1;
+  }
+  if (size_t(fv_len) != o->num_features) {
+    PyErr_SetString(PyExc_ValueError, "knn: feature vector lengths don't match");
+    return -1;
+  }
+  if (image_get_id_name(image, id_name, len) < 0) {
+    PyErr_SetString(PyExc_ValueError, "knn: could not get id name");
+    return -1;
   }
+  return 0;
+}
 
-  if (!is_ImageObject(unknown)) {
-    PyErr_SetString(PyExc_TypeError, "knn: unknown must be an image");
+static PyObject* knn_insert_from_image(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* image;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &image) <= 0)
+    return 0;
+  double* fv;
+  char* id_name;
+  int len;
+  if (knn_get_row_data(o, image, &fv, &id_name, &len) < 0)
+    return 0;
+  try {
+    if (o->normalize != 0 && o->raw_data == 0)
+      knn_create_raw_data(o);
+    size_t i = o->feature_vectors->size();
+    knn_reserve(o, i + 1);
+    o->feature_vectors->push_back(o->feature_data == 0 ? 0 :
+                                  o->feature_data + i * o->feature_stride);
+    knn_set_row(o, i, fv, id_name, len);
+    return PyInt_FromLong((long)i);
+  } catch (std::exception& e) {
+    PyErr_SetString(PyExc_RuntimeError, e.what());
     return 0;
   }
+}
+
+static PyObject* knn_update_from_image(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* image;
+  long row;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "lO", &row, &image) <= 0)
+    return 0;
   double* fv;
-  Py_ssize_t fv_len;
-  if (image_get_fv(unknown, &fv, &fv_len) < 0) {
-    PyErr_SetString(PyExc_ValueError, "knn: could not get features");
+  char* id_name;
+  int len;
+  if (knn_get_row_data(o, image, &fv, &id_name, &len) < 0)
+    return 0;
+  if (row < 0 || size_t(row) >= o->feature_vectors->size()) {
+    PyErr_SetString(PyExc_IndexError, "knn: row out of range");
     return 0;
   }
-  if (size_t(fv_len) != o->num_features) {
-    PyErr_SetString(PyExc_ValueError, "knn: features not the correct size");
+  if (o->normalize != 0 && o->raw_data == 0)
+    knn_create_raw_data(o);
+  knn_clear_row(o, size_t(row));
+  knn_set_row(o, size_t(row), fv, id_name, len);
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static PyObject* knn_remove_feature_vector(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  long row;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "l", &row) <= 0)
+    return 0;
+  if (o->feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: feature vectors changed before instantiate from images");
+    return 0;
+  }
+  if (o->mapping != 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: the feature vectors of a snapshot cannot be changed");
+    return 0;
+  }
+  if (row < 0 || size_t(row) >= o->feature_vectors->size()) {
+    PyErr_SetString(PyExc_IndexError, "knn: row out of range");
+    return 0;
+  }
+  if (o->normalize != 0 && o->raw_data == 0)
+    knn_create_raw_data(o);
+  knn_clear_row(o, size_t(row));
+  // move the last row into the gap
+  size_t last = o->feature_vectors->size() - 1;
+  if (size_t(row) != last) {
+    size_t element_size = o->single_precision ? sizeof(float) : sizeof(double);
+    char* data = o->single_precision ? (char*)o->single_data : (char*)o->feature_data;
+    memcpy(data + row * o->feature_stride * element_size,
+           data + last * o->feature_stride * element_size,
+           o->num_features * element_size);
+    if (o->raw_data != 0)
+      std::copy(o->raw_data + last * o->feature_stride,
+                o->raw_data + last * o->feature_stride + o->num_features,
+                o->raw_data + row * o->feature_stride);
+    o->id_names[row] = o->id_names[last];
+    o->id_names[last] = 0;
+  }
+  o->feature_vectors->pop_back();
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static PyObject* knn_update_id_names(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* images;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &images) <= 0)
+    return 0;
+  if (o->feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: id names updated before instantiate from images");
+    return 0;
+  }
+  PyObject* seq = PySequence_Fast(images, "knn: glyphs must be a sequence");
+  if (seq == 0)
+    return 0;
+  if (size_t(PySequence_Fast_GET_SIZE(seq)) != o->feature_vectors->size()) {
+    Py_DECREF(seq);
+    PyErr_SetString(PyExc_ValueError,
+                    "knn: the number of glyphs does not match the number of rows");
     return 0;
   }
+  long changed = 0;
+  for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
+    PyObject* image = PySequence_Fast_GET_ITEM(seq, i);
+    if (!is_ImageObject(image)) {
+      Py_DECREF(seq);
+      PyErr_SetString(PyExc_TypeError, "knn: glyph must be an image");
+      return 0;
+    }
+    char* id_name;
+    int len;
+    if (image_get_id_name(image, &id_name, &len) < 0) {
+      Py_DECREF(seq);
+      return 0;
+    }
+    if (strcmp(o->id_names[i], id_name) != 0) {
+      if (o->mapping != 0) {
+        Py_DECREF(seq);
+        PyErr_SetString(PyExc_RuntimeError,
+                        "knn: the feature vectors of a snapshot cannot be changed");
+        return 0;
+      }
+      delete[] o->id_names[i];
+      o->id_names[i] = new char[len + 1];
+      strncpy(o->id_names[i], id_name, len + 1);
+      ++changed;
+    }
+  }
+  Py_DECREF(seq);
+  if (changed) {
+    o->stale_histogram = true;
+    // the labels of the index are taken from the id names
+    if (o->index != 0)
+      o->stale = true;
+  }
+  return PyInt_FromLong(changed);
+}
 
-  // normalize the unknown
-  if (o->normalize != 0) {
-    o->normalize->apply(fv, fv + o->num_features, o->unknown);
+typedef kNearestNeighbors<char*, ltstr, eqstr> knn_type;
+
+/*
+  Find the k nearest neighbors of the unknown with the kd-tree index and
+  store them in knn. The maximum distance and the nearest unlike neighbor
+  are set explicitly, so that the confidences are the same as after
+  adding every feature vector in the database.
+*/
+static void knn_index_neighbors(KnnObject* o, const double* unknown, knn_type& knn) {
+  KdIndex::Result result;
+  bool with_unlike = std::find(knn.confidence_types.begin(), knn.confidence_types.end(),
+                               (int)CONFIDENCE_NUN) != knn.confidence_types.end();
+  o->index->search(unknown, o->distance_type, o->num_k, with_unlike, result);
+  for (size_t i = 0; i < result.neighbors.size(); ++i)
+    knn.add(o->id_names[result.neighbors[i].second], result.neighbors[i].first);
+  if (result.has_unlike) {
+    knn_type::neighbor_type nun(o->id_names[result.unlike.second], result.unlike.first);
+    knn.set_statistics(result.max_distance, &nun);
   } else {
-    std::copy(fv, fv + o->num_features, o->unknown);
+    knn.set_statistics(result.max_distance, NULL);
   }
+}
 
-  // create the kNN object
-  kNearestNeighbors<char*, ltstr, eqstr> knn(o->num_k);
-  knn.confidence_types = *(o->confidence_types);
+/*
+  Stop predicate for the bounded distances in the linear scan of classify.
+  A candidate cannot change the result when its distance exceeds the
+  distance of the current k-th nearest neighbor (and of the nearest
+  unlike neighbor, when that is needed) and is not larger than the
+  current maximum distance, which is needed for the confidences. The
+  latter is checked with *remaining*, an upper bound for the sum of the
+  terms of the features from i on.
+*/
+struct knn_scan_stop {
+  knn_scan_stop(double l, double m, const double* r)
+    : lower(l), max_distance(m), remaining(r) {}
+  bool operator()(double partial, size_t i) const {
+    // the slack covers the rounding in remaining
+    return partial > lower && (partial + remaining[i]) * (1.0 + 1e-9) < max_distance;
+  }
+  double lower;
+  double max_distance;
+  const double* remaining;
+};
 
-  double *current_known;
+/*
+  Compute an upper bound for the sum of the distance terms of the features
+  from i on for every i, which follows from the range of each feature.
+*/
+static void knn_remaining_bounds(KnnObject* o, const double* unknown,
+                                 std::vector<double>& remaining) {
+  remaining.resize(o->num_features + 1);
+  remaining[o->num_features] = 0.0;
+  for (size_t i = o->num_features; i > 0; --i) {
+    size_t j = i - 1;
+    double diff = std::max(std::fabs(unknown[j] - o->feature_min[j]),
+                           std::fabs(unknown[j] - o->feature_max[j]));
+    double term = (o->distance_type == FAST_EUCLIDEAN) ? diff * diff : diff;
+    remaining[j] = remaining[i] +
+      o->selection_vector[j] * (o->weight_vector[j] * term);
+  }
+}
 
-  for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    double distance;
+/*
+  Find the k nearest neighbors of the unknown among the rows in data with
+  a linear scan.
+*/
+template<class T>
+static void knn_scan_neighbors(KnnObject* o, const T* data, const double* unknown,
+                               knn_type& knn) {
+  if (nonnegative_weights(o->selection_vector, o->weight_vector,
+                          o->num_features)) {
+    bool with_unlike = std::find(knn.confidence_types.begin(), knn.confidence_types.end(),
+                                 (int)CONFIDENCE_NUN) != knn.confidence_types.end();
+    std::vector<double> remaining;
+    knn_remaining_bounds(o, unknown, remaining);
+    const T *current_known = data;
+
+    for (size_t i = 0; i < o->feature_vectors->size();
+         ++i, current_known += o->feature_stride) {
+      double distance;
+      double lower = knn.worst_distance();
+      if (with_unlike)
+        lower = std::max(lower, knn.nun_distance());
+
+      /*
+        When the computation is abandoned, distance is only a lower
+        bound, but adding it to knn changes nothing.
+      */
+      compute_distance(o->distance_type, current_known, o->num_features,
+                       unknown, &distance,
+                       o->selection_vector, o->weight_vector,
+                       knn_scan_stop(lower, knn.max_distance(), &remaining[0]));
+
+      knn.add(o->id_names[i], distance);
+    }
+  } else {
+    const T *current_known = data;
 
-    current_known = (*o->feature_vectors)[i];
+    for (size_t i = 0; i < o->feature_vectors->size();
+         ++i, current_known += o->feature_stride) {
+      double distance;
 
-    compute_distance(o->distance_type, current_known, o->num_features,
-                     o->unknown, &distance,
-                     o->selection_vector, o->weight_vector);
+      compute_distance(o->distance_type, current_known, o->num_features,
+                       unknown, &distance,
+                       o->selection_vector, o->weight_vector);
 
-    knn.add(o->id_names[i], distance);
+      knn.add(o->id_names[i], distance);
+    }
   }
+}
+
+/*
+  Find the k nearest neighbors of the (already normalized) unknown among
+  the feature vectors created by instantiate_from_images, compute the
+  majority and the confidences. This only reads from the knn object, so
+  that it can be called from several threads at once.
+*/
+static void knn_find_neighbors(KnnObject* o, const double* unknown, knn_type& knn) {
+  if (o->index != 0)
+    knn_index_neighbors(o, unknown, knn);
+  else if (o->single_precision)
+    knn_scan_neighbors(o, (const float*)o->single_data, unknown, knn);
+  else
+    knn_scan_neighbors(o, (const double*)o->feature_data, unknown, knn);
   knn.majority();
   knn.calculate_confidences();
+}
+
+/*
+  Build the Python result (id_name, confidencemap) of a classification.
+*/
+static PyObject* knn_result_to_python(const knn_type& knn) {
   PyObject* ans_list = PyList_New(knn.answer.size());
   for (size_t i = 0; i < knn.answer.size(); ++i) {
     // PyList_SET_ITEM steals references so this code only looks
@@ -474,6 +1008,141 @@ static PyObject* knn_classify(PyObject* self, PyObject* args) {
   return result;
 }
 
+/*
+  Copy the feature vector of the unknown image to dest and normalize it.
+*/
+static int knn_get_unknown(KnnObject* o, PyObject* unknown, double* dest) {
+  if (!is_ImageObject(unknown)) {
+    PyErr_SetString(PyExc_TypeError, "knn: unknown must be an image");
+    return -1;
+  }
+  double* fv;
+  Py_ssize_t fv_len;
+  if (image_get_fv(unknown, &fv, &fv_len) < 0) {
+    PyErr_SetString(PyExc_ValueError, "knn: could not get features");
+    return -1;
+  }
+  if (size_t(fv_len) != o->num_features) {
+    PyErr_SetString(PyExc_ValueError, "knn: features not the correct size");
+    return -1;
+  }
+
+  // normalize the unknown
+  if (o->normalize != 0) {
+    o->normalize->apply(fv, fv + o->num_features, dest);
+  } else {
+    std::copy(fv, fv + o->num_features, dest);
+  }
+  return 0;
+}
+
+/*
+  non-interactive classification using the data created by
+  instantiate from images.
+*/
+static PyObject* knn_classify(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+
+  if (o->feature_vectors == 0) {
+      PyErr_SetString(PyExc_RuntimeError,
+                      "knn: classify called before instantiate from images");
+      return 0;
+  }
+  knn_prepare(o);
+  if (o->feature_vectors->empty()) {
+    PyErr_SetString(PyExc_ValueError, "knn: there are no feature vectors to classify with");
+    return 0;
+  }
+  PyObject* unknown;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &unknown) <= 0) {
+    return 0;
+  }
+  if (knn_get_unknown(o, unknown, o->unknown) < 0)
+    return 0;
+
+  // create the kNN object
+  knn_type knn(o->num_k);
+  knn.confidence_types = *(o->confidence_types);
+  knn_find_neighbors(o, o->unknown, knn);
+  return knn_result_to_python(knn);
+}
+
+/*
+  non-interactive classification of a list of images. All feature vectors
+  are read first, so that the classification itself can run without the
+  GIL and in parallel.
+*/
+static PyObject* knn_classify_many(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+
+  if (o->feature_vectors == 0) {
+      PyErr_SetString(PyExc_RuntimeError,
+                      "knn: classify_many called before instantiate from images");
+      return 0;
+  }
+  knn_prepare(o);
+  if (o->feature_vectors->empty()) {
+    PyErr_SetString(PyExc_ValueError, "knn: there are no feature vectors to classify with");
+    return 0;
+  }
+  if (o->num_k < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: num_k must be at least 1");
+    return 0;
+  }
+  PyObject* glyphs;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O", &glyphs) <= 0) {
+    return 0;
+  }
+  PyObject* glyphs_seq = PySequence_Fast(glyphs, "knn: glyphs must be iterable");
+  if (glyphs_seq == 0)
+    return 0;
+  int num_glyphs = (int)PySequence_Fast_GET_SIZE(glyphs_seq);
+
+  std::vector<double> unknowns(size_t(num_glyphs) * o->num_features);
+  for (int i = 0; i < num_glyphs; ++i) {
+    if (knn_get_unknown(o, PySequence_Fast_GET_ITEM(glyphs_seq, i),
+                        &unknowns[size_t(i) * o->num_features]) < 0) {
+      Py_DECREF(glyphs_seq);
+      return 0;
+    }
+  }
+  Py_DECREF(glyphs_seq);
+
+  std::vector<knn_type*> knns(num_glyphs);
+  for (int i = 0; i < num_glyphs; ++i) {
+    knns[i] = new knn_type(o->num_k);
+    knns[i]->confidence_types = *(o->confidence_types);
+  }
+  bool failed = false;
+
+  Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+  int num_threads = knn_num_threads(o);
+#pragma omp parallel for schedule(dynamic) num_threads(num_threads)
+#endif
+  for (int i = 0; i < num_glyphs; ++i) {
+    // exceptions must not leave the parallel region
+    try {
+      knn_find_neighbors(o, &unknowns[size_t(i) * o->num_features], *knns[i]);
+    } catch (std::exception&) {
+      failed = true;
+    }
+  }
+  Py_END_ALLOW_THREADS
+
+  PyObject* result = 0;
+  if (failed) {
+    PyErr_SetString(PyExc_RuntimeError, "knn: classification failed");
+  } else {
+    result = PyList_New(num_glyphs);
+    for (int i = 0; i < num_glyphs; ++i)
+      PyList_SET_ITEM(result, i, knn_result_to_python(*knns[i]));
+  }
+  for (int i = 0; i < num_glyphs; ++i)
+    delete knns[i];
+  return result;
+}
+
 static PyObject* knn_classify_with_images(PyObject* self, PyObject* args) {
   KnnObject* o = (KnnObject*)self;
   PyObject* unknown, *iterator, *container;
@@ -512,6 +1181,14 @@ static PyObject* knn_classify_with_images(PyObject* self, PyObject* args) {
   kNearestNeighbors<char*, ltstr, eqstr> knn(o->num_k);
   knn.confidence_types = *(o->confidence_types);
 
+  /*
+    Without confidences, only the k nearest neighbors are needed, so the
+    distance computation can be abandoned for candidates that are farther
+    away than the current k-th nearest neighbor.
+  */
+  bool bounded = !do_confidence &&
+    nonnegative_weights(o->selection_vector, o->weight_vector, o->num_features);
+
   PyObject* cur;
   while ((cur = PyIter_Next(iterator))) {
 
@@ -522,8 +1199,10 @@ static PyObject* knn_classify_with_images(PyObject* self, PyObject* args) {
     if (cross_validation_mode && (cur == unknown))
       continue;
     double distance;
+    double bound = bounded ? knn.worst_distance() : std::numeric_limits<double>::infinity();
     if (compute_distance(o->distance_type, cur, unknown_buf, &distance,
-                         o->selection_vector, o->weight_vector, unknown_len) < 0) {
+                         o->selection_vector, o->weight_vector, unknown_len,
+                         bound) < 0) {
       PyErr_SetString(PyExc_ValueError,
                       "knn: error in distance calculation \
                        (This is most likely because features have not been generated.)");
@@ -595,6 +1274,11 @@ static PyObject* knn_distance_from_images(PyObject* self, PyObject* args) {
       return 0;
   }
 
+  // distances beyond maximum_distance are not needed
+  double bound = std::numeric_limits<double>::infinity();
+  if (nonnegative_weights(o->selection_vector, o->weight_vector, o->num_features))
+    bound = maximum_distance;
+
   PyObject* cur;
   PyObject* distance_list = PyList_New(0);
   PyObject* tmp_val;
@@ -605,7 +1289,8 @@ static PyObject* knn_distance_from_images(PyObject* self, PyObject* args) {
     }
     double distance;
     if (compute_distance(o->distance_type, cur, unknown_buf, &distance,
-                         o->selection_vector, o->weight_vector, unknown_len) < 0) {
+                         o->selection_vector, o->weight_vector, unknown_len,
+                         bound) < 0) {
       PyErr_SetString(PyExc_ValueError,
                       "knn: error in distance calculation \
                        (This is most likely because features have not been generated.)");
@@ -645,121 +1330,171 @@ static PyObject* knn_distance_between_images(PyObject* self, PyObject* args) {
 }
 
 /*
-  Create a symmetric float matrix (image) containing all of the
-  distances between the images in the list passed in. This is useful
-  because it allows you to find the distance between any two pairs
-  of images regardless of the order of the pairs. NOTE: the features
-  are normalized before performing the distance calculations.
+  Gather the feature vectors of the images in images_seq into one block
+  of rows padded to feature_stride (like the feature data of the
+  classifier). When normalize is true, the rows are normalized with the
+  normalization of these images.
 */
-PyObject* knn_distance_matrix(PyObject* self, PyObject* args) {
-  KnnObject* o = (KnnObject*)self;
-  PyObject* images;
-  PyObject* progress = 0;
-  long normalize = 1;
-  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O|Oi", &images, &progress, &normalize) <= 0)
-    return 0;
-  // images is a list of Gamera/Python ImageObjects
-  PyObject* images_seq = PySequence_Fast(images, "First argument must be iterable.");
-  if (images_seq == NULL)
-    return 0;
-
-  int images_len = PySequence_Fast_GET_SIZE(images_seq);
-  if (!(images_len > 1)) {
-    PyErr_SetString(PyExc_ValueError, "List must have at least two images.");
-    Py_DECREF(images_seq);
-    return 0;
-  }
-
-  // Check the number of features
-  double* buf_a, *buf_b;
-  Py_ssize_t len_a, len_b;
-  PyObject* cur_a, *cur_b;
-  cur_a = PySequence_Fast_GET_ITEM(images_seq, 0);
-  if (!is_ImageObject(cur_a)) {
-    PyErr_SetString(PyExc_TypeError, "knn: expected an image");
-    Py_DECREF(images_seq);
-    return 0;
-  }
-  if (image_get_fv(cur_a, &buf_a, &len_a) < 0) {
-    Py_DECREF(images_seq);
-    return 0;
-  }
-
-  if (len_a != (int)o->num_features) {
-    PyErr_SetString(PyExc_ValueError, "knn: feature vector lengths don't match.");
-    Py_DECREF(images_seq);
-    return 0;
-  }
-
-  // create the normalization object
-  double* tmp_a = new double[len_a];
-  double* tmp_b = new double[len_a];
-  FloatImageData* data = new FloatImageData(Dim(images_len, images_len));
-  FloatImageView* mat = new FloatImageView(*data);
-
-  kNN::Normalize norm(len_a);
-  for (int i = 0; i < images_len; ++i) {
-    cur_a = PySequence_Fast_GET_ITEM(images_seq, i);
-    if (cur_a == NULL)
-      goto mat_error;
-    if (!is_ImageObject(cur_a)) {
+static int knn_gather_features(KnnObject* o, PyObject* images_seq, bool normalize,
+                               std::vector<double>& rows) {
+  size_t images_len = PySequence_Fast_GET_SIZE(images_seq);
+  size_t stride = feature_stride(o->num_features);
+  rows.assign(images_len * stride, 0.0);
+  kNN::Normalize norm(o->num_features);
+  for (size_t i = 0; i < images_len; ++i) {
+    PyObject* cur = PySequence_Fast_GET_ITEM(images_seq, i);
+    if (!is_ImageObject(cur)) {
       PyErr_SetString(PyExc_TypeError, "knn: expected an image");
-      goto mat_error;
+      return -1;
     }
-    if (image_get_fv(cur_a, &buf_a, &len_a) < 0)
-      goto mat_error;
-    if (len_a != (int)o->num_features) {
+    double* buf;
+    Py_ssize_t len;
+    if (image_get_fv(cur, &buf, &len) < 0)
+      return -1;
+    if (len != (Py_ssize_t)o->num_features) {
       PyErr_SetString(PyExc_ValueError, "knn: feature vector lengths don't match.");
-      goto mat_error;
+      return -1;
     }
+    std::copy(buf, buf + len, &rows[i * stride]);
     if (normalize)
-      norm.add(buf_a, buf_a + len_a);
+      norm.add(buf, buf + len);
   }
-  if (normalize)
+  if (normalize) {
     norm.compute_normalization();
+    for (size_t i = 0; i < images_len; ++i)
+      norm.apply(&rows[i * stride], &rows[i * stride] + o->num_features);
+  }
+  return 0;
+}
 
-  std::fill(mat->vec_begin(), mat->vec_end(), 0.0);
-  // do the distance calculations
-  for (int i = 0; i < images_len; ++i) {
-    cur_a = PySequence_Fast_GET_ITEM(images_seq, i);
-    if (cur_a == NULL)
-      goto mat_error;
-    if (image_get_fv(cur_a, &buf_a, &len_a) < 0)
-      goto mat_error;
-    if (normalize)
-      norm.apply(buf_a, buf_a + len_a, tmp_a);
-    for (int j = i + 1; j < images_len; ++j) {
-      cur_b = PySequence_Fast_GET_ITEM(images_seq, j);
-      if (cur_b == NULL)
-        goto mat_error;
-      if (image_get_fv(cur_b, &buf_b, &len_b) < 0)
-        goto mat_error;
-      if (normalize)
-        norm.apply(buf_b, buf_b + len_b, tmp_b);
-      double distance;
-      if (normalize)
-        compute_distance(o->distance_type, tmp_a, len_a, tmp_b, &distance,
-                         o->selection_vector, o->weight_vector);
-      else
-        compute_distance(o->distance_type, buf_a, len_a, buf_b, &distance,
-                         o->selection_vector, o->weight_vector);
-      mat->set(Point(j, i), distance);
-      mat->set(Point(i, j), distance);
+// the number of feature vectors in a tile of the pairwise distances
+static const size_t distance_tile = 64;
+
+/*
+  Store the distance between feature vectors i < j either in the full
+  symmetric n x n matrix or in the condensed upper triangle, which holds
+  the pairs (i, j) with i < j row by row.
+*/
+template<class T>
+struct full_distances {
+  full_distances(T* d, size_t size) : data(d), n(size) {}
+  void operator()(size_t i, size_t j, double distance) const {
+    data[i * n + j] = data[j * n + i] = T(distance);
+  }
+  T* data;
+  size_t n;
+};
+
+template<class T>
+struct condensed_distances {
+  condensed_distances(T* d, size_t size) : data(d), n(size) {}
+  void operator()(size_t i, size_t j, double distance) const {
+    data[i * n - i * (i + 1) / 2 + j - i - 1] = T(distance);
+  }
+  T* data;
+  size_t n;
+};
+
+/*
+  Compute the distances between all pairs of the n rows gathered by
+  knn_gather_features. The pairs are computed in square tiles of
+  distance_tile rows, so that the rows of both sides of a tile stay in
+  the cache. The tiles of each band of rows are distributed over the
+  threads with the GIL released; progress is called for each row after
+  its band is done.
+*/
+template<class Out>
+static int knn_pairwise_distances(KnnObject* o, const std::vector<double>& rows,
+                                  size_t n, const Out& out, PyObject* progress) {
+  const size_t stride = feature_stride(o->num_features);
+  const int len = (int)o->num_features;
+  const long num_tiles = long((n + distance_tile - 1) / distance_tile);
+  const double* data = &rows[0];
+  for (long band = 0; band < num_tiles; ++band) {
+    size_t row_begin = band * distance_tile;
+    size_t row_end = std::min(row_begin + distance_tile, n);
+    Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+    int num_threads = knn_num_threads(o);
+#pragma omp parallel for schedule(dynamic) num_threads(num_threads)
+#endif
+    for (long tile = band; tile < num_tiles; ++tile) {
+      size_t col_begin = tile * distance_tile;
+      size_t col_end = std::min(col_begin + distance_tile, n);
+      for (size_t i = row_begin; i < row_end; ++i) {
+        const double* a = data + i * stride;
+        for (size_t j = std::max(col_begin, i + 1); j < col_end; ++j) {
+          double distance;
+          compute_distance(o->distance_type, a, len, data + j * stride, &distance,
+                           o->selection_vector, o->weight_vector);
+          out(i, j, distance);
+        }
+      }
     }
-    if (progress)
-      PyObject_CallObject(progress, NULL);
+    Py_END_ALLOW_THREADS
+    if (progress) {
+      for (size_t i = row_begin; i < row_end; ++i) {
+        PyObject* result = PyObject_CallObject(progress, NULL);
+        if (result == 0)
+          return -1;
+        Py_DECREF(result);
+      }
+    }
+  }
+  return 0;
+}
+
+/*
+  Get the images passed to the pairwise distance functions as a fast
+  sequence of at least two images.
+*/
+static PyObject* knn_pairwise_images(PyObject* images) {
+  // images is a list of Gamera/Python ImageObjects
+  PyObject* images_seq = PySequence_Fast(images, "First argument must be iterable.");
+  if (images_seq == NULL)
+    return 0;
+  if (!(PySequence_Fast_GET_SIZE(images_seq) > 1)) {
+    PyErr_SetString(PyExc_ValueError, "List must have at least two images.");
+    Py_DECREF(images_seq);
+    return 0;
   }
-  delete[] tmp_a;
-  delete[] tmp_b;
+  return images_seq;
+}
+
+/*
+  Create a symmetric float matrix (image) containing all of the
+  distances between the images in the list passed in. This is useful
+  because it allows you to find the distance between any two pairs
+  of images regardless of the order of the pairs. NOTE: the features
+  are normalized before performing the distance calculations.
+*/
+PyObject* knn_distance_matrix(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* images;
+  PyObject* progress = 0;
+  long normalize = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "O|Oi", &images, &progress, &normalize) <= 0)
+    return 0;
+  PyObject* images_seq = knn_pairwise_images(images);
+  if (images_seq == 0)
+    return 0;
+  size_t images_len = PySequence_Fast_GET_SIZE(images_seq);
+  std::vector<double> rows;
+  int error = knn_gather_features(o, images_seq, normalize != 0, rows);
   Py_DECREF(images_seq);
+  if (error < 0)
+    return 0;
+
+  FloatImageData* data = new FloatImageData(Dim(images_len, images_len));
+  FloatImageView* mat = new FloatImageView(*data);
+  std::fill(data->begin(), data->end(), 0.0);
+  if (knn_pairwise_distances(o, rows, images_len,
+                             full_distances<double>(data->begin(), images_len),
+                             progress) < 0) {
+    delete mat; delete data;
+    return 0;
+  }
   return create_ImageObject(mat);
- mat_error:
-  Py_DECREF(images_seq);
-  // delete the image
-  delete mat; delete data;
-  // delete the tmp buffers
-  delete[] tmp_a; delete[] tmp_b;
-  return 0;
 }
 
 /*
@@ -773,112 +1508,88 @@ PyObject* knn_unique_distances(PyObject* self, PyObject* args) {
   long normalize = 1;
   if (PyArg_ParseTuple(args, CHAR_PTR_CAST "OO|i", &images, &progress, &normalize) <= 0)
     return 0;
-  // images is a list of Gamera/Python ImageObjects
-  PyObject* images_seq = PySequence_Fast(images, "First argument must be iterable.");
-  if (images_seq == NULL)
+  PyObject* images_seq = knn_pairwise_images(images);
+  if (images_seq == 0)
     return 0;
-
-  int images_len = PySequence_Fast_GET_SIZE(images_seq);
-  if (!(images_len > 1)) {
-    PyErr_SetString(PyExc_ValueError, "List must have at least two images.");
-    Py_DECREF(images_seq);
+  size_t images_len = PySequence_Fast_GET_SIZE(images_seq);
+  std::vector<double> rows;
+  int error = knn_gather_features(o, images_seq, normalize != 0, rows);
+  Py_DECREF(images_seq);
+  if (error < 0)
     return 0;
-  }
+
   // create the 'vector' for the output
-  int list_len = ((images_len * images_len) - images_len) / 2;
+  size_t list_len = ((images_len * images_len) - images_len) / 2;
   FloatImageData* data = new FloatImageData(Dim(list_len, 1));
   FloatImageView* list = new FloatImageView(*data);
-
-  // create a default set of weights for the distance calculation.
-  double* buf_a, *buf_b;
-  Py_ssize_t len_a, len_b;
-  PyObject* cur_a, *cur_b;
-  cur_a = PySequence_Fast_GET_ITEM(images_seq, 0);
-  if (!is_ImageObject(cur_a)) {
-    PyErr_SetString(PyExc_TypeError, "knn: expected an image");
-    Py_DECREF(images_seq);
-    return 0;
-  }
-  if (image_get_fv(cur_a, &buf_a, &len_a) < 0) {
-    Py_DECREF(images_seq);
+  if (knn_pairwise_distances(o, rows, images_len,
+                             condensed_distances<double>(data->begin(), images_len),
+                             progress) < 0) {
+    delete list; delete data;
     return 0;
   }
+  return create_ImageObject(list);
+}
 
-  if (len_a != (int)o->num_features) {
-    PyErr_SetString(PyExc_ValueError, "knn: feature vector lengths don't match.");
+/*
+  Compute the distances between all pairs of images into a writable
+  buffer (e.g. a numpy array or an array.array) instead of an image:
+  either the condensed upper triangle as 32 bit floats or the full
+  symmetric matrix as 64 bit floats. This needs a fraction of the memory
+  of the image or list results for large numbers of images.
+*/
+PyObject* knn_distances_into(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  PyObject* images;
+  PyObject* out;
+  int condensed = 1;
+  PyObject* progress = 0;
+  long normalize = 1;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "OO|iOi", &images, &out, &condensed,
+                       &progress, &normalize) <= 0)
+    return 0;
+  if (progress == Py_None)
+    progress = 0;
+  void* buffer;
+  Py_ssize_t buffer_len;
+  if (PyObject_AsWriteBuffer(out, &buffer, &buffer_len) < 0)
+    return 0;
+  PyObject* images_seq = knn_pairwise_images(images);
+  if (images_seq == 0)
+    return 0;
+  size_t images_len = PySequence_Fast_GET_SIZE(images_seq);
+  size_t expected_len = condensed
+    ? images_len * (images_len - 1) / 2 * sizeof(float)
+    : images_len * images_len * sizeof(double);
+  if (size_t(buffer_len) != expected_len) {
+    PyErr_Format(PyExc_ValueError,
+                 "knn: the output buffer has %ld bytes, but %ld are needed.",
+                 long(buffer_len), long(expected_len));
     Py_DECREF(images_seq);
     return 0;
   }
+  std::vector<double> rows;
+  int error = knn_gather_features(o, images_seq, normalize != 0, rows);
+  Py_DECREF(images_seq);
+  if (error < 0)
+    return 0;
 
-  // create the normalization object
-  kNN::Normalize norm(len_a);
-  for (int i = 0; i < images_len; ++i) {
-    cur_a = PySequence_Fast_GET_ITEM(images_seq, i);
-    if (!is_ImageObject(cur_a)) {
-      PyErr_SetString(PyExc_TypeError, "knn: expected an image");
-      Py_DECREF(images_seq);
-      return 0;
-    }
-    if (cur_a == NULL) {
-      Py_DECREF(images_seq);
-      return 0;
-    }
-    if (image_get_fv(cur_a, &buf_a, &len_a) < 0) {
-      Py_DECREF(images_seq);
-      return 0;
-    }
-    if (normalize)
-      norm.add(buf_a, buf_a + len_a);
-  }
-  if (normalize)
-    norm.compute_normalization();
-  double* tmp_a = new double[len_a];
-  double* tmp_b = new double[len_a];
-  // do the distance calculations
-  size_t index = 0;
-  for (int i = 0; i < images_len; ++i) {
-    cur_a = PySequence_Fast_GET_ITEM(images_seq, i);
-    if (cur_a == NULL)
-      goto uniq_error;
-    if (image_get_fv(cur_a, &buf_a, &len_a) < 0)
-      goto uniq_error;
-    if (normalize)
-      norm.apply(buf_a, buf_a + len_a, tmp_a);
-    for (int j = i + 1; j < images_len; ++j) {
-      cur_b = PySequence_Fast_GET_ITEM(images_seq, j);
-      if (cur_b == NULL)
-        goto uniq_error;
-      if (image_get_fv(cur_b, &buf_b, &len_b) < 0)
-        goto uniq_error;
-
-      if (len_a != len_b) {
-        PyErr_SetString(PyExc_ValueError, "Feature vector lengths do not match!");
-        goto uniq_error;
-      }
-      if (normalize)
-        norm.apply(buf_b, buf_b + len_b, tmp_b);
-      double distance;
-      if (normalize)
-        compute_distance(o->distance_type, tmp_a, len_a, tmp_b, &distance,
-                         o->selection_vector, o->weight_vector);
-      else
-        compute_distance(o->distance_type, buf_a, len_a, buf_b, &distance,
-                         o->selection_vector, o->weight_vector);
-      list->set(Point(index, 0), distance);
-      index++;
-    }
-    // call the progress object
-    PyObject_CallObject(progress, NULL);
+  if (condensed) {
+    error = knn_pairwise_distances(o, rows, images_len,
+                                   condensed_distances<float>((float*)buffer, images_len),
+                                   progress);
+  } else {
+    double* matrix = (double*)buffer;
+    for (size_t i = 0; i < images_len; ++i)
+      matrix[i * images_len + i] = 0.0;
+    error = knn_pairwise_distances(o, rows, images_len,
+                                   full_distances<double>(matrix, images_len),
+                                   progress);
   }
-
-  delete[] tmp_a; delete[] tmp_b;
-  return create_ImageObject(list);
-  // in case of error
- uniq_error:
-  delete[] tmp_a; delete[] tmp_b;
-  delete list;
-  delete data;
-  return 0;
+  if (error < 0)
+    return 0;
+  Py_INCREF(out);
+  return out;
 }
 
 static PyObject* knn_get_num_k(PyObject* self) {
@@ -959,6 +1670,8 @@ static PyObject* knn_leave_one_out(PyObject* self, PyObject* args) {
                     "knn: leave_one_out called before instantiate_from_images.");
     return 0;
   }
+  knn_prepare(o);
+  knn_prepare_histogram(o);
   if (indexes == 0) {
     // If we don't have a list of indexes, just do the leave_one_out
     Py_BEGIN_ALLOW_THREADS
@@ -1007,6 +1720,379 @@ static PyObject* knn_leave_one_out(PyObject* self, PyObject* args) {
   }
 }
 
+/*
+  Stratified k-fold cross validation. Returns the confusion counts as a
+  dictionary {(id_name, predicted id_name): count}.
+*/
+static PyObject* knn_stratified_kfold(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  int num_folds;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "i", &num_folds) <= 0)
+    return 0;
+  if (o->feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: stratified_kfold called before instantiate_from_images.");
+    return 0;
+  }
+  if (num_folds < 2) {
+    PyErr_SetString(PyExc_ValueError, "knn: the number of folds must be at least 2.");
+    return 0;
+  }
+  if (o->num_k < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: num_k must be at least 1");
+    return 0;
+  }
+  knn_prepare(o);
+
+  std::vector<char*> predicted;
+  Py_BEGIN_ALLOW_THREADS
+  stratified_kfold(o, num_folds, predicted);
+  Py_END_ALLOW_THREADS
+
+  typedef std::map<std::pair<std::string, std::string>, int> confusion_type;
+  confusion_type confusion;
+  for (size_t i = 0; i < predicted.size(); ++i) {
+    // without any neighbors, the classification is "unknown"
+    const char* answer = predicted[i] != 0 ? predicted[i] : "unknown";
+    confusion[std::make_pair(std::string(o->id_names[i]), std::string(answer))]++;
+  }
+  PyObject* result = PyDict_New();
+  for (confusion_type::iterator i = confusion.begin(); i != confusion.end(); ++i) {
+    PyObject* key = Py_BuildValue(CHAR_PTR_CAST "(ss)", i->first.first.c_str(),
+                                  i->first.second.c_str());
+    PyObject* value = PyInt_FromLong(i->second);
+    PyDict_SetItem(result, key, value);
+    Py_DECREF(key);
+    Py_DECREF(value);
+  }
+  return result;
+}
+
+/*
+  EDITING
+
+  Wilson's editing (MNN) and Hart's condensing (CNN) of the feature
+  vectors, which gamera.knn_editing uses to create edited classifiers.
+  Both return row numbers, which the caller maps back to its glyphs.
+*/
+
+// The rows in the sequence rows, which must be distinct.
+static int knn_parse_rows(KnnObject* o, PyObject* rows, std::vector<size_t>& result) {
+  PyObject* rows_seq = PySequence_Fast(rows, "knn: the rows must be a sequence of ints.");
+  if (rows_seq == NULL)
+    return -1;
+  size_t size = o->feature_vectors->size();
+  std::vector<char> seen(size, 0);
+  int rows_size = PySequence_Fast_GET_SIZE(rows_seq);
+  result.resize(rows_size);
+  for (int i = 0; i < rows_size; ++i) {
+    PyObject* tmp = PySequence_Fast_GET_ITEM(rows_seq, i);
+    if (!PyInt_Check(tmp)) {
+      PyErr_SetString(PyExc_TypeError, "knn: the rows must be a sequence of ints.");
+      Py_DECREF(rows_seq);
+      return -1;
+    }
+    long row = PyInt_AS_LONG(tmp);
+    if (row < 0 || row >= (long)size) {
+      PyErr_SetString(PyExc_IndexError, "knn: row out of range.");
+      Py_DECREF(rows_seq);
+      return -1;
+    }
+    if (seen[row]) {
+      PyErr_SetString(PyExc_ValueError, "knn: the rows must not contain duplicates.");
+      Py_DECREF(rows_seq);
+      return -1;
+    }
+    seen[row] = 1;
+    result[i] = size_t(row);
+  }
+  Py_DECREF(rows_seq);
+  return 0;
+}
+
+static PyObject* knn_rows_to_list(const std::vector<size_t>& rows) {
+  PyObject* result = PyList_New(rows.size());
+  for (size_t i = 0; i < rows.size(); ++i)
+    PyList_SET_ITEM(result, i, PyInt_FromLong((long)rows[i]));
+  return result;
+}
+
+/*
+  Classify row i by its k nearest neighbors among the other rows with the
+  kd-tree index. As the row itself is in the index, k + 1 neighbors are
+  searched.
+*/
+static void knn_index_row_majority(KnnObject* o, size_t i, size_t k, knn_row_type& knn) {
+  KdIndex::Result result;
+  o->index->search((*o->feature_vectors)[i], o->distance_type, k + 1, false, result, false);
+  size_t count = 0;
+  for (size_t j = 0; j < result.neighbors.size() && count < k; ++j) {
+    if (result.neighbors[j].second == i)
+      continue;
+    knn.add(o->id_names[result.neighbors[j].second], result.neighbors[j].first);
+    ++count;
+  }
+  knn.majority();
+}
+
+/*
+  Wilson's editing: every row is classified by its k nearest neighbors
+  among the other rows (as in leave_one_out), and the misclassified rows
+  are removed, except for the rows of classes with fewer than
+  rare_threshold rows. Returns the remaining rows in order.
+
+  The rows are classified in parallel with num_threads threads, block by
+  block, so that progress can be called once per row in between.
+*/
+static PyObject* knn_edit_mnn(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  int k, rare_threshold;
+  PyObject* progress = 0;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "ii|O", &k, &rare_threshold, &progress) <= 0)
+    return 0;
+  if (o->feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: edit_mnn called before instantiate_from_images.");
+    return 0;
+  }
+  if (k < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: k must be at least 1");
+    return 0;
+  }
+  if (progress == Py_None)
+    progress = 0;
+  knn_prepare(o);
+  knn_prepare_histogram(o);
+
+  bool bounded = nonnegative_weights(o->selection_vector, o->weight_vector,
+                                     o->num_features);
+  size_t size = o->feature_vectors->size();
+  std::vector<char> misclassified(size, 0);
+  int num_threads = knn_num_threads(o);
+  size_t block_size = 256 * size_t(num_threads);
+  for (size_t start = 0; start < size; start += block_size) {
+    int count = int(std::min(block_size, size - start));
+    Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel num_threads(num_threads)
+#endif
+    {
+      knn_row_type knn((size_t)k);
+#ifdef _OPENMP
+#pragma omp for schedule(dynamic, 8)
+#endif
+      for (int q = 0; q < count; ++q) {
+        size_t i = start + q;
+        if (o->index != 0)
+          knn_index_row_majority(o, i, (size_t)k, knn);
+        else
+          knn_row_majority(o, i, o->selection_vector, o->weight_vector, 0, bounded,
+                           knn_skip_row(i), knn);
+        // a single row has no neighbors and is kept
+        misclassified[i] = !knn.answer.empty() &&
+          strcmp(knn.answer[0].first, o->id_names[i]) != 0;
+        knn.reset();
+      }
+    }
+    Py_END_ALLOW_THREADS
+    for (int q = 0; progress != 0 && q < count; ++q) {
+      PyObject* ok = PyObject_CallObject(progress, NULL);
+      if (ok == 0)
+        return 0;
+      Py_DECREF(ok);
+    }
+  }
+
+  std::vector<size_t> kept;
+  for (size_t i = 0; i < size; ++i) {
+    if (!misclassified[i] || o->id_name_histogram[i] < rare_threshold)
+      kept.push_back(i);
+  }
+  return knn_rows_to_list(kept);
+}
+
+// the distance between two rows, computed only up to bound
+template<class T>
+inline double knn_distance_between_rows(KnnObject* o, const T* data, size_t a, size_t b,
+                                        double bound) {
+  double distance;
+  compute_distance(o->distance_type, data + a * o->feature_stride, o->num_features,
+                   data + b * o->feature_stride, &distance, o->selection_vector,
+                   o->weight_vector, bound);
+  return distance;
+}
+
+/*
+  The state of Hart's condensing: every row that is not in the store
+  keeps its k nearest neighbors in the store, sorted by distance, so that
+  classifying it with the store does not need any distance computations.
+*/
+struct knn_condensing {
+  typedef std::pair<double, size_t> neighbor_type;
+
+  knn_condensing(KnnObject* o_, size_t k_, const std::vector<size_t>& rows_)
+    : o(o_), k(k_), rows(rows_), neighbors(rows_.size() * k_),
+      num_neighbors(rows_.size(), 0), in_store(rows_.size(), 0) {
+    bounded = nonnegative_weights(o->selection_vector, o->weight_vector,
+                                  o->num_features);
+  }
+
+  /*
+    Move rows[p] into the store and add it to the neighbors of the rows in
+    pending that are not in the store. The distances are computed in
+    parallel with num_threads threads.
+  */
+  void add_to_store(size_t p, const std::vector<size_t>& pending, int num_threads) {
+    in_store[p] = 1;
+    size_t row = rows[p];
+    int count = int(pending.size());
+#ifdef _OPENMP
+#pragma omp parallel for num_threads(num_threads) schedule(static)
+#endif
+    for (int q = 0; q < count; ++q) {
+      size_t r = pending[q];
+      if (in_store[r])
+        continue;
+      neighbor_type* nn = &neighbors[r * k];
+      size_t& size = num_neighbors[r];
+      double worst = size < k ? std::numeric_limits<double>::max() : nn[size - 1].first;
+      double bound = bounded ? worst : std::numeric_limits<double>::infinity();
+      double distance;
+      if (o->single_precision)
+        distance = knn_distance_between_rows(o, (const float*)o->single_data,
+                                             rows[r], row, bound);
+      else
+        distance = knn_distance_between_rows(o, (const double*)o->feature_data,
+                                             rows[r], row, bound);
+      // as in kNearestNeighbors::add, ties do not replace a neighbor
+      if (distance < worst) {
+        size_t j = size < k ? size++ : k - 1;
+        for (; j > 0 && nn[j - 1].first > distance; --j)
+          nn[j] = nn[j - 1];
+        nn[j] = neighbor_type(distance, row);
+      }
+    }
+  }
+
+  // whether the store classifies rows[p] correctly
+  bool correct(size_t p, knn_row_type& knn) const {
+    knn.reset();
+    const neighbor_type* nn = &neighbors[p * k];
+    for (size_t j = 0; j < num_neighbors[p]; ++j)
+      knn.add(o->id_names[nn[j].second], nn[j].first);
+    knn.majority();
+    return !knn.answer.empty() && strcmp(knn.answer[0].first, o->id_names[rows[p]]) == 0;
+  }
+
+  KnnObject* o;
+  size_t k;
+  bool bounded;
+  const std::vector<size_t>& rows;
+  std::vector<neighbor_type> neighbors;
+  std::vector<size_t> num_neighbors;
+  std::vector<char> in_store;
+};
+
+/*
+  Hart's condensing of the given rows: the first row forms the store, and
+  every row that is misclassified by its k nearest neighbors in the store
+  is moved into the store, in passes over the remaining rows until no
+  more rows are moved. Returns the rows of the store in the order they
+  were added. progress is called once for each row added to the store.
+
+  The result is the same as classifying every remaining row with the
+  store in each pass, but every distance is computed only once: when a
+  row is added to the store, its distance to each remaining row.
+*/
+static PyObject* knn_edit_cnn(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  int k;
+  PyObject* rows_arg;
+  PyObject* progress = 0;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "iO|O", &k, &rows_arg, &progress) <= 0)
+    return 0;
+  if (o->feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: edit_cnn called before instantiate_from_images.");
+    return 0;
+  }
+  if (k < 1) {
+    PyErr_SetString(PyExc_ValueError, "knn: k must be at least 1");
+    return 0;
+  }
+  if (progress == Py_None)
+    progress = 0;
+  std::vector<size_t> rows;
+  if (knn_parse_rows(o, rows_arg, rows) < 0)
+    return 0;
+  std::vector<size_t> store;
+  if (rows.empty())
+    return knn_rows_to_list(store);
+  knn_prepare(o);
+
+  int num_threads = knn_num_threads(o);
+  knn_condensing condensing(o, (size_t)k, rows);
+  knn_row_type knn((size_t)k);
+  std::vector<size_t> pending;
+  for (size_t p = 1; p < rows.size(); ++p)
+    pending.push_back(p);
+  Py_BEGIN_ALLOW_THREADS
+  condensing.add_to_store(0, pending, num_threads);
+  Py_END_ALLOW_THREADS
+  store.push_back(rows[0]);
+
+  bool changed = true;
+  while (changed) {
+    changed = false;
+    std::vector<size_t> remaining;
+    for (size_t q = 0; q < pending.size(); ++q) {
+      size_t p = pending[q];
+      if (condensing.correct(p, knn)) {
+        remaining.push_back(p);
+        continue;
+      }
+      Py_BEGIN_ALLOW_THREADS
+      condensing.add_to_store(p, pending, num_threads);
+      Py_END_ALLOW_THREADS
+      store.push_back(rows[p]);
+      changed = true;
+      if (progress != 0) {
+        PyObject* ok = PyObject_CallObject(progress, NULL);
+        if (ok == 0)
+          return 0;
+        Py_DECREF(ok);
+      }
+    }
+    pending.swap(remaining);
+  }
+  return knn_rows_to_list(store);
+}
+
+/*
+  Find the k nearest neighbors of row i among the other rows in data.
+*/
+template<class T>
+static void knn_row_neighbors(KnnObject* o, const T* data, size_t i, bool bounded,
+                              kNearestNeighbors<char*, ltstr, eqstr>& knn) {
+  const T* feature_i = data + i * o->feature_stride;
+  for (size_t j = 0; j < o->feature_vectors->size(); j++) {
+    if (j == i) continue;
+    const T* feature_j = data + j * o->feature_stride;
+    double distance;
+    // compute distance
+    if (bounded)
+      compute_distance(o->distance_type, feature_i, o->num_features,
+                       feature_j, &distance, o->selection_vector, o->weight_vector,
+                       knn.worst_distance());
+    else
+      compute_distance(o->distance_type, feature_i, o->num_features,
+                       feature_j, &distance, o->selection_vector, o->weight_vector);
+    // store distance in kNearestNeighbors
+    if (distance < knn.worst_distance())
+      knn.add(o->id_names[j], distance);
+  }
+}
+
 /*
   statistics of average distance to k nearest neighbors
 */
@@ -1022,6 +2108,7 @@ static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args) {
                     "knn: knndistance_statistics called before instantiate_from_images.");
     return 0;
   }
+  knn_prepare(o);
   if (k <= 0) {
     k = o->num_k;
   }
@@ -1032,22 +2119,18 @@ static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args) {
   }
   PyObject* entry;
   PyObject* result = PyList_New(o->feature_vectors->size());
-  double *feature_i, *feature_j;
   double distance;
   kNearestNeighbors<char*, ltstr, eqstr> knn((size_t)k);
+  // only the k nearest neighbors are needed, so distances can be bounded
+  bool bounded = nonnegative_weights(o->selection_vector, o->weight_vector,
+                                     o->num_features);
   for (i=0; i<o->feature_vectors->size(); i++) {
     knn.reset();
     // find k nearest neighbors of i-th prototype
-    feature_i = (*o->feature_vectors)[i];
-    for (j=0; j<o->feature_vectors->size(); j++) {
-      if (j==i) continue;
-      feature_j = (*o->feature_vectors)[j];
-      // compute distance
-      compute_distance(o->distance_type, feature_i, o->num_features,
-                       feature_j, &distance, o->selection_vector, o->weight_vector);
-      // store distance in kNearestNeighbors
-      knn.add(o->id_names[j], distance);
-    }
+    if (o->single_precision)
+      knn_row_neighbors(o, (const float*)o->single_data, i, bounded, knn);
+    else
+      knn_row_neighbors(o, (const double*)o->feature_data, i, bounded, knn);
     // compute average distance
     distance = 0.0;
     for (j=0; j < knn.m_nn.size(); ++j) {
@@ -1112,7 +2195,8 @@ static PyObject* knn_knndistance_statistics(PyObject* self, PyObject* args) {
 
   There are, of course, feature_vectors->size() id_names. Next is the data which is
   simply written directly - i.e. feature_vectors->size() arrays of doubles of length
-  num_features.
+  num_features. Feature vectors stored in single precision are written as doubles
+  as well; unserialize stores them in the precision set on the kNN object.
 
 */
 static PyObject* knn_serialize(PyObject* self, PyObject* args) {
@@ -1142,6 +2226,7 @@ static PyObject* knn_serialize(PyObject* self, PyObject* args) {
     fclose(file);
     return 0;
   }
+  knn_prepare(o);
 
   // write the header info
   unsigned long version = 2;
@@ -1242,11 +2327,11 @@ static PyObject* knn_serialize(PyObject* self, PyObject* args) {
     return 0;
   }
 
-  // write the data
-  double* cur;
+  // write the data (always in double precision)
+  std::vector<double> cur(o->num_features);
   for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    cur = (*o->feature_vectors)[i];
-    if (fwrite((const void*)cur, sizeof(double), o->num_features, file)
+    knn_get_row(o, i, &cur[0]);
+    if (fwrite((const void*)&cur[0], sizeof(double), o->num_features, file)
         != o->num_features) {
       PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
       fclose(file);
@@ -1352,7 +2437,12 @@ static PyObject* knn_unserialize(PyObject* self, PyObject* args) {
     return 0;
   }
 
+  if (o->normalize != 0) {
+    delete o->normalize;
+    o->normalize = 0;
+  }
   if (normalize) {
+    o->normalize = new Normalize(o->num_features);
     double* tmp_mean_norm = new double[o->num_features];
     if (fread((void*)tmp_mean_norm, sizeof(double), o->num_features, file) != o->num_features) {
       PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
@@ -1386,21 +2476,479 @@ static PyObject* knn_unserialize(PyObject* self, PyObject* args) {
     return 0;
   }
 
-  double* cur;
+  std::vector<double> cur(o->num_features);
   for (size_t i = 0; i < o->feature_vectors->size(); ++i) {
-    cur = (*o->feature_vectors)[i];
-    if (fread((void*)cur, sizeof(double), o->num_features, file) != o->num_features) {
+    if (fread((void*)&cur[0], sizeof(double), o->num_features, file) != o->num_features) {
       PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
       fclose(file);
       return 0;
     }
+    knn_put_row(o, i, &cur[0]);
     o->id_name_histogram[i] = id_name_histogram[o->id_names[i]];
   }
+  knn_compute_feature_range(o);
+  knn_build_index(o);
 
   fclose(file);
   return feature_names;
 }
 
+/*
+  SNAPSHOTS
+
+  A snapshot stores the same data as serialize, but in a layout that can
+  be memory mapped by load_snapshot without copying or parsing the data:
+  the feature matrix, the id_names and the range of each feature are used
+  in place, so that several processes loading the same snapshot share a
+  single copy of it in the page cache. Only the per-row pointers and the
+  (small) normalization, selection and weight vectors are copied.
+
+  As the data is used in place, the format depends on the byte order and
+  the sizes of int and double, which are stored in the header and checked
+  when loading.
+
+  FORMAT
+
+  The file starts with the header (struct SnapshotHeader below). The
+  header contains the offset of each section of the file, where every
+  section starts at a multiple of 64 bytes:
+
+  section             what
+  ------------------------------------------
+  feature names       num_feature_names null terminated strings
+  id_name offsets     an unsigned PY_LONG_LONG for each feature vector: the
+                      offset of its id_name within the id_names section
+  id_names            null terminated strings
+  histogram           an int for each feature vector: the number of
+                      feature vectors with the same id_name
+  mean, stdev         double[num_features] each, the normalization (only
+                      meaningful when the normalize flag is set)
+  selections          int[num_features]
+  weights             double[num_features]
+  feature min, max    double[num_features] each, the range of each feature
+  feature data        double[num_feature_vectors * feature_stride], or
+                      float[...] when the single_precision flag is set
+
+  The feature vectors are stored already normalized and in the precision
+  used in memory.
+*/
+static const char snapshot_magic[8] = {'G', 'A', 'M', 'E', 'R', 'A', 'K', 'N'};
+static const unsigned int snapshot_version = 2;
+static const unsigned int snapshot_byte_order = 0x01020304;
+static const size_t snapshot_alignment = 64;
+
+enum SnapshotSection {
+  SNAPSHOT_FEATURE_NAMES,
+  SNAPSHOT_ID_NAME_OFFSETS,
+  SNAPSHOT_ID_NAMES,
+  SNAPSHOT_HISTOGRAM,
+  SNAPSHOT_MEAN,
+  SNAPSHOT_STDEV,
+  SNAPSHOT_SELECTIONS,
+  SNAPSHOT_WEIGHTS,
+  SNAPSHOT_FEATURE_MIN,
+  SNAPSHOT_FEATURE_MAX,
+  SNAPSHOT_FEATURE_DATA,
+  // the end of the file
+  SNAPSHOT_END,
+  NUM_SNAPSHOT_SECTIONS
+};
+
+struct SnapshotHeader {
+  char magic[8];
+  unsigned int byte_order;
+  unsigned int version;
+  unsigned int int_size;
+  unsigned int double_size;
+  unsigned PY_LONG_LONG num_k;
+  unsigned PY_LONG_LONG num_features;
+  unsigned PY_LONG_LONG num_feature_vectors;
+  unsigned PY_LONG_LONG feature_stride;
+  unsigned PY_LONG_LONG normalize;
+  unsigned PY_LONG_LONG single_precision;
+  unsigned PY_LONG_LONG num_feature_names;
+  unsigned PY_LONG_LONG offsets[NUM_SNAPSHOT_SECTIONS];
+};
+
+static size_t snapshot_align(size_t offset) {
+  return (offset + snapshot_alignment - 1) / snapshot_alignment * snapshot_alignment;
+}
+
+/*
+  Write a section of a snapshot, preceded by the padding from the current
+  position up to its offset.
+*/
+static bool snapshot_write(FILE* file, size_t& position, size_t offset,
+                           const void* data, size_t size) {
+  static const char zeros[snapshot_alignment] = {0};
+  assert(offset >= position && offset - position <= snapshot_alignment);
+  if (offset > position &&
+      fwrite((const void*)zeros, 1, offset - position, file) != offset - position)
+    return false;
+  if (size > 0 && fwrite(data, 1, size, file) != size)
+    return false;
+  position = offset + size;
+  return true;
+}
+
+static PyObject* knn_save_snapshot(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  char* filename;
+  PyObject* features;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "sO", &filename, &features) <= 0) {
+    return 0;
+  }
+  if (!PyList_Check(features)) {
+    PyErr_SetString(PyExc_TypeError, "knn: list of features must be a list.");
+    return 0;
+  }
+  if (o->feature_vectors == 0) {
+    PyErr_SetString(PyExc_RuntimeError, "knn: save_snapshot called before instatiate from images.");
+    return 0;
+  }
+  knn_prepare(o);
+  knn_prepare_histogram(o);
+
+  size_t num_feature_vectors = o->feature_vectors->size();
+  std::string feature_names;
+  for (Py_ssize_t i = 0; i < PyList_GET_SIZE(features); ++i) {
+    char* name = PyString_AsString(PyList_GET_ITEM(features, i));
+    if (name == 0)
+      return 0;
+    feature_names.append(name, strlen(name) + 1);
+  }
+  std::vector<unsigned PY_LONG_LONG> id_name_offsets(num_feature_vectors);
+  std::string id_names;
+  for (size_t i = 0; i < num_feature_vectors; ++i) {
+    id_name_offsets[i] = id_names.size();
+    id_names.append(o->id_names[i], strlen(o->id_names[i]) + 1);
+  }
+  std::vector<double> mean(o->num_features, 0.0), stdev(o->num_features, 1.0);
+  if (o->normalize != 0) {
+    std::copy(o->normalize->get_mean_vector(),
+              o->normalize->get_mean_vector() + o->num_features, mean.begin());
+    std::copy(o->normalize->get_stdev_vector(),
+              o->normalize->get_stdev_vector() + o->num_features, stdev.begin());
+  }
+
+  SnapshotHeader header;
+  memset(&header, 0, sizeof(SnapshotHeader));
+  memcpy(header.magic, snapshot_magic, sizeof(snapshot_magic));
+  header.byte_order = snapshot_byte_order;
+  header.version = snapshot_version;
+  header.int_size = sizeof(int);
+  header.double_size = sizeof(double);
+  header.num_k = o->num_k;
+  header.num_features = o->num_features;
+  header.num_feature_vectors = num_feature_vectors;
+  header.feature_stride = o->feature_stride;
+  header.normalize = (o->normalize != 0);
+  header.single_precision = o->single_precision;
+  header.num_feature_names = PyList_GET_SIZE(features);
+
+  // the sections in the order of the file
+  const void* data[SNAPSHOT_END];
+  size_t sizes[SNAPSHOT_END];
+  data[SNAPSHOT_FEATURE_NAMES] = feature_names.data();
+  sizes[SNAPSHOT_FEATURE_NAMES] = feature_names.size();
+  data[SNAPSHOT_ID_NAME_OFFSETS] = &id_name_offsets[0];
+  sizes[SNAPSHOT_ID_NAME_OFFSETS] = num_feature_vectors * sizeof(unsigned PY_LONG_LONG);
+  data[SNAPSHOT_ID_NAMES] = id_names.data();
+  sizes[SNAPSHOT_ID_NAMES] = id_names.size();
+  data[SNAPSHOT_HISTOGRAM] = o->id_name_histogram;
+  sizes[SNAPSHOT_HISTOGRAM] = num_feature_vectors * sizeof(int);
+  data[SNAPSHOT_MEAN] = &mean[0];
+  sizes[SNAPSHOT_MEAN] = o->num_features * sizeof(double);
+  data[SNAPSHOT_STDEV] = &stdev[0];
+  sizes[SNAPSHOT_STDEV] = o->num_features * sizeof(double);
+  data[SNAPSHOT_SELECTIONS] = o->selection_vector;
+  sizes[SNAPSHOT_SELECTIONS] = o->num_features * sizeof(int);
+  data[SNAPSHOT_WEIGHTS] = o->weight_vector;
+  sizes[SNAPSHOT_WEIGHTS] = o->num_features * sizeof(double);
+  data[SNAPSHOT_FEATURE_MIN] = o->feature_min;
+  sizes[SNAPSHOT_FEATURE_MIN] = o->num_features * sizeof(double);
+  data[SNAPSHOT_FEATURE_MAX] = o->feature_max;
+  sizes[SNAPSHOT_FEATURE_MAX] = o->num_features * sizeof(double);
+  if (o->single_precision) {
+    data[SNAPSHOT_FEATURE_DATA] = o->single_data;
+    sizes[SNAPSHOT_FEATURE_DATA] = num_feature_vectors * o->feature_stride * sizeof(float);
+  } else {
+    data[SNAPSHOT_FEATURE_DATA] = o->feature_data;
+    sizes[SNAPSHOT_FEATURE_DATA] = num_feature_vectors * o->feature_stride * sizeof(double);
+  }
+
+  size_t offset = sizeof(SnapshotHeader);
+  for (size_t i = 0; i < SNAPSHOT_END; ++i) {
+    offset = snapshot_align(offset);
+    header.offsets[i] = offset;
+    offset += sizes[i];
+  }
+  header.offsets[SNAPSHOT_END] = offset;
+
+  /*
+    Other processes may have the old snapshot mapped, so it must not be
+    rewritten in place: the new snapshot is written to a temporary file
+    in the same directory, which then replaces the old one.
+  */
+  char process_id[32];
+#ifdef _WIN32
+  sprintf(process_id, ".%lu.tmp", (unsigned long)GetCurrentProcessId());
+#else
+  sprintf(process_id, ".%lu.tmp", (unsigned long)getpid());
+#endif
+  std::string temporary = std::string(filename) + process_id;
+  FILE* file = fopen(temporary.c_str(), "wb");
+  if (file == 0) {
+    PyErr_SetString(PyExc_IOError, "knn: error opening file.");
+    return 0;
+  }
+  size_t position = 0;
+  bool ok = snapshot_write(file, position, 0, &header, sizeof(SnapshotHeader));
+  for (size_t i = 0; i < SNAPSHOT_END && ok; ++i)
+    ok = snapshot_write(file, position, (size_t)header.offsets[i], data[i], sizes[i]);
+  if (fclose(file) != 0)
+    ok = false;
+  if (ok) {
+#ifdef _WIN32
+    ok = MoveFileExA(temporary.c_str(), filename, MOVEFILE_REPLACE_EXISTING) != 0;
+#else
+    ok = rename(temporary.c_str(), filename) == 0;
+#endif
+  }
+  if (!ok) {
+    remove(temporary.c_str());
+    PyErr_SetString(PyExc_IOError, "knn: problem writing to a file.");
+    return 0;
+  }
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+/*
+  Map a file read-only into memory. On failure, a Python exception is
+  set and 0 is returned.
+*/
+static void* knn_map_file(const char* filename, size_t* size) {
+#ifdef _WIN32
+  // FILE_SHARE_DELETE lets save_snapshot replace the file while it is mapped
+  HANDLE file = CreateFileA(filename, GENERIC_READ,
+                            FILE_SHARE_READ | FILE_SHARE_DELETE, NULL,
+                            OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, NULL);
+  if (file == INVALID_HANDLE_VALUE) {
+    PyErr_SetString(PyExc_IOError, "knn: error opening file.");
+    return 0;
+  }
+  LARGE_INTEGER file_size;
+  if (!GetFileSizeEx(file, &file_size) || file_size.QuadPart == 0) {
+    CloseHandle(file);
+    PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
+    return 0;
+  }
+  HANDLE mapping = CreateFileMapping(file, NULL, PAGE_READONLY, 0, 0, NULL);
+  CloseHandle(file);
+  if (mapping == NULL) {
+    PyErr_SetString(PyExc_IOError, "knn: could not map file.");
+    return 0;
+  }
+  void* address = MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0);
+  // the view keeps the mapping alive
+  CloseHandle(mapping);
+  if (address == NULL) {
+    PyErr_SetString(PyExc_IOError, "knn: could not map file.");
+    return 0;
+  }
+  *size = (size_t)file_size.QuadPart;
+  return address;
+#else
+  int fd = open(filename, O_RDONLY);
+  if (fd < 0) {
+    PyErr_SetString(PyExc_IOError, "knn: error opening file.");
+    return 0;
+  }
+  struct stat info;
+  if (fstat(fd, &info) != 0 || info.st_size == 0) {
+    close(fd);
+    PyErr_SetString(PyExc_IOError, "knn: problem reading file.");
+    return 0;
+  }
+  void* address = mmap(0, (size_t)info.st_size, PROT_READ, MAP_SHARED, fd, 0);
+  // the mapping stays valid after closing the file
+  close(fd);
+  if (address == MAP_FAILED) {
+    PyErr_SetString(PyExc_IOError, "knn: could not map file.");
+    return 0;
+  }
+  *size = (size_t)info.st_size;
+  return address;
+#endif
+}
+
+static void knn_unmap_file(void* address, size_t size) {
+#ifdef _WIN32
+  UnmapViewOfFile(address);
+#else
+  munmap(address, size);
+#endif
+}
+
+/*
+  Check the header of a mapped snapshot and that all sections lie within
+  the file. On failure, a Python exception is set and false is returned.
+*/
+static bool knn_check_snapshot(const char* base, size_t size) {
+  if (size < sizeof(SnapshotHeader) ||
+      memcmp(base, snapshot_magic, sizeof(snapshot_magic)) != 0) {
+    PyErr_SetString(PyExc_IOError, "knn: file is not a kNN snapshot.");
+    return false;
+  }
+  const SnapshotHeader* header = (const SnapshotHeader*)base;
+  if (header->byte_order != snapshot_byte_order ||
+      header->int_size != sizeof(int) || header->double_size != sizeof(double)) {
+    PyErr_SetString(PyExc_IOError, "knn: the kNN snapshot was created on an incompatible platform.");
+    return false;
+  }
+  if (header->version != snapshot_version) {
+    PyErr_SetString(PyExc_IOError, "knn: unknown version of kNN snapshot.");
+    return false;
+  }
+  unsigned PY_LONG_LONG n = header->num_feature_vectors;
+  unsigned PY_LONG_LONG d = header->num_features;
+  if (n == 0 || d == 0 || header->feature_stride < d ||
+      header->offsets[SNAPSHOT_END] != size) {
+    PyErr_SetString(PyExc_IOError, "knn: corrupt kNN snapshot.");
+    return false;
+  }
+  // the minimal size of each section
+  unsigned PY_LONG_LONG sizes[SNAPSHOT_END];
+  sizes[SNAPSHOT_FEATURE_NAMES] = header->num_feature_names;
+  sizes[SNAPSHOT_ID_NAME_OFFSETS] = n * sizeof(unsigned PY_LONG_LONG);
+  sizes[SNAPSHOT_ID_NAMES] = n;
+  sizes[SNAPSHOT_HISTOGRAM] = n * sizeof(int);
+  sizes[SNAPSHOT_MEAN] = sizes[SNAPSHOT_STDEV] = d * sizeof(double);
+  sizes[SNAPSHOT_SELECTIONS] = d * sizeof(int);
+  sizes[SNAPSHOT_WEIGHTS] = d * sizeof(double);
+  sizes[SNAPSHOT_FEATURE_MIN] = sizes[SNAPSHOT_FEATURE_MAX] = d * sizeof(double);
+  sizes[SNAPSHOT_FEATURE_DATA] = n * header->feature_stride *
+    (header->single_precision ? sizeof(float) : sizeof(double));
+  for (size_t i = 0; i < SNAPSHOT_END; ++i) {
+    if (header->offsets[i] % snapshot_alignment != 0 ||
+        header->offsets[i] < sizeof(SnapshotHeader) ||
+        header->offsets[i] + sizes[i] > header->offsets[i + 1]) {
+      PyErr_SetString(PyExc_IOError, "knn: corrupt kNN snapshot.");
+      return false;
+    }
+  }
+  // all strings must be terminated within their section
+  size_t names_end = (size_t)header->offsets[SNAPSHOT_ID_NAME_OFFSETS];
+  size_t id_names_begin = (size_t)header->offsets[SNAPSHOT_ID_NAMES];
+  size_t id_names_end = (size_t)header->offsets[SNAPSHOT_HISTOGRAM];
+  const unsigned PY_LONG_LONG* id_name_offsets =
+    (const unsigned PY_LONG_LONG*)(base + header->offsets[SNAPSHOT_ID_NAME_OFFSETS]);
+  size_t position = (size_t)header->offsets[SNAPSHOT_FEATURE_NAMES];
+  for (size_t i = 0; i < header->num_feature_names; ++i) {
+    const char* end = (const char*)memchr(base + position, 0, names_end - position);
+    if (end == 0) {
+      PyErr_SetString(PyExc_IOError, "knn: corrupt kNN snapshot.");
+      return false;
+    }
+    position = end - base + 1;
+  }
+  for (size_t i = 0; i < n; ++i) {
+    if (id_name_offsets[i] >= id_names_end - id_names_begin ||
+        memchr(base + id_names_begin + id_name_offsets[i], 0,
+               id_names_end - id_names_begin - id_name_offsets[i]) == 0) {
+      PyErr_SetString(PyExc_IOError, "knn: corrupt kNN snapshot.");
+      return false;
+    }
+  }
+  return true;
+}
+
+static PyObject* knn_load_snapshot(PyObject* self, PyObject* args) {
+  KnnObject* o = (KnnObject*)self;
+  char* filename;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "s", &filename) <= 0)
+    return 0;
+
+  size_t size;
+  void* mapping = knn_map_file(filename, &size);
+  if (mapping == 0)
+    return 0;
+  char* base = (char*)mapping;
+  if (!knn_check_snapshot(base, size)) {
+    knn_unmap_file(mapping, size);
+    return 0;
+  }
+  const SnapshotHeader* header = (const SnapshotHeader*)base;
+  size_t num_feature_vectors = (size_t)header->num_feature_vectors;
+
+  PyObject* feature_names = PyList_New((Py_ssize_t)header->num_feature_names);
+  const char* name = base + header->offsets[SNAPSHOT_FEATURE_NAMES];
+  for (size_t i = 0; i < header->num_feature_names; ++i) {
+    PyList_SET_ITEM(feature_names, i, PyString_FromString(name));
+    name += strlen(name) + 1;
+  }
+
+  knn_delete_feature_data(o);
+  set_num_features(o, (size_t)header->num_features);
+  o->num_k = (size_t)header->num_k;
+  o->mapping = mapping;
+  o->mapping_size = size;
+
+  // the data is used in place
+  o->feature_stride = (size_t)header->feature_stride;
+  o->single_precision = (header->single_precision != 0);
+  if (o->single_precision)
+    o->single_data = (float*)(base + header->offsets[SNAPSHOT_FEATURE_DATA]);
+  else
+    o->feature_data = (double*)(base + header->offsets[SNAPSHOT_FEATURE_DATA]);
+  o->feature_vectors = new std::vector<double*>(num_feature_vectors);
+  knn_set_row_pointers(o);
+  const unsigned PY_LONG_LONG* id_name_offsets =
+    (const unsigned PY_LONG_LONG*)(base + header->offsets[SNAPSHOT_ID_NAME_OFFSETS]);
+  o->id_names = new char*[num_feature_vectors];
+  for (size_t i = 0; i < num_feature_vectors; ++i)
+    o->id_names[i] = base + header->offsets[SNAPSHOT_ID_NAMES] + id_name_offsets[i];
+  o->id_name_histogram = (int*)(base + header->offsets[SNAPSHOT_HISTOGRAM]);
+  o->feature_min = (double*)(base + header->offsets[SNAPSHOT_FEATURE_MIN]);
+  o->feature_max = (double*)(base + header->offsets[SNAPSHOT_FEATURE_MAX]);
+
+  // the settings are copied, because they can be changed
+  const int* selections = (const int*)(base + header->offsets[SNAPSHOT_SELECTIONS]);
+  std::copy(selections, selections + o->num_features, o->selection_vector);
+  const double* weights = (const double*)(base + header->offsets[SNAPSHOT_WEIGHTS]);
+  std::copy(weights, weights + o->num_features, o->weight_vector);
+  if (o->normalize != 0) {
+    delete o->normalize;
+    o->normalize = 0;
+  }
+  if (header->normalize) {
+    o->normalize = new Normalize(o->num_features);
+    const double* mean = (const double*)(base + header->offsets[SNAPSHOT_MEAN]);
+    o->normalize->set_mean_vector(mean, mean + o->num_features);
+    const double* stdev = (const double*)(base + header->offsets[SNAPSHOT_STDEV]);
+    o->normalize->set_stdev_vector(stdev, stdev + o->num_features);
+  }
+  knn_build_index(o);
+  return feature_names;
+}
+
+static PyObject* knn_is_snapshot(PyObject* self, PyObject* args) {
+  char* filename;
+  if (PyArg_ParseTuple(args, CHAR_PTR_CAST "s", &filename) <= 0)
+    return 0;
+  FILE* file = fopen(filename, "rb");
+  if (file == 0) {
+    PyErr_SetString(PyExc_IOError, "knn: error opening file.");
+    return 0;
+  }
+  char magic[sizeof(snapshot_magic)];
+  bool result = (fread((void*)magic, 1, sizeof(magic), file) == sizeof(magic) &&
+                 memcmp(magic, snapshot_magic, sizeof(magic)) == 0);
+  fclose(file);
+  return PyBool_FromLong(result);
+}
+
 static PyObject* knn_get_selections(PyObject* self, PyObject* args) {
   KnnObject *o = (KnnObject*) self;
   PyObject *arglist = Py_BuildValue(CHAR_PTR_CAST "(s)", "i");
@@ -1479,6 +3027,7 @@ static PyObject* knn_set_selections(PyObject* self, PyObject* args) {
       return 0;
     }
   }
+  knn_build_index(o);
 
   Py_INCREF(Py_None);
   return Py_None;
@@ -1507,6 +3056,7 @@ static PyObject* knn_set_weights(PyObject* self, PyObject* args) {
   for (size_t i = 0; i < o->num_features; ++i) {
     o->weight_vector[i] = weights[i];
   }
+  knn_build_index(o);
   Py_INCREF(Py_None);
   return Py_None;
 }
@@ -1526,7 +3076,119 @@ static int knn_set_num_features(PyObject* self, PyObject* v) {
   return 0;
 }
 
+static PyObject* knn_get_use_index(PyObject* self) {
+  KnnObject* o = (KnnObject*)self;
+  return PyBool_FromLong(o->use_index);
+}
+
+static int knn_set_use_index(PyObject* self, PyObject* v) {
+  KnnObject* o = (KnnObject*)self;
+  int flag = PyObject_IsTrue(v);
+  if (flag < 0)
+    return -1;
+  if (bool(flag) != o->use_index) {
+    o->use_index = bool(flag);
+    knn_build_index(o);
+  }
+  return 0;
+}
+
+static PyObject* knn_get_index_build_time(PyObject* self) {
+  KnnObject* o = (KnnObject*)self;
+  return PyFloat_FromDouble(o->index_build_time);
+}
+
+static PyObject* knn_get_single_precision(PyObject* self) {
+  return PyBool_FromLong(((KnnObject*)self)->single_precision);
+}
+
+/*
+  Convert the rows of src (with stride src_stride) into the rows of dest.
+*/
+template<class T, class U>
+static void knn_convert_rows(KnnObject* o, const T* src, size_t src_stride,
+                             U* dest, size_t size) {
+  for (size_t i = 0; i < size; ++i)
+    std::copy(src + i * src_stride, src + i * src_stride + o->num_features,
+              dest + i * o->feature_stride);
+}
+
+/*
+  Changing the precision converts the rows of the existing feature data.
+*/
+static int knn_set_single_precision(PyObject* self, PyObject* v) {
+  KnnObject* o = (KnnObject*)self;
+  int flag = PyObject_IsTrue(v);
+  if (flag < 0)
+    return -1;
+  if (bool(flag) == o->single_precision)
+    return 0;
+  if (o->feature_vectors == 0) {
+    o->single_precision = bool(flag);
+    return 0;
+  }
+  if (o->mapping != 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+                    "knn: the precision of a snapshot cannot be changed");
+    return -1;
+  }
+  try {
+    size_t size = o->feature_vectors->size();
+    size_t old_stride = o->feature_stride;
+    char* old_storage = o->feature_storage;
+    if (flag) {
+      o->feature_stride = feature_stride(o->num_features, sizeof(float));
+      o->feature_storage = knn_allocate_rows(o->feature_capacity, o->feature_stride,
+                                             &o->single_data);
+      knn_convert_rows(o, o->feature_data, old_stride, o->single_data, size);
+      o->feature_data = 0;
+    } else {
+      o->feature_stride = feature_stride(o->num_features);
+      o->feature_storage = knn_allocate_rows(o->feature_capacity, o->feature_stride,
+                                             &o->feature_data);
+      knn_convert_rows(o, o->single_data, old_stride, o->feature_data, size);
+      o->single_data = 0;
+    }
+    delete[] old_storage;
+    if (o->raw_data != 0) {
+      double* raw_data = new double[o->feature_capacity * o->feature_stride];
+      knn_convert_rows(o, o->raw_data, old_stride, raw_data, size);
+      delete[] o->raw_data;
+      o->raw_data = raw_data;
+    }
+    o->single_precision = bool(flag);
+    knn_set_row_pointers(o);
+    if (size > 0)
+      knn_compute_feature_range(o);
+    knn_build_index(o);
+  } catch (std::exception& e) {
+    PyErr_SetString(PyExc_RuntimeError, e.what());
+    return -1;
+  }
+  return 0;
+}
+
+static PyObject* knn_get_num_threads(PyObject* self) {
+  return Py_BuildValue(CHAR_PTR_CAST "i", ((KnnObject*)self)->num_threads);
+}
+
+static int knn_set_num_threads(PyObject* self, PyObject* v) {
+  if (!PyInt_Check(v)) {
+    PyErr_SetString(PyExc_TypeError, "knn: expected an int.");
+    return -1;
+  }
+  long num_threads = PyInt_AS_LONG(v);
+  if (num_threads < 0) {
+    PyErr_SetString(PyExc_ValueError, "knn: num_threads must not be negative.");
+    return -1;
+  }
+  ((KnnObject*)self)->num_threads = (int)num_threads;
+  return 0;
+}
+
 PyMethodDef knn_module_methods[] = {
+  { (char *)"is_snapshot", knn_is_snapshot, METH_VARARGS,
+    (char *)"Returns whether the given file is a kNN snapshot (see kNNNonInteractive.save_snapshot)." },
   { NULL }
 };
 
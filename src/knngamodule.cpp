@@ -1637,6 +1637,9 @@ static PyObject *GAOptimization_new(PyTypeObject *pytype, PyObject *args, PyObje
 
     // Attention: no type-checking is performed for the classifier object!
     KnnObject *knn = (KnnObject*) classifier;
+    // apply pending changes before leave_one_out runs in several threads
+    knn_prepare(knn);
+    knn_prepare_histogram(knn);
 
     GABaseSettingObject *ga_baseSetting = (GABaseSettingObject*) baseSetting;
     GASelectionObject *ga_selection = (GASelectionObject*) selection;
@@ -682,7 +682,7 @@ static PyObject* rect_repr(PyObject* self) {
 
 static long rect_hash(PyObject* self) {
   Rect* x = ((RectObject*)self)->m_x;
-  return (((x->ul_x() & 0xff) << 24) & ((x->ul_y() & 0xff) << 16) & ((x->lr_x() & 0xff) << 8) & (x->lr_y() & 0xff));
+  return (((x->ul_x() & 0xff) << 24) | ((x->ul_y() & 0xff) << 16) | ((x->lr_x() & 0xff) << 8) | (x->lr_y() & 0xff));
 }
 
 void init_RectType(PyObject* module_dict) {
@@ -1,5 +1,7 @@
 from gamera.core import *
-from gamera import knn, classify, gamera_xml
+from gamera import knn, knncore, classify, gamera_xml
+import array
+import py.test
 init_gamera()
 
 correct_classes = ['latin.lower.letter.h', 'latin.lower.ligature.ft', 'latin.capital.letter.m', '_group._part.latin.capital.letter.m', '_group._part.latin.capital.letter.m', '_group._part.latin.lower.letter.i', 'latin.lower.letter.d', 'latin.capital.letter.m', 'latin.capital.letter.t', '_group._part.latin.lower.letter.h', 'latin.lower.ligature.fi', '_group._part.latin.lower.ligature.ft', '_group._part.latin.lower.letter.h', '_group._part.latin.lower.letter.i', 'latin.lower.letter.h', 'latin.lower.letter.d', 'latin.lower.letter.d', 'latin.capital.letter.m', 'latin.capital.letter.c', 'latin.lower.letter.t', 'latin.lower.letter.t', '_group._part.latin.lower.letter.n', 'latin.lower.letter.e', 'latin.lower.letter.a', 'latin.lower.letter.r', 'latin.lower.letter.r', 'latin.lower.letter.a', '_group._part.latin.lower.letter.n', '_group._part.latin.lower.letter.i', 'latin.lower.letter.a', 'latin.lower.letter.r', 'latin.lower.letter.r', '_group._part.latin.lower.letter.h', 'latin.lower.letter.e', 'latin.lower.letter.r', 'latin.lower.letter.e', 'latin.lower.letter.n', 'latin.lower.letter.n', 'latin.lower.letter.o', 'latin.lower.letter.e', 'latin.lower.letter.s', 'latin.lower.letter.e', '_group._part.latin.lower.letter.h', '_group._part.latin.lower.letter.i', '_group._part.latin.lower.letter.g', 'latin.lower.letter.a', 'latin.lower.letter.r', 'latin.lower.letter.r', 'latin.lower.letter.o-', 'latin.lower.letter.r', 'hyphen-minus', 'comma', 'full.stop', 'comma', '_group._part.latin.lower.ligature.ft', 'noise', '_group._part.latin.lower.letter.g']
@@ -127,3 +129,391 @@ def test_noninteractive_classifier():
    assert len(classifier.get_glyphs()) == 0
    classifier.unserialize("tmp/serialized.knn")
 
+
+def test_indexed_classifier():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   confidence_types = [CONFIDENCE_DEFAULT, CONFIDENCE_KNNFRACTION,
+                       CONFIDENCE_INVERSEWEIGHT, CONFIDENCE_LINEARWEIGHT,
+                       CONFIDENCE_NUN, CONFIDENCE_NNDISTANCE,
+                       CONFIDENCE_AVGDISTANCE]
+   plain = knn.kNNNonInteractive(database,features=featureset,normalize=True)
+   indexed = knn.kNNNonInteractive(database,features=featureset,normalize=True,
+                                   use_index=True)
+   assert indexed.use_index and not plain.use_index
+   assert indexed.index_build_time >= 0.0
+   for classifier in (plain, indexed):
+      classifier.confidence_types = confidence_types
+   for distance_type in (knn.CITY_BLOCK, knn.EUCLIDEAN, knn.FAST_EUCLIDEAN):
+      for k in (1, 3, 7):
+         for classifier in (plain, indexed):
+            classifier.num_k = k
+            classifier.distance_type = distance_type
+         for cc in ccs:
+            # compare the repr, because some confidences may be nan
+            assert repr(plain.guess_glyph_automatic(cc)) == \
+                   repr(indexed.guess_glyph_automatic(cc))
+
+   # the index must follow changes of the selections and weights
+   selections = plain.get_selections()
+   weights = plain.get_weights()
+   for i in range(len(selections)):
+      selections[i] = int(i % 3 != 0)
+      weights[i] = (i % 5) / 4.0
+   for classifier in (plain, indexed):
+      classifier.set_selections(selections)
+      classifier.set_weights(weights)
+   for cc in ccs:
+      assert repr(plain.guess_glyph_automatic(cc)) == \
+             repr(indexed.guess_glyph_automatic(cc))
+
+def test_classify_many():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNNonInteractive(database,features=featureset,normalize=True)
+   classifier.num_k = 3
+   classifier.confidence_types = [CONFIDENCE_DEFAULT, CONFIDENCE_KNNFRACTION]
+   classifier.generate_features_on_glyphs(ccs)
+   expected = [classifier.classify(cc) for cc in ccs]
+   for num_threads in (0, 1, 4):
+      classifier.num_threads = num_threads
+      assert classifier.classify_many(ccs) == expected
+   assert classifier.classify_many([]) == []
+
+   # classify_list_automatic classifies the glyphs in one batch
+   (add, remove) = classifier.classify_list_automatic(ccs)
+   assert [cc.id_name for cc in ccs] == [result[0] for result in expected]
+
+def test_bounded_distances():
+   # the linear scans abandon distance computations early; this must
+   # not change any result
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   interactive = knn.kNNInteractive(database,features=featureset)
+   noninteractive = knn.kNNNonInteractive(database,features=featureset,normalize=False)
+   confidence_types = [CONFIDENCE_DEFAULT, CONFIDENCE_NUN, CONFIDENCE_AVGDISTANCE]
+   for classifier in (interactive, noninteractive):
+      classifier.confidence_types = confidence_types
+      classifier.num_k = 3
+   interactive.generate_features_on_glyphs(ccs)
+   for cc in ccs:
+      expected = interactive.classify_with_images(interactive.database, cc)
+      assert repr(noninteractive.classify(cc)) == repr(expected)
+      # without confidences, the raw distances are returned
+      (id_name, conf) = interactive.classify_with_images(interactive.database, cc, False, False)
+      assert [x[1] for x in id_name] == [x[1] for x in expected[0]]
+      assert conf == {}
+
+def test_snapshot():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNNonInteractive(database,features=featureset,normalize=True)
+   classifier.num_k = 3
+   classifier.confidence_types = [CONFIDENCE_DEFAULT, CONFIDENCE_NUN]
+   classifier.generate_features_on_glyphs(ccs)
+   expected = [repr(classifier.classify(cc)) for cc in ccs]
+   classifier.save_snapshot("tmp/snapshot.knn")
+   assert knncore.is_snapshot("tmp/snapshot.knn")
+
+   # the constructor recognizes snapshots
+   for use_index in (False, True):
+      loaded = knn.kNNNonInteractive("tmp/snapshot.knn", use_index=use_index)
+      loaded.confidence_types = classifier.confidence_types
+      assert loaded.num_k == 3
+      assert [repr(loaded.classify(cc)) for cc in ccs] == expected
+
+   # settings of a loaded snapshot can be changed
+   selections = loaded.get_selections()
+   for i in range(len(selections)):
+      selections[i] = int(i % 2 == 0)
+   loaded.set_selections(selections)
+   loaded.classify(ccs[0])
+
+   classifier.serialize("tmp/serialized.knn")
+   assert not knncore.is_snapshot("tmp/serialized.knn")
+   truncated = open("tmp/snapshot.knn", "rb").read()[:1000]
+   open("tmp/truncated.knn", "wb").write(truncated)
+   py.test.raises(IOError, loaded.load_snapshot, "tmp/truncated.knn")
+
+def test_incremental_database():
+   # the interactive classifier updates its copy of the training data
+   # incrementally; the results must be those of classify_with_images
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNInteractive(database[:40],features=featureset)
+   classifier.num_k = 3
+   classifier.generate_features_on_glyphs(ccs)
+   def check():
+      for cc in ccs:
+         assert repr(classifier.guess_glyph_automatic(cc)) == \
+                repr(classifier.classify_with_images(classifier.database, cc))
+   check()
+   classifier.add_to_database(database[40:])
+   classifier.remove_from_database(database[:10])
+   check()
+   classifier.classify_glyph_manual(ccs[0], "dummy")
+   classifier.classify_list_manual(ccs[1:5], "dummy")
+   check()
+   classifier.classify_list_manual(ccs[1:3], "other")
+   check()
+   classifier.remove_from_database(ccs[:5])
+   check()
+   # the database can also be changed directly
+   for glyph in database[20:23]:
+      classifier.get_glyphs().remove(glyph)
+      check()
+      classifier.get_glyphs().add(glyph)
+   check()
+   # direct changes followed by a change through the classifier
+   ccs[6].classify_manual("direct")
+   classifier.get_glyphs().remove(database[25])
+   classifier.get_glyphs().add(ccs[6])
+   classifier.add_to_database([database[0]])
+   assert database[0] in classifier.get_glyphs()
+   check()
+   # glyphs of the database reclassified directly
+   for glyph in classifier.get_glyphs():
+      glyph.classify_heuristic("zzz.renamed")
+   check()
+   assert classifier.guess_glyph_automatic(ccs[7])[0][0][1] == "zzz.renamed"
+   # the kd-tree index takes the new class names too (the nearest
+   # unlike neighbor depends on them)
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   training, unknown = database[::2], database[1::2]
+   indexed = knn.kNNInteractive(training,features=featureset)
+   plain = knn.kNNInteractive(training,features=featureset)
+   indexed.use_index = True
+   for c in (indexed, plain):
+      c.confidence_types = [CONFIDENCE_DEFAULT, CONFIDENCE_NUN]
+   indexed.generate_features_on_glyphs(unknown)
+   indexed.guess_glyph_automatic(unknown[0])
+   for glyph in training[::2]:
+      glyph.classify_heuristic("zzz.renamed")
+   for glyph in unknown:
+      assert repr(indexed.guess_glyph_automatic(glyph)) == \
+             repr(plain.guess_glyph_automatic(glyph))
+
+   # with normalization, the running sums give the same normalization
+   # as instantiating from scratch
+   full = knn.kNNNonInteractive(database,features=featureset,normalize=True)
+   partial = knn.kNNNonInteractive(database[:30],features=featureset,normalize=True)
+   for glyph in database[30:]:
+      partial.insert_from_image(glyph)
+   for glyph in ccs[:5]:
+      partial.insert_from_image(glyph)
+   for i in range(5):
+      partial.remove_feature_vector(len(database))
+   for cc in ccs:
+      (expected, conf) = full.classify(cc)
+      (id_name, conf) = partial.classify(cc)
+      assert [x[1] for x in id_name] == [x[1] for x in expected]
+      for (x, y) in zip(id_name, expected):
+         assert abs(x[0] - y[0]) < 1e-6
+
+def test_cross_validation():
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNNonInteractive(database,features=featureset,normalize=True)
+   classifier.num_k = 3
+   # the result does not depend on the number of threads
+   expected = classifier.leave_one_out()
+   for num_threads in (1, 4):
+      classifier.num_threads = num_threads
+      assert classifier.leave_one_out() == expected
+      assert classifier.leave_one_out(range(10)) == \
+             classifier.leave_one_out(range(10), 1000000)
+      # stopping after a number of errors
+      (correct, total) = classifier.leave_one_out(range(10), 2)
+      assert total - correct == 3 and total < expected[1]
+
+   (accuracy, class_accuracy, confusion) = classifier.evaluate_kfold(3)
+   assert sum(confusion.values()) == len(database)
+   assert 0.0 <= accuracy <= 1.0
+   id_names = [glyph.get_main_id() for glyph in database]
+   for id_name in id_names:
+      total = sum([count for ((x, y), count) in confusion.items() if x == id_name])
+      assert total == id_names.count(id_name)
+      assert class_accuracy[id_name] == \
+             float(confusion.get((id_name, id_name), 0)) / total
+   classifier.num_threads = 1
+   assert classifier.evaluate_kfold(3) == (accuracy, class_accuracy, confusion)
+
+def test_single_precision():
+   image = load_image("data/testline.png")
+   ccs = image.cc_analysis()
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   double = knn.kNNNonInteractive(database,features=featureset,normalize=True)
+   single = knn.kNNNonInteractive(database,features=featureset,normalize=True,
+                                  single_precision=True)
+   assert single.single_precision and not double.single_precision
+   double.generate_features_on_glyphs(ccs)
+   def same_results(a, b):
+      for cc in ccs:
+         (x, conf) = a.classify(cc)
+         (y, conf) = b.classify(cc)
+         assert [id for (d, id) in x] == [id for (d, id) in y]
+         for ((d, id), (e, id)) in zip(x, y):
+            assert abs(d - e) <= 1e-5 * max(d, 1.0)
+   # the accuracy does not suffer from the rounding on the test data
+   for num_k in (1, 3):
+      for distance_type in (knn.CITY_BLOCK, knn.EUCLIDEAN, knn.FAST_EUCLIDEAN):
+         for classifier in (single, double):
+            classifier.num_k = num_k
+            classifier.distance_type = distance_type
+         assert single.leave_one_out() == double.leave_one_out()
+         same_results(single, double)
+
+   # the weights are applied in double precision
+   weights = double.get_weights()
+   for i in range(len(weights)):
+      weights[i] = (i % 3) * 0.5
+   for classifier in (single, double):
+      classifier.set_weights(weights)
+   assert single.get_weights() == double.get_weights()
+   assert single.leave_one_out() == double.leave_one_out()
+   same_results(single, double)
+
+   # serialized data can be loaded in either precision
+   single.serialize("tmp/single.knn")
+   loaded = knn.kNNNonInteractive("tmp/single.knn", single_precision=True)
+   assert loaded.single_precision
+   # the distance type is not serialized
+   loaded.distance_type = single.distance_type
+   assert loaded.leave_one_out() == single.leave_one_out()
+   loaded = knn.kNNNonInteractive("tmp/single.knn")
+   assert not loaded.single_precision
+   loaded.distance_type = single.distance_type
+   same_results(loaded, double)
+   # snapshots keep their precision
+   single.save_snapshot("tmp/single_snapshot.knn")
+   loaded = knn.kNNNonInteractive("tmp/single_snapshot.knn")
+   assert loaded.single_precision
+   loaded.distance_type = single.distance_type
+   assert loaded.leave_one_out() == single.leave_one_out()
+
+   # the precision of existing data can be changed
+   double.single_precision = True
+   assert double.leave_one_out() == single.leave_one_out()
+   double.single_precision = False
+   same_results(double, single)
+
+   # incremental updates of single precision data
+   interactive = knn.kNNInteractive(database[:40],features=featureset,single_precision=True)
+   interactive.num_k = 3
+   interactive.add_to_database(database[40:])
+   interactive.remove_from_database(database[:10])
+   for cc in ccs:
+      assert repr(interactive.guess_glyph_automatic(cc)[0][0][1]) == \
+             repr(interactive.classify_with_images(interactive.database, cc)[0][0][1])
+
+def test_editing():
+   from gamera import knn_editing
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNInteractive(database,features=featureset)
+   glyphs = list(classifier.get_glyphs())
+   # Wilson's editing removes the glyphs misclassified by the others
+   for k in (1, 3):
+      edited = knn_editing.edit_mnn(classifier, k, False)
+      expected = []
+      for glyph in glyphs:
+         others = knn.kNNInteractive([x for x in glyphs if x is not glyph],
+                                     features=featureset, num_k=k)
+         if others.guess_glyph_automatic(glyph)[0][0][1] == glyph.get_main_id():
+            expected.append(glyph)
+      assert set(edited.get_glyphs()) == set(expected)
+      assert edited.num_k == k
+   # the glyphs of rare classes are kept
+   edited = knn_editing.edit_mnn(classifier, 1, True, 100)
+   assert len(edited.get_glyphs()) == len(glyphs)
+
+   # Hart's condensing keeps a subset that classifies all glyphs correctly
+   for k in (1, 3):
+      condensed = knn_editing.edit_cnn(classifier, k, False)
+      store = list(condensed.get_glyphs())
+      assert 0 < len(store) < len(glyphs)
+      check = knn.kNNInteractive(store, features=featureset, num_k=k)
+      for glyph in glyphs:
+         if glyph not in condensed.get_glyphs():
+            assert check.guess_glyph_automatic(glyph)[0][0][1] == glyph.get_main_id()
+      # without randomization the result is reproducible
+      again = knn_editing.edit_cnn(classifier, k, False)
+      assert set(again.get_glyphs()) == set(store)
+   combined = knn_editing.edit_mnn_cnn(classifier, 1, True, 3, False)
+   assert set(combined.get_glyphs()) <= set(knn_editing.edit_mnn(classifier).get_glyphs())
+
+   # the rows given to the native condensing are checked
+   for rows in ([0, 0], [len(glyphs)]):
+      py.test.raises((ValueError, IndexError), classifier._edit_cnn, 1, rows)
+
+def test_distance_array():
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")[:50]
+   classifier = knn.kNNInteractive(database,features=featureset)
+   n = len(database)
+   for normalize in (True, False):
+      matrix = classifier.distance_matrix(database, normalize)
+      unique = classifier.unique_distances(database, normalize)
+      full = classifier.distance_array(database, False, normalize)
+      # a numpy array when numpy is installed, an array.array otherwise
+      full = list(getattr(full, 'flat', full))
+      condensed = classifier.distance_array(database, True, normalize)
+      assert len(condensed) == n * (n - 1) / 2
+      index = 0
+      for i in range(n):
+         for j in range(i + 1, n):
+            distance = matrix.get((j, i))
+            assert matrix.get((i, j)) == distance
+            assert unique.get((index, 0)) == distance
+            assert full[i * n + j] == full[j * n + i] == distance
+            assert abs(condensed[index] - distance) <= 1e-6 * max(distance, 1.0)
+            index += 1
+   # a buffer of the wrong size is rejected
+   py.test.raises(ValueError, classifier.distance_array, database,
+                  out=array.array('f', [0.0]) * 3)
+   # and so is a buffer of the right size with the wrong type
+   py.test.raises(ValueError, classifier.distance_array, database[:8],
+                  out=array.array('d', [0.0]) * 14)
+   py.test.raises(ValueError, classifier.distance_array, database[:8], False,
+                  out=array.array('f', [0.0]) * 128)
+   out = array.array('d', [0.0]) * 64
+   assert classifier.distance_array(database[:8], False, out=out) is out
+
+def test_required_features():
+   image = load_image("data/testline.png")
+   database = gamera_xml.glyphs_from_xml("data/testline.xml")
+   classifier = knn.kNNNonInteractive(database,features=featureset,normalize=True)
+   assert classifier.get_required_features() == featureset
+   selections = classifier.get_selections_by_features()
+   for name in ('moments', 'skeleton_features'):
+      selections[name] = [0] * len(selections[name])
+   classifier.set_selections_by_features(selections)
+   required = classifier.get_required_features()
+   assert required == [x for x in featureset
+                       if x not in ('moments', 'skeleton_features')]
+
+   full = image.cc_analysis()
+   classifier.generate_features_on_glyphs(full)
+   expected = classifier.classify_many(full)
+   ccs = image.cc_analysis()
+   (add, remove) = classifier.classify_list_automatic(ccs)
+   assert [cc.id_name for cc in ccs] == [result[0] for result in expected]
+   # only the selected feature functions were generated
+   for cc, glyph in zip(ccs, full):
+      assert cc.feature_functions[2] == tuple(required)
+      offset = 0
+      for name, function in cc.feature_functions[0]:
+         length = function.return_type.length
+         values = list(cc.features[offset:offset + length])
+         if name in required:
+            assert values == list(glyph.features[offset:offset + length])
+         else:
+            assert values == [0.0] * length
+         offset += length
+   # they are completed when all features are needed
+   classifier.generate_features_on_glyphs(ccs)
+   for cc, glyph in zip(ccs, full):
+      assert cc.feature_functions == glyph.feature_functions
+      assert list(cc.features) == list(glyph.features)
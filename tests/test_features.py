@@ -503,3 +503,155 @@ def test_zernike_moments():
     assert abs(ZM_f[11] - ZM_f0[11]) <= 0.1
     assert abs(ZM_f[12] - ZM_f0[12]) <= 0.1
     assert abs(ZM_f[13] - ZM_f0[13]) <= 0.1
+
+
+# generate_features_list computes the built-in features of all images
+# at once, it must give the same features as generate_features
+def test_generate_features_list():
+    from gamera.plugins import features as features_module
+    img = load_image("data/testline.png")
+    ccs = img.cc_analysis()
+    ff = Image.get_feature_functions('all')
+    for glyph in ccs:
+        glyph.generate_features(ff)
+    expected = [list(glyph.features) for glyph in ccs]
+
+    ccs = img.cc_analysis()
+    features_module.generate_features_list(ccs, 'all', 2)
+    for glyph, features in zip(ccs, expected):
+        assert glyph.feature_functions == ff
+        assert list(glyph.features) == features
+
+
+# generate_features computes these features from one scan of the image,
+# they must be the same as those of the single feature functions
+def test_fused_features():
+    names = ['black_area', 'moments', 'nholes', 'nholes_extended', 'volume',
+             'compactness', 'volume16regions', 'volume64regions', 'top_bottom']
+    ff = Image.get_feature_functions(names)
+    img = load_image("data/testline.png")
+    images = img.cc_analysis() + [img, img.subimage((5, 3), Dim(37, 11))]
+    for image in images:
+        image.generate_features(ff, force=True)
+        expected = []
+        for name, function in ff[0]:
+            expected.extend(getattr(image, name)())
+        assert list(image.features) == expected
+
+
+def test_feature_cache():
+    import os
+    from gamera import feature_cache
+    from gamera.plugins import features as features_module
+    filename = "tmp/features.cache"
+    if os.path.exists(filename):
+        os.remove(filename)
+    cache = feature_cache.FeatureCache(filename)
+    feature_cache.set_feature_cache(cache)
+    try:
+        img = load_image("data/testline.png")
+        ccs = img.cc_analysis()
+        features_module.generate_features_list(ccs, 'all')
+        expected = [list(glyph.features) for glyph in ccs]
+        keys = set([cache.key(glyph, glyph.feature_functions) for glyph in ccs])
+        assert len(cache) == len(keys)
+
+        # glyphs segmented again get their features from the cache
+        ccs = img.cc_analysis()
+        ff = Image.get_feature_functions('all')
+        assert cache.get_features(ccs, ff) == []
+        for glyph, features in zip(ccs, expected):
+            assert glyph.feature_functions == ff
+            assert list(glyph.features) == features
+        glyph = img.cc_analysis()[0]
+        glyph.generate_features(ff)
+        assert list(glyph.features) == expected[0]
+
+        # the least recently used features are removed until the cache
+        # fits in max_size, the features used again (including those of
+        # the first glyph above) are kept
+        recent = img.cc_analysis()[-3:]
+        for glyph in recent:
+            glyph.generate_features(ff)
+        recent_keys = set([cache.key(glyph, ff) for glyph in recent])
+        recent_keys.add(cache.key(ccs[0], ff))
+        cache.max_size = 10000
+        ccs[0].generate_features(Image.get_feature_functions(['volume']))
+        size = cache._get_connection().execute(
+            "SELECT SUM(LENGTH(key) + LENGTH(features)) FROM features").fetchone()[0]
+        assert size <= cache.max_size
+        assert cache.get_features(img.cc_analysis()[-3:], ff) == []
+        earliest = [glyph for glyph in img.cc_analysis()[1:6]
+                    if cache.key(glyph, ff) not in recent_keys]
+        assert len(earliest)
+        assert len(cache.get_features(earliest, ff)) == len(earliest)
+    finally:
+        feature_cache.set_feature_cache(None)
+
+
+# zernike_moments reads run-length encoded images from their runs
+def test_zernike_moments_rle():
+    img = load_image("data/testline.png")
+    for dense, rle in zip(img.cc_analysis(),
+                          img.image_copy(RLE).cc_analysis()):
+        expected = dense.zernike_moments()
+        ZM_f = rle.zernike_moments()
+        for a, b in zip(ZM_f, expected):
+            assert abs(a - b) <= 1e-9 * max(abs(b), 1.0)
+
+
+def test_features_numpy():
+    numpy = py.test.importorskip("numpy")
+    from gamera.plugins import features as features_module
+    img = load_image("data/testline.png")
+    ccs = img.cc_analysis()
+    ff = Image.get_feature_functions('all')
+    for glyph in ccs:
+        glyph.generate_features(ff)
+    expected = [list(glyph.features) for glyph in ccs]
+
+    matrix = features_module.features_to_numpy(ccs)
+    assert matrix.shape == (len(ccs), ff[1])
+    assert matrix.tolist() == expected
+
+    # shared features are rows of one array
+    ccs = img.cc_analysis()
+    ccs[0].generate_features(ff)
+    matrix = features_module.features_to_numpy(ccs, share=True)
+    assert matrix.tolist() == expected
+    for i, glyph in enumerate(ccs):
+        assert glyph.features.base is matrix
+        assert glyph.feature_functions == ff
+    matrix[1, 0] = -1.0
+    assert ccs[1].features[0] == -1.0
+
+    ccs = img.cc_analysis()
+    features_module.features_from_numpy(ccs, numpy.array(expected), ff)
+    for glyph, features in zip(ccs, expected):
+        assert glyph.feature_functions == ff
+        assert list(glyph.features) == features
+    # these features are not generated again
+    ccs[0].generate_features(ff)
+    assert list(ccs[0].features) == expected[0]
+    py.test.raises(ValueError, features_module.features_from_numpy,
+                   ccs[1:], numpy.array(expected), ff)
+
+
+# run-length encoded images are read from their runs, they must give the
+# same features as dense images
+def test_rle_features():
+    names = ['black_area', 'moments', 'nholes', 'nholes_extended', 'volume',
+             'volume16regions', 'volume64regions', 'top_bottom',
+             'projection_rows', 'projection_cols']
+    img = load_image("data/testline.png")
+    rle = img.image_copy(RLE)
+    pairs = [(img, rle),
+             (img.subimage((5, 3), Dim(37, 11)), rle.subimage((5, 3), Dim(37, 11)))]
+    pairs.extend(zip(img.cc_analysis(), rle.cc_analysis()))
+    for dense, image in pairs:
+        for name in names:
+            assert list(getattr(image, name)()) == list(getattr(dense, name)())
+        ff = Image.get_feature_functions(names[:-2])
+        dense.generate_features(ff, force=True)
+        image.generate_features(ff, force=True)
+        assert list(image.features) == list(dense.features)
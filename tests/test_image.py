@@ -20,6 +20,7 @@ def make_test(inner):
                           (GREY16, xrange((2 ** 16) - 1))]:
          inner(type, value, DENSE)
       inner(ONEBIT, xrange(0, 2 ** 16 - 1), RLE)
+      inner(ONEBIT, [0, 1], PACKED)
    return test
 
 def _test_image_constructors(type, value, storage):
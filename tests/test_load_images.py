@@ -0,0 +1,47 @@
+import py.test
+
+from gamera.core import *
+init_gamera()
+
+FILES = ["data/GreyScale_generic.tiff", "data/testline.png",
+         "data/RGB_generic.tiff", "data/Grey16_generic.png",
+         "data/testline.tiff", "data/OneBit_generic.png"]
+
+def test_load_images():
+   images = [load_image(filename) for filename in FILES]
+   for prefetch, num_threads in [(1, 1), (2, 1), (3, 2), (10, 0)]:
+      loaded = list(load_images(FILES, DENSE, prefetch, num_threads))
+      assert len(loaded) == len(images)
+      for image, other in zip(images, loaded):
+         assert image.data.pixel_type == other.data.pixel_type
+         assert image.to_nested_list() == other.to_nested_list()
+   # any iterable of filenames
+   loaded = list(load_images(iter(["data/testline.png"] * 5), RLE))
+   assert len(loaded) == 5
+   assert [x.data.storage_format for x in loaded] == [RLE] * 5
+   assert list(load_images([])) == []
+
+def test_load_images_errors():
+   loaded = []
+   def load_all(filenames):
+      for image in load_images(filenames):
+         loaded.append(image)
+   py.test.raises(IOError, load_all,
+                  FILES[:2] + ["data/nonexistent.tiff"] + FILES)
+   # the images before the missing file are returned
+   assert len(loaded) == 2
+   py.test.raises(ValueError, list, load_images(FILES, DENSE, 0))
+
+def test_load_images_prefetch():
+   requested = []
+   def filenames():
+      for filename in FILES * 10:
+         requested.append(filename)
+         yield filename
+   images = load_images(filenames(), DENSE, 2)
+   assert images.next().ncols == load_image(FILES[0]).ncols
+   # only the prefetched images are requested
+   assert len(requested) == 2
+   images.next()
+   assert len(requested) == 3
+   images.close()
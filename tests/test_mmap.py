@@ -0,0 +1,63 @@
+import os
+import py.test
+import shutil
+import tempfile
+
+from gamera.core import *
+init_gamera()
+
+def test_mmap_scratch():
+   for pixel_type in [ONEBIT, GREYSCALE, GREY16, RGB, FLOAT, COMPLEX]:
+      image = Image((0, 0), Dim(31, 17), pixel_type, mmap_file=True)
+      assert image.data.mmap_file == ""
+      # the same initial pixel values as an image in main memory
+      reference = Image((0, 0), Dim(31, 17), pixel_type)
+      assert image._to_raw_string() == reference._to_raw_string()
+      assert image.get((30, 16)) == reference.get((30, 16))
+      image.set((30, 16), image.black())
+      assert image.get((30, 16)) == image.black()
+   assert Image((0, 0), Dim(31, 17)).data.mmap_file is None
+
+def test_mmap_cache_file():
+   directory = tempfile.mkdtemp()
+   try:
+      filename = os.path.join(directory, "cache.raw")
+      image = Image((0, 0), Dim(100, 20), GREYSCALE, mmap_file=filename)
+      assert image.data.mmap_file == filename
+      assert os.path.getsize(filename) == 2000
+      image.set((3, 1), 42)
+      del image
+      # the cache file is kept and holds the raw pixels
+      data = open(filename, "rb").read()
+      assert ord(data[103]) == 42
+      assert ord(data[0]) == 255
+
+      # a directory holds an anonymous scratch file
+      image = Image((0, 0), Dim(10, 10), RGB, mmap_file=directory)
+      assert image.data.mmap_file == ""
+      assert os.listdir(directory) == ["cache.raw"]
+   finally:
+      shutil.rmtree(directory)
+
+def test_mmap_errors():
+   for storage in [RLE, PACKED]:
+      # only DENSE images can be memory-mapped
+      py.test.raises(TypeError, Image, (0, 0), Dim(10, 10), ONEBIT, storage,
+                     mmap_file=True)
+   # the cache file cannot be created
+   py.test.raises(IOError, Image, (0, 0), Dim(10, 10), ONEBIT,
+                  mmap_file="/nonexistent/cache.raw")
+
+def test_mmap_load_image():
+   for filename in ["data/testline.png", "data/GreyScale_generic.tiff",
+                    "data/RGB_generic.png"]:
+      image1 = load_image(filename)
+      image2 = load_image(filename, mmap_file=True)
+      assert image2.data.mmap_file == ""
+      assert image1._to_raw_string() == image2._to_raw_string()
+   # plugins work on memory-mapped images unchanged
+   image1 = load_image("data/testline.png")
+   image2 = load_image("data/testline.png", DENSE, True)
+   assert image1.black_area() == image2.black_area()
+   assert [(cc.ul, cc.lr) for cc in image1.cc_analysis()] == \
+       [(cc.ul, cc.lr) for cc in image2.cc_analysis()]
@@ -0,0 +1,66 @@
+import py.test
+
+from gamera.core import *
+from gamera.plugins.numpy_io import from_numpy
+init_gamera()
+
+def test_array_interface():
+   numpy = py.test.importorskip("numpy")
+   for filename in ["data/GreyScale_generic.tiff", "data/RGB_generic.tiff",
+                    "data/Grey16_generic.tiff", "data/testline.png"]:
+      image = load_image(filename)
+      for pixel_type in [image.data.pixel_type, FLOAT, COMPLEX]:
+         if pixel_type != image.data.pixel_type:
+            if image.data.pixel_type != GREYSCALE:
+               continue
+            image = image.to_float() if pixel_type == FLOAT else image.to_complex()
+         part = image.subimage((3, 4), Dim(10, 5))
+         array = numpy.asarray(part)
+         assert array.shape[:2] == (5, 10)
+         # a view of the image, not a copy
+         assert not array.flags.owndata
+         assert array.tolist() == part.to_numpy().tolist()
+         assert from_numpy(array.copy()).to_nested_list() == \
+             part.to_nested_list()
+         array[1, 2] = array[0, 0]
+         assert image.get((5, 5)) == image.get((3, 4))
+
+def test_array_interface_copies():
+   numpy = py.test.importorskip("numpy")
+   image = load_image("data/testline.png")
+   for other in [image.image_copy(RLE), image.image_copy(PACKED),
+                 image.cc_analysis()[0]]:
+      array = numpy.asarray(other)
+      assert array.shape == (other.nrows, other.ncols)
+      assert not array.flags.writeable
+      assert array.tolist() == other.to_nested_list()
+
+def test_from_numpy_share():
+   numpy = py.test.importorskip("numpy")
+   array = numpy.zeros((20, 30), numpy.float64)
+   image = from_numpy(array, (5, 7), share=True)
+   assert image.ul == Point(5, 7)
+   assert image.dim == Dim(30, 20)
+   image.set((2, 1), 4.5)
+   assert array[1, 2] == 4.5
+   array[3, 4] = -1.0
+   assert image.get((4, 3)) == -1.0
+   # the image keeps the array alive
+   del array
+   assert numpy.asarray(image)[1, 2] == 4.5
+   assert image.image_copy().get((2, 1)) == 4.5
+   # neither the size nor the shape of the shared memory can change
+   image.data.dimensions(Dim(30, 20))
+   py.test.raises(RuntimeError, image.data.dimensions, Dim(20, 30))
+   py.test.raises(RuntimeError, setattr, image.data, "nrows", 10)
+   assert image.data.stride == 30
+
+   rgb = numpy.zeros((4, 6, 3), numpy.uint8)
+   rgb[1, 2] = (10, 20, 30)
+   assert from_numpy(rgb, share=True).get((2, 1)) == RGBPixel(10, 20, 30)
+
+   py.test.raises(ValueError, from_numpy,
+                  numpy.zeros((20, 30), numpy.uint8)[:, ::2], share=True)
+   readonly = numpy.zeros((20, 30), numpy.uint8)
+   readonly.flags.writeable = False
+   py.test.raises(ValueError, from_numpy, readonly, share=True)
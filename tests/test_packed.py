@@ -0,0 +1,71 @@
+from gamera.core import *
+init_gamera()
+
+def test_packed1():
+   image1 = load_image("data/testline.png")
+   image2 = image1.image_copy(PACKED)
+
+   # Check basic packed image copying
+   assert image2.pixel_type_name == "OneBit"
+   assert image2.storage_format_name == "Packed"
+   assert image2.nrows == 44
+   assert image2.ncols == 907
+   assert image2.black_area()[0] == 5174.0
+
+   # Compare packed to DENSE image
+   assert image1._to_raw_string() == image2._to_raw_string()
+   assert image1.to_rle() == image2.to_rle()
+   assert image2.image_copy(DENSE)._to_raw_string() == image1._to_raw_string()
+
+   # the word-parallel functions, also on subimages that do not start
+   # at a word boundary
+   for rect in [image1, Rect(Point(3, 5), Dim(300, 30)),
+                Rect(Point(70, 1), Dim(1, 40)), Rect(Point(500, 0), Dim(407, 44))]:
+      sub1 = image1.subimage(rect)
+      sub2 = image2.subimage(rect)
+      for name in ['black_area', 'moments', 'nholes', 'nholes_extended',
+                   'volume', 'volume16regions', 'volume64regions',
+                   'top_bottom', 'projection_rows', 'projection_cols']:
+         assert list(getattr(sub1, name)()) == list(getattr(sub2, name)())
+      sub1.generate_features()
+      sub2.generate_features()
+      assert list(sub1.features) == list(sub2.features)
+
+def test_packed_logical():
+   image1 = load_image("data/testline.png")
+   image2 = image1.image_copy(PACKED)
+   a = Rect(Point(0, 0), Dim(400, 40))
+   b = Rect(Point(333, 3), Dim(400, 40))
+   for function in ["and_image", "or_image", "xor_image"]:
+      dense = getattr(image1.subimage(a), function)(image1.subimage(b), False)
+      packed = getattr(image2.subimage(a), function)(image2.subimage(b), False)
+      assert packed.storage_format_name == "Packed"
+      assert dense._to_raw_string() == packed._to_raw_string()
+      # in place
+      dense = image1.image_copy()
+      packed = image2.image_copy(PACKED)
+      getattr(dense.subimage(b), function)(image1.subimage(a), True)
+      getattr(packed.subimage(b), function)(image2.subimage(a), True)
+      assert dense._to_raw_string() == packed._to_raw_string()
+
+   dense = image1.image_copy()
+   packed = image2.image_copy(PACKED)
+   dense.subimage(b).invert()
+   packed.subimage(b).invert()
+   assert dense._to_raw_string() == packed._to_raw_string()
+
+def test_packed_ccs():
+   image1 = load_image("data/testline.png")
+   image2 = image1.image_copy(PACKED)
+   ccs1 = image1.cc_analysis()
+   ccs2 = image2.cc_analysis()
+
+   # the Ccs of a packed image refer to a dense copy
+   assert len(ccs1) == len(ccs2)
+   for cc1, cc2 in zip(ccs1, ccs2):
+      assert Rect(cc1) == Rect(cc2)
+      assert cc1.label == cc2.label
+      assert cc2.data.storage_format == DENSE
+      assert cc1._to_raw_string() == cc2._to_raw_string()
+   # and the packed image is not labeled
+   assert image2._to_raw_string() == load_image("data/testline.png")._to_raw_string()
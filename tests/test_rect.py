@@ -50,3 +50,13 @@ def test_rect():
    assert r1.distance_bb(Rect(Point(0,0), Point(20,20))) == sqrt(5*5 + 5*5)
    assert r1.distance_cx(Rect(Point(0,0), Point(20,20))) == 39
    assert r1.distance_cy(Rect(Point(0,0), Point(20,20))) == 34
+
+def test_rect_hash():
+   # equal rectangles have equal hashes, and different rectangles
+   # should not all share one hash value
+   assert hash(Rect(Point(5,10), Point(30,40))) == hash(Rect(Point(5,10), Point(30,40)))
+   hashes = {}
+   for x in range(10):
+      for y in range(10):
+         hashes[hash(Rect(Point(x,y), Point(x+20,y+30)))] = None
+   assert len(hashes) == 100
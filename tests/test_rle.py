@@ -1,3 +1,4 @@
+import py.test
 from gamera.core import *
 init_gamera()
 
@@ -31,3 +32,38 @@ def test_rle1():
    assert image1.most_frequent_run("black","horizontal") == image2.most_frequent_run("black","horizontal")
 
    
+
+def test_rle_binary():
+   image = load_image("data/testline.png")
+   runs = image.to_rle_binary()
+   assert len(runs) < len(image.to_rle())
+   assert len(image.to_rle_binary(True)) < len(runs)
+   for storage in [DENSE, RLE, PACKED]:
+      other = image.image_copy(storage)
+      assert other.to_rle_binary() == runs
+      copy = Image(image, ONEBIT, storage)
+      copy.from_rle_binary(runs)
+      assert copy._to_raw_string() == other._to_raw_string()
+      copy = Image(image, ONEBIT, storage)
+      copy.from_rle_binary(image.to_rle_binary(True), True)
+      assert copy._to_raw_string() == other._to_raw_string()
+   # the same runs as the decimal encoding
+   for cc in image.cc_analysis()[:5]:
+      copy = Image(cc, ONEBIT)
+      copy.from_rle_binary(cc.to_rle_binary())
+      other = Image(cc, ONEBIT)
+      other.from_rle(cc.to_rle())
+      assert copy._to_raw_string() == other._to_raw_string()
+
+def test_rle_binary_errors():
+   image = Image((0, 0), Dim(300, 2), ONEBIT)
+   # 300 white, 32 black, 268 white and 0 black pixels
+   image.from_rle_binary("\xac\x02\x20\x8c\x02\x00")
+   assert image.black_area()[0] == 32
+   assert image.get((299, 0)) == 0 and image.get((0, 1)) == 1
+   for runs in ["\xac\x02\x21\x8c\x02\x00", "\xac\x02\x20\x8c\x02",
+                "\xac\x02\x20", "\xff" * 12,
+                "\xac\x02\x20\x8c\x02\x00" + "GARBAGE", "\x00\x80\x05"]:
+      py.test.raises(RuntimeError, image.from_rle_binary, runs)
+      # the image is not changed by invalid data
+      assert image.black_area()[0] == 32
@@ -0,0 +1,61 @@
+import py.test
+
+from gamera.core import *
+from gamera.plugins.tiff_support import tiff_bands
+init_gamera()
+
+def _assert_bands(filename, band_height, overlap, storage=DENSE):
+   image = load_image(filename, storage)
+   bands = list(tiff_bands(filename, band_height, overlap, storage))
+   assert bands[0].ul_y == 0
+   assert bands[-1].lr_y == image.lr_y
+   for i, band in enumerate(bands):
+      assert band.ul_x == 0 and band.ncols == image.ncols
+      assert band.data.storage_format == storage
+      assert band.nrows <= band_height
+      if i < len(bands) - 1:
+         assert band.nrows == band_height
+         assert bands[i + 1].ul_y == band.lr_y + 1 - overlap
+      # the bands are the rows of the full page
+      assert band.to_nested_list() == image.subimage(band).to_nested_list()
+   return bands
+
+def test_tiff_bands():
+   for filename in ["data/testline.tiff", "data/GreyScale_generic.tiff",
+                    "data/RGB_generic.tiff", "data/OneBit_generic.tiff",
+                    "data/Grey16_generic.tiff"]:
+      for band_height, overlap in [(10, 0), (10, 3), (7, 6), (1000, 0)]:
+         _assert_bands(filename, band_height, overlap)
+   _assert_bands("data/testline.tiff", 10, 4, RLE)
+   _assert_bands("data/testline.tiff", 9, 2, PACKED)
+
+def test_tiff_bands_tiled():
+   # files organized in tiles instead of strips
+   for tiled, strips in [("data/GreyScale_tiled.tiff", "data/GreyScale_generic.tiff"),
+                         ("data/testline_tiled.tiff", "data/testline.tiff")]:
+      assert load_image(tiled).to_nested_list() == \
+          load_image(strips).to_nested_list()
+      _assert_bands(tiled, 11, 5)
+      _assert_bands(tiled, 16, 0)
+
+def test_tiff_bands_modified():
+   # changing a band does not change the overlap of the next band
+   bands = []
+   for band in tiff_bands("data/GreyScale_generic.tiff", 20, 5):
+      bands.append(band.image_copy())
+      band.fill(0)
+   image = load_image("data/GreyScale_generic.tiff")
+   for band in bands:
+      assert band.to_nested_list() == image.subimage(band).to_nested_list()
+
+def test_tiff_bands_cc_analysis():
+   # connected components of the bands have page coordinates
+   image = load_image("data/testline.tiff")
+   ccs = [(cc.ul, cc.lr) for cc in image.cc_analysis()]
+   for band in tiff_bands("data/testline.tiff", 1000):
+      assert [(cc.ul, cc.lr) for cc in band.cc_analysis()] == ccs
+
+def test_tiff_bands_errors():
+   py.test.raises(ValueError, list, tiff_bands("data/testline.tiff", 10, 10))
+   py.test.raises(ValueError, list, tiff_bands("data/testline.tiff", 0))
+   py.test.raises(RuntimeError, list, tiff_bands("data/nonexistent.tiff"))
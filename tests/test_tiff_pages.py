@@ -0,0 +1,69 @@
+import py.test
+
+from gamera.core import *
+from gamera.plugins.tiff_support import tiff_pages, tiff_bands, \
+     save_tiff_pages, tiff_page_count, tiff_info, load_tiff
+from gamera.plugins import _tiff_support
+init_gamera()
+
+def _pages():
+   return [load_image("data/GreyScale_generic.tiff"),
+           load_image("data/testline.png"),
+           load_image("data/RGB_generic.tiff"),
+           load_image("data/Grey16_generic.tiff")]
+
+def test_save_tiff_pages():
+   pages = _pages()
+   save_tiff_pages(pages, "tmp/pages.tiff")
+   assert tiff_page_count("tmp/pages.tiff") == len(pages)
+   for i, page in enumerate(pages):
+      info = tiff_info("tmp/pages.tiff", i)
+      assert (info.ncols, info.nrows) == (page.ncols, page.nrows)
+      loaded = load_tiff("tmp/pages.tiff", 0, None, i)
+      assert loaded.data.pixel_type == page.data.pixel_type
+      assert loaded.to_nested_list() == page.to_nested_list()
+   # the first page is the default
+   assert load_image("tmp/pages.tiff").to_nested_list() == \
+       pages[0].to_nested_list()
+   py.test.raises(RuntimeError, load_tiff, "tmp/pages.tiff", 0, None, 4)
+   py.test.raises(RuntimeError, tiff_info, "tmp/pages.tiff", -1)
+
+def test_tiff_pages():
+   pages = _pages()
+   # any iterable of images can be saved
+   save_tiff_pages(iter(pages), "tmp/pages.tiff")
+   loaded = list(tiff_pages("tmp/pages.tiff"))
+   assert len(loaded) == len(pages)
+   for page, image in zip(pages, loaded):
+      assert image.to_nested_list() == page.to_nested_list()
+   onebit = pages[1].subimage((0, 0), Dim(100, 30))
+   save_tiff_pages([pages[1], onebit], "tmp/pages.tiff")
+   loaded = list(tiff_pages("tmp/pages.tiff", RLE))
+   assert [image.data.storage_format for image in loaded] == [RLE, RLE]
+   assert loaded[1].to_nested_list() == onebit.to_nested_list()
+   # single page files
+   assert len(list(tiff_pages("data/testline.tiff"))) == 1
+   assert tiff_page_count("data/testline.tiff") == 1
+
+def test_tiff_bands_page():
+   pages = _pages()
+   save_tiff_pages(pages, "tmp/pages.tiff")
+   bands = list(tiff_bands("tmp/pages.tiff", 10, 2, page=2))
+   assert bands[-1].lr_y == pages[2].lr_y
+   for band in bands:
+      assert band.to_nested_list() == \
+          pages[2].subimage(band).to_nested_list()
+
+def test_tiff_select_page_errors():
+   pages = _pages()
+   save_tiff_pages(pages, "tmp/pages.tiff")
+   reader = _tiff_support._tiff_open("tmp/pages.tiff")
+   nrows = pages[0].nrows
+   py.test.raises(RuntimeError, _tiff_support._tiff_select_page, reader, 5)
+   # the page stays selected
+   band = _tiff_support._tiff_read_band(reader, 0, nrows, 0, DENSE)
+   assert band.to_nested_list() == pages[0].to_nested_list()
+   assert _tiff_support._tiff_select_page(reader, 0).nrows == nrows
+   assert _tiff_support._tiff_select_page(reader, 3).nrows == pages[3].nrows
+   py.test.raises(RuntimeError, _tiff_support._tiff_select_page, reader, -1)
+   assert _tiff_support._tiff_select_page(reader, 0).nrows == nrows
@@ -0,0 +1,94 @@
+import py.test
+
+from gamera.core import *
+from gamera.tiles import TiledImage
+from gamera.plugins import convolution
+init_gamera()
+
+def _tiled_equals_whole(image, function, args=(), tile_size=37, num_threads=1):
+   whole = getattr(image, function)(*args)
+   tiled = TiledImage(image, tile_size).apply(function, args, num_threads)
+   assert tiled.dim == whole.dim
+   assert tiled.ul == whole.ul
+   assert tiled.data.pixel_type == whole.data.pixel_type
+   assert tiled._to_raw_string() == whole._to_raw_string(), function
+
+def test_copy_at_and_paste():
+   image = load_image("data/GreyScale_generic.tiff")
+   part = image.subimage((10, 20), Dim(30, 15))
+   copy = part.image_copy_at((0, 0))
+   assert copy.ul == Point(0, 0)
+   assert copy.dim == part.dim
+   assert copy._to_raw_string() == part.image_copy()._to_raw_string()
+
+   target = Image(image)
+   target.paste_image(part, part.ul)
+   assert target.subimage(part)._to_raw_string() == \
+       part.image_copy()._to_raw_string()
+   assert target.get((9, 20)) == target.white()
+   # the pasted image must lie within the image
+   py.test.raises(RuntimeError, target.paste_image, copy, (image.ncols - 5, 0))
+
+def test_tile_rects():
+   image = Image((5, 7), Dim(100, 50), GREYSCALE)
+   tiled = TiledImage(image, (30, 20))
+   rects = tiled.tile_rects()
+   assert len(tiled) == 4 * 3
+   assert rects[0] == Rect((5, 7), Dim(30, 20))
+   assert rects[-1] == Rect((95, 47), Dim(10, 10))
+   assert sum([r.ncols * r.nrows for r in rects]) == 100 * 50
+   tile, inner = tiled.tile(rects[-1], 4)
+   assert tile.ul == Point(0, 0)
+   assert tile.dim == Dim(14, 14)
+   assert inner == Rect((4, 4), Dim(10, 10))
+
+def test_tiled_filters():
+   grey = load_image("data/GreyScale_generic.tiff")
+   onebit = load_image("data/testline.png")
+   kernel = convolution.GaussianKernel(2.0)
+   for function, args in [("threshold", (128,)),
+                          ("bernsen_threshold", (0, 7)),
+                          ("mean_filter", (5,)),
+                          ("wiener_filter", (5, 10.0)),
+                          ("niblack_threshold", (9,)),
+                          ("sauvola_threshold", (9,)),
+                          ("convolve", (kernel,)),
+                          ("convolve_x", (kernel,)),
+                          ("convolve_xy", (kernel,)),
+                          ("rank", (5, 3)),
+                          ("mean", (5,)),
+                          ("min_max_filter", (5, 1, 3)),
+                          ("erode_dilate", (2, 1, 1)),
+                          ("erode", ()),
+                          ("dilate", ())]:
+      _tiled_equals_whole(grey, function, args)
+   # a larger page with a non-zero offset
+   onebit = onebit.subimage((3, 2), Dim(onebit.ncols - 3, onebit.nrows - 2))
+   structure = Image((0, 0), Dim(3, 2), ONEBIT)
+   structure.fill(1)
+   for function, args in [("erode_dilate", (2, 0, 0)),
+                          ("dilate_with_structure", (structure, Point(1, 0))),
+                          ("dilate_with_structure", (structure, Point(2, 1), True)),
+                          ("erode_with_structure", (structure, Point(0, 1))),
+                          ("rank", (7, 3)),
+                          ("kfill", (3, 2)),
+                          ("kfill_modified", (5,))]:
+      _tiled_equals_whole(onebit, function, args, (61, 23))
+
+def test_tiled_threads_and_mmap():
+   image = load_image("data/GreyScale_generic.tiff")
+   whole = image.mean_filter(7)
+   tiled = TiledImage(image, 16).apply("mean_filter", (7,), 4, True)
+   assert tiled.data.mmap_file == ""
+   assert tiled._to_raw_string() == whole._to_raw_string()
+   _tiled_equals_whole(image, "sauvola_threshold", (15,), 19, 0)
+
+def test_tiled_errors():
+   image = load_image("data/GreyScale_generic.tiff")
+   tiled = TiledImage(image, 32)
+   # the noise variance is estimated from the whole image
+   py.test.raises(ValueError, tiled.apply, "wiener_filter", (5,))
+   py.test.raises(ValueError, tiled.apply, "otsu_threshold")
+   # other functions are applied with the halo of the tiled image
+   result = TiledImage(image, 32, 2).apply(lambda tile: tile.mean_filter(5))
+   assert result._to_raw_string() == image.mean_filter(5)._to_raw_string()
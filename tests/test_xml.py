@@ -98,3 +98,19 @@ def test_malformed():
    def _test_malformed():
       glyphs = gamera_xml.glyphs_from_xml("data/malformed.xml")
    py.test.raises(gamera_xml.XMLError, _test_malformed)
+
+def test_glyphs_to_xml_binary():
+   glyphs = gamera_xml.glyphs_from_xml("data/testline.xml")
+   for encoding in ["rle-binary", "rle-zlib"]:
+      gamera_xml.glyphs_to_xml("tmp/testline_binary.xml", glyphs, False,
+                               encoding)
+      text = open("tmp/testline_binary.xml").read()
+      assert text.count('<data encoding="%s">' % encoding) == len(glyphs)
+      loaded = gamera_xml.glyphs_from_xml("tmp/testline_binary.xml")
+      assert len(loaded) == len(glyphs)
+      for glyph, other in zip(glyphs, loaded):
+         assert glyph.dim == other.dim and glyph.ul == other.ul
+         assert glyph.id_name == other.id_name
+         assert glyph._to_raw_string() == other._to_raw_string()
+   py.test.raises(gamera_xml.XMLError, gamera_xml.WriteXML, glyphs,
+                  data_encoding="base64")